@@ -0,0 +1,40 @@
+"""
+乘客 CSV 导入。
+
+按身份证号新增或更新乘客，user 列为关联用户 ID，
+每批用一条 IN 查询确认用户存在。
+"""
+from typing import Dict, List, Tuple
+
+from core.imports import BulkCsvImporter, RowError
+from .models import Passenger, User
+
+
+class PassengerImporter(BulkCsvImporter):
+    """乘客导入器"""
+
+    model = Passenger
+    key_field = 'id_card'
+    fields = ('id_card', 'name', 'passport_number', 'gender', 'birth_date')
+
+    def update_fields(self) -> List[str]:
+        return super().update_fields() + ['user']
+
+    def prepare_chunk(self, rows: List[Tuple[int, Dict[str, str]]]) -> None:
+        user_ids = set()
+        for _, row in rows:
+            try:
+                user_ids.add(int(row.get('user') or ''))
+            except ValueError:
+                continue
+        self.user_ids = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+
+    def clean_row(self, row: Dict[str, str], values: Dict[str, object]) -> Dict[str, object]:
+        try:
+            user_id = int(row.get('user') or '')
+        except ValueError:
+            raise RowError({'user': [f"无效的用户 ID: {row.get('user')}"]})
+        if user_id not in self.user_ids:
+            raise RowError({'user': [f'用户 {user_id} 不存在']})
+        values['user_id'] = user_id
+        return values
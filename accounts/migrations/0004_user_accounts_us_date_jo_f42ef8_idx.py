@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_alter_passenger_id_card_alter_user_id_card'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['date_joined', 'id'], name='accounts_us_date_jo_f42ef8_idx'),
+        ),
+    ]
@@ -96,6 +96,10 @@ class User(AbstractUser):
     class Meta:
         verbose_name = "用户"
         verbose_name_plural = "用户"
+        indexes = [
+            # 管理后台用户列表的键集分页
+            models.Index(fields=['date_joined', 'id']),
+        ]
 
     def __str__(self):
         return self.username
@@ -160,6 +160,32 @@ class PassengerAPITest(APITestCase):
         self.assertIn('created', resp_import.data)
 
 
+class PassengerImporterTest(TestCase):
+    """乘客分块导入测试"""
+
+    def test_users_resolved_in_batch(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .imports import PassengerImporter
+
+        user = User.objects.create_user(username='importowner', password='password123')
+        content = (
+            'user,name,id_card,passport_number,gender,birth_date\n'
+            f'{user.id},张三,110101199001011234,,male,1990-01-01\n'
+            '999999,李四,110101199001011235,,female,1995-05-05\n'
+            'abc,王五,110101199001011236,,male,1992-03-03\n'
+            f'{user.id},赵六,123,,male,1992-03-03\n'
+        ).encode('utf-8')
+
+        with self.assertNumQueries(5):
+            report = PassengerImporter().run(SimpleUploadedFile('passengers.csv', content))
+
+        self.assertEqual((report['created'], report['failed']), (1, 3))
+        self.assertEqual([error['row'] for error in report['errors']], [3, 4, 5])
+        self.assertIn('user', report['errors'][0]['errors'])
+        self.assertIn('id_card', report['errors'][2]['errors'])
+        self.assertEqual(Passenger.objects.get(id_card='110101199001011234').user, user)
+
+
 class UserProfileAPITest(APITestCase):
     """测试用户个人资料API"""
     
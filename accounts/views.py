@@ -4,14 +4,11 @@ accounts 视图模块。
 提供用户认证、用户信息管理和乘客管理相关的 API 视图。
 """
 import base64
-import csv
-import io
 import logging
 import os
 
 from django.contrib.auth import authenticate
 from django.core.files.base import ContentFile
-from django.http import HttpResponse
 from rest_framework import (
     filters as drf_filters,
     generics,
@@ -26,7 +23,10 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from core.export import ExportColumn
+from core.mixins import CsvImportMixin, StreamingExportMixin
 from .filters import PassengerFilter
+from .imports import PassengerImporter
 from .models import Passenger, User
 from .permissions import IsAdminUser, IsOwnerOrAdmin, IsPassengerOwnerOrAdmin
 from .serializers import (
@@ -241,7 +241,7 @@ class ChangePasswordView(generics.UpdateAPIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class PassengerViewSet(viewsets.ModelViewSet):
+class PassengerViewSet(StreamingExportMixin, CsvImportMixin, viewsets.ModelViewSet):
     """乘客信息视图集。"""
 
     serializer_class = PassengerSerializer
@@ -249,6 +249,16 @@ class PassengerViewSet(viewsets.ModelViewSet):
     filter_backends = [drf_filters.SearchFilter]
     filterset_class = PassengerFilter
     search_fields = ['name', 'id_card', 'passport_number']
+    importer_class = PassengerImporter
+    export_filename = 'passengers'
+    export_columns = [
+        ExportColumn('id', 'id'),
+        ExportColumn('user', 'user_id'),
+    ] + [
+        ExportColumn(name, name) for name in (
+            'name', 'id_card', 'passport_number', 'gender', 'birth_date', 'created_at', 'updated_at'
+        )
+    ]
 
     def get_queryset(self):
         """获取乘客查询集，管理员可查看所有，普通用户只能查看自己的。"""
@@ -263,62 +273,13 @@ class PassengerViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
     def export_csv(self, request):
-        """导出乘客信息为 CSV 文件。"""
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="passengers.csv"'
-        writer = csv.writer(response)
-        writer.writerow([
-            'id', 'user', 'name', 'id_card', 'passport_number',
-            'gender', 'birth_date', 'created_at', 'updated_at'
-        ])
-        for p in self.get_queryset():
-            writer.writerow([
-                p.id, p.user.id, p.name, p.id_card, p.passport_number,
-                p.gender, p.birth_date, p.created_at, p.updated_at
-            ])
-        return response
+        """导出乘客信息（流式输出，支持 export_format=jsonl 和 compression=gzip）。"""
+        return self.stream_export(request)
 
     @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
     def import_csv(self, request):
-        """从 CSV 文件导入乘客信息。"""
-        file = request.FILES.get('file')
-        if not file:
-            return Response(
-                {'detail': '请上传 CSV 文件'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        decoded = file.read().decode('utf-8')
-        reader = csv.DictReader(io.StringIO(decoded))
-        created = 0
-        updated = 0
-
-        for row in reader:
-            try:
-                user = User.objects.get(id=row['user'])
-            except User.DoesNotExist:
-                logger.warning(f"User with id {row['user']} does not exist")
-                continue
-            except ValueError:
-                logger.error(f"Invalid user id format: {row['user']}")
-                continue
-
-            _, created_flag = Passenger.objects.update_or_create(
-                id_card=row['id_card'],
-                defaults={
-                    'user': user,
-                    'name': row['name'],
-                    'passport_number': row['passport_number'],
-                    'gender': row['gender'],
-                    'birth_date': row['birth_date'],
-                }
-            )
-            if created_flag:
-                created += 1
-            else:
-                updated += 1
-
-        return Response({'created': created, 'updated': updated})
+        """按身份证号分块导入乘客，返回逐行错误报告；async=true 时作为后台任务执行。"""
+        return self.run_import(request)
 
 
 class UserManagementViewSet(viewsets.ModelViewSet):
@@ -10,6 +10,7 @@ from booking.models import Order
 from flight.serializers import FlightSerializer
 from accounts.serializers import UserSerializer
 from booking.serializers import OrderSerializer
+from core.pagination import KeysetPagination
 from core.services import SettingsService
 
 
@@ -18,12 +19,13 @@ class AdminFlightViewSet(viewsets.ModelViewSet):
     管理员航班管理API
     """
     permission_classes = [IsAdminUser]
-    queryset = Flight.objects.all().order_by('-departure_time')
+    queryset = Flight.objects.all().order_by('-departure_time', '-id')
     serializer_class = FlightSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     filterset_fields = ['status']
     search_fields = ['flight_number', 'departure_city', 'arrival_city']
-    pagination_class = None  # 禁用分页，返回所有航班
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-departure_time', '-id')
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -71,12 +73,13 @@ class AdminUserViewSet(viewsets.ModelViewSet):
     管理员用户管理API
     """
     permission_classes = [IsAdminUser]
-    queryset = User.objects.all().order_by('-date_joined')
+    queryset = User.objects.all().order_by('-date_joined', '-id')
     serializer_class = UserSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     filterset_fields = ['role', 'is_active']
     search_fields = ['username', 'email', 'phone']
-    pagination_class = None  # 禁用分页，返回所有用户
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-date_joined', '-id')
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -108,9 +111,12 @@ class AdminUserViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def orders(self, request, pk=None):
         user = self.get_object()
-        orders = Order.objects.filter(user=user).order_by('-created_at')
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        orders = Order.objects.filter(user=user).prefetch_related('tickets__flight')
+        paginator = KeysetPagination()
+        paginator.default_ordering = AdminOrderViewSet.keyset_ordering
+        page = paginator.paginate_queryset(orders, request)
+        serializer = OrderSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
     
     @action(detail=True, methods=['post'])
     def send_notification(self, request, pk=None):
@@ -129,12 +135,13 @@ class AdminOrderViewSet(viewsets.ModelViewSet):
     管理员订单管理API
     """
     permission_classes = [IsAdminUser]
-    queryset = Order.objects.all().order_by('-created_at')
+    queryset = Order.objects.all().order_by('-created_at', '-id')
     serializer_class = OrderSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     filterset_fields = ['status']
     search_fields = ['order_number', 'contact_name', 'contact_phone']
-    pagination_class = None  # 禁用分页，返回所有订单
+    pagination_class = KeysetPagination
+    keyset_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
         queryset = super().get_queryset().prefetch_related('tickets__flight')
@@ -0,0 +1,41 @@
+"""
+条件聚合辅助函数。
+
+多个区间（如预订提前期、票价区间）的计数用一条查询完成：每个区间是一个
+Count(filter=Q(...)) 条件聚合，总数作为同一条查询中的一列一并返回，
+不再逐个区间执行 COUNT。
+"""
+from typing import Dict, Mapping, Optional
+
+from django.db.models import Count, Q
+
+# 总数所在的结果列名
+TOTAL = '_total'
+
+
+def bucket_counts(queryset, buckets: Mapping[str, Q], total: bool = False) -> Dict[str, int]:
+    """
+    一条查询统计各区间的行数。
+
+    Args:
+        queryset: 统计范围
+        buckets: {区间名: 条件}，区间之间可以重叠
+        total: 是否同时返回统计范围内的总行数（键为 TOTAL）
+
+    Returns:
+        {区间名: 行数}，按 buckets 的顺序
+    """
+    names = list(buckets)
+    aggregates = {f'bucket_{index}': Count('pk', filter=buckets[name]) for index, name in enumerate(names)}
+    if total:
+        aggregates[TOTAL] = Count('pk')
+    row = queryset.order_by().aggregate(**aggregates)
+    counts = {name: row[f'bucket_{index}'] or 0 for index, name in enumerate(names)}
+    if total:
+        counts[TOTAL] = row[TOTAL] or 0
+    return counts
+
+
+def percentage(count: int, total: Optional[int]) -> float:
+    """count 占 total 的百分比，total 为 0 时返回 0。"""
+    return count / total * 100 if total else 0
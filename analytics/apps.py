@@ -3,4 +3,26 @@ from django.apps import AppConfig
 class AnalyticsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'analytics'
-    verbose_name = '数据分析与报表' 
\ No newline at end of file
+    verbose_name = '数据分析与报表'
+
+    # 周期任务执行间隔（秒）
+    RECOMMENDER_REFRESH_INTERVAL = 5 * 60
+    RECOMMENDER_TRAIN_INTERVAL = 24 * 60 * 60
+
+    def ready(self):
+        import analytics.signals
+
+        from core.scheduler import scheduler
+        from analytics.recommender import RouteRecommender
+        scheduler.register(
+            'recommender_refresh',
+            RouteRecommender.refresh,
+            self.RECOMMENDER_REFRESH_INTERVAL,
+        )
+        # 全量重新训练兜底，处理增量刷新无法发现的变化
+        scheduler.register(
+            'recommender_train',
+            RouteRecommender.train,
+            self.RECOMMENDER_TRAIN_INTERVAL,
+            timeout=60 * 60,
+        )
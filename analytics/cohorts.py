@@ -0,0 +1,185 @@
+"""
+客户留存队列引擎。
+
+一条分组查询取出已支付订单中每个用户有下单的月份（(用户, 月份) 去重），
+之后全部在 NumPy 中计算：
+
+- 首购月份：每个用户活跃月份的最小值，用户按首购月份划入队列
+- 队列计数矩阵：counts[队列, 距首购的月数] = 该月仍有下单的队列用户数
+- 留存矩阵：计数矩阵除以队列人数，尚未到达的月份为空（队列三角）
+- 回购率：每月活跃用户中首购月份早于当月的比例
+
+结果按查询的起止日期缓存 COHORT_CACHE_TIMEOUT 秒。
+"""
+from datetime import date
+from typing import Optional, Union
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.functions import TruncMonth
+
+from booking.models import Order
+
+DateBound = Optional[Union[str, date]]
+
+
+def _month_index(value) -> int:
+    """月份序号：year * 12 + month - 1，便于按月做差。"""
+    return value.year * 12 + value.month - 1
+
+
+def _month_label(index: int) -> str:
+    year, month = divmod(int(index), 12)
+    return f'{year}-{month + 1:02d}'
+
+
+class CohortEngine:
+    """
+    按首购月份划分的留存队列分析。
+
+    compute 返回的矩阵以 base（最早活跃月份序号）为起点，第 i 行/列对应 base + i 月。
+    """
+
+    CACHE_PREFIX = 'cohorts'
+    ORDER_STATUS = 'paid'
+
+    @classmethod
+    def _cache_key(cls, start: DateBound, end: DateBound) -> str:
+        bounds = ':'.join(str(value) if value else '' for value in (start, end))
+        return f'{cls.CACHE_PREFIX}:{bounds}'
+
+    @classmethod
+    def activity(cls, start: DateBound = None, end: DateBound = None):
+        """(用户, 月份序号) 去重后的两个数组，一条查询。"""
+        orders = Order.objects.filter(status=cls.ORDER_STATUS)
+        if start:
+            orders = orders.filter(created_at__date__gte=start)
+        if end:
+            orders = orders.filter(created_at__date__lte=end)
+        rows = orders.annotate(month=TruncMonth('created_at')).order_by().values_list(
+            'user_id', 'month'
+        ).distinct()
+        users, months = [], []
+        for user_id, month in rows:
+            users.append(user_id)
+            months.append(_month_index(month))
+        return np.array(users, dtype=np.int64), np.array(months, dtype=np.int64)
+
+    @classmethod
+    def compute(cls, start: DateBound = None, end: DateBound = None) -> dict:
+        """
+        不经缓存计算队列矩阵。
+
+        Returns:
+            {
+                'base': 最早活跃月份序号（没有订单时为 None）,
+                'counts': 队列计数矩阵 (月数 x 月数),
+                'active': 每月活跃用户数,
+                'new': 每月首购用户数,
+            }
+        """
+        users, months = cls.activity(start, end)
+        if not len(users):
+            empty = np.zeros(0, dtype=np.int64)
+            return {'base': None, 'counts': np.zeros((0, 0), dtype=np.int64), 'active': empty, 'new': empty}
+
+        base = int(months.min())
+        span = int(months.max()) - base + 1
+        months = months - base
+
+        _, user_index = np.unique(users, return_inverse=True)
+        first = np.full(user_index.max() + 1, span, dtype=np.int64)
+        np.minimum.at(first, user_index, months)
+
+        cohort = first[user_index]
+        counts = np.zeros((span, span), dtype=np.int64)
+        np.add.at(counts, (cohort, months - cohort), 1)
+        return {
+            'base': base,
+            'counts': counts,
+            'active': np.bincount(months, minlength=span),
+            'new': np.bincount(first, minlength=span),
+        }
+
+    @classmethod
+    def get(cls, start: DateBound = None, end: DateBound = None) -> dict:
+        """获取队列矩阵（优先读取缓存）。"""
+        key = cls._cache_key(start, end)
+        result = cache.get(key)
+        if result is None:
+            result = cls.compute(start, end)
+            cache.set(key, result, getattr(settings, 'COHORT_CACHE_TIMEOUT', 300))
+        return result
+
+    @staticmethod
+    def _percent(numerator: np.ndarray, denominator: np.ndarray) -> np.ndarray:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = np.where(denominator > 0, numerator * 100.0 / denominator, 0.0)
+        return np.round(rates, 1)
+
+    @classmethod
+    def retention_trend(cls, start: DateBound = None, end: DateBound = None) -> dict:
+        """
+        每月回购率：当月活跃用户中此前已购买过的比例，只包含有订单的月份。
+
+        Returns:
+            {'months': ['2024-01', ...], 'rates': [0, 35.2, ...]}
+        """
+        return cls._trend(cls.get(start, end))
+
+    @classmethod
+    def _trend(cls, result: dict) -> dict:
+        active = result['active']
+        rates = cls._percent(active - result['new'], active)
+        present = np.flatnonzero(active)
+        return {
+            'months': [_month_label(result['base'] + index) for index in present],
+            'rates': rates[present].tolist(),
+        }
+
+    @classmethod
+    def triangle(cls, start: DateBound = None, end: DateBound = None) -> dict:
+        """
+        队列留存三角。
+
+        Returns:
+            {
+                'cohorts': 首购月份列表,
+                'sizes': 各队列人数,
+                'offsets': 距首购的月数 [0, 1, ...],
+                'counts': 各队列每月仍下单的人数（未到达的月份为 None）,
+                'retention': 对应的留存率（%）,
+            }
+        """
+        return cls._triangle(cls.get(start, end))
+
+    @classmethod
+    def _triangle(cls, result: dict) -> dict:
+        counts = result['counts']
+        span = len(counts)
+        sizes = counts[:, 0] if span else np.zeros(0, dtype=np.int64)
+        retention = cls._percent(counts, sizes[:, np.newaxis])
+        # 队列 i 只观察到第 span - 1 - i 个月
+        observed = np.add.outer(np.arange(span), np.arange(span)) < span
+
+        cohorts = np.flatnonzero(sizes)
+        return {
+            'cohorts': [_month_label(result['base'] + index) for index in cohorts],
+            'sizes': sizes[cohorts].tolist(),
+            'offsets': list(range(span)),
+            'counts': [
+                [int(value) if seen else None for value, seen in zip(counts[index], observed[index])]
+                for index in cohorts
+            ],
+            'retention': [
+                [float(value) if seen else None for value, seen in zip(retention[index], observed[index])]
+                for index in cohorts
+            ],
+        }
+
+    @classmethod
+    def report(cls, start: DateBound = None, end: DateBound = None) -> dict:
+        """留存趋势和队列三角，共用一次计算。"""
+        result = cls.get(start, end)
+        return {'retention_trend': cls._trend(result), 'cohort_triangle': cls._triangle(result)}
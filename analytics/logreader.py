@@ -0,0 +1,324 @@
+"""
+系统日志查询引擎。
+
+日志文件格式: LEVEL YYYY-MM-DD HH:MM:SS,mmm source PID TID message
+
+查询从文件末尾按块向前读取，取满 limit 条即停止，读取量与文件大小无关。
+按日期或级别筛选时使用旁路索引：记录每个日志文件中每天、每天每个级别的
+日志所在的字节区间，只读取与筛选条件相交的区间。
+
+- 索引按文件开头的内容签名保存，RotatingFileHandler 轮转（重命名为 .1、.2 ...）后
+  原有索引仍可直接使用；文件被截断或重写时签名或末尾校验不一致，重新建立索引
+- 日志追加后只扫描新增部分，更新索引
+- 当前文件和轮转文件的索引一起保存在 <日志文件>.idx 中，多个进程共享
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 支持的日志级别
+SUPPORTED_LEVELS = ('INFO', 'WARNING', 'ERROR')
+
+# 建立索引的日志级别
+INDEXED_LEVELS = (b'DEBUG', b'INFO', b'WARNING', b'ERROR', b'CRITICAL')
+
+# 向前读取的块大小
+BLOCK_SIZE = 64 * 1024
+
+# 计算文件签名和末尾校验的字节数
+SIGNATURE_BYTES = 256
+CHECK_BYTES = 64
+
+
+def parse_log_line(line: str) -> Optional[dict]:
+    """
+    解析单行日志，解析失败（如异常堆栈的续行）返回 None。
+
+    Returns:
+        {'timestamp', 'level', 'message', 'source'}
+    """
+    if not line:
+        return None
+
+    parts = line.split(' ', 6)
+    if len(parts) < 5:
+        return None
+
+    level = parts[0]
+    if level not in SUPPORTED_LEVELS:
+        return None
+
+    timestamp = f"{parts[1]}T{parts[2].replace(',', '.')}"
+    source = parts[3]
+    # 跳过 PID 和 TID
+    if len(parts) >= 7:
+        message = parts[6]
+    elif len(parts) >= 6:
+        message = parts[5]
+    else:
+        message = parts[4]
+
+    return {
+        'timestamp': timestamp,
+        'level': level,
+        'message': message,
+        'source': source,
+    }
+
+
+def reverse_lines(f, start: int, end: int, block_size: int = BLOCK_SIZE) -> Iterator[bytes]:
+    """从 end 向前按块读取到 start（须为行首），逐行倒序返回（不含换行符）。"""
+    position = end
+    remainder = b''
+    while position > start:
+        size = min(block_size, position - start)
+        position -= size
+        f.seek(position)
+        lines = (f.read(size) + remainder).split(b'\n')
+        remainder = lines[0]
+        for line in reversed(lines[1:]):
+            yield line
+    if remainder:
+        yield remainder
+
+
+def _merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """合并相交的字节区间，按位置从后往前返回。"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged[::-1]
+
+
+def _extend(ranges: dict, key: str, start: int, end: int) -> None:
+    entry = ranges.get(key)
+    if entry is None:
+        ranges[key] = [start, end, 1]
+    else:
+        entry[0] = min(entry[0], start)
+        entry[1] = max(entry[1], end)
+        entry[2] += 1
+
+
+class LogIndex:
+    """
+    一个日志文件的索引。
+
+    Attributes:
+        size: 已建立索引的字节数（位于行尾）
+        check: 已索引部分末尾 CHECK_BYTES 字节的摘要，用于发现文件被重写
+        days: {日期: [起始偏移, 结束偏移, 条数]}
+        levels: {级别: {日期: [起始偏移, 结束偏移, 条数]}}
+    """
+
+    def __init__(self, data: Optional[dict] = None):
+        data = data or {}
+        self.size = data.get('size', 0)
+        self.check = data.get('check', '')
+        self.days: Dict[str, list] = data.get('days', {})
+        self.levels: Dict[str, Dict[str, list]] = data.get('levels', {})
+
+    def to_dict(self) -> dict:
+        return {'size': self.size, 'check': self.check, 'days': self.days, 'levels': self.levels}
+
+    @staticmethod
+    def tail_check(f, size: int) -> str:
+        f.seek(max(0, size - CHECK_BYTES))
+        return hashlib.sha1(f.read(min(size, CHECK_BYTES))).hexdigest()
+
+    def is_valid_for(self, f, file_size: int) -> bool:
+        if self.size == 0:
+            return True
+        return file_size >= self.size and self.tail_check(f, self.size) == self.check
+
+    def update(self, f, file_size: int) -> bool:
+        """扫描 size 之后新增的完整行，返回索引是否有变化。"""
+        if file_size <= self.size:
+            return False
+        f.seek(self.size)
+        offset = self.size
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            end = offset + len(line)
+            parts = line.split(b' ', 2)
+            if len(parts) == 3 and parts[0] in INDEXED_LEVELS and len(parts[1]) == 10:
+                day = parts[1].decode('ascii', errors='replace')
+                _extend(self.days, day, offset, end)
+                _extend(self.levels.setdefault(parts[0].decode('ascii'), {}), day, offset, end)
+            offset = end
+        if offset == self.size:
+            return False
+        self.size = offset
+        self.check = self.tail_check(f, offset)
+        return True
+
+    def ranges(self, level: Optional[str], start_date: Optional[str],
+               end_date: Optional[str]) -> List[Tuple[int, int]]:
+        """与筛选条件相交的字节区间，按位置从后往前返回。"""
+        days = self.levels.get(level, {}) if level else self.days
+        return _merge_ranges([
+            (start, end) for day, (start, end, _) in days.items()
+            if (not start_date or day >= start_date) and (not end_date or day <= end_date)
+        ])
+
+
+class LogQueryEngine:
+    """
+    日志查询引擎。
+
+    Args:
+        path: 当前日志文件路径，轮转文件为 path.1、path.2 ...
+        persist: 是否将索引保存到 <path>.idx
+    """
+
+    # 进程内的索引缓存：{日志文件路径: (索引文件修改时间, {签名: LogIndex})}
+    _cache: Dict[str, Tuple[Optional[float], Dict[str, LogIndex]]] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, path: str, persist: bool = True):
+        self.path = path
+        self.persist = persist
+        self.index_path = f'{path}.idx'
+
+    def files(self) -> List[str]:
+        """当前日志文件和轮转文件，从新到旧。"""
+        files = [self.path] if os.path.exists(self.path) else []
+        number = 1
+        while os.path.exists(f'{self.path}.{number}'):
+            files.append(f'{self.path}.{number}')
+            number += 1
+        return files
+
+    @staticmethod
+    def signature(f) -> Optional[str]:
+        f.seek(0)
+        head = f.read(SIGNATURE_BYTES)
+        return hashlib.sha1(head).hexdigest() if head else None
+
+    # ------------------------------------------------------------------
+    # 索引
+    # ------------------------------------------------------------------
+
+    def _index_mtime(self) -> Optional[float]:
+        try:
+            return os.path.getmtime(self.index_path)
+        except OSError:
+            return None
+
+    def _load_indexes(self) -> Dict[str, LogIndex]:
+        mtime = self._index_mtime() if self.persist else None
+        cached = self._cache.get(self.path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        indexes = {}
+        if mtime is not None:
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    indexes = {key: LogIndex(data) for key, data in json.load(f).items()}
+            except (OSError, ValueError):
+                logger.warning(f"日志索引 {self.index_path} 无法读取，将重新建立")
+        self._cache[self.path] = (mtime, indexes)
+        return indexes
+
+    def _save_indexes(self, indexes: Dict[str, LogIndex]) -> None:
+        mtime = None
+        if self.persist:
+            tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({key: index.to_dict() for key, index in indexes.items()}, f)
+                os.replace(tmp_path, self.index_path)
+                mtime = self._index_mtime()
+            except OSError as e:
+                logger.warning(f"日志索引 {self.index_path} 保存失败: {e}")
+        self._cache[self.path] = (mtime, indexes)
+
+    def _indexes_for(self, handles: List[Tuple[str, object]]) -> List[Optional[LogIndex]]:
+        """取得各文件的最新索引（按需扫描新增内容），并清理已删除文件的索引。"""
+        with self._lock:
+            indexes = self._load_indexes()
+            changed = False
+            result, alive = [], {}
+            for path, f in handles:
+                key = self.signature(f)
+                if key is None:
+                    result.append(None)
+                    continue
+                file_size = os.fstat(f.fileno()).st_size
+                index = indexes.get(key)
+                if index is None or not index.is_valid_for(f, file_size):
+                    index, changed = LogIndex(), True
+                changed = index.update(f, file_size) or changed
+                alive[key] = index
+                result.append(index)
+            if changed or set(alive) != set(indexes):
+                self._save_indexes(alive)
+            return result
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def query(self, level: Optional[str] = None, start_date=None, end_date=None,
+              limit: int = 100) -> List[dict]:
+        """
+        查询最新的日志记录。
+
+        Args:
+            level: 日志级别筛选
+            start_date: 开始日期（date）
+            end_date: 结束日期（date）
+            limit: 返回数量限制
+
+        Returns:
+            从新到旧的日志列表
+        """
+        start = start_date.isoformat() if start_date else None
+        end = end_date.isoformat() if end_date else None
+        filtered = bool(level or start or end)
+
+        handles = []
+        try:
+            for path in self.files():
+                try:
+                    handles.append((path, open(path, 'rb')))
+                except FileNotFoundError:
+                    continue  # 读取过程中被轮转删除
+            indexes = self._indexes_for(handles) if filtered else [None] * len(handles)
+
+            logs = []
+            for (path, f), index in zip(handles, indexes):
+                file_size = os.fstat(f.fileno()).st_size
+                if index is None:
+                    ranges = [(0, file_size)]
+                else:
+                    ranges = index.ranges(level, start, end)
+                    # 末尾尚未写完的行不在索引中
+                    if file_size > index.size:
+                        ranges.insert(0, (index.size, file_size))
+                for range_start, range_end in ranges:
+                    for line in reverse_lines(f, range_start, range_end):
+                        entry = parse_log_line(line.decode('utf-8', errors='replace').strip())
+                        if entry is None:
+                            continue
+                        if level and entry['level'] != level:
+                            continue
+                        day = entry['timestamp'][:10]
+                        if (start and day < start) or (end and day > end):
+                            continue
+                        logs.append(entry)
+                        if len(logs) >= limit:
+                            return logs
+            return logs
+        finally:
+            for _, f in handles:
+                f.close()
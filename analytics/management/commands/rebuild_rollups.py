@@ -0,0 +1,50 @@
+"""
+分析汇总表重建命令。
+
+汇总表、销售事实表、销售预聚合表和用户消费统计由订单、机票和用户的变化增量维护。
+首次部署、导入历史数据、修改航班城市或直接修改数据库后，需要执行本命令
+从明细数据全量重建。
+
+Usage:
+    python manage.py rebuild_rollups
+    python manage.py rebuild_rollups --chunk-size 5000
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from analytics.olap import SalesFactService
+from analytics.rollups import RollupService
+from analytics.user_stats import UserStatsService
+
+
+class Command(BaseCommand):
+    """重建分析汇总表的管理命令。"""
+
+    help = '从订单、机票和用户数据全量重建分析汇总表、销售事实表和用户消费统计'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help='每批读取的记录数，默认 2000',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        stats = RollupService.rebuild(chunk_size=options['chunk_size'])
+        # 销售事实中的用户分群读取用户消费统计，需先重建
+        user_stats = UserStatsService.rebuild()
+        olap = SalesFactService.rebuild(chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"读取订单 {stats['orders']} 个, 机票 {stats['tickets']} 张, 用户 {stats['users']} 个"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"汇总表重建完成: 每日 {stats['daily_rows']} 行, 每小时 {stats['hourly_rows']} 行, "
+            f"用户 {stats['user_rows']} 行, 销售事实 {olap['fact_rows']} 行, "
+            f"销售预聚合 {olap['cube_rows']} 行, 用户消费统计 {user_stats['user_stats_rows']} 行, "
+            f"耗时 {elapsed:.2f} 秒"
+        ))
@@ -0,0 +1,59 @@
+"""
+航线推荐模型训练命令。
+
+模型由周期任务增量刷新并每日全量重新训练。首次部署或需要立即更新模型时，
+执行本命令全量训练并写入模型文件（RECOMMENDER_MODEL_PATH）。
+
+Usage:
+    python manage.py train_recommender
+    python manage.py train_recommender --top-k 30 --min-orders 2
+    python manage.py train_recommender --incremental
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from analytics.recommender import RouteRecommender
+
+
+class Command(BaseCommand):
+    """训练航线推荐模型的管理命令。"""
+
+    help = '从已支付订单训练航线推荐模型'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top-k',
+            type=int,
+            default=None,
+            help='每个用户保留的相似用户数，默认为 RECOMMENDER_TOP_K',
+        )
+        parser.add_argument(
+            '--min-orders',
+            type=int,
+            default=None,
+            help='参与相似度计算的最少购买航线数，默认为 RECOMMENDER_MIN_ORDERS',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='只刷新上次训练后有变化的用户',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['incremental']:
+            refreshed = RouteRecommender.refresh()
+            self.stdout.write(self.style.SUCCESS(
+                f"增量刷新完成: {refreshed} 个用户, 耗时 {time.perf_counter() - started:.2f} 秒"
+            ))
+            return
+
+        model = RouteRecommender.train(top_k=options['top_k'], min_orders=options['min_orders'])
+        self.stdout.write(self.style.SUCCESS(
+            f"模型训练完成: {len(model.user_ids)} 个用户, {len(model.routes)} 条航线, "
+            f"耗时 {time.perf_counter() - started:.2f} 秒"
+        ))
+        path = RouteRecommender.model_path()
+        if path:
+            self.stdout.write(f"模型文件: {path}")
@@ -0,0 +1,74 @@
+# Generated by Django 5.1.4 on 2026-10-18 07:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUserRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='日期')),
+                ('new_users', models.IntegerField(default=0, verbose_name='新用户数')),
+            ],
+            options={
+                'verbose_name': '每日用户汇总',
+                'verbose_name_plural': '每日用户汇总',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('departure_city', models.CharField(default='', max_length=50, verbose_name='出发城市')),
+                ('arrival_city', models.CharField(default='', max_length=50, verbose_name='到达城市')),
+                ('cabin_class', models.CharField(default='', max_length=20, verbose_name='舱位等级')),
+                ('payment_method', models.CharField(default='', max_length=20, verbose_name='支付方式')),
+                ('orders', models.IntegerField(default=0, verbose_name='订单数')),
+                ('sales', models.IntegerField(default=0, verbose_name='已支付订单数（按下单时间）')),
+                ('sales_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='销售额（按下单时间）')),
+                ('paid_orders', models.IntegerField(default=0, verbose_name='已支付订单数（按支付时间）')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='收入（按支付时间）')),
+                ('tickets', models.IntegerField(default=0, verbose_name='出票数')),
+                ('refunds', models.IntegerField(default=0, verbose_name='退票数')),
+                ('refund_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='退票金额')),
+                ('date', models.DateField(verbose_name='日期')),
+            ],
+            options={
+                'verbose_name': '每日销售汇总',
+                'verbose_name_plural': '每日销售汇总',
+                'constraints': [models.UniqueConstraint(fields=('date', 'departure_city', 'arrival_city', 'cabin_class', 'payment_method'), name='uniq_daily_sales_rollup')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('departure_city', models.CharField(default='', max_length=50, verbose_name='出发城市')),
+                ('arrival_city', models.CharField(default='', max_length=50, verbose_name='到达城市')),
+                ('cabin_class', models.CharField(default='', max_length=20, verbose_name='舱位等级')),
+                ('payment_method', models.CharField(default='', max_length=20, verbose_name='支付方式')),
+                ('orders', models.IntegerField(default=0, verbose_name='订单数')),
+                ('sales', models.IntegerField(default=0, verbose_name='已支付订单数（按下单时间）')),
+                ('sales_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='销售额（按下单时间）')),
+                ('paid_orders', models.IntegerField(default=0, verbose_name='已支付订单数（按支付时间）')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='收入（按支付时间）')),
+                ('tickets', models.IntegerField(default=0, verbose_name='出票数')),
+                ('refunds', models.IntegerField(default=0, verbose_name='退票数')),
+                ('refund_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='退票金额')),
+                ('hour', models.DateTimeField(verbose_name='小时')),
+            ],
+            options={
+                'verbose_name': '每小时销售汇总',
+                'verbose_name_plural': '每小时销售汇总',
+                'constraints': [models.UniqueConstraint(fields=('hour', 'departure_city', 'arrival_city', 'cabin_class', 'payment_method'), name='uniq_hourly_sales_rollup')],
+            },
+        ),
+    ]
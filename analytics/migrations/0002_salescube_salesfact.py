@@ -0,0 +1,62 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesCube',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rollup', models.CharField(max_length=30, verbose_name='汇总层级')),
+                ('period', models.DateField(verbose_name='时间段')),
+                ('departure_city', models.CharField(default='', max_length=50, verbose_name='出发城市')),
+                ('arrival_city', models.CharField(default='', max_length=50, verbose_name='到达城市')),
+                ('cabin_class', models.CharField(default='', max_length=20, verbose_name='舱位等级')),
+                ('payment_method', models.CharField(default='', max_length=20, verbose_name='支付方式')),
+                ('user_segment', models.CharField(default='', max_length=20, verbose_name='用户分群（下单时）')),
+                ('order_status', models.CharField(default='', max_length=20, verbose_name='订单状态')),
+                ('orders', models.IntegerField(default=0, verbose_name='订单数')),
+                ('tickets', models.IntegerField(default=0, verbose_name='机票数')),
+                ('price', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='票价')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='订单金额')),
+            ],
+            options={
+                'verbose_name': '销售预聚合',
+                'verbose_name_plural': '销售预聚合',
+                'constraints': [models.UniqueConstraint(fields=('rollup', 'period', 'departure_city', 'arrival_city', 'cabin_class', 'payment_method', 'user_segment', 'order_status'), name='uniq_sales_cube')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SalesFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_id', models.BigIntegerField(db_index=True, verbose_name='订单ID')),
+                ('ticket_id', models.BigIntegerField(blank=True, null=True, verbose_name='机票ID')),
+                ('user_id', models.BigIntegerField(blank=True, null=True, verbose_name='用户ID')),
+                ('created_at', models.DateTimeField(verbose_name='下单时间')),
+                ('date', models.DateField(verbose_name='下单日期')),
+                ('departure_city', models.CharField(default='', max_length=50, verbose_name='出发城市')),
+                ('arrival_city', models.CharField(default='', max_length=50, verbose_name='到达城市')),
+                ('cabin_class', models.CharField(default='', max_length=20, verbose_name='舱位等级')),
+                ('payment_method', models.CharField(default='', max_length=20, verbose_name='支付方式')),
+                ('user_segment', models.CharField(default='', max_length=20, verbose_name='用户分群（下单时）')),
+                ('order_status', models.CharField(default='', max_length=20, verbose_name='订单状态')),
+                ('orders', models.SmallIntegerField(default=0, verbose_name='订单数')),
+                ('tickets', models.SmallIntegerField(default=0, verbose_name='机票数')),
+                ('price', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='票价')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='分摊订单金额')),
+            ],
+            options={
+                'verbose_name': '销售事实',
+                'verbose_name_plural': '销售事实',
+                'indexes': [models.Index(fields=['order_status', 'created_at'], name='analytics_s_order_s_d8c10d_idx'), models.Index(fields=['order_status', 'date'], name='analytics_s_order_s_98a0d4_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_user_accounts_us_date_jo_f42ef8_idx'),
+        ('analytics', '0002_salescube_salesfact'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='analytics_stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+                ('order_count', models.IntegerField(default=0, verbose_name='已支付订单数')),
+                ('total_spend', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='消费总额')),
+                ('first_order_at', models.DateTimeField(blank=True, null=True, verbose_name='首次下单时间')),
+                ('last_order_at', models.DateTimeField(blank=True, null=True, verbose_name='最近下单时间')),
+                ('segment', models.CharField(db_index=True, default='', max_length=20, verbose_name='用户分群')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+            ],
+            options={
+                'verbose_name': '用户消费统计',
+                'verbose_name_plural': '用户消费统计',
+            },
+        ),
+    ]
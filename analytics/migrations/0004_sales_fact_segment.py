@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0003_userstats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='salescube',
+            name='user_segment',
+            field=models.CharField(default='', max_length=20, verbose_name='用户分群'),
+        ),
+        migrations.AlterField(
+            model_name='salesfact',
+            name='user_segment',
+            field=models.CharField(default='', max_length=20, verbose_name='用户分群'),
+        ),
+    ]
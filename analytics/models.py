@@ -0,0 +1,205 @@
+"""
+数据分析模块的数据模型。
+
+本模块定义仪表盘使用的汇总事实表。汇总数据由订单、机票和用户的状态变化
+增量维护（见 analytics.rollups），也可以通过 rebuild_rollups 命令全量重建。
+"""
+from django.conf import settings
+from django.db import models
+
+
+class SalesRollupBase(models.Model):
+    """
+    销售汇总事实表基类。
+
+    维度：出发城市、到达城市、舱位等级、支付方式。
+    订单级指标（订单数、销售额、收入）不区分航线，记录在航线维度为空的行上；
+    机票级指标（出票数、退票数）按航线和舱位记录，支付方式维度为空。
+    """
+
+    departure_city = models.CharField(max_length=50, default='', verbose_name='出发城市')
+    arrival_city = models.CharField(max_length=50, default='', verbose_name='到达城市')
+    cabin_class = models.CharField(max_length=20, default='', verbose_name='舱位等级')
+    payment_method = models.CharField(max_length=20, default='', verbose_name='支付方式')
+
+    # 按下单时间统计
+    orders = models.IntegerField(default=0, verbose_name='订单数')
+    sales = models.IntegerField(default=0, verbose_name='已支付订单数（按下单时间）')
+    sales_amount = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name='销售额（按下单时间）'
+    )
+    # 按支付时间统计
+    paid_orders = models.IntegerField(default=0, verbose_name='已支付订单数（按支付时间）')
+    revenue = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name='收入（按支付时间）'
+    )
+    # 机票指标
+    tickets = models.IntegerField(default=0, verbose_name='出票数')
+    refunds = models.IntegerField(default=0, verbose_name='退票数')
+    refund_amount = models.DecimalField(
+        max_digits=14, decimal_places=2, default=0, verbose_name='退票金额'
+    )
+
+    class Meta:
+        abstract = True
+
+
+class DailySalesRollup(SalesRollupBase):
+    """按天汇总的销售事实表。"""
+
+    date = models.DateField(verbose_name='日期')
+
+    class Meta:
+        verbose_name = '每日销售汇总'
+        verbose_name_plural = '每日销售汇总'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'departure_city', 'arrival_city', 'cabin_class', 'payment_method'],
+                name='uniq_daily_sales_rollup',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.departure_city}-{self.arrival_city} {self.cabin_class}"
+
+
+class HourlySalesRollup(SalesRollupBase):
+    """按小时汇总的销售事实表。"""
+
+    hour = models.DateTimeField(verbose_name='小时')
+
+    class Meta:
+        verbose_name = '每小时销售汇总'
+        verbose_name_plural = '每小时销售汇总'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['hour', 'departure_city', 'arrival_city', 'cabin_class', 'payment_method'],
+                name='uniq_hourly_sales_rollup',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.hour} {self.departure_city}-{self.arrival_city} {self.cabin_class}"
+
+
+class DailyUserRollup(models.Model):
+    """按天汇总的新用户数。"""
+
+    date = models.DateField(unique=True, verbose_name='日期')
+    new_users = models.IntegerField(default=0, verbose_name='新用户数')
+
+    class Meta:
+        verbose_name = '每日用户汇总'
+        verbose_name_plural = '每日用户汇总'
+
+    def __str__(self):
+        return f"{self.date}: {self.new_users}"
+
+
+class SalesFact(models.Model):
+    """
+    机票粒度的销售事实表（见 analytics.olap）。
+
+    每张机票一行，没有机票的订单记一行（机票维度为空）。订单级指标分摊到订单的各行：
+    amount 为订单金额按机票平均分摊（除不尽的部分记在第一行），orders 只在订单的第一行记 1，
+    因此按任意维度分组求和都不会重复计算订单。
+    """
+
+    order_id = models.BigIntegerField(db_index=True, verbose_name='订单ID')
+    ticket_id = models.BigIntegerField(null=True, blank=True, verbose_name='机票ID')
+    user_id = models.BigIntegerField(null=True, blank=True, verbose_name='用户ID')
+    created_at = models.DateTimeField(verbose_name='下单时间')
+    date = models.DateField(verbose_name='下单日期')
+
+    departure_city = models.CharField(max_length=50, default='', verbose_name='出发城市')
+    arrival_city = models.CharField(max_length=50, default='', verbose_name='到达城市')
+    cabin_class = models.CharField(max_length=20, default='', verbose_name='舱位等级')
+    payment_method = models.CharField(max_length=20, default='', verbose_name='支付方式')
+    user_segment = models.CharField(max_length=20, default='', verbose_name='用户分群')
+    order_status = models.CharField(max_length=20, default='', verbose_name='订单状态')
+
+    orders = models.SmallIntegerField(default=0, verbose_name='订单数')
+    tickets = models.SmallIntegerField(default=0, verbose_name='机票数')
+    price = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='票价')
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='分摊订单金额')
+
+    class Meta:
+        verbose_name = '销售事实'
+        verbose_name_plural = '销售事实'
+        indexes = [
+            models.Index(fields=['order_status', 'created_at']),
+            models.Index(fields=['order_status', 'date']),
+        ]
+
+    def __str__(self):
+        return f"订单{self.order_id} 机票{self.ticket_id or '-'}"
+
+
+class SalesCube(models.Model):
+    """
+    销售事实的预聚合表。
+
+    每个汇总层级（rollup，见 analytics.olap.ROLLUPS）按日或按月汇总，
+    只保留部分维度，未保留的维度为空字符串。
+    """
+
+    rollup = models.CharField(max_length=30, verbose_name='汇总层级')
+    period = models.DateField(verbose_name='时间段')
+
+    departure_city = models.CharField(max_length=50, default='', verbose_name='出发城市')
+    arrival_city = models.CharField(max_length=50, default='', verbose_name='到达城市')
+    cabin_class = models.CharField(max_length=20, default='', verbose_name='舱位等级')
+    payment_method = models.CharField(max_length=20, default='', verbose_name='支付方式')
+    user_segment = models.CharField(max_length=20, default='', verbose_name='用户分群')
+    order_status = models.CharField(max_length=20, default='', verbose_name='订单状态')
+
+    orders = models.IntegerField(default=0, verbose_name='订单数')
+    tickets = models.IntegerField(default=0, verbose_name='机票数')
+    price = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='票价')
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='订单金额')
+
+    class Meta:
+        verbose_name = '销售预聚合'
+        verbose_name_plural = '销售预聚合'
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    'rollup', 'period', 'departure_city', 'arrival_city', 'cabin_class',
+                    'payment_method', 'user_segment', 'order_status',
+                ],
+                name='uniq_sales_cube',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.rollup} {self.period}"
+
+
+class UserStats(models.Model):
+    """
+    用户终身消费统计（见 analytics.user_stats）。
+
+    只统计已支付订单，没有已支付订单的用户没有记录。分群按已支付订单数划分：
+    10 单及以上为 vip，2-9 单为 returning，1 单为 new。
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='analytics_stats',
+        verbose_name='用户',
+    )
+    order_count = models.IntegerField(default=0, verbose_name='已支付订单数')
+    total_spend = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name='消费总额')
+    first_order_at = models.DateTimeField(null=True, blank=True, verbose_name='首次下单时间')
+    last_order_at = models.DateTimeField(null=True, blank=True, verbose_name='最近下单时间')
+    segment = models.CharField(max_length=20, default='', db_index=True, verbose_name='用户分群')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        verbose_name = '用户消费统计'
+        verbose_name_plural = '用户消费统计'
+
+    def __str__(self):
+        return f"{self.user_id}: {self.order_count} 单 / {self.total_spend}"
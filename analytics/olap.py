@@ -0,0 +1,554 @@
+"""
+销售 OLAP 查询层。
+
+销售数据按机票粒度反规范化到事实表 SalesFact（下单日期、航线、舱位、支付方式、
+用户分群、订单状态，指标为订单数、机票数、票价和分摊后的订单金额）：
+
+- 订单金额按机票分摊、订单数只记在订单的第一行，按机票维度分组求和时
+  不会重复计算订单，也不需要 COUNT(DISTINCT)
+- 订单或机票保存、删除时记录该订单（见 analytics.signals），事务提交后
+  （或本线程下一次查询前）批量重新生成事实行，与原有事实行比较后
+  把差值累加到各汇总层级的预聚合表 SalesCube
+- 查询规划：在能回答查询（维度、过滤条件、时间粒度和日期边界）的汇总层级中
+  选最粗的一个，都不能回答时（如按精确时间过滤）直接查询事实表
+- 查询结果按规范化后的查询缓存 OLAP_CACHE_TIMEOUT 秒，事实变化时更换缓存版本
+
+用户分群只有一个定义：用户已支付订单总数（0-1 单为 new，2-9 单为 returning，
+10 单起为 vip），保存在用户消费统计 UserStats.segment 中（见 analytics.user_stats），
+事实行复制所属用户当前的分群；用户分群变化时重新生成该用户全部订单的事实行，
+因此各分析页面中同一用户的分群一致。修改航班城市或绕过模型信号直接修改数据库后，
+需要执行 rebuild_rollups 命令重建。
+"""
+import hashlib
+import logging
+import threading
+import uuid
+from collections import Counter, defaultdict
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import ROUND_DOWN, Decimal
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncQuarter, TruncWeek, TruncYear
+from django.utils import timezone
+
+from booking.models import Order, Ticket
+from .models import SalesCube, SalesFact
+from .rollups import RollupService
+
+logger = logging.getLogger(__name__)
+
+# 事实表的维度和度量字段
+DIMENSIONS = ('departure_city', 'arrival_city', 'cabin_class', 'payment_method', 'user_segment', 'order_status')
+MEASURES = ('orders', 'tickets', 'price', 'amount')
+
+# 查询指标及其所需的度量
+METRICS = {
+    'revenue': ('amount',),
+    'order_count': ('orders',),
+    'ticket_count': ('tickets',),
+    'ticket_revenue': ('price',),
+    'avg_price': ('amount', 'orders'),
+    'avg_ticket_price': ('price', 'tickets'),
+    'tickets_per_order': ('tickets', 'orders'),
+}
+
+GRANULARITIES = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'quarter': TruncQuarter,
+    'year': TruncYear,
+}
+
+# 用户分群：按已支付订单总数（最少单数, 分群）从高到低排列
+SEGMENTS = ((10, 'vip'), (2, 'returning'), (1, 'new'))
+
+DateBound = Optional[Union[date, datetime]]
+
+
+class Rollup(NamedTuple):
+    """预聚合层级：按 grain（day / month）汇总，只保留 dimensions 中的维度。"""
+
+    name: str
+    grain: str
+    dimensions: Tuple[str, ...]
+
+
+# 按从粗到细排列，规划时选第一个能回答查询的层级
+ROLLUPS = (
+    Rollup('month_status', 'month', ('order_status',)),
+    Rollup('month_route', 'month', ('order_status', 'departure_city', 'arrival_city', 'cabin_class')),
+    Rollup('month_customer', 'month', ('order_status', 'payment_method', 'user_segment')),
+    Rollup('day_status', 'day', ('order_status',)),
+    Rollup('day_all', 'day', DIMENSIONS),
+)
+
+# 各汇总粒度能回答的时间粒度
+GRAIN_GRANULARITIES = {
+    'day': set(GRANULARITIES),
+    'month': {'month', 'quarter', 'year'},
+}
+
+_pending = threading.local()
+
+# 比较事实行是否变化时使用的字段
+FACT_FIELDS = ('order_id', 'ticket_id', 'user_id', 'created_at', 'date') + DIMENSIONS + MEASURES
+
+
+def _pending_orders() -> set:
+    """本线程待重新生成事实的订单 ID。"""
+    if not hasattr(_pending, 'order_ids'):
+        _pending.order_ids = set()
+    return _pending.order_ids
+
+
+def segment_for(order_count: int) -> str:
+    """按已支付订单总数划分用户分群，没有已支付订单的用户为 new。"""
+    for minimum, name in SEGMENTS:
+        if order_count >= minimum:
+            return name
+    return SEGMENTS[-1][1]
+
+
+def _bound_key(value: DateBound) -> str:
+    if isinstance(value, datetime):
+        return value.astimezone(dt_timezone.utc).isoformat() if timezone.is_aware(value) else value.isoformat()
+    return value.isoformat() if value else ''
+
+
+class OlapQuery(NamedTuple):
+    """
+    规范化的 OLAP 查询。
+
+    dimensions 可以包含 'time'（按 granularity 截断下单日期）；filters 为
+    ((维度, (取值, ...)), ...)；start、end 为下单时间的闭区间，date 表示整天，
+    datetime 表示精确时间（只能由事实表回答）。
+    """
+
+    dimensions: Tuple[str, ...]
+    metrics: Tuple[str, ...]
+    granularity: Optional[str] = None
+    start: DateBound = None
+    end: DateBound = None
+    filters: Tuple[Tuple[str, Tuple[str, ...]], ...] = ()
+
+    @classmethod
+    def build(cls, dimensions: Iterable[str], metrics: Iterable[str], granularity: str = 'month',
+              start: DateBound = None, end: DateBound = None,
+              filters: Optional[Dict[str, Iterable[str]]] = None) -> 'OlapQuery':
+        """校验并规范化查询：维度和指标去重，过滤条件排序；不支持的维度或指标抛出 ValueError。"""
+        dimensions = tuple(dict.fromkeys(dimensions))
+        metrics = tuple(dict.fromkeys(metrics))
+        for dim in dimensions:
+            if dim != 'time' and dim not in DIMENSIONS:
+                raise ValueError(f'不支持的维度: {dim}')
+        for metric in metrics:
+            if metric not in METRICS:
+                raise ValueError(f'不支持的指标: {metric}')
+        if 'time' in dimensions:
+            if granularity not in GRANULARITIES:
+                raise ValueError(f'不支持的时间粒度: {granularity}')
+        else:
+            granularity = None
+        normalized = []
+        for dim, values in sorted((filters or {}).items()):
+            if dim not in DIMENSIONS:
+                raise ValueError(f'不支持的过滤维度: {dim}')
+            normalized.append((dim, tuple(sorted(set(values)))))
+        return cls(dimensions, metrics, granularity, start, end, tuple(normalized))
+
+    def cache_key(self) -> str:
+        payload = repr((
+            self.dimensions, self.metrics, self.granularity,
+            _bound_key(self.start), _bound_key(self.end), self.filters,
+        ))
+        return hashlib.md5(payload.encode()).hexdigest()
+
+
+class OlapEngine:
+    """查询规划与执行。"""
+
+    CACHE_PREFIX = 'olap'
+    VERSION_KEY = 'olap:version'
+
+    # ------------------------------------------------------------------
+    # 缓存版本
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _version(cls) -> str:
+        version = cache.get(cls.VERSION_KEY)
+        if version is None:
+            version = uuid.uuid4().hex
+            cache.set(cls.VERSION_KEY, version, None)
+        return version
+
+    @classmethod
+    def invalidate(cls) -> None:
+        """事实变化后更换缓存版本；事务提交后再更换一次，避免提交前读到的旧结果被缓存。"""
+        def bump():
+            cache.set(cls.VERSION_KEY, uuid.uuid4().hex, None)
+
+        bump()
+        transaction.on_commit(bump)
+
+    # ------------------------------------------------------------------
+    # 规划
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _aligned(bound: DateBound, grain: str, is_end: bool) -> bool:
+        """日期边界是否落在汇总粒度的边界上。"""
+        if bound is None:
+            return True
+        if isinstance(bound, datetime):
+            return False
+        if grain == 'month':
+            return (bound + timedelta(days=1)).day == 1 if is_end else bound.day == 1
+        return True
+
+    @classmethod
+    def plan(cls, query: OlapQuery) -> Optional[Rollup]:
+        """选最粗的能回答查询的汇总层级；都不能回答时返回 None（查询事实表）。"""
+        needed = {dim for dim in query.dimensions if dim != 'time'} | {dim for dim, _ in query.filters}
+        for rollup in ROLLUPS:
+            if not needed.issubset(rollup.dimensions):
+                continue
+            if query.granularity and query.granularity not in GRAIN_GRANULARITIES[rollup.grain]:
+                continue
+            if not (cls._aligned(query.start, rollup.grain, False) and cls._aligned(query.end, rollup.grain, True)):
+                continue
+            return rollup
+        return None
+
+    # ------------------------------------------------------------------
+    # 执行
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def execute(cls, query: OlapQuery, rollup: Optional[Rollup]) -> List[dict]:
+        """在指定层级（None 为事实表）上执行查询，不经缓存。"""
+        if rollup:
+            queryset, date_field = SalesCube.objects.filter(rollup=rollup.name), 'period'
+        else:
+            queryset, date_field = SalesFact.objects.all(), 'date'
+
+        for dim, values in query.filters:
+            queryset = queryset.filter(**{f'{dim}__in': values})
+        for lookup, bound in (('gte', query.start), ('lte', query.end)):
+            if isinstance(bound, datetime):
+                queryset = queryset.filter(**{f'created_at__{lookup}': bound})
+            elif bound:
+                queryset = queryset.filter(**{f'{date_field}__{lookup}': bound})
+
+        groups = []
+        for dim in query.dimensions:
+            if dim == 'time':
+                queryset = queryset.annotate(time_period=GRANULARITIES[query.granularity](date_field))
+                groups.append('time_period')
+            else:
+                groups.append(dim)
+
+        measures = sorted({name for metric in query.metrics for name in METRICS[metric]})
+        sums = {f'total_{name}': Sum(name) for name in measures}
+        if groups:
+            rows = queryset.values(*groups).annotate(**sums).order_by(*groups)
+        else:
+            rows = [queryset.aggregate(**sums)]
+        return [cls._row(query, groups, row) for row in rows]
+
+    @staticmethod
+    def _row(query: OlapQuery, groups: List[str], row: dict) -> dict:
+        totals = {name: row.get(f'total_{name}') or 0 for name in MEASURES}
+        result = {}
+        for name in groups:
+            value = row[name]
+            if isinstance(value, datetime):
+                value = value.date()
+            # 空字符串表示维度缺失（如没有机票的订单）
+            result[name] = value if value != '' else None
+
+        def ratio(numerator, denominator):
+            if not denominator:
+                return Decimal('0.00')
+            return (Decimal(numerator) / denominator).quantize(Decimal('0.01'))
+
+        def money(value):
+            return Decimal(value).quantize(Decimal('0.01'))
+
+        values = {
+            'revenue': lambda: money(totals['amount']),
+            'order_count': lambda: int(totals['orders']),
+            'ticket_count': lambda: int(totals['tickets']),
+            'ticket_revenue': lambda: money(totals['price']),
+            'avg_price': lambda: ratio(totals['amount'], totals['orders']),
+            'avg_ticket_price': lambda: ratio(totals['price'], totals['tickets']),
+            'tickets_per_order': lambda: ratio(totals['tickets'], totals['orders']),
+        }
+        for metric in query.metrics:
+            result[metric] = values[metric]()
+        return result
+
+    @classmethod
+    def run(cls, query: OlapQuery) -> dict:
+        """
+        执行查询（优先读取缓存）。
+
+        Returns:
+            {'source': 使用的汇总层级名称或 'fact', 'rows': [...]}
+        """
+        # 本线程尚未提交的订单变化先写入事实表
+        SalesFactService.flush()
+        key = f'{cls.CACHE_PREFIX}:{cls._version()}:{query.cache_key()}'
+        result = cache.get(key)
+        if result is None:
+            rollup = cls.plan(query)
+            result = {'source': rollup.name if rollup else 'fact', 'rows': cls.execute(query, rollup)}
+            cache.set(key, result, getattr(settings, 'OLAP_CACHE_TIMEOUT', 300))
+        return result
+
+    @classmethod
+    def query(cls, dimensions: Iterable[str], metrics: Iterable[str], **kwargs) -> dict:
+        """OlapQuery.build 与 run 的简写。"""
+        return cls.run(OlapQuery.build(dimensions, metrics, **kwargs))
+
+
+class SalesFactService:
+    """事实表与预聚合表维护。"""
+
+    ORDER_FIELDS = ('id', 'user_id', 'created_at', 'status', 'payment_method', 'total_price')
+    TICKET_FIELDS = ('id', 'order_id', 'cabin_class', 'price', 'flight__departure_city', 'flight__arrival_city')
+
+    # ------------------------------------------------------------------
+    # 事实
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def order_facts(order: dict, tickets: List[dict], segment: str) -> List[SalesFact]:
+        """
+        订单的事实行：每张机票一行，没有机票时记一行。
+
+        Args:
+            order: 订单字段值（ORDER_FIELDS）
+            tickets: 订单的机票字段值（TICKET_FIELDS），按 id 排序
+            segment: 用户当前的分群
+        """
+        total = order['total_price'] or Decimal('0')
+        common = {
+            'order_id': order['id'],
+            'user_id': order['user_id'],
+            'created_at': order['created_at'],
+            'date': timezone.localtime(order['created_at']).date(),
+            'payment_method': order['payment_method'] or '',
+            'user_segment': segment,
+            'order_status': order['status'] or '',
+        }
+        if not tickets:
+            return [SalesFact(**common, orders=1, tickets=0, price=Decimal('0'), amount=total)]
+
+        share = (total / len(tickets)).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
+        facts = []
+        for index, ticket in enumerate(tickets):
+            facts.append(SalesFact(
+                **common,
+                ticket_id=ticket['id'],
+                departure_city=ticket['flight__departure_city'] or '',
+                arrival_city=ticket['flight__arrival_city'] or '',
+                cabin_class=ticket['cabin_class'] or '',
+                orders=1 if index == 0 else 0,
+                tickets=1,
+                price=ticket['price'] or Decimal('0'),
+                # 除不尽的部分记在第一行
+                amount=total - share * (len(tickets) - 1) if index == 0 else share,
+            ))
+        return facts
+
+    @classmethod
+    def _orders(cls, order_ids: Iterable[int]):
+        """订单字段值及用户当前的分群（关联用户消费统计）。"""
+        return Order.objects.filter(pk__in=order_ids).values(
+            *cls.ORDER_FIELDS, segment=F('user__analytics_stats__segment')
+        )
+
+    @classmethod
+    def build_facts(cls, order_ids: Iterable[int]) -> List[SalesFact]:
+        """从订单和机票生成事实行（两条查询）。"""
+        tickets = defaultdict(list)
+        for values in Ticket.objects.filter(order_id__in=order_ids).order_by('id').values(*cls.TICKET_FIELDS):
+            tickets[values['order_id']].append(values)
+
+        facts = []
+        for order in cls._orders(order_ids):
+            facts.extend(cls.order_facts(order, tickets[order['id']], order['segment'] or segment_for(0)))
+        return facts
+
+    @staticmethod
+    def _fact_key(fact: SalesFact) -> tuple:
+        return tuple(getattr(fact, name) for name in FACT_FIELDS)
+
+    # ------------------------------------------------------------------
+    # 预聚合
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def accumulate(facts: Iterable[SalesFact], sign: int, into: Dict[tuple, Counter]) -> None:
+        """把事实行按各汇总层级累加到 into[(层级, 时间段, 维度取值...)]。"""
+        for fact in facts:
+            for rollup in ROLLUPS:
+                period = fact.date if rollup.grain == 'day' else fact.date.replace(day=1)
+                dims = tuple(getattr(fact, name) if name in rollup.dimensions else '' for name in DIMENSIONS)
+                counter = into[(rollup.name, period) + dims]
+                for name in MEASURES:
+                    counter[name] += sign * getattr(fact, name)
+
+    @staticmethod
+    def _lookup(key: tuple) -> dict:
+        return {'rollup': key[0], 'period': key[1], **dict(zip(DIMENSIONS, key[2:]))}
+
+    @classmethod
+    def apply(cls, deltas: Dict[tuple, Counter]) -> int:
+        """写入预聚合增量（一条语句批量执行），删除减为零的行；返回写入的行数。"""
+        rows = [(key, measures) for key, measures in deltas.items() if any(measures.values())]
+        if not rows:
+            return 0
+        sql, columns = RollupService._upsert_sql(SalesCube, ('rollup', 'period') + DIMENSIONS, MEASURES)
+        period = SalesCube._meta.get_field('period')
+        params = []
+        for key, measures in rows:
+            values = {**cls._lookup(key), **{name: measures[name] for name in MEASURES}}
+            values['period'] = period.get_db_prep_save(key[1], connection)
+            params.append([values[name] for name in columns])
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+        if any(value < 0 for _, measures in rows for value in measures.values()):
+            SalesCube.objects.filter(
+                period__in={key[1] for key, _ in rows}, orders=0, tickets=0, price=0, amount=0
+            ).delete()
+        return len(rows)
+
+    # ------------------------------------------------------------------
+    # 增量维护
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def mark_dirty(cls, *order_ids: Optional[int]) -> None:
+        """
+        记录需要重新生成事实的订单，事务提交后批量处理。
+
+        同一事务内多次保存同一订单（如下单后逐张出票）只处理一次；事务回滚时
+        订单仍留在待处理集合中，之后重新生成时与数据库一致，不会写入变化。
+        """
+        order_ids = {pk for pk in order_ids if pk is not None}
+        if not order_ids:
+            return
+        _pending_orders().update(order_ids)
+        transaction.on_commit(cls.flush)
+
+    @classmethod
+    def flush(cls, chunk_size: int = 500) -> int:
+        """处理本线程待处理的订单，返回写入的预聚合行数。"""
+        # 事实行复制用户分群，先重新统计本线程待处理的用户（分群变化的用户的订单会加入待处理集合）
+        from .user_stats import UserStatsService
+        UserStatsService.flush()
+        pending = _pending_orders()
+        if not pending:
+            return 0
+        order_ids = sorted(pending)
+        pending.clear()
+        written = 0
+        try:
+            for offset in range(0, len(order_ids), chunk_size):
+                written += cls.refresh_orders(order_ids[offset:offset + chunk_size])
+        except Exception:
+            pending.update(order_ids)
+            raise
+        return written
+
+    @classmethod
+    def refresh_orders(cls, order_ids: Iterable[int]) -> int:
+        """
+        重新生成订单的事实行，把变化写入预聚合表（订单已删除时移除其事实）。
+
+        Returns:
+            写入的预聚合行数（事实没有变化时为 0）
+        """
+        order_ids = {pk for pk in order_ids if pk is not None}
+        if not order_ids:
+            return 0
+
+        def keys(facts):
+            return sorted((cls._fact_key(fact) for fact in facts), key=lambda key: key[1] or 0)
+
+        with transaction.atomic():
+            # 先锁定订单行：同一订单的并发刷新依次执行，后执行的基于先提交的事实计算差异，
+            # 不会把同一变化量重复累加到预聚合表
+            list(Order.objects.select_for_update().filter(pk__in=order_ids).order_by('pk').values_list('pk'))
+            existing = defaultdict(list)
+            for fact in SalesFact.objects.filter(order_id__in=order_ids):
+                existing[fact.order_id].append(fact)
+            current = defaultdict(list)
+            for fact in cls.build_facts(order_ids):
+                current[fact.order_id].append(fact)
+
+            changed = [pk for pk in order_ids if keys(existing[pk]) != keys(current[pk])]
+            if not changed:
+                return 0
+
+            deltas = defaultdict(Counter)
+            created = []
+            for pk in changed:
+                cls.accumulate(existing[pk], -1, deltas)
+                cls.accumulate(current[pk], 1, deltas)
+                created.extend(current[pk])
+            SalesFact.objects.filter(order_id__in=changed).delete()
+            SalesFact.objects.bulk_create(created, batch_size=500)
+            written = cls.apply(deltas)
+        OlapEngine.invalidate()
+        return written
+
+    # ------------------------------------------------------------------
+    # 全量重建
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def rebuild(cls, chunk_size: int = 2000) -> dict:
+        """
+        从订单和机票全量重建事实表和预聚合表。
+
+        用户分群读取用户消费统计，需先重建用户消费统计。
+
+        Returns:
+            统计信息（读取的订单数及写入的事实行、预聚合行数）
+        """
+        facts = []
+        cube = defaultdict(Counter)
+        order_ids = list(Order.objects.order_by('id').values_list('id', flat=True))
+        for offset in range(0, len(order_ids), chunk_size):
+            chunk = order_ids[offset:offset + chunk_size]
+            tickets = defaultdict(list)
+            for values in Ticket.objects.filter(order_id__in=chunk).order_by('id').values(*cls.TICKET_FIELDS):
+                tickets[values['order_id']].append(values)
+            for order in cls._orders(chunk):
+                order_facts = cls.order_facts(order, tickets[order['id']], order['segment'] or segment_for(0))
+                cls.accumulate(order_facts, 1, cube)
+                facts.extend(order_facts)
+
+        cube_rows = [
+            SalesCube(**cls._lookup(key), **measures)
+            for key, measures in cube.items() if any(measures.values())
+        ]
+        with transaction.atomic():
+            SalesFact.objects.all().delete()
+            SalesCube.objects.all().delete()
+            SalesFact.objects.bulk_create(facts, batch_size=500)
+            SalesCube.objects.bulk_create(cube_rows, batch_size=500)
+        OlapEngine.invalidate()
+
+        stats = {'orders': len(order_ids), 'fact_rows': len(facts), 'cube_rows': len(cube_rows)}
+        logger.info(f"销售事实表重建完成: {stats}")
+        return stats
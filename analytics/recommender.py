@@ -0,0 +1,563 @@
+"""
+航线推荐模型（离线训练的用户-用户协同过滤）。
+
+- 训练：从已支付订单按 (用户, 航线) 分组聚合隐式评分，构建 CSR 稀疏评分矩阵，
+  预先计算每个用户的向量模长和最相似的 K 个邻居，模型文件保存到磁盘。
+- 增量刷新：周期任务按水位线找出此后有支付订单或机票变化的用户，
+  只重算这些用户的评分行、邻居列表，并更新其他用户邻居列表中与他们相关的项。
+- 在线推荐：加载模型（文件变化时重新加载），查表取得用户的 K 个邻居并打分，
+  不访问数据库。
+
+增量刷新无法发现不修改时间戳的变化（如直接修改订单状态），
+由每日全量重新训练兜底。
+"""
+import copy
+import io
+import logging
+import math
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def implicit_rating(order_count, total_amount):
+    """
+    隐式评分，使用对数平滑避免极端值影响：
+    rating = log(1 + order_count) + 0.1 * log(1 + total_amount / 1000)
+
+    参数可以是数值或 NumPy 数组。
+    """
+    if isinstance(order_count, np.ndarray):
+        return np.log1p(order_count) + 0.1 * np.log1p(total_amount / 1000)
+    return math.log(1 + order_count) + 0.1 * math.log(1 + total_amount / 1000)
+
+
+def rating_rows(user_ids: Optional[Iterable[int]] = None):
+    """
+    按 (用户, 出发城市, 到达城市) 分组统计已支付订单的机票数和金额。
+
+    Args:
+        user_ids: 只统计这些用户，默认为全部用户
+
+    Returns:
+        [(user_id, departure_city, arrival_city, ticket_count, amount), ...]
+    """
+    from booking.models import Ticket
+
+    tickets = Ticket.objects.filter(order__status='paid')
+    if user_ids is not None:
+        tickets = tickets.filter(order__user_id__in=list(user_ids))
+    return list(
+        tickets.order_by().values_list(
+            'order__user_id', 'flight__departure_city', 'flight__arrival_city'
+        ).annotate(count=Count('id'), amount=Sum('price'))
+    )
+
+
+def valid_route_keys() -> set:
+    """有效航线集合（排除已取消航班）。"""
+    from flight.models import Flight
+
+    return {
+        f"{dep}->{arr}" for dep, arr in Flight.objects.exclude(
+            status='canceled'
+        ).order_by().values_list('departure_city', 'arrival_city').distinct()
+    }
+
+
+class RouteRatingModel:
+    """
+    用户-航线评分模型。
+
+    Attributes:
+        user_ids: 用户 ID，行号即用户下标
+        routes: 航线标识（"出发城市->到达城市"），列号即航线下标
+        indptr, indices, data: CSR 稀疏评分矩阵（每行的航线下标升序）
+        norms: 每个用户评分向量的模长
+        neighbor_idx, neighbor_sim: 每个用户最相似的 K 个邻居（下标，-1 表示空位）及相似度
+        valid_routes: 各航线当前是否有未取消的航班
+        watermark: 增量刷新的水位线，此前的订单和机票变化已计入模型
+    """
+
+    def __init__(self, user_ids, routes, indptr, indices, data, top_k=10, min_orders=1,
+                 valid_routes=None, watermark=None, neighbor_idx=None, neighbor_sim=None):
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.routes = list(routes)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.data = np.asarray(data, dtype=np.float64)
+        self.top_k = top_k
+        self.min_orders = min_orders
+        self.watermark = watermark
+        self.valid_routes = (
+            np.asarray(valid_routes, dtype=bool) if valid_routes is not None
+            else np.ones(len(self.routes), dtype=bool)
+        )
+        self._index()
+        if neighbor_idx is None:
+            self.compute_neighbors()
+        else:
+            self.neighbor_idx = np.asarray(neighbor_idx, dtype=np.int64)
+            self.neighbor_sim = np.asarray(neighbor_sim, dtype=np.float64)
+
+    # ------------------------------------------------------------------
+    # 构建
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[tuple], **kwargs) -> 'RouteRatingModel':
+        """由 rating_rows() 的结果构建模型。"""
+        user_ids, routes, indptr, indices, data = cls._to_csr(rows)
+        return cls(user_ids, routes, indptr, indices, data, **kwargs)
+
+    @staticmethod
+    def _to_csr(rows: Sequence[tuple], routes: Optional[List[str]] = None):
+        """将评分行转换为 CSR 矩阵，routes 为已有的航线列表（新航线追加在末尾）。"""
+        routes = list(routes or [])
+        route_index = {route: i for i, route in enumerate(routes)}
+        ratings: Dict[int, Dict[int, float]] = {}
+        for user_id, dep, arr, count, amount in rows:
+            route = f"{dep}->{arr}"
+            if route not in route_index:
+                route_index[route] = len(routes)
+                routes.append(route)
+            ratings.setdefault(user_id, {})[route_index[route]] = implicit_rating(
+                count, float(amount or 0)
+            )
+
+        user_ids = sorted(ratings)
+        indptr = [0]
+        indices, data = [], []
+        for user_id in user_ids:
+            for route_id in sorted(ratings[user_id]):
+                indices.append(route_id)
+                data.append(ratings[user_id][route_id])
+            indptr.append(len(indices))
+        return user_ids, routes, indptr, indices, data
+
+    def _index(self):
+        """计算模长、倒排表（航线 -> 用户）和用户下标。"""
+        n_users = len(self.user_ids)
+        counts = np.diff(self.indptr)
+        self.row_of = np.repeat(np.arange(n_users, dtype=np.int64), counts)
+        self.route_counts = counts
+        self.norms = np.sqrt(np.bincount(self.row_of, weights=self.data ** 2, minlength=n_users))
+
+        order = np.argsort(self.indices, kind='stable')
+        self.post_users = self.row_of[order]
+        self.post_data = self.data[order]
+        self.post_indptr = np.concatenate((
+            [0], np.cumsum(np.bincount(self.indices, minlength=len(self.routes)))
+        )).astype(np.int64)
+        self.user_index = {int(user_id): i for i, user_id in enumerate(self.user_ids)}
+        self.route_names = np.asarray(self.routes, dtype=str)
+
+    def similar_users(self, u: int, eligible_only: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        计算用户 u 与所有共同购买过航线的用户的余弦相似度。
+
+        Args:
+            u: 用户下标
+            eligible_only: 是否排除购买航线数低于 min_orders 的用户
+
+        Returns:
+            (用户下标数组, 相似度数组)，按相似度降序、下标升序排列
+        """
+        start, end = self.indptr[u], self.indptr[u + 1]
+        route_ids, weights = self.indices[start:end], self.data[start:end]
+        if not len(route_ids) or self.norms[u] == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        slices = [slice(self.post_indptr[r], self.post_indptr[r + 1]) for r in route_ids]
+        candidates = np.concatenate([self.post_users[s] for s in slices])
+        contributions = np.concatenate([self.post_data[s] * w for s, w in zip(slices, weights)])
+        users, inverse = np.unique(candidates, return_inverse=True)
+        dots = np.bincount(inverse, weights=contributions)
+
+        keep = (users != u) & (self.norms[users] > 0)
+        if eligible_only:
+            keep &= self.route_counts[users] >= self.min_orders
+        users, dots = users[keep], dots[keep]
+        # 舍入消除累加顺序带来的浮点误差，相似度相同的用户按下标排序
+        sims = np.round(np.clip(dots / (self.norms[u] * self.norms[users]), 0.0, 1.0), 12)
+        positive = sims > 0
+        users, sims = users[positive], sims[positive]
+        order = np.lexsort((users, -sims))
+        return users[order], sims[order]
+
+    def compute_neighbors(self, rows: Optional[Iterable[int]] = None) -> None:
+        """计算（或重算指定用户的）K 近邻列表。"""
+        n_users = len(self.user_ids)
+        if rows is None:
+            self.neighbor_idx = np.full((n_users, self.top_k), -1, dtype=np.int64)
+            self.neighbor_sim = np.zeros((n_users, self.top_k))
+            rows = range(n_users)
+        for u in rows:
+            users, sims = self.similar_users(u)
+            self._set_neighbors(u, users[:self.top_k], sims[:self.top_k])
+
+    def _set_neighbors(self, u, users, sims):
+        self.neighbor_idx[u] = -1
+        self.neighbor_sim[u] = 0
+        self.neighbor_idx[u, :len(users)] = users
+        self.neighbor_sim[u, :len(users)] = sims
+
+    # ------------------------------------------------------------------
+    # 增量更新
+    # ------------------------------------------------------------------
+
+    def update_users(self, rows: Sequence[tuple], user_ids: Iterable[int]) -> None:
+        """
+        用新的评分行替换指定用户的评分，并更新受影响的邻居列表。
+
+        指定用户以及原邻居列表包含这些用户的用户重新计算邻居列表；
+        其他用户的邻居列表与这些用户的新相似度合并，保留前 K 名。
+
+        Args:
+            rows: 这些用户的 rating_rows()
+            user_ids: 需要替换的用户 ID（无评分行的用户将被移除评分）
+        """
+        changed = set(int(user_id) for user_id in user_ids)
+        if not changed:
+            return
+
+        new_users, routes, new_indptr, new_indices, new_data = self._to_csr(rows, self.routes)
+
+        # 保留未变化用户的评分行，变化用户的评分行替换为新值
+        old_rows = {
+            int(user_id): (self.indices[self.indptr[i]:self.indptr[i + 1]],
+                           self.data[self.indptr[i]:self.indptr[i + 1]])
+            for i, user_id in enumerate(self.user_ids) if int(user_id) not in changed
+        }
+        fresh_rows = {
+            user_id: (np.asarray(new_indices[new_indptr[i]:new_indptr[i + 1]], dtype=np.int64),
+                      np.asarray(new_data[new_indptr[i]:new_indptr[i + 1]], dtype=np.float64))
+            for i, user_id in enumerate(new_users)
+        }
+        merged = {**old_rows, **fresh_rows}
+
+        previous_index = self.user_index
+        previous_neighbors = (self.neighbor_idx, self.neighbor_sim)
+        previous_ids = self.user_ids
+
+        user_ids_sorted = sorted(merged)
+        lengths = [len(merged[user_id][0]) for user_id in user_ids_sorted]
+        self.user_ids = np.asarray(user_ids_sorted, dtype=np.int64)
+        self.routes = routes
+        self.indptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        self.indices = (np.concatenate([merged[u][0] for u in user_ids_sorted])
+                        if user_ids_sorted else np.empty(0, dtype=np.int64))
+        self.data = (np.concatenate([merged[u][1] for u in user_ids_sorted])
+                     if user_ids_sorted else np.empty(0))
+        if len(self.valid_routes) < len(routes):
+            self.valid_routes = np.concatenate((
+                self.valid_routes, np.ones(len(routes) - len(self.valid_routes), dtype=bool)
+            ))
+        self._index()
+
+        # 未变化用户沿用原邻居列表（转换为新下标，移除变化用户）
+        n_users = len(self.user_ids)
+        self.neighbor_idx = np.full((n_users, self.top_k), -1, dtype=np.int64)
+        self.neighbor_sim = np.zeros((n_users, self.top_k))
+        old_idx, old_sim = previous_neighbors
+        remap = np.full(len(previous_ids), -1, dtype=np.int64)
+        for old_u, user_id in enumerate(previous_ids):
+            remap[old_u] = self.user_index.get(int(user_id), -1)
+        # 原邻居列表包含变化用户的，列表之外的候选未知，需要重算
+        recompute = set()
+        for user_id, u in self.user_index.items():
+            if user_id in changed or user_id not in previous_index:
+                recompute.add(u)
+                continue
+            old_u = previous_index[user_id]
+            row = [v for v in old_idx[old_u] if v >= 0]
+            if any(int(previous_ids[v]) in changed for v in row):
+                recompute.add(u)
+                continue
+            self._set_neighbors(u, remap[row], old_sim[old_u, :len(row)])
+        self.compute_neighbors(sorted(recompute))
+
+        # 其余用户的邻居列表只可能因变化用户进入前 K 名而改变
+        for user_id in changed:
+            u = self.user_index.get(user_id)
+            if u is None or self.route_counts[u] < self.min_orders:
+                continue
+            users, sims = self.similar_users(u, eligible_only=False)
+            for v, sim in zip(users, sims):
+                if v not in recompute:
+                    self._offer_neighbor(v, u, sim)
+
+    def _offer_neighbor(self, v, u, sim):
+        """若 u 的相似度能进入 v 的前 K 名，则插入 v 的邻居列表。"""
+        row_idx, row_sim = self.neighbor_idx[v], self.neighbor_sim[v]
+        filled = row_idx >= 0
+        if filled.all() and (sim < row_sim[-1] or (sim == row_sim[-1] and u > row_idx[-1])):
+            return
+        users = np.append(row_idx[filled], u)
+        sims = np.append(row_sim[filled], sim)
+        order = np.lexsort((users, -sims))[:self.top_k]
+        self._set_neighbors(v, users[order], sims[order])
+
+    # ------------------------------------------------------------------
+    # 推荐
+    # ------------------------------------------------------------------
+
+    def ratings_of(self, user_id: int) -> Dict[str, float]:
+        u = self.user_index.get(int(user_id))
+        if u is None:
+            return {}
+        start, end = self.indptr[u], self.indptr[u + 1]
+        return {self.routes[r]: float(w) for r, w in zip(self.indices[start:end], self.data[start:end])}
+
+    def neighbors_of(self, user_id: int, top_k: Optional[int] = None) -> List[Tuple[int, float]]:
+        """用户最相似的邻居 [(user_id, similarity), ...]，按相似度降序。"""
+        u = self.user_index.get(int(user_id))
+        if u is None:
+            return []
+        top_k = min(top_k or self.top_k, self.top_k)
+        return [
+            (int(self.user_ids[v]), float(sim))
+            for v, sim in zip(self.neighbor_idx[u, :top_k], self.neighbor_sim[u, :top_k]) if v >= 0
+        ]
+
+    def recommend(self, user_id: int, limit: int = 5, top_k: Optional[int] = None) -> List[Dict]:
+        """
+        基于 K 近邻的评分预测推荐航线。
+
+        预测评分为邻居评分的相似度加权平均，归一化到 [0, 1]；
+        排除用户已购买的航线和当前无有效航班的航线。
+        """
+        u = self.user_index.get(int(user_id))
+        if u is None:
+            return []
+        top_k = min(top_k or self.top_k, self.top_k)
+        neighbors = self.neighbor_idx[u, :top_k]
+        sims = self.neighbor_sim[u, :top_k]
+        valid = neighbors >= 0
+        neighbors, sims = neighbors[valid], sims[valid]
+        if not len(neighbors):
+            return []
+
+        spans = [(self.indptr[v], self.indptr[v + 1]) for v in neighbors]
+        route_ids = np.concatenate([self.indices[s:e] for s, e in spans])
+        weighted = np.concatenate([self.data[s:e] * sim for (s, e), sim in zip(spans, sims)])
+        similarity = np.concatenate([np.full(e - s, sim) for (s, e), sim in zip(spans, sims)])
+
+        n_routes = len(self.routes)
+        weighted_sum = np.bincount(route_ids, weights=weighted, minlength=n_routes)
+        similarity_sum = np.bincount(route_ids, weights=similarity, minlength=n_routes)
+
+        candidates = similarity_sum > 0
+        candidates[self.indices[self.indptr[u]:self.indptr[u + 1]]] = False
+        candidate_ids = np.flatnonzero(candidates)
+        if not len(candidate_ids):
+            return []
+        scores = np.round(weighted_sum[candidate_ids] / similarity_sum[candidate_ids], 12)
+        confidence = np.minimum(similarity_sum[candidate_ids], 1.0)
+
+        # 评分相同的航线按名称排序，与航线下标无关
+        order = np.lexsort((self.route_names[candidate_ids], -scores))
+        candidate_ids, scores, confidence = candidate_ids[order], scores[order], confidence[order]
+
+        # 归一化评分到 [0, 1] 范围，所有评分相同时统一为 1.0
+        score_range = scores[0] - scores[-1]
+        if score_range > 0:
+            scores = (scores - scores[-1]) / score_range
+        else:
+            scores = np.ones_like(scores)
+
+        recommendations: List[Dict] = []
+        for route_id, score, conf in zip(candidate_ids, scores, confidence):
+            if not self.valid_routes[route_id]:
+                continue
+            route = self.routes[route_id]
+            departure_city, arrival_city = route.split('->')
+            recommendations.append({
+                'route': route,
+                'departure_city': departure_city,
+                'arrival_city': arrival_city,
+                'predicted_score': round(float(score), 4),
+                'confidence': round(float(conf), 4),
+                'reason': '基于相似用户的购买偏好'
+            })
+            if len(recommendations) >= limit:
+                break
+        return recommendations
+
+    # ------------------------------------------------------------------
+    # 持久化
+    # ------------------------------------------------------------------
+
+    def save(self, path: str) -> None:
+        """保存模型文件（先写临时文件再替换，读取方不会读到不完整的文件）。"""
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            user_ids=self.user_ids,
+            routes=self.route_names,
+            indptr=self.indptr,
+            indices=self.indices,
+            data=self.data,
+            neighbor_idx=self.neighbor_idx,
+            neighbor_sim=self.neighbor_sim,
+            valid_routes=self.valid_routes,
+            meta=np.asarray([
+                str(self.top_k), str(self.min_orders),
+                self.watermark.isoformat() if self.watermark else '',
+            ]),
+        )
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'RouteRatingModel':
+        with np.load(path, allow_pickle=False) as archive:
+            top_k, min_orders, watermark = archive['meta'].tolist()
+            return cls(
+                archive['user_ids'], archive['routes'].tolist(),
+                archive['indptr'], archive['indices'], archive['data'],
+                top_k=int(top_k), min_orders=int(min_orders),
+                valid_routes=archive['valid_routes'],
+                watermark=datetime.fromisoformat(watermark) if watermark else None,
+                neighbor_idx=archive['neighbor_idx'],
+                neighbor_sim=archive['neighbor_sim'],
+            )
+
+
+class RouteRecommender:
+    """航线推荐模型的训练、增量刷新和加载。"""
+
+    _model: Optional[RouteRatingModel] = None
+    _loaded_mtime: Optional[int] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def model_path() -> Optional[str]:
+        return getattr(settings, 'RECOMMENDER_MODEL_PATH', None)
+
+    @staticmethod
+    def default_top_k() -> int:
+        return getattr(settings, 'RECOMMENDER_TOP_K', 20)
+
+    @staticmethod
+    def default_min_orders() -> int:
+        return getattr(settings, 'RECOMMENDER_MIN_ORDERS', 1)
+
+    @classmethod
+    def train(cls, top_k: Optional[int] = None, min_orders: Optional[int] = None,
+              save: bool = True) -> RouteRatingModel:
+        """
+        从全部已支付订单训练模型。
+
+        Args:
+            top_k: 每个用户保留的邻居数
+            min_orders: 参与相似度计算的用户最少购买航线数
+            save: 是否保存为当前模型（并写入模型文件）
+        """
+        watermark = timezone.now()
+        model = RouteRatingModel.from_rows(
+            rating_rows(),
+            top_k=top_k or cls.default_top_k(),
+            min_orders=min_orders or cls.default_min_orders(),
+            watermark=watermark,
+        )
+        cls._refresh_valid_routes(model)
+        if save:
+            cls._publish(model)
+        logger.info(f"航线推荐模型训练完成: {len(model.user_ids)} 个用户, {len(model.routes)} 条航线")
+        return model
+
+    @classmethod
+    def refresh(cls, model: Optional[RouteRatingModel] = None, save: bool = True) -> int:
+        """
+        增量刷新：重算水位线之后有支付订单或机票变化的用户。
+
+        Args:
+            model: 要刷新的模型，默认为当前模型；尚无模型时全量训练
+            save: 是否保存为当前模型
+
+        Returns:
+            刷新的用户数
+        """
+        from booking.models import Order
+
+        if model is None:
+            # 在副本上更新，在线请求继续使用当前模型直到新模型发布
+            model = copy.deepcopy(cls.get_model())
+        if model is None or model.watermark is None:
+            return len(cls.train(save=save).user_ids)
+
+        watermark = timezone.now()
+        changed = set(Order.objects.filter(
+            Q(paid_at__gte=model.watermark) | Q(tickets__updated_at__gte=model.watermark)
+        ).order_by().values_list('user_id', flat=True).distinct())
+        if changed:
+            model.update_users(rating_rows(changed), changed)
+        cls._refresh_valid_routes(model)
+        model.watermark = watermark
+        if save:
+            cls._publish(model)
+        if changed:
+            logger.info(f"航线推荐模型已增量刷新 {len(changed)} 个用户")
+        return len(changed)
+
+    @staticmethod
+    def _refresh_valid_routes(model: RouteRatingModel) -> None:
+        valid = valid_route_keys()
+        model.valid_routes = np.fromiter((route in valid for route in model.routes), dtype=bool,
+                                         count=len(model.routes))
+
+    @classmethod
+    def _publish(cls, model: RouteRatingModel) -> None:
+        path = cls.model_path()
+        with cls._lock:
+            if path:
+                model.save(path)
+                cls._loaded_mtime = os.stat(path).st_mtime_ns
+            cls._model = model
+
+    @classmethod
+    def get_model(cls) -> Optional[RouteRatingModel]:
+        """
+        获取当前模型，模型文件被其他进程更新后重新加载。
+
+        RECOMMENDER_SYNC_TRAINING 开启时（测试环境）每次重新训练，
+        保证推荐结果与当前数据一致。
+        """
+        if getattr(settings, 'RECOMMENDER_SYNC_TRAINING', False):
+            return cls.train(save=False)
+
+        path = cls.model_path()
+        if not path:
+            return cls._model
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return cls._model
+        with cls._lock:
+            if cls._model is None or mtime != cls._loaded_mtime:
+                try:
+                    cls._model = RouteRatingModel.load(path)
+                    cls._loaded_mtime = mtime
+                except (OSError, ValueError, KeyError):
+                    logger.exception("航线推荐模型文件加载失败")
+            return cls._model
+
+    @classmethod
+    def recommend(cls, user_id: int, limit: int = 5, top_k: Optional[int] = None) -> List[Dict]:
+        """在线推荐：只查表和打分，不访问数据库；模型尚未训练时返回空列表。"""
+        model = cls.get_model()
+        if model is None:
+            return []
+        return model.recommend(user_id, limit=limit, top_k=top_k)
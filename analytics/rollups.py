@@ -0,0 +1,237 @@
+"""
+分析汇总表维护服务。
+
+订单、机票和用户的每次变化都被拆分为若干"事实"（时间点、维度、指标增量），
+按本地时区的日期和小时累加到汇总表中。保存时比较加载时与保存后的事实，
+只写入差值；删除时减去原有事实。
+
+绕过模型信号的批量 UPDATE（如超时订单批量取消、机票批量作废）不改变汇总表
+使用的任何指标，无需处理；其他直接修改数据库的场景（如导入历史数据）
+需要执行 rebuild_rollups 命令全量重建。
+"""
+import logging
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import DailySalesRollup, DailyUserRollup, HourlySalesRollup
+
+logger = logging.getLogger(__name__)
+
+# 销售汇总表的维度字段（顺序与事实中的维度元组一致）
+DIMENSIONS = ('departure_city', 'arrival_city', 'cabin_class', 'payment_method')
+
+# 计算事实所需的订单和机票字段
+ORDER_FIELDS = ('created_at', 'paid_at', 'status', 'total_price', 'payment_method')
+TICKET_FIELDS = ('flight_id', 'cabin_class', 'status', 'price', 'created_at', 'updated_at')
+
+
+def _local_date(value):
+    return timezone.localtime(value).date()
+
+
+def _local_hour(value):
+    return timezone.localtime(value).replace(minute=0, second=0, microsecond=0)
+
+
+# 汇总表、时间桶字段及时间桶计算方式
+SALES_TABLES = (
+    (DailySalesRollup, 'date', _local_date),
+    (HourlySalesRollup, 'hour', _local_hour),
+)
+BUCKET_FIELDS = {model: field for model, field, _ in SALES_TABLES}
+
+Fact = Tuple[object, Tuple[str, str, str, str], Dict[str, object]]
+
+
+class RollupService:
+    """分析汇总表服务"""
+
+    # ------------------------------------------------------------------
+    # 事实
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def order_facts(values: Optional[dict]) -> Iterator[Fact]:
+        """
+        订单事实：订单指标不区分航线，只记录支付方式维度。
+
+        - 下单时间：订单数；已支付订单同时计入销售数和销售额
+        - 支付时间：已支付订单计入支付订单数和收入
+        """
+        if not values or values.get('created_at') is None:
+            return
+        dims = ('', '', '', values.get('payment_method') or '')
+        yield values['created_at'], dims, {'orders': 1}
+        if values['status'] == 'paid':
+            amount = values['total_price'] or 0
+            yield values['created_at'], dims, {'sales': 1, 'sales_amount': amount}
+            if values.get('paid_at') is not None:
+                yield values['paid_at'], dims, {'paid_orders': 1, 'revenue': amount}
+
+    @staticmethod
+    def ticket_facts(values: Optional[dict], route: Tuple[str, str]) -> Iterator[Fact]:
+        """
+        机票事实：按航线和舱位记录。
+
+        - 出票时间：出票数
+        - 已退票的机票按最后更新时间计入退票数和退票金额
+        """
+        if not values or values.get('created_at') is None:
+            return
+        dims = (route[0] or '', route[1] or '', values.get('cabin_class') or '', '')
+        yield values['created_at'], dims, {'tickets': 1}
+        if values['status'] == 'refunded' and values.get('updated_at') is not None:
+            yield values['updated_at'], dims, {
+                'refunds': 1, 'refund_amount': values['price'] or 0
+            }
+
+    @staticmethod
+    def accumulate(facts: Iterable[Fact], sign: int, into: Dict[tuple, Counter]) -> None:
+        """将事实按日、小时时间桶累加到 into 中（sign 为 1 或 -1）。"""
+        for moment, dims, measures in facts:
+            for model, _, bucket in SALES_TABLES:
+                counter = into[(model, bucket(moment), dims)]
+                for name, value in measures.items():
+                    counter[name] += sign * value
+
+    # ------------------------------------------------------------------
+    # 增量维护
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _upsert_sql(model, keys: Tuple[str, ...], changed: Tuple[str, ...]) -> Tuple[str, Tuple[str, ...]]:
+        """生成增量写入语句，返回 SQL 和插入列顺序。"""
+        measures = tuple(
+            field.attname for field in model._meta.concrete_fields
+            if not field.primary_key and field.attname not in keys
+        )
+        columns = keys + measures
+        qn = connection.ops.quote_name
+        table = qn(model._meta.db_table)
+        updates = ', '.join(f'{qn(name)} = {table}.{qn(name)} + excluded.{qn(name)}' for name in changed)
+        sql = (
+            f"INSERT INTO {table} ({', '.join(qn(name) for name in columns)}) "
+            f"VALUES ({', '.join(['%s'] * len(columns))}) "
+            f"ON CONFLICT ({', '.join(qn(name) for name in keys)}) DO UPDATE SET {updates}"
+        )
+        return sql, columns
+
+    @classmethod
+    def _upsert(cls, model, lookup: dict, changes: dict) -> None:
+        """
+        对汇总行的指标做原子增量更新，行不存在时创建。
+
+        使用 INSERT ... ON CONFLICT DO UPDATE（SQLite 3.24+ / PostgreSQL）一条语句完成，
+        并发写入同一行时由唯一约束保证不会重复创建，也不需要先查询再更新。
+        """
+        sql, columns = cls._upsert_sql(model, tuple(lookup), tuple(changes))
+        values = dict(lookup)
+        for name, field in ((name, model._meta.get_field(name)) for name in lookup):
+            values[name] = field.get_db_prep_save(values[name], connection)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [values.get(name, changes.get(name, 0)) for name in columns])
+
+    @classmethod
+    def apply(cls, deltas: Dict[tuple, Counter]) -> int:
+        """
+        写入汇总增量。
+
+        Returns:
+            写入的汇总行数
+        """
+        written = 0
+        for (model, bucket, dims), measures in deltas.items():
+            changes = {name: value for name, value in measures.items() if value}
+            if not changes:
+                continue
+            lookup = {BUCKET_FIELDS[model]: bucket, **dict(zip(DIMENSIONS, dims))}
+            cls._upsert(model, lookup, changes)
+            written += 1
+        return written
+
+    @classmethod
+    def record_order(cls, old: Optional[dict], new: Optional[dict]) -> int:
+        """订单从 old 变为 new（新建时 old 为 None，删除时 new 为 None）。"""
+        deltas = defaultdict(Counter)
+        cls.accumulate(cls.order_facts(old), -1, deltas)
+        cls.accumulate(cls.order_facts(new), 1, deltas)
+        return cls.apply(deltas)
+
+    @classmethod
+    def record_ticket(cls, old: Optional[dict], new: Optional[dict],
+                      old_route: Tuple[str, str] = ('', ''),
+                      new_route: Tuple[str, str] = ('', '')) -> int:
+        """机票从 old 变为 new（新建时 old 为 None，删除时 new 为 None）。"""
+        deltas = defaultdict(Counter)
+        cls.accumulate(cls.ticket_facts(old, old_route), -1, deltas)
+        cls.accumulate(cls.ticket_facts(new, new_route), 1, deltas)
+        return cls.apply(deltas)
+
+    @classmethod
+    def record_new_user(cls, date_joined, sign: int = 1) -> None:
+        """新用户注册（sign=1）或删除（sign=-1）。"""
+        if date_joined is None:
+            return
+        cls._upsert(DailyUserRollup, {'date': _local_date(date_joined)}, {'new_users': sign})
+
+    # ------------------------------------------------------------------
+    # 全量重建
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def rebuild(cls, chunk_size: int = 2000) -> dict:
+        """
+        从订单、机票和用户数据全量重建汇总表。
+
+        Args:
+            chunk_size: 每批读取的记录数
+
+        Returns:
+            统计信息（读取的订单、机票、用户数及写入的汇总行数）
+        """
+        from accounts.models import User
+        from booking.models import Order, Ticket
+
+        sales = defaultdict(Counter)
+        stats = {'orders': 0, 'tickets': 0, 'users': 0}
+
+        for values in Order.objects.values(*ORDER_FIELDS).iterator(chunk_size=chunk_size):
+            cls.accumulate(cls.order_facts(values), 1, sales)
+            stats['orders'] += 1
+
+        ticket_fields = TICKET_FIELDS + ('flight__departure_city', 'flight__arrival_city')
+        for values in Ticket.objects.values(*ticket_fields).iterator(chunk_size=chunk_size):
+            route = (values['flight__departure_city'], values['flight__arrival_city'])
+            cls.accumulate(cls.ticket_facts(values, route), 1, sales)
+            stats['tickets'] += 1
+
+        users = Counter()
+        for date_joined in User.objects.values_list('date_joined', flat=True).iterator(chunk_size=chunk_size):
+            users[_local_date(date_joined)] += 1
+            stats['users'] += 1
+
+        rows = defaultdict(list)
+        for (model, bucket, dims), measures in sales.items():
+            lookup = {BUCKET_FIELDS[model]: bucket, **dict(zip(DIMENSIONS, dims))}
+            rows[model].append(model(**lookup, **measures))
+
+        with transaction.atomic():
+            for model in (DailySalesRollup, HourlySalesRollup, DailyUserRollup):
+                model.objects.all().delete()
+            for model, objs in rows.items():
+                model.objects.bulk_create(objs, batch_size=500)
+            DailyUserRollup.objects.bulk_create(
+                [DailyUserRollup(date=date, new_users=count) for date, count in users.items()],
+                batch_size=500
+            )
+
+        stats['daily_rows'] = len(rows[DailySalesRollup])
+        stats['hourly_rows'] = len(rows[HourlySalesRollup])
+        stats['user_rows'] = len(users)
+        logger.info(f"分析汇总表重建完成: {stats}")
+        return stats
@@ -0,0 +1,194 @@
+"""
+航线指标引擎。
+
+按 (航线, 时间段) 在数据库中分组计算航线级指标，供航线分析、航线地图、
+航班可视化和多维分析共用：
+
+- 航班侧（一条分组查询）：航班数、座位数、已订座位数（capacity - available_seats）、
+  平均上座率（各航班上座率的平均值）
+- 机票侧（一条机票关联航班的分组查询）：已售座位数和实际票价收入，
+  只统计已支付或已完成订单中有效、已使用的机票
+
+时间段按航班起飞时间划分。结果按查询窗口（时间粒度、起止时间）缓存
+ROUTE_METRICS_CACHE_TIMEOUT 秒。
+"""
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple, Union
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, DecimalField, F, Sum, Value
+from django.db.models.functions import (
+    Coalesce,
+    NullIf,
+    TruncDay,
+    TruncMonth,
+    TruncQuarter,
+    TruncWeek,
+    TruncYear,
+)
+
+from booking.models import Ticket
+from flight.models import Flight
+
+# 计入已售座位和收入的机票、订单状态
+SOLD_TICKET_STATUSES = ('valid', 'used')
+PAID_ORDER_STATUSES = ('paid', 'completed')
+
+DateBound = Optional[Union[date, datetime]]
+RouteKey = Tuple[str, str, Optional[date]]
+
+
+class RouteMetricsEngine:
+    """
+    航线指标引擎。
+
+    每行指标包含 departure_city、arrival_city、period（时间段起点，period='all' 时为 None）、
+    flights、capacity、booked_seats、load_factor、sold_seats、revenue、avg_fare。
+    """
+
+    PERIODS = {
+        'all': None,
+        'day': TruncDay,
+        'week': TruncWeek,
+        'month': TruncMonth,
+        'quarter': TruncQuarter,
+        'year': TruncYear,
+    }
+
+    CACHE_PREFIX = 'route_metrics'
+
+    @classmethod
+    def _cache_key(cls, period: str, start: DateBound, end: DateBound) -> str:
+        bounds = ':'.join(value.isoformat() if value else '' for value in (start, end))
+        return f'{cls.CACHE_PREFIX}:{period}:{bounds}'
+
+    @staticmethod
+    def _filter_departure(queryset, field: str, start: DateBound, end: DateBound):
+        if start:
+            queryset = queryset.filter(**{f'{field}__gte': start})
+        if end:
+            queryset = queryset.filter(**{f'{field}__lte': end})
+        return queryset
+
+    @classmethod
+    def compute(cls, period: str = 'all', start: DateBound = None,
+                end: DateBound = None) -> Dict[RouteKey, dict]:
+        """不经缓存计算指标，返回 {(出发城市, 到达城市, 时间段): 指标}。"""
+        if period not in cls.PERIODS:
+            raise ValueError(f'不支持的时间粒度: {period}')
+        trunc = cls.PERIODS[period]
+
+        flights = cls._filter_departure(Flight.objects.all(), 'departure_time', start, end)
+        flight_groups = ['departure_city', 'arrival_city']
+        if trunc:
+            flights = flights.annotate(period=trunc('departure_time'))
+            flight_groups.append('period')
+        flight_rows = flights.values(*flight_groups).annotate(
+            flight_count=Count('id'),
+            total_capacity=Sum('capacity'),
+            total_booked=Sum(F('capacity') - F('available_seats')),
+            avg_load_factor=Avg(100.0 * (F('capacity') - F('available_seats')) / NullIf(F('capacity'), 0)),
+        ).order_by()
+
+        tickets = cls._filter_departure(
+            Ticket.objects.filter(status__in=SOLD_TICKET_STATUSES, order__status__in=PAID_ORDER_STATUSES),
+            'flight__departure_time', start, end
+        )
+        ticket_groups = ['flight__departure_city', 'flight__arrival_city']
+        if trunc:
+            tickets = tickets.annotate(period=trunc('flight__departure_time'))
+            ticket_groups.append('period')
+        ticket_rows = tickets.values(*ticket_groups).annotate(
+            sold_count=Count('id'),
+            ticket_revenue=Coalesce(
+                Sum('price'), Value(0), output_field=DecimalField(max_digits=14, decimal_places=2)
+            ),
+        ).order_by()
+
+        metrics = {}
+        for row in flight_rows:
+            key = (row['departure_city'], row['arrival_city'], cls._period_date(row.get('period')))
+            metrics[key] = {
+                'departure_city': row['departure_city'],
+                'arrival_city': row['arrival_city'],
+                'period': key[2],
+                'flights': row['flight_count'],
+                'capacity': row['total_capacity'] or 0,
+                'booked_seats': row['total_booked'] or 0,
+                'load_factor': round(row['avg_load_factor'] or 0, 2),
+                'sold_seats': 0,
+                'revenue': Decimal('0'),
+                'avg_fare': Decimal('0'),
+            }
+        for row in ticket_rows:
+            key = (row['flight__departure_city'], row['flight__arrival_city'], cls._period_date(row.get('period')))
+            item = metrics.get(key)
+            if item is None:
+                continue
+            item['sold_seats'] = row['sold_count']
+            item['revenue'] = row['ticket_revenue']
+            item['avg_fare'] = (row['ticket_revenue'] / row['sold_count']).quantize(Decimal('0.01'))
+        return metrics
+
+    @staticmethod
+    def _period_date(value) -> Optional[date]:
+        if isinstance(value, datetime):
+            return value.date()
+        return value
+
+    @classmethod
+    def get(cls, period: str = 'all', start: DateBound = None, end: DateBound = None) -> Dict[RouteKey, dict]:
+        """获取指标（优先读取缓存）。"""
+        key = cls._cache_key(period, start, end)
+        metrics = cache.get(key)
+        if metrics is None:
+            metrics = cls.compute(period, start, end)
+            cache.set(key, metrics, getattr(settings, 'ROUTE_METRICS_CACHE_TIMEOUT', 300))
+        return metrics
+
+    @classmethod
+    def routes(cls, start: DateBound = None, end: DateBound = None, order_by: str = 'flights',
+               limit: Optional[int] = None) -> List[dict]:
+        """
+        各航线在整个时间窗口内的指标。
+
+        Args:
+            order_by: 降序排序的指标，如 flights、revenue、load_factor
+            limit: 返回的航线数量
+        """
+        rows = sorted(cls.get('all', start, end).values(), key=lambda item: item[order_by], reverse=True)
+        return rows[:limit] if limit else rows
+
+    @classmethod
+    def route(cls, departure_city: str, arrival_city: str, period: str = 'month',
+              start: DateBound = None, end: DateBound = None) -> List[dict]:
+        """单条航线按时间段的指标，按时间排序。"""
+        rows = [
+            item for (dep, arr, _), item in cls.get(period, start, end).items()
+            if dep == departure_city and arr == arrival_city
+        ]
+        return sorted(rows, key=lambda item: item['period'] or date.min)
+
+    @classmethod
+    def summary(cls, start: DateBound = None, end: DateBound = None) -> dict:
+        """全部航线的汇总：航班数、平均上座率、已售座位数和收入。"""
+        rows = cls.get('all', start, end).values()
+        flights = sum(item['flights'] for item in rows)
+        weighted = sum(item['load_factor'] * item['flights'] for item in rows)
+        return {
+            'total_flights': flights,
+            'avg_load_factor': round(weighted / flights, 2) if flights else 0,
+            'sold_seats': sum(item['sold_seats'] for item in rows),
+            'revenue': sum((item['revenue'] for item in rows), Decimal('0')),
+        }
+
+    @classmethod
+    def city_traffic(cls, start: DateBound = None, end: DateBound = None) -> Dict[str, int]:
+        """各城市的进出港航班数。"""
+        traffic: Dict[str, int] = {}
+        for item in cls.get('all', start, end).values():
+            for city in (item['departure_city'], item['arrival_city']):
+                traffic[city] = traffic.get(city, 0) + item['flights']
+        return traffic
@@ -6,21 +6,18 @@
 """
 import csv
 import io
-from datetime import datetime, timedelta
-from statistics import mean, stdev
-from typing import Dict, List, Literal, Optional
-
-from django.db.models import Avg, Case, Count, F, Sum, Value, When
-from django.db.models.functions import (
-    TruncDay,
-    TruncMonth,
-    TruncQuarter,
-    TruncWeek,
-    TruncYear,
-)
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, List, Literal, Optional, Union
+
+import numpy as np
+from django.db.models import Avg, Count, Q, Sum
 
 from booking.models import Order, Ticket
 from flight.models import Flight
+from .olap import GRANULARITIES, OlapEngine
+from .route_metrics import RouteMetricsEngine
+from .trends import TrendSeries, group_average, moving_average, to_array, to_number
 
 
 class MultiDimensionAnalytics:
@@ -30,110 +27,78 @@ class MultiDimensionAnalytics:
     计算收入、订单数、平均票价、上座率等关键指标。
     """
 
-    TIME_DIMENSIONS = {
-        'day': TruncDay,
-        'week': TruncWeek,
-        'month': TruncMonth,
-        'quarter': TruncQuarter,
-        'year': TruncYear,
+    # 分析维度 -> ((事实表维度, 输出字段), ...)
+    DIMENSION_FIELDS = {
+        'route': (
+            ('departure_city', 'tickets__flight__departure_city'),
+            ('arrival_city', 'tickets__flight__arrival_city'),
+        ),
+        'cabin_class': (('cabin_class', 'tickets__cabin_class'),),
+        'user_segment': (('user_segment', 'user_segment'),),
     }
 
+    METRICS = ('revenue', 'order_count', 'avg_price', 'ticket_count')
+
     def analyze(
         self,
         dimensions: List[str],
         metrics: List[str],
-        start_date: Optional[datetime] = None,
-        end_date: Optional[datetime] = None,
+        start_date: Optional[Union[date, datetime]] = None,
+        end_date: Optional[Union[date, datetime]] = None,
         time_granularity: str = 'month',
     ) -> Dict:
         """
-        执行多维度分析 - 
+        执行多维度分析（查询销售 OLAP 层，只统计已支付订单）。
+
+        订单金额按机票分摊，订单数记在订单的第一张机票上，按航线、舱位分组时
+        各组之和等于订单总额和订单总数。
 
         Args:
             dimensions: 分析维度列表 ['time', 'route', 'cabin_class', 'user_segment']
-            metrics: 指标列表 ['revenue', 'order_count', 'avg_price', 'load_factor']
-            start_date: 开始日期
-            end_date: 结束日期
+            metrics: 指标列表 ['revenue', 'order_count', 'avg_price', 'ticket_count']
+            start_date: 开始日期（date 包含当天，datetime 为精确时间）
+            end_date: 结束日期（date 包含当天，datetime 为精确时间）
             time_granularity: 时间粒度 (day, week, month, quarter, year)
 
         Returns:
-            包含分析结果的字典
+            包含分析结果的字典，source 为回答查询的汇总层级
         """
-        queryset = Order.objects.filter(status='paid')
-
-        if start_date:
-            queryset = queryset.filter(created_at__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(created_at__lte=end_date)
-
-        # 构建分组字段和注解
-        group_fields = []
-        annotations = {}
-
+        olap_dimensions = []
+        outputs = {}
         for dim in dimensions:
             if dim == 'time':
-                trunc_func = self.TIME_DIMENSIONS.get(time_granularity, TruncMonth)
-                annotations['time_period'] = trunc_func('created_at')
-                group_fields.append('time_period')
-
-            elif dim == 'route':
-                # 需要通过 tickets 关联到 flight
-                group_fields.extend([
-                    'tickets__flight__departure_city',
-                    'tickets__flight__arrival_city'
-                ])
-
-            elif dim == 'cabin_class':
-                group_fields.append('tickets__cabin_class')
-
-            elif dim == 'user_segment':
-                annotations['user_segment'] = self._get_user_segment_case()
-                group_fields.append('user_segment')
-
-        metric_annotations = {}
-        if 'revenue' in metrics:
-            metric_annotations['revenue'] = Sum('total_price')
-        if 'order_count' in metrics:
-            metric_annotations['order_count'] = Count('id', distinct=True)
-        if 'avg_price' in metrics:
-            metric_annotations['avg_price'] = Avg('total_price')
-        if 'ticket_count' in metrics:
-            metric_annotations['ticket_count'] = Count('tickets__id')
-
-        if annotations:
-            queryset = queryset.annotate(**annotations)
-
-        if group_fields:
-            result = queryset.values(*group_fields).annotate(**metric_annotations)
-        else:
-            # 无分组时返回总计
-            result = [queryset.aggregate(**metric_annotations)]
+                olap_dimensions.append('time')
+                outputs['time_period'] = 'time_period'
+            for field, output in self.DIMENSION_FIELDS.get(dim, ()):
+                olap_dimensions.append(field)
+                outputs[field] = output
+
+        if time_granularity not in GRANULARITIES:
+            time_granularity = 'month'
+        result = OlapEngine.query(
+            olap_dimensions,
+            [metric for metric in metrics if metric in self.METRICS],
+            granularity=time_granularity,
+            start=start_date,
+            end=end_date,
+            filters={'order_status': ['paid']},
+        )
+        rows = [
+            {outputs.get(key, key): value for key, value in row.items()}
+            for row in result['rows']
+        ]
 
         # 格式化结果
-        formatted_data = self._format_result(list(result), dimensions)
+        formatted_data = self._format_result(rows, dimensions)
 
         return {
             'dimensions': dimensions,
             'metrics': metrics,
             'data': formatted_data,
             'total_records': len(formatted_data),
+            'source': result['source'],
         }
 
-    def _get_user_segment_case(self):
-        """
-        用户分群逻辑。
-
-        根据用户订单数量进行分群：
-        - VIP: 订单数 >= 10
-        - returning: 订单数 >= 2
-        - new: 其他
-        """
-        return Case(
-            When(user__orders__count__gte=10, then=Value('vip')),
-            When(user__orders__count__gte=2, then=Value('returning')),
-            default=Value('new'),
-        )
-
     def _format_result(self, data: List[Dict], dimensions: List[str]) -> List[Dict]:
         """格式化查询结果，处理日期时间等特殊类型。"""
         formatted = []
@@ -156,28 +121,17 @@ class MultiDimensionAnalytics:
         end_date: Optional[datetime] = None,
     ) -> Dict:
         """
+        计算起飞时间在指定范围内航班的平均上座率（由航线指标引擎按航线分组汇总）。
 
         Returns:
-            包含上座率数据的字典
+            包含上座率、航班数、已售座位数和机票收入的字典
         """
-        queryset = Flight.objects.all()
-
-        if start_date:
-            queryset = queryset.filter(departure_time__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(departure_time__lte=end_date)
-
-        # 计算上座率 = (总座位数 - 剩余座位数) / 总座位数 * 100
-        result = queryset.annotate(
-            load_factor=100 * (1 - F('available_seats') * 1.0 / F('capacity'))
-        ).aggregate(
-            avg_load_factor=Avg('load_factor'),
-            total_flights=Count('id'),
-        )
-
+        summary = RouteMetricsEngine.summary(start_date, end_date)
         return {
-            'avg_load_factor': round(result['avg_load_factor'] or 0, 2),
-            'total_flights': result['total_flights'],
+            'avg_load_factor': summary['avg_load_factor'],
+            'total_flights': summary['total_flights'],
+            'sold_seats': summary['sold_seats'],
+            'revenue': summary['revenue'],
         }
 
 
@@ -188,19 +142,22 @@ class PivotTableEngine:
     支持动态配置行维度、列维度和聚合方式，生成透视表数据并导出为 CSV。
     """
 
-    # 支持的聚合函数映射
-    AGG_FUNCS = {
-        'sum': Sum,
-        'count': Count,
-        'avg': Avg,
+    # 值指标 -> {聚合方式: OLAP 指标}
+    VALUE_METRICS = {
+        'total_price': {'sum': 'revenue', 'count': 'order_count', 'avg': 'avg_price'},
+        'revenue': {'sum': 'revenue', 'count': 'order_count', 'avg': 'avg_price'},
+        'ticket_price': {'sum': 'ticket_revenue', 'count': 'ticket_count', 'avg': 'avg_ticket_price'},
+        'ticket_count': {'sum': 'ticket_count', 'count': 'ticket_count', 'avg': 'tickets_per_order'},
     }
 
-    # 支持的值指标字段映射
-    VALUE_FIELDS = {
-        'total_price': 'total_price',
-        'revenue': 'total_price',
-        'ticket_price': 'tickets__price',
-        'ticket_count': 'tickets__id',
+    # 维度名称 -> 事实表维度
+    DIMENSION_FIELDS = {
+        'departure_city': 'departure_city',
+        'arrival_city': 'arrival_city',
+        'cabin_class': 'cabin_class',
+        'payment_method': 'payment_method',
+        'user_segment': 'user_segment',
+        'status': 'order_status',
     }
 
     def generate(
@@ -209,42 +166,46 @@ class PivotTableEngine:
         col_dimensions: List[str],
         value_metric: str = 'total_price',
         aggregation: Literal['sum', 'count', 'avg'] = 'sum',
-        start_date: Optional[datetime] = None,
-        end_date: Optional[datetime] = None,
+        start_date: Optional[Union[date, datetime]] = None,
+        end_date: Optional[Union[date, datetime]] = None,
     ) -> Dict:
         """
-        生成透视表数据 - 
+        生成透视表数据（查询销售 OLAP 层，只统计已支付订单）。
 
         Args:
-            value_metric: 值指标字段
-            start_date: 开始日期
-            end_date: 结束日期
+            value_metric: 值指标 (total_price, revenue, ticket_price, ticket_count)
+            aggregation: 聚合方式 (sum, count, avg)
+            start_date: 开始日期（date 包含当天，datetime 为精确时间）
+            end_date: 结束日期（date 包含当天，datetime 为精确时间）
 
         Returns:
-        """
-        queryset = Order.objects.filter(status='paid')
+            包含行列维度、聚合方式和透视表数据的字典
 
-        if start_date:
-            queryset = queryset.filter(created_at__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(created_at__lte=end_date)
-
-        # 获取聚合函数
-        agg_func = self.AGG_FUNCS.get(aggregation, Sum)
-
-        # 获取值字段
-        value_field = self.VALUE_FIELDS.get(value_metric, value_metric)
+        Raises:
+            ValueError: 不支持的维度、值指标或聚合方式
+        """
+        if value_metric not in self.VALUE_METRICS:
+            raise ValueError(f'不支持的值指标: {value_metric}')
+        if aggregation not in self.VALUE_METRICS[value_metric]:
+            raise ValueError(f'不支持的聚合方式: {aggregation}')
+        metric = self.VALUE_METRICS[value_metric][aggregation]
 
         # 映射维度字段
         mapped_row_dims = self._map_dimensions(row_dimensions)
         mapped_col_dims = self._map_dimensions(col_dimensions)
 
-        # 所有维度
-        all_dimensions = mapped_row_dims + mapped_col_dims
+        result = OlapEngine.query(
+            mapped_row_dims + mapped_col_dims,
+            [metric],
+            start=start_date,
+            end=end_date,
+            filters={'order_status': ['paid']},
+        )
+        raw_data = [{**row, 'value': row[metric]} for row in result['rows']]
 
-        if not all_dimensions:
+        if not mapped_row_dims and not mapped_col_dims:
             # 无维度时返回总计
-            total = queryset.aggregate(value=agg_func(value_field))
+            total = raw_data[0]['value'] if raw_data else 0
             return {
                 'row_dimensions': row_dimensions,
                 'col_dimensions': col_dimensions,
@@ -252,23 +213,11 @@ class PivotTableEngine:
                 'data': {
                     'rows': [['Total']],
                     'columns': [['Total']],
-                    'matrix': {"(('Total',), ('Total',))": total.get('value', 0)},
+                    'matrix': {"(('Total',), ('Total',))": float(total)},
                 },
             }
 
-        # 执行聚合查询
-        if aggregation == 'count':
-            result = queryset.values(*all_dimensions).annotate(
-                value=agg_func(value_field, distinct=True)
-            )
-        else:
-            result = queryset.values(*all_dimensions).annotate(
-                value=agg_func(value_field)
-            )
-
-        pivot_data = self._build_pivot_structure(
-            list(result), mapped_row_dims, mapped_col_dims
-        )
+        pivot_data = self._build_pivot_structure(raw_data, mapped_row_dims, mapped_col_dims)
 
         return {
             'row_dimensions': row_dimensions,
@@ -278,15 +227,13 @@ class PivotTableEngine:
         }
 
     def _map_dimensions(self, dimensions: List[str]) -> List[str]:
-        """将用户友好的维度名称映射到数据库字段。"""
-        mapping = {
-            'departure_city': 'tickets__flight__departure_city',
-            'arrival_city': 'tickets__flight__arrival_city',
-            'cabin_class': 'tickets__cabin_class',
-            'payment_method': 'payment_method',
-            'status': 'status',
-        }
-        return [mapping.get(dim, dim) for dim in dimensions]
+        """将用户友好的维度名称映射到事实表维度。"""
+        mapped = []
+        for dim in dimensions:
+            if dim not in self.DIMENSION_FIELDS:
+                raise ValueError(f'不支持的维度: {dim}')
+            mapped.append(self.DIMENSION_FIELDS[dim])
+        return mapped
 
     def _build_pivot_structure(
         self,
@@ -360,10 +307,178 @@ class PivotTableEngine:
 
 
 
+class DimensionPivotEngine:
+    """
+    单维度透视聚合引擎。
+
+    每个维度、指标组合只执行固定次数的分组查询（见 query_budget），
+    再在内存中按维度合并，查询次数不随城市、支付方式的数量增长。
+    """
+
+    DIMENSIONS = ['city', 'paymentMethod']
+    METRICS = ['revenue', 'orders', 'averageValue', 'refundRate']
+
+    # 保留两位小数的指标
+    ROUNDED_METRICS = ('revenue', 'averageValue')
+
+    @classmethod
+    def query_budget(cls, dimension: str, metric: str) -> int:
+        """维度、指标组合的查询次数上限，与数据量无关。"""
+        if dimension == 'city':
+            # 航线航班数 + 机票分组（未知指标不查询机票）
+            return 2 if metric in cls.METRICS else 1
+        # 支付方式订单分组；退票率另需一次机票分组
+        return 2 if metric == 'refundRate' else 1
+
+    def aggregate(self, dimension: str, metric: str) -> List[Dict]:
+        """
+        按维度聚合指标。
+
+        Args:
+            dimension: 维度（city、paymentMethod）
+            metric: 指标（revenue、orders、averageValue、refundRate）
+
+        Returns:
+            透视数据列表，每项包含 dimension、value、percentage 及维度相关的计数字段
+        """
+        if dimension == 'city':
+            pivot_data = self._aggregate_by_city(metric)
+        elif dimension == 'paymentMethod':
+            pivot_data = self._aggregate_by_payment_method(metric)
+        else:
+            raise ValueError(f'不支持的维度: {dimension}')
+
+        for item in pivot_data:
+            if metric in self.ROUNDED_METRICS:
+                item['value'] = round(item['value'], 2)
+
+        total_value = sum(item['value'] for item in pivot_data)
+        for item in pivot_data:
+            if total_value > 0:
+                item['percentage'] = round(item['value'] / total_value * 100, 2)
+            else:
+                item['percentage'] = 0
+        return pivot_data
+
+    @staticmethod
+    def _refund_rate(refunded: int, total: int) -> float:
+        if not total:
+            return 0
+        return round(refunded / total * 100, 2)
+
+    def _aggregate_by_city(self, metric: str) -> List[Dict]:
+        """
+        按城市聚合：城市相关的机票为出发或到达该城市的航班上的机票。
+
+        机票、航班先按航线分组，再合并到航线两端的城市；
+        订单数和客单价需要按订单去重，使用出发城市、到达城市两组 (城市, 订单) 的 UNION。
+        """
+        flight_counts = defaultdict(int)
+        route_flights = Flight.objects.order_by().values_list(
+            'departure_city', 'arrival_city'
+        ).annotate(count=Count('id'))
+        for departure, arrival, count in route_flights:
+            for city in {departure, arrival}:
+                flight_counts[city] += count
+
+        values = defaultdict(int)
+        if metric in ('revenue', 'refundRate'):
+            refunded = defaultdict(int)
+            routes = Ticket.objects.order_by().values_list(
+                'flight__departure_city', 'flight__arrival_city'
+            ).annotate(
+                revenue=Sum('price'),
+                tickets=Count('id'),
+                refunded=Count('id', filter=Q(status='refunded')),
+            )
+            for departure, arrival, revenue, tickets, refunded_tickets in routes:
+                for city in {departure, arrival}:
+                    if metric == 'revenue':
+                        values[city] += revenue or 0
+                    else:
+                        values[city] += tickets
+                        refunded[city] += refunded_tickets
+            if metric == 'refundRate':
+                values = {city: self._refund_rate(refunded[city], total) for city, total in values.items()}
+
+        elif metric in ('orders', 'averageValue'):
+            tickets = Ticket.objects.order_by()
+            fields = ['order_id']
+            if metric == 'averageValue':
+                tickets = tickets.filter(order__status='paid')
+                fields.append('order__total_price')
+            city_orders = tickets.values_list('flight__departure_city', *fields).union(
+                tickets.values_list('flight__arrival_city', *fields)
+            )
+            amounts = defaultdict(int)
+            for city, _, *amount in city_orders:
+                values[city] += 1
+                if amount:
+                    amounts[city] += amount[0] or 0
+            if metric == 'averageValue':
+                values = {city: amounts[city] / count for city, count in values.items()}
+
+        return [
+            {
+                'dimension': city,
+                'value': float(values.get(city, 0)) if metric in self.ROUNDED_METRICS else values.get(city, 0),
+                'flight_count': count,
+            }
+            for city, count in flight_counts.items()
+        ]
+
+    def _aggregate_by_payment_method(self, metric: str) -> List[Dict]:
+        """按支付方式聚合已支付订单。"""
+        paid_orders = Order.objects.filter(
+            status='paid',
+            payment_method__isnull=False
+        ).exclude(payment_method='')
+
+        methods = paid_orders.order_by().values_list('payment_method').annotate(
+            revenue=Sum('total_price'),
+            orders=Count('id'),
+            average=Avg('total_price'),
+        )
+
+        refund_stats = {}
+        if metric == 'refundRate':
+            refund_stats = {
+                method: self._refund_rate(refunded, total)
+                for method, total, refunded in Ticket.objects.filter(
+                    order__in=paid_orders
+                ).order_by().values_list('order__payment_method').annotate(
+                    tickets=Count('id'),
+                    refunded=Count('id', filter=Q(status='refunded')),
+                )
+            }
+
+        pivot_data = []
+        for method, revenue, orders, average in methods:
+            if metric == 'revenue':
+                value = float(revenue or 0)
+            elif metric == 'orders':
+                value = orders
+            elif metric == 'averageValue':
+                value = float(average) if average else 0
+            elif metric == 'refundRate':
+                value = refund_stats.get(method, 0)
+            else:
+                value = 0
+            pivot_data.append({
+                'dimension': method,
+                'value': value,
+                'order_count': orders,
+            })
+        return pivot_data
+
+
 class TrendAnalyzer:
     """
 
     提供移动平均计算、同比分析、异常检测和季节性模式识别功能。
+
+    逐行数据接口：每个方法从数据行中取出一列转为 NumPy 数组，由趋势引擎
+    （见 analytics.trends）整列计算后再写回各行。按天的完整分析见 TrendsView。
     """
 
     def calculate_moving_average(
@@ -377,7 +492,7 @@ class TrendAnalyzer:
         Args:
             data: 时间序列数据列表
             value_field: 值字段名
-            window_size: 窗口大小
+            window_size: 窗口大小（序列开头窗口不足时使用已有数据）
 
         Returns:
             包含移动平均值的数据列表
@@ -385,32 +500,11 @@ class TrendAnalyzer:
         if not data:
             return []
 
-        # 确保值为数字类型
-        def to_number(val):
-            if val is None:
-                return 0
-            try:
-                return float(val)
-            except (ValueError, TypeError):
-                return 0
-
-        values = [to_number(d.get(value_field, 0)) for d in data]
-        moving_averages = []
-
-        for i in range(len(values)):
-            if i < window_size - 1:
-                # 窗口不足时使用可用数据
-                window = values[:i + 1]
-            else:
-                window = values[i - window_size + 1:i + 1]
-
-            ma = sum(window) / len(window) if window else 0
-            moving_averages.append({
-                **data[i],
-                'moving_average': round(ma, 2),
-            })
-
-        return moving_averages
+        averages = moving_average(to_array(d.get(value_field, 0) for d in data), window_size)
+        return [
+            {**item, 'moving_average': round(average, 2)}
+            for item, average in zip(data, averages.tolist())
+        ]
 
     def year_over_year(
         self,
@@ -428,15 +522,6 @@ class TrendAnalyzer:
         Returns:
             包含同比增长率的数据列表
         """
-        # 辅助函数：确保值为数字类型
-        def to_number(val):
-            if val is None:
-                return 0
-            try:
-                return float(val)
-            except (ValueError, TypeError):
-                return 0
-
         # 构建上年数据映射
         prev_map = {}
         for d in previous_data:
@@ -473,6 +558,7 @@ class TrendAnalyzer:
         """
 
         使用 Z-score 方法，标记偏离均值超过 threshold 个标准差的数据点。
+        Z-score 保留两位小数后再与阈值比较，判断和返回的值一致。
 
         Args:
             data: 数据列表
@@ -485,55 +571,14 @@ class TrendAnalyzer:
         if not data:
             return []
 
-        # 辅助函数：确保值为数字类型
-        def to_number(val):
-            if val is None:
-                return 0
-            try:
-                return float(val)
-            except (ValueError, TypeError):
-                return 0
-
-        values = [to_number(d.get(value_field, 0)) for d in data]
-
-        if len(values) < 2:
-            # 数据点不足，无法计算标准差
-            return [{
-                **item,
-                'z_score': 0.0,
-                'is_anomaly': False,
-                'confidence': 'low',
-            } for item in data]
-
-        avg = mean(values)
-        std = stdev(values) if len(values) > 1 else 0
-
-        result = []
-        for item in data:
-            value = to_number(item.get(value_field, 0))
-
-            # 计算 Z-score 并四舍五入，确保判断和存储使用一致的值
-            raw_z_score = (value - avg) / std if std > 0 else 0.0
-            z_score = round(raw_z_score, 2)
-            
-            is_anomaly = abs(z_score) > threshold
-
-            # 使用四舍五入后的 z_score 确保一致性
-            if abs(z_score) > 3:
-                confidence = 'high'
-            elif abs(z_score) > 2:
-                confidence = 'medium'
-            else:
-                confidence = 'low'
-
-            result.append({
-                **item,
-                'z_score': z_score,
-                'is_anomaly': is_anomaly,
-                'confidence': confidence,
-            })
-
-        return result
+        # 少于两个数据点时无法计算标准差，Z-score 全为 0
+        flags = TrendSeries(d.get(value_field, 0) for d in data).anomalies(threshold)
+        return [
+            {**item, 'z_score': z_score, 'is_anomaly': is_anomaly, 'confidence': confidence}
+            for item, z_score, is_anomaly, confidence in zip(
+                data, flags['z_score'].tolist(), flags['is_anomaly'].tolist(), flags['confidence'].tolist()
+            )
+        ]
 
     def identify_seasonal_patterns(
         self,
@@ -545,71 +590,31 @@ class TrendAnalyzer:
         按月份分组计算平均值，识别高峰和低谷月份。
 
         Args:
-            data: 数据列表
+            data: 数据列表（period 为日期对象或 YYYY-MM、YYYY-MM-DD 格式的字符串）
             value_field: 值字段名
 
         Returns:
             季节性模式分析结果
         """
-        if not data:
-            return {
-                'pattern': {},
-                'peak_month': None,
-                'low_month': None,
-            }
-
-        # 辅助函数：确保值为数字类型
-        def to_number(val):
-            if val is None:
-                return 0
-            try:
-                return float(val)
-            except (ValueError, TypeError):
-                return 0
-
-        monthly_data = {}
-
+        months, values = [], []
         for item in data:
-            period = item.get('period')
-            if period:
-                # 尝试从不同格式提取月份
-                month = None
-                if hasattr(period, 'month'):
-                    month = period.month
-                elif isinstance(period, str):
-                    try:
-                        # 尝试解析 YYYY-MM 或 YYYY-MM-DD 格式
-                        if len(period) >= 7:
-                            month = int(period[5:7])
-                    except (ValueError, IndexError):
-                        pass
-
-                if month is not None:
-                    if month not in monthly_data:
-                        monthly_data[month] = []
-                    value = to_number(item.get(value_field, 0))
-                    monthly_data[month].append(value)
-
-        # 计算每月平均值
-        seasonal_pattern = {}
-        for month, values in monthly_data.items():
-            seasonal_pattern[month] = {
-                'average': round(mean(values), 2) if values else 0,
-                'sample_count': len(values),
-            }
+            month = self._period_month(item.get('period'))
+            if month is not None:
+                months.append(month)
+                values.append(item.get(value_field, 0))
+
+        pattern = group_average(np.array(months, dtype=np.int64), to_array(values))
+        seasonal_pattern = {
+            month: {'average': average, 'sample_count': count}
+            for month, average, count in zip(pattern['keys'], pattern['average'], pattern['sample_count'])
+        }
 
         # 找出高峰和低谷月份
         peak_month = None
         low_month = None
         if seasonal_pattern:
-            peak_month = max(
-                seasonal_pattern.keys(),
-                key=lambda m: seasonal_pattern[m]['average']
-            )
-            low_month = min(
-                seasonal_pattern.keys(),
-                key=lambda m: seasonal_pattern[m]['average']
-            )
+            peak_month = max(seasonal_pattern, key=lambda m: seasonal_pattern[m]['average'])
+            low_month = min(seasonal_pattern, key=lambda m: seasonal_pattern[m]['average'])
 
         return {
             'pattern': seasonal_pattern,
@@ -617,12 +622,29 @@ class TrendAnalyzer:
             'low_month': low_month,
         }
 
+    @staticmethod
+    def _period_month(period) -> Optional[int]:
+        """从日期对象或 YYYY-MM(-DD) 字符串中取出月份。"""
+        if not period:
+            return None
+        if hasattr(period, 'month'):
+            return period.month
+        if isinstance(period, str) and len(period) >= 7:
+            try:
+                month = int(period[5:7])
+            except ValueError:
+                return None
+            return month if 1 <= month <= 12 else None
+        return None
+
 
 
 import math
 from collections import defaultdict
 from typing import Dict, List, Optional, Set, Tuple
 
+from .recommender import RouteRecommender, implicit_rating, rating_rows, valid_route_keys
+
 
 class CollaborativeFilteringEngine:
     """
@@ -630,6 +652,9 @@ class CollaborativeFilteringEngine:
 
     基于用户-用户协同过滤算法，通过分析用户历史订票行为，
     找到相似用户群体，并基于相似用户的购买记录为目标用户推荐航线。
+
+    在线推荐使用离线训练的模型（见 analytics.recommender），
+    相似度门槛 min_orders 在训练时生效（RECOMMENDER_MIN_ORDERS）。
     """
 
     def __init__(self, min_orders: int = 1, top_k_users: int = 10):
@@ -660,7 +685,7 @@ class CollaborativeFilteringEngine:
         Returns:
             隐式评分值
         """
-        return math.log(1 + order_count) + 0.1 * math.log(1 + total_amount / 1000)
+        return implicit_rating(order_count, total_amount)
 
     def build_user_route_matrix(self) -> Dict[int, Dict[str, float]]:
         """
@@ -671,38 +696,12 @@ class CollaborativeFilteringEngine:
             {user_id: {route_key: implicit_rating}}
             route_key 格式: "departure_city->arrival_city"
         """
-        # 查询已支付订单的航线数据
-        orders = Order.objects.filter(
-            status='paid'
-        ).select_related('user').prefetch_related(
-            'tickets__flight'
-        )
-
-        # 聚合用户-航线数据
-        user_route_data: Dict[int, Dict[str, Dict[str, float]]] = defaultdict(
-            lambda: defaultdict(lambda: {'count': 0, 'amount': 0.0})
-        )
-
-        for order in orders:
-            user_id = order.user_id
-            for ticket in order.tickets.all():
-                flight = ticket.flight
-                route_key = f"{flight.departure_city}->{flight.arrival_city}"
-                user_route_data[user_id][route_key]['count'] += 1
-                user_route_data[user_id][route_key]['amount'] += float(ticket.price)
-
-        # 计算隐式评分
-        user_route_matrix: Dict[int, Dict[str, float]] = {}
-        for user_id, routes in user_route_data.items():
-            user_route_matrix[user_id] = {}
-            for route_key, data in routes.items():
-                rating = self.calculate_implicit_rating(
-                    data['count'],
-                    data['amount']
-                )
-                user_route_matrix[user_id][route_key] = rating
-
-        return user_route_matrix
+        user_route_matrix: Dict[int, Dict[str, float]] = defaultdict(dict)
+        for user_id, dep, arr, count, amount in rating_rows():
+            user_route_matrix[user_id][f"{dep}->{arr}"] = self.calculate_implicit_rating(
+                count, float(amount or 0)
+            )
+        return dict(user_route_matrix)
 
     def calculate_user_similarity(
         self,
@@ -795,82 +794,9 @@ class CollaborativeFilteringEngine:
             - confidence: 置信度
             - reason: 推荐理由
         """
-        # 构建用户-航线矩阵
-        matrix = self.build_user_route_matrix()
-
-        if user_id not in matrix:
-            # 用户无历史记录，返回空列表（由调用方处理冷启动）
-            return []
-
-        # 获取用户已购买的航线
-        user_routes: Set[str] = set(matrix[user_id].keys())
-
-        similar_users = self.calculate_user_similarity(user_id, matrix)
-
-        # 限制相似用户数量
-        top_similar_users = similar_users[:self.top_k_users]
-
-        if not top_similar_users:
-            return []
-
-        # 基于相似用户预测评分
-        route_scores: Dict[str, Dict[str, float]] = defaultdict(
-            lambda: {'weighted_sum': 0.0, 'similarity_sum': 0.0}
-        )
-
-        for other_user_id, similarity in top_similar_users:
-            other_routes = matrix[other_user_id]
-            for route, rating in other_routes.items():
-                if route not in user_routes:
-                    route_scores[route]['weighted_sum'] += similarity * rating
-                    route_scores[route]['similarity_sum'] += similarity
-
-        # 计算预测评分
-        predictions: List[Tuple[str, float, float]] = []
-        for route, scores in route_scores.items():
-            if scores['similarity_sum'] > 0:
-                predicted_score = scores['weighted_sum'] / scores['similarity_sum']
-                confidence = min(scores['similarity_sum'], 1.0)
-                predictions.append((route, predicted_score, confidence))
-
-        predictions.sort(key=lambda x: x[1], reverse=True)
-
-        # 归一化评分到 [0, 1] 范围
-        if predictions:
-            max_score = predictions[0][1]  # 最高分（已排序）
-            min_score = predictions[-1][1]  # 最低分
-            score_range = max_score - min_score
-            if score_range > 0:
-                predictions = [
-                    (route, (score - min_score) / score_range, conf)
-                    for route, score, conf in predictions
-                ]
-            else:
-                # 所有评分相同时，统一设为 1.0
-                predictions = [(route, 1.0, conf) for route, score, conf in predictions]
-
-        valid_routes = self._get_valid_routes()
-
-        # 生成推荐结果
-        recommendations: List[Dict] = []
-        for route, predicted_score, confidence in predictions:
-            if route not in valid_routes:
-                continue
-
-            departure_city, arrival_city = route.split('->')
-            recommendations.append({
-                'route': route,
-                'departure_city': departure_city,
-                'arrival_city': arrival_city,
-                'predicted_score': round(predicted_score, 4),
-                'confidence': round(confidence, 4),
-                'reason': '基于相似用户的购买偏好'
-            })
-
-            if len(recommendations) >= limit:
-                break
-
-        return recommendations
+        # 查询离线训练的模型，只对 K 个近邻打分，不访问数据库；
+        # 用户无历史记录时返回空列表（由调用方处理冷启动）
+        return RouteRecommender.recommend(user_id, limit=limit, top_k=self.top_k_users)
 
     def _get_valid_routes(self) -> Set[str]:
         """
@@ -879,13 +805,7 @@ class CollaborativeFilteringEngine:
         Returns:
             有效航线的集合
         """
-        valid_flights = Flight.objects.exclude(
-            status='canceled'
-        ).values_list('departure_city', 'arrival_city').distinct()
-
-        return {
-            f"{dep}->{arr}" for dep, arr in valid_flights
-        }
+        return valid_route_keys()
 
 
 class PopularRouteService:
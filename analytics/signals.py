@@ -0,0 +1,142 @@
+"""
+数据分析模块信号处理。
+
+订单、机票和用户变化时增量维护分析汇总表、销售事实表和用户消费统计。
+"""
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from booking.models import Order, Ticket
+from flight.models import Flight
+from .olap import SalesFactService
+from .rollups import ORDER_FIELDS, TICKET_FIELDS, RollupService
+from .user_stats import UserStatsService
+
+User = get_user_model()
+
+
+def _current_values(instance, fields):
+    return {name: getattr(instance, name) for name in fields}
+
+
+def _loaded_values(instance, fields):
+    """加载时的字段值；实例不是从数据库加载的或字段被延迟加载时从数据库读取。"""
+    loaded = getattr(instance, '_loaded_values', None) or {}
+    if all(name in loaded for name in fields):
+        return {name: loaded[name] for name in fields}
+    return type(instance).objects.filter(pk=instance.pk).values(*fields).first()
+
+
+def _remember(instance, values):
+    instance._loaded_values = {**(getattr(instance, '_loaded_values', None) or {}), **values}
+
+
+def _ticket_route(ticket, flight_id):
+    """机票所属航班的航线，优先使用已加载的航班。"""
+    if flight_id is None:
+        return ('', '')
+    if Ticket.flight.is_cached(ticket) and ticket.flight.pk == flight_id:
+        return (ticket.flight.departure_city, ticket.flight.arrival_city)
+    route = Flight.objects.filter(pk=flight_id).values_list('departure_city', 'arrival_city').first()
+    return route or ('', '')
+
+
+@receiver(pre_save, sender=Order)
+def snapshot_order(sender, instance, raw=False, **kwargs):
+    """保存前取得订单原有的字段值。"""
+    if raw or instance._state.adding or instance.pk is None:
+        instance._rollup_previous = None
+        return
+    instance._rollup_previous = _loaded_values(instance, ORDER_FIELDS)
+
+
+@receiver(post_save, sender=Order)
+def rollup_order_on_save(sender, instance, created=False, raw=False, **kwargs):
+    """下单、支付、取消等订单变化写入汇总表。"""
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_rollup_previous', None)
+    current = _current_values(instance, ORDER_FIELDS)
+    RollupService.record_order(previous, current)
+    _remember(instance, current)
+
+
+@receiver(post_delete, sender=Order)
+def rollup_order_on_delete(sender, instance, **kwargs):
+    RollupService.record_order(_current_values(instance, ORDER_FIELDS), None)
+
+
+@receiver(pre_save, sender=Ticket)
+def snapshot_ticket(sender, instance, raw=False, **kwargs):
+    """保存前取得机票原有的字段值。"""
+    if raw or instance._state.adding or instance.pk is None:
+        instance._rollup_previous = None
+        return
+    instance._rollup_previous = _loaded_values(instance, TICKET_FIELDS)
+
+
+@receiver(post_save, sender=Ticket)
+def rollup_ticket_on_save(sender, instance, created=False, raw=False, **kwargs):
+    """出票、退票、改签等机票变化写入汇总表。"""
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_rollup_previous', None)
+    current = _current_values(instance, TICKET_FIELDS)
+    route = _ticket_route(instance, current['flight_id'])
+    if previous and previous['flight_id'] != current['flight_id']:
+        previous_route = _ticket_route(instance, previous['flight_id'])
+    else:
+        previous_route = route
+    RollupService.record_ticket(previous, current, previous_route, route)
+    _remember(instance, current)
+
+
+@receiver(post_delete, sender=Ticket)
+def rollup_ticket_on_delete(sender, instance, **kwargs):
+    current = _current_values(instance, TICKET_FIELDS)
+    RollupService.record_ticket(current, None, old_route=_ticket_route(instance, current['flight_id']))
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def refresh_order_facts(sender, instance, raw=False, **kwargs):
+    """订单变化后重新生成销售事实（订单已删除时移除）。"""
+    if not raw:
+        SalesFactService.mark_dirty(instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def refresh_user_stats_on_save(sender, instance, created=False, raw=False, **kwargs):
+    """订单支付、退款或修改金额时重新统计用户。"""
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_rollup_previous', None)
+    current = _current_values(instance, ORDER_FIELDS)
+    if UserStatsService.contribution(previous) != UserStatsService.contribution(current):
+        UserStatsService.mark_dirty(instance.user_id)
+
+
+@receiver(post_delete, sender=Order)
+def refresh_user_stats_on_delete(sender, instance, **kwargs):
+    if UserStatsService.contribution(_current_values(instance, ORDER_FIELDS)):
+        UserStatsService.mark_dirty(instance.user_id)
+
+
+@receiver(post_save, sender=Ticket)
+@receiver(post_delete, sender=Ticket)
+def refresh_ticket_facts(sender, instance, raw=False, **kwargs):
+    """机票变化时重新生成所属订单的销售事实。"""
+    if not raw:
+        SalesFactService.mark_dirty(instance.order_id)
+
+
+@receiver(post_save, sender=User)
+def rollup_new_user(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        RollupService.record_new_user(instance.date_joined)
+
+
+@receiver(post_delete, sender=User)
+def rollup_deleted_user(sender, instance, **kwargs):
+    RollupService.record_new_user(instance.date_joined, sign=-1)
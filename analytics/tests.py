@@ -1,8 +1,17 @@
 """管理后台分析模块测试"""
-from datetime import timedelta
+from datetime import date, timedelta
 from decimal import Decimal
+import os
+import tempfile
+from io import StringIO
 
-
+import numpy as np
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
@@ -10,7 +19,21 @@ from rest_framework import status
 
 from accounts.models import User
 from flight.models import Flight
-from booking.models import Order
+from booking.models import Order, Ticket
+from . import trends
+from .cohorts import CohortEngine
+from .logreader import LogQueryEngine
+from .models import DailySalesRollup, DailyUserRollup, HourlySalesRollup, SalesCube, SalesFact, UserStats
+from .olap import OlapEngine, OlapQuery
+from .recommender import RouteRatingModel, RouteRecommender
+from .route_metrics import RouteMetricsEngine
+from .services import (
+    CollaborativeFilteringEngine,
+    DimensionPivotEngine,
+    MultiDimensionAnalytics,
+    PivotTableEngine,
+)
+from .user_stats import UserStatsService
 
 
 class AnalyticsAPITest(APITestCase):
@@ -110,3 +133,894 @@ class AnalyticsAPITest(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('logs', response.data)
+
+
+class SalesRollupTest(APITestCase):
+    """分析汇总表测试"""
+    def setUp(self):
+        self.admin = User.objects.create_user(
+            username='rollupadmin', password='adminpassword123', role='admin'
+        )
+        self.user = User.objects.create_user(
+            username='rollupuser', password='testpassword123', role='user'
+        )
+        self.flight = Flight.objects.create(
+            flight_number='MU5101',
+            departure_city='上海',
+            arrival_city='北京',
+            departure_time=timezone.now() + timedelta(days=3),
+            arrival_time=timezone.now() + timedelta(days=3, hours=2),
+            price=Decimal('1000.00'),
+            capacity=100,
+            available_seats=100,
+            aircraft_type='A320',
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def create_order(self, price='500.00', status='pending', **kwargs):
+        order = Order.objects.create(
+            user=self.user, total_price=Decimal(price), status=status, **kwargs
+        )
+        ticket = Ticket.objects.create(
+            order=order,
+            flight=self.flight,
+            passenger_name='测试乘客',
+            passenger_id_number='110101199001011234',
+            cabin_class='business',
+            price=Decimal(price),
+        )
+        return order, ticket
+
+    def daily_totals(self):
+        return DailySalesRollup.objects.aggregate(
+            orders=Sum('orders'), sales=Sum('sales'), revenue=Sum('revenue'),
+            tickets=Sum('tickets'), refunds=Sum('refunds'), refund_amount=Sum('refund_amount'),
+        )
+
+    def snapshot(self):
+        """汇总表中所有非零行（增量维护可能留下指标全为 0 的行）"""
+        measures = ['orders', 'sales', 'sales_amount', 'paid_orders', 'revenue',
+                    'tickets', 'refunds', 'refund_amount']
+        result = {}
+        for model, bucket in ((DailySalesRollup, 'date'), (HourlySalesRollup, 'hour')):
+            rows = model.objects.values_list(
+                bucket, 'departure_city', 'arrival_city', 'cabin_class', 'payment_method', *measures
+            )
+            result[model.__name__] = sorted(row for row in rows if any(row[5:]))
+        result['users'] = sorted(
+            DailyUserRollup.objects.filter(new_users__gt=0).values_list('date', 'new_users')
+        )
+        return result
+
+    def test_order_lifecycle_updates_rollups(self):
+        order, ticket = self.create_order()
+        totals = self.daily_totals()
+        self.assertEqual((totals['orders'], totals['sales'], totals['tickets']), (1, 0, 1))
+
+        order.status = 'paid'
+        order.payment_method = 'alipay'
+        order.paid_at = timezone.now()
+        order.save()
+        totals = self.daily_totals()
+        self.assertEqual((totals['orders'], totals['sales'], totals['revenue']), (1, 1, Decimal('500.00')))
+
+        ticket.status = 'refunded'
+        ticket.save()
+        totals = self.daily_totals()
+        self.assertEqual((totals['refunds'], totals['refund_amount']), (1, Decimal('500.00')))
+
+        # 机票指标按航线和舱位记录
+        route = DailySalesRollup.objects.get(departure_city='上海', cabin_class='business')
+        self.assertEqual((route.tickets, route.refunds), (1, 1))
+
+        # 重复保存不改变汇总
+        order.save()
+        self.assertEqual(self.daily_totals()['revenue'], Decimal('500.00'))
+
+        order.delete()
+        totals = self.daily_totals()
+        self.assertEqual((totals['orders'], totals['revenue'], totals['tickets']), (0, 0, 0))
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.create_order(status='paid', payment_method='wechat', paid_at=timezone.now())
+        _, ticket = self.create_order(price='320.00')
+        ticket.status = 'refunded'
+        ticket.save()
+        incremental = self.snapshot()
+
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_overview_reads_rollups_with_constant_queries(self):
+        url = reverse('analytics-overview')
+        self.create_order(status='paid', payment_method='alipay', paid_at=timezone.now())
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(url)
+        self.assertEqual(response.data['stats']['orders'], 1)
+        self.assertEqual(response.data['revenueData'][-1][2], 1)
+
+        for _ in range(10):
+            self.create_order(status='paid', payment_method='alipay', paid_at=timezone.now())
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(response.data['stats']['orders'], 11)
+        self.assertEqual(response.data['stats']['revenue'], 5500.0)
+        self.assertEqual(len(many), len(few))
+
+    def test_sales_trend_by_hour(self):
+        self.create_order(status='paid', payment_method='alipay', paid_at=timezone.now())
+        response = self.client.get(reverse('visualization-sales-trend'), {'time_unit': 'hour'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['sales_trend']), 1)
+        self.assertEqual(response.data['sales_trend'][0]['count'], 1)
+        self.assertEqual(
+            response.data['sales_trend'][0]['date'],
+            timezone.localtime().strftime('%Y-%m-%d %H:00')
+        )
+
+
+class DimensionPivotEngineTest(APITestCase):
+    """单维度透视聚合引擎测试"""
+    def setUp(self):
+        self.user = User.objects.create_user(username='pivotuser', password='testpassword123')
+        self.engine = DimensionPivotEngine()
+
+    def create_flight(self, departure, arrival):
+        return Flight.objects.create(
+            flight_number=f'CA{Flight.objects.count() + 1:04d}',
+            departure_city=departure,
+            arrival_city=arrival,
+            departure_time=timezone.now() + timedelta(days=5),
+            arrival_time=timezone.now() + timedelta(days=5, hours=2),
+            price=Decimal('600.00'),
+            capacity=100,
+            available_seats=100,
+            aircraft_type='A320',
+        )
+
+    def book(self, flights, price='600.00', payment_method='alipay', refunded=0):
+        order = Order.objects.create(
+            user=self.user, total_price=Decimal(price) * len(flights),
+            status='paid', payment_method=payment_method, paid_at=timezone.now()
+        )
+        for index, flight in enumerate(flights):
+            Ticket.objects.create(
+                order=order, flight=flight, passenger_name='乘客',
+                passenger_id_number='110101199001011234', price=Decimal(price),
+                status='refunded' if index < refunded else 'valid',
+            )
+        return order
+
+    def values(self, dimension, metric):
+        return {item['dimension']: item['value'] for item in self.engine.aggregate(dimension, metric)}
+
+    def test_city_metrics(self):
+        outbound = self.create_flight('北京', '上海')
+        inbound = self.create_flight('上海', '北京')
+        onward = self.create_flight('上海', '广州')
+        # 往返订单对北京、上海各只计一次
+        self.book([outbound, inbound], refunded=1)
+        self.book([onward], price='300.00', payment_method='wechat')
+
+        self.assertEqual(self.values('city', 'revenue'), {'北京': 1200.0, '上海': 1500.0, '广州': 300.0})
+        self.assertEqual(self.values('city', 'orders'), {'北京': 1, '上海': 2, '广州': 1})
+        self.assertEqual(self.values('city', 'averageValue'), {'北京': 1200.0, '上海': 750.0, '广州': 300.0})
+        self.assertEqual(self.values('city', 'refundRate'), {'北京': 50.0, '上海': 33.33, '广州': 0})
+
+        flight_counts = {item['dimension']: item['flight_count'] for item in self.engine.aggregate('city', 'orders')}
+        self.assertEqual(flight_counts, {'北京': 2, '上海': 3, '广州': 1})
+
+    def test_payment_method_metrics(self):
+        flight = self.create_flight('北京', '上海')
+        self.book([flight], refunded=1)
+        self.book([flight], price='400.00')
+        self.book([flight], payment_method='wechat')
+
+        self.assertEqual(self.values('paymentMethod', 'revenue'), {'alipay': 1000.0, 'wechat': 600.0})
+        self.assertEqual(self.values('paymentMethod', 'orders'), {'alipay': 2, 'wechat': 1})
+        self.assertEqual(self.values('paymentMethod', 'averageValue'), {'alipay': 500.0, 'wechat': 600.0})
+        self.assertEqual(self.values('paymentMethod', 'refundRate'), {'alipay': 50.0, 'wechat': 0})
+
+    def test_query_budget_does_not_grow_with_network(self):
+        cities = ['北京', '上海', '广州', '深圳', '成都', '杭州']
+        for size in (2, len(cities)):
+            for departure, arrival in zip(cities[:size], cities[1:size] + cities[:1]):
+                self.book([self.create_flight(departure, arrival)], payment_method=f'method{size}')
+            for dimension in DimensionPivotEngine.DIMENSIONS:
+                for metric in DimensionPivotEngine.METRICS:
+                    with self.subTest(size=size, dimension=dimension, metric=metric):
+                        with self.assertNumQueries(DimensionPivotEngine.query_budget(dimension, metric)):
+                            self.engine.aggregate(dimension, metric)
+
+
+class RouteMetricsEngineTest(APITestCase):
+    """航线指标引擎测试"""
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='routeuser', password='testpassword123')
+
+    def create_flight(self, departure, arrival, available, days=5):
+        departure_time = timezone.now() + timedelta(days=days)
+        return Flight.objects.create(
+            flight_number=f'RM{Flight.objects.count() + 1:04d}',
+            departure_city=departure,
+            arrival_city=arrival,
+            departure_time=departure_time,
+            arrival_time=departure_time + timedelta(hours=2),
+            price=Decimal('1000.00'),
+            capacity=100,
+            available_seats=available,
+            aircraft_type='A320',
+        )
+
+    def book(self, flight, prices, order_status='paid', ticket_status='valid'):
+        order = Order.objects.create(user=self.user, total_price=sum(map(Decimal, prices)), status=order_status)
+        for price in prices:
+            Ticket.objects.create(
+                order=order, flight=flight, passenger_name='乘客',
+                passenger_id_number='110101199001011234', price=Decimal(price), status=ticket_status,
+            )
+
+    def test_route_metrics_use_ticket_prices(self):
+        first = self.create_flight('北京', '上海', available=80)
+        self.create_flight('北京', '上海', available=60)
+        other = self.create_flight('上海', '广州', available=100)
+        self.book(first, ['500.00', '700.00'])
+        self.book(first, ['300.00'], ticket_status='refunded')
+        self.book(first, ['900.00'], order_status='pending')
+        self.book(other, ['400.00'], order_status='completed', ticket_status='used')
+
+        with self.assertNumQueries(2):
+            metrics = RouteMetricsEngine.compute()
+        route = metrics[('北京', '上海', None)]
+        self.assertEqual(
+            (route['flights'], route['capacity'], route['booked_seats'], route['load_factor']),
+            (2, 200, 60, 30.0)
+        )
+        self.assertEqual((route['sold_seats'], route['revenue'], route['avg_fare']),
+                         (2, Decimal('1200.00'), Decimal('600.00')))
+
+        summary = RouteMetricsEngine.summary()
+        self.assertEqual((summary['total_flights'], summary['avg_load_factor']), (3, 20.0))
+        self.assertEqual((summary['sold_seats'], summary['revenue']), (3, Decimal('1600.00')))
+        self.assertEqual(RouteMetricsEngine.city_traffic(), {'北京': 2, '上海': 3, '广州': 1})
+
+    def test_periods_and_cache(self):
+        self.create_flight('北京', '上海', available=50, days=5)
+        self.create_flight('北京', '上海', available=100, days=70)
+
+        rows = RouteMetricsEngine.route('北京', '上海', period='month')
+        self.assertEqual([row['flights'] for row in rows], [1, 1])
+        self.assertEqual([row['load_factor'] for row in rows], [50.0, 0.0])
+        self.assertLess(rows[0]['period'], rows[1]['period'])
+
+        with override_settings(ROUTE_METRICS_CACHE_TIMEOUT=60):
+            RouteMetricsEngine.routes()
+            with self.assertNumQueries(0):
+                self.assertEqual(RouteMetricsEngine.routes()[0]['load_factor'], 25.0)
+
+
+class AnalyticsQueryCountTest(APITestCase):
+    """分析接口查询数回归测试"""
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='querycountadmin', password='testpassword123', role='admin')
+        self.client.force_authenticate(user=self.admin)
+
+    def create_flight(self, departure, arrival, days):
+        departure_time = timezone.now() + timedelta(days=days)
+        return Flight.objects.create(
+            flight_number=f'QC{Flight.objects.count() + 1:04d}',
+            departure_city=departure,
+            arrival_city=arrival,
+            departure_time=departure_time,
+            arrival_time=departure_time + timedelta(hours=2),
+            price=Decimal('1000.00'),
+            capacity=100,
+            available_seats=90,
+            aircraft_type='A320',
+        )
+
+    def book(self, flight, prices, order_status='paid'):
+        order = Order.objects.create(user=self.admin, total_price=sum(map(Decimal, prices)), status=order_status)
+        for price in prices:
+            Ticket.objects.create(
+                order=order, flight=flight, passenger_name='乘客',
+                passenger_id_number='110101199001011234', price=Decimal(price), status='valid',
+            )
+
+    def test_analytics_endpoints_aggregate_in_constant_queries(self):
+        cities = ['北京', '上海', '广州', '深圳', '成都', '杭州']
+        for index, days in enumerate([5, 10, 20, 45, 100]):
+            flight = self.create_flight(cities[index], cities[index + 1], days=days)
+            self.book(flight, ['400.00', '1200.00'])
+        self.book(flight, ['2500.00'], order_status='pending')
+        UserStatsService.flush()
+
+        # 查询数不随航线、提前期或票价区间的数量增长（测试中不缓存，航线列表和汇总各两条）
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('flight-analytics'))
+        self.assertEqual(len(response.data['route_revenue']), 5)
+
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('business-intelligence'))
+        self.assertEqual(
+            [(item['days'], item['count'], item['percentage']) for item in response.data['advance_booking']],
+            [(7, 2, 20.0), (14, 4, 40.0), (30, 6, 60.0), (60, 8, 80.0), (90, 8, 80.0)]
+        )
+
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('data-visualization'))
+        self.assertEqual(
+            [item['value'] for item in response.data['ticket_price_ranges']],
+            [5, 0, 5, 0, 1]
+        )
+
+
+class CohortEngineTest(APITestCase):
+    """客户留存队列引擎测试"""
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(username='cohortadmin', password='testpassword123', role='admin')
+        self.users = [
+            User.objects.create_user(username=f'cohort{index}', password='testpassword123') for index in range(3)
+        ]
+
+    def order(self, user, month, status='paid'):
+        order = Order.objects.create(user=user, total_price=Decimal('500.00'), status=status)
+        created_at = timezone.make_aware(timezone.datetime(2024, month, 15, 12))
+        Order.objects.filter(pk=order.pk).update(created_at=created_at)
+
+    def create_orders(self):
+        first, second, third = self.users
+        for month in (1, 1, 2, 4):
+            self.order(first, month)
+        self.order(second, 1)
+        self.order(second, 3, status='canceled')
+        self.order(third, 2)
+        self.order(third, 3)
+
+    def test_retention_trend_and_triangle(self):
+        self.create_orders()
+        with self.assertNumQueries(1):
+            report = CohortEngine.report()
+
+        self.assertEqual(report['retention_trend'], {
+            'months': ['2024-01', '2024-02', '2024-03', '2024-04'],
+            'rates': [0.0, 50.0, 100.0, 100.0],
+        })
+        triangle = report['cohort_triangle']
+        self.assertEqual(triangle['cohorts'], ['2024-01', '2024-02'])
+        self.assertEqual(triangle['sizes'], [2, 1])
+        self.assertEqual(triangle['counts'], [[2, 1, 0, 1], [1, 1, 0, None]])
+        self.assertEqual(triangle['retention'], [[100.0, 50.0, 0.0, 50.0], [100.0, 100.0, 0.0, None]])
+
+        # 日期范围内重新划分队列
+        trend = CohortEngine.retention_trend(start='2024-02-01')
+        self.assertEqual(trend['rates'], [0.0, 100.0, 100.0])
+        self.assertEqual(CohortEngine.triangle(end='2023-12-31')['cohorts'], [])
+
+    def test_loyalty_endpoint_and_cache(self):
+        self.create_orders()
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(reverse('customer-loyalty'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['retention_trend']['rates'], [0.0, 50.0, 100.0, 100.0])
+        self.assertEqual(response.data['cohort_triangle']['sizes'], [2, 1])
+
+        with override_settings(COHORT_CACHE_TIMEOUT=60):
+            CohortEngine.report()
+            with self.assertNumQueries(0):
+                self.assertEqual(CohortEngine.report()['cohort_triangle']['sizes'], [2, 1])
+
+
+
+class OlapEngineTest(APITestCase):
+    """销售 OLAP 查询层测试"""
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='olapuser', password='testpassword123')
+        self.flight = Flight.objects.create(
+            flight_number='CA1501',
+            departure_city='北京',
+            arrival_city='上海',
+            departure_time=timezone.now() + timedelta(days=3),
+            arrival_time=timezone.now() + timedelta(days=3, hours=2),
+            price=Decimal('800.00'),
+            capacity=100,
+            available_seats=100,
+            aircraft_type='A320',
+        )
+
+    def create_order(self, total, tickets, status='paid', payment_method='alipay'):
+        order = Order.objects.create(
+            user=self.user, total_price=Decimal(total), status=status, payment_method=payment_method
+        )
+        for cabin_class, price in tickets:
+            Ticket.objects.create(
+                order=order,
+                flight=self.flight,
+                passenger_name='测试乘客',
+                passenger_id_number='110101199001011234',
+                cabin_class=cabin_class,
+                price=Decimal(price),
+            )
+        return order
+
+    def create_orders(self):
+        self.create_order('1000.00', [('economy', '400.00'), ('business', '600.00')])
+        self.create_order('500.00', [('economy', '500.00')], payment_method='wechat')
+        self.create_order('300.00', [('economy', '300.00')], status='pending')
+
+    def snapshot(self):
+        fields = [field.name for field in SalesCube._meta.fields if field.name != 'id']
+        return sorted(SalesCube.objects.values_list(*fields))
+
+    def test_multi_ticket_orders_are_not_overcounted(self):
+        self.create_orders()
+        result = MultiDimensionAnalytics().analyze(
+            dimensions=['cabin_class'], metrics=['revenue', 'order_count', 'ticket_count']
+        )
+        rows = {row['tickets__cabin_class']: row for row in result['data']}
+        self.assertEqual(rows['economy']['revenue'], '1000.00')
+        self.assertEqual(rows['business']['revenue'], '500.00')
+        self.assertEqual(sum(row['order_count'] for row in result['data']), 2)
+        self.assertEqual(sum(row['ticket_count'] for row in result['data']), 3)
+
+        pivot = PivotTableEngine().generate(['cabin_class'], [], value_metric='ticket_price')
+        self.assertEqual(pivot['data']['matrix'], {
+            "(('business',), ('Total',))": 600.0,
+            "(('economy',), ('Total',))": 900.0,
+        })
+        total = PivotTableEngine().generate([], [], value_metric='total_price', aggregation='avg')
+        self.assertEqual(total['data']['matrix'], {"(('Total',), ('Total',))": 750.0})
+        with self.assertRaises(ValueError):
+            PivotTableEngine().generate(['flight_number'], [])
+
+    def test_planner_picks_coarsest_rollup(self):
+        paid = {'order_status': ['paid']}
+        cases = [
+            ((['time'], ['revenue']), {'filters': paid}, 'month_status'),
+            ((['time', 'departure_city'], ['revenue']), {'filters': paid}, 'month_route'),
+            ((['user_segment'], ['order_count']), {'filters': paid}, 'month_customer'),
+            ((['time'], ['revenue']), {'granularity': 'week'}, 'day_status'),
+            ((['time'], ['revenue']), {'start': date(2024, 1, 15)}, 'day_status'),
+            ((['time'], ['revenue']), {'start': date(2024, 1, 1), 'end': date(2024, 2, 29)}, 'month_status'),
+            ((['cabin_class', 'payment_method'], ['revenue']), {}, 'day_all'),
+        ]
+        for args, kwargs, expected in cases:
+            self.assertEqual(OlapEngine.plan(OlapQuery.build(*args, **kwargs)).name, expected)
+        self.assertIsNone(OlapEngine.plan(OlapQuery.build(['time'], ['revenue'], start=timezone.now())))
+
+        # 各层级与事实表的结果一致
+        self.create_orders()
+        today = timezone.localdate()
+        query = OlapQuery.build(
+            ['time', 'cabin_class'], ['revenue', 'order_count', 'avg_ticket_price'],
+            granularity='day', start=today, end=today, filters=paid,
+        )
+        self.assertEqual(OlapEngine.execute(query, OlapEngine.plan(query)), OlapEngine.execute(query, None))
+        self.assertEqual(OlapEngine.run(query)['source'], 'day_all')
+
+    def test_incremental_maintenance_matches_rebuild(self):
+        # 事实在事务提交后批量重新生成
+        with self.captureOnCommitCallbacks(execute=True):
+            order = self.create_order('1000.00', [('economy', '500.00'), ('economy', '500.00')])
+            self.create_order('333.33', [('economy', '111.11')] * 3, status='pending')
+            self.create_order('200.00', [])
+            order.tickets.first().delete()
+            order.status = 'refunded'
+            order.save()
+
+        # 用户分群按已支付订单总数，与用户消费统计一致（只有一个已支付订单）
+        facts = sorted(SalesFact.objects.values_list('order_id', 'user_segment', 'orders', 'tickets', 'amount'))
+        self.assertEqual([fact[1] for fact in facts], ['new'] * 5)
+        self.assertEqual(sum(fact[4] for fact in facts), Decimal('1533.33'))
+        incremental = self.snapshot()
+
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(self.snapshot(), incremental)
+
+        # 用户分群变化时该用户全部订单的事实随之更新
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_order('300.00', [])
+        self.assertEqual(UserStats.objects.get(user=self.user).segment, 'returning')
+        self.assertEqual(set(SalesFact.objects.values_list('user_segment', flat=True)), {'returning'})
+        incremental = self.snapshot()
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(self.snapshot(), incremental)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.all().delete()
+        self.assertFalse(SalesFact.objects.exists())
+        self.assertFalse(SalesCube.objects.exists())
+
+    def test_rebuild_dates_facts_by_backfilled_order_time(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = self.create_order('1000.00', [('economy', '400.00'), ('business', '600.00')])
+
+        # 直接 UPDATE 回填下单时间不触发信号，重建后事实按回填后的日期统计
+        created_at = timezone.now() - timedelta(days=30)
+        Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(
+            set(SalesFact.objects.values_list('created_at', 'date')),
+            {(created_at, timezone.localtime(created_at).date())},
+        )
+        self.assertEqual(
+            set(SalesCube.objects.filter(rollup__startswith='day').values_list('period', flat=True)),
+            {timezone.localtime(created_at).date()},
+        )
+
+    def test_results_cached_by_normalized_query(self):
+        self.create_orders()
+        with override_settings(OLAP_CACHE_TIMEOUT=60):
+            first = OlapEngine.query(['payment_method'], ['revenue'], filters={'order_status': ['paid', 'completed']})
+            with self.assertNumQueries(0):
+                second = OlapEngine.query(
+                    ['payment_method', 'payment_method'], ['revenue'],
+                    filters={'order_status': ['completed', 'paid', 'paid']},
+                )
+            self.assertEqual(second, first)
+
+            # 订单变化后更换缓存版本
+            self.create_order('200.00', [('first', '200.00')])
+            third = OlapEngine.query(['payment_method'], ['revenue'], filters={'order_status': ['paid', 'completed']})
+            self.assertEqual(
+                {row['payment_method']: row['revenue'] for row in third['rows']},
+                {'alipay': Decimal('1200.00'), 'wechat': Decimal('500.00')},
+            )
+
+
+class UserStatsTest(APITestCase):
+    """用户消费统计测试"""
+    def setUp(self):
+        self.admin = User.objects.create_user(username='statsadmin', password='testpassword123', role='admin')
+        self.users = [
+            User.objects.create_user(username=f'stats{index}', password='testpassword123') for index in range(3)
+        ]
+        self.client.force_authenticate(user=self.admin)
+
+    def order(self, user, price, status='paid'):
+        return Order.objects.create(user=user, total_price=Decimal(price), status=status)
+
+    def stats(self):
+        return {
+            row.user_id: (row.order_count, row.total_spend, row.segment)
+            for row in UserStats.objects.all()
+        }
+
+    def test_payment_refund_and_delete_update_stats(self):
+        first, second, _ = self.users
+        with self.captureOnCommitCallbacks(execute=True):
+            paid = self.order(first, '1200.00')
+            pending = self.order(first, '800.00', status='pending')
+            self.order(second, '300.00')
+        self.assertEqual(self.stats(), {
+            first.pk: (1, Decimal('1200.00'), 'new'),
+            second.pk: (1, Decimal('300.00'), 'new'),
+        })
+
+        with self.captureOnCommitCallbacks(execute=True):
+            pending.status = 'paid'
+            pending.save()
+        row = UserStats.objects.get(user=first)
+        self.assertEqual((row.order_count, row.total_spend, row.segment), (2, Decimal('2000.00'), 'returning'))
+        self.assertEqual((row.first_order_at, row.last_order_at), (paid.created_at, pending.created_at))
+
+        # 退款后不再计入；没有已支付订单的用户删除统计行
+        with self.captureOnCommitCallbacks(execute=True):
+            paid.status = 'refunded'
+            paid.save()
+            Order.objects.filter(user=second).delete()
+        self.assertEqual(self.stats(), {first.pk: (1, Decimal('800.00'), 'new')})
+
+        incremental = self.stats()
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(self.stats(), incremental)
+
+    def test_rebuild_recomputes_backfilled_orders_before_facts(self):
+        first = self.users[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            older = self.order(first, '500.00')
+            newer = self.order(first, '700.00')
+        self.assertEqual(self.stats(), {first.pk: (2, Decimal('1200.00'), 'returning')})
+
+        # 直接 UPDATE 回填下单时间和状态不触发信号，统计和事实都需要重建
+        first_at = timezone.now() - timedelta(days=60)
+        Order.objects.filter(pk=older.pk).update(created_at=first_at)
+        Order.objects.filter(pk=newer.pk).update(created_at=first_at + timedelta(days=1), status='refunded')
+        call_command('rebuild_rollups', stdout=StringIO())
+
+        row = UserStats.objects.get(user=first)
+        self.assertEqual((row.order_count, row.segment), (1, 'new'))
+        self.assertEqual((row.first_order_at, row.last_order_at), (first_at, first_at))
+        # 事实中的用户分群读取重建后的统计
+        self.assertEqual(set(SalesFact.objects.values_list('user_segment', flat=True)), {'new'})
+
+    def test_segment_endpoints_read_stats_table(self):
+        first, second, third = self.users
+        for _ in range(3):
+            self.order(first, '1500.00')
+        self.order(second, '1000.00')
+        self.order(third, '200.00')
+        self.order(third, '999.00', status='pending')
+
+        # 读取前写入本线程待处理的变化，之后分群只需一条聚合查询
+        self.assertEqual(UserStatsService.flush(), 3)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('customer-segments'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_users'], 3)
+        self.assertEqual(
+            [(item['count'], item['total_spend']) for item in response.data['segments']],
+            [(1, 4500.0), (1, 1000.0), (1, 200.0)]
+        )
+
+        response = self.client.get(reverse('customer-loyalty'))
+        spending = {item['name']: item for item in response.data['loyalty_spending']}
+        self.assertEqual(spending['低频用户(1-2次)']['user_count'], 2)
+        self.assertEqual(spending['中频用户(3-5次)']['avg_spend'], 4500.0)
+
+        response = self.client.get(reverse('business-intelligence'))
+        self.assertAlmostEqual(float(response.data['user_stats']['avg_value']), 1900.0)
+        self.assertAlmostEqual(response.data['user_stats']['avg_orders'], 5 / 3)
+
+
+class TrendEngineTest(APITestCase):
+    """时间序列趋势引擎测试"""
+    def test_column_calculations_match_reference(self):
+        values = trends.to_array([3, None, '7.5', 'x', 12, 4, 30, 5, 6, 8])
+        self.assertEqual(values.tolist(), [3.0, 0.0, 7.5, 0.0, 12.0, 4.0, 30.0, 5.0, 6.0, 8.0])
+
+        window = 4
+        reference_average, reference_rolling, reference_ewma = [], [], []
+        alpha, smoothed = 2 / (window + 1), values[0]
+        for index, value in enumerate(values.tolist()):
+            recent = values[max(0, index - window + 1):index + 1]
+            reference_average.append(recent.mean())
+            std = recent.std(ddof=1) if len(recent) > 1 else 0
+            reference_rolling.append((value - recent.mean()) / std if std else 0)
+            smoothed = value if index == 0 else alpha * value + (1 - alpha) * smoothed
+            reference_ewma.append(smoothed)
+
+        self.assertTrue(np.allclose(trends.moving_average(values, window), reference_average))
+        self.assertTrue(np.allclose(trends.rolling_zscores(values, window), reference_rolling))
+        self.assertTrue(np.allclose(trends.ewma(values, window), reference_ewma))
+        self.assertTrue(np.allclose(trends.ewma(np.full(5000, 7.0), 500), 7.0))
+        self.assertEqual(trends.rolling_zscores(np.full(6, 9.0), 3).tolist(), [0.0] * 6)
+
+    def test_seasonality_and_year_over_year(self):
+        dates = np.arange(np.datetime64('2024-02-26'), np.datetime64('2024-03-04'))
+        series = trends.TrendSeries([1, 2, 3, 4, 5, 6, 7], dates)
+        weekday = series.seasonality('weekday')
+        self.assertEqual(weekday['keys'], [1, 2, 3, 4, 5, 6, 7])  # 2024-02-26 为星期一
+        self.assertEqual((weekday['peak'], weekday['low']), (7, 1))
+        month = series.seasonality('month')
+        self.assertEqual(month['keys'], [2, 3])
+        self.assertEqual(month['average'], [2.5, 6.0])
+
+        previous = trends.TrendSeries(
+            [10, 0, 2, 2], np.arange(np.datetime64('2023-02-26'), np.datetime64('2023-03-02'))
+        )
+        yoy = series.year_over_year(previous)
+        # 2024-02-29 对应 2023-02-28；上年没有 3 月 2 日之后的数据
+        self.assertEqual(yoy['previous_value'].tolist(), [10.0, 0.0, 2.0, 2.0, 2.0, 0.0, 0.0])
+        self.assertEqual(yoy['yoy_rate'].tolist(), [-90.0, 100.0, 50.0, 100.0, 150.0, 100.0, 100.0])
+
+    def test_trends_view_uses_one_query(self):
+        admin = User.objects.create_user(username='trendadmin', password='testpassword123', role='admin')
+        for day, amount in ((date(2024, 3, 1), '100.00'), (date(2024, 3, 1), '50.00'),
+                            (date(2024, 3, 3), '300.00'), (date(2023, 3, 3), '200.00')):
+            order = Order.objects.create(user=admin, total_price=Decimal(amount), status='paid')
+            created_at = timezone.make_aware(timezone.datetime(day.year, day.month, day.day, 12))
+            Order.objects.filter(pk=order.pk).update(created_at=created_at)
+
+        self.client.force_authenticate(user=admin)
+        url = reverse('bi-trends')
+        params = {'start_date': '2024-03-01', 'end_date': '2024-03-04', 'window_size': 2}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len([q for q in queries if 'booking_order' in q['sql']]), 1)
+
+        series = response.data['series']
+        self.assertEqual(series['periods'], ['2024-03-01', '2024-03-02', '2024-03-03', '2024-03-04'])
+        self.assertEqual(series['revenue'], [150.0, 0.0, 300.0, 0.0])
+        self.assertEqual(series['order_count'], [2, 0, 1, 0])
+        self.assertEqual(series['moving_average'], [150.0, 75.0, 150.0, 150.0])
+        self.assertEqual(series['previous_value'], [0.0, 0.0, 200.0, 0.0])
+        self.assertEqual(series['yoy_rate'], [100.0, 0.0, 50.0, 0.0])
+        self.assertEqual(response.data['trend_data'][2]['time_period'], '2024-03-03')
+        self.assertEqual(response.data['trend_data'][2]['moving_average'], 150.0)
+        self.assertEqual(response.data['seasonal_patterns']['peak_month'], 3)
+        self.assertEqual(response.data['summary']['total_records'], 4)
+
+
+@override_settings(RECOMMENDER_SYNC_TRAINING=False, RECOMMENDER_MODEL_PATH=None)
+class RouteRecommenderTest(APITestCase):
+    """离线航线推荐模型测试"""
+    ROUTES = [('北京', '上海'), ('北京', '广州'), ('上海', '深圳'), ('广州', '成都'), ('成都', '重庆')]
+
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'cfuser{i}', password='testpassword123') for i in range(5)
+        ]
+        self.flights = [
+            Flight.objects.create(
+                flight_number=f'CF{i:04d}',
+                departure_city=departure,
+                arrival_city=arrival,
+                departure_time=timezone.now() + timedelta(days=5),
+                arrival_time=timezone.now() + timedelta(days=5, hours=2),
+                price=Decimal('800.00'),
+                capacity=100,
+                available_seats=100,
+                aircraft_type='A320',
+            )
+            for i, (departure, arrival) in enumerate(self.ROUTES)
+        ]
+        purchases = {0: [0], 1: [0, 1], 2: [0, 1, 2], 3: [2, 3], 4: [3, 4]}
+        for user_index, flight_indexes in purchases.items():
+            for flight_index in flight_indexes:
+                self.book(self.users[user_index], self.flights[flight_index])
+
+    def tearDown(self):
+        RouteRecommender._model = None
+        RouteRecommender._loaded_mtime = None
+
+    def book(self, user, flight, price='800.00'):
+        order = Order.objects.create(
+            user=user, total_price=Decimal(price), status='paid', paid_at=timezone.now()
+        )
+        Ticket.objects.create(
+            order=order, flight=flight, passenger_name='乘客',
+            passenger_id_number='110101199001011234', price=Decimal(price),
+        )
+        return order
+
+    def assertModelsEqual(self, model, expected):
+        self.assertEqual(sorted(model.user_ids.tolist()), sorted(expected.user_ids.tolist()))
+        for user_id in expected.user_ids.tolist():
+            self.assertEqual(model.ratings_of(user_id), expected.ratings_of(user_id))
+            self.assertEqual(
+                [(v, round(sim, 10)) for v, sim in model.neighbors_of(user_id)],
+                [(v, round(sim, 10)) for v, sim in expected.neighbors_of(user_id)],
+            )
+            self.assertEqual(model.recommend(user_id, limit=10), expected.recommend(user_id, limit=10))
+
+    def test_neighbors_match_brute_force_similarity(self):
+        model = RouteRecommender.train(top_k=2, save=False)
+        engine = CollaborativeFilteringEngine()
+        matrix = engine.build_user_route_matrix()
+        for user in self.users:
+            expected = engine.calculate_user_similarity(user.id, matrix)[:2]
+            neighbors = model.neighbors_of(user.id)
+            self.assertEqual([round(sim, 10) for _, sim in neighbors], [round(sim, 10) for _, sim in expected])
+
+    def test_incremental_refresh_matches_full_training(self):
+        model = RouteRecommender.train(top_k=2, save=False)
+
+        # 新用户购买、老用户追加购买、订单退款后重新付款
+        newcomer = User.objects.create_user(username='cfnewcomer', password='testpassword123')
+        self.book(newcomer, self.flights[4])
+        self.book(newcomer, self.flights[0])
+        self.book(self.users[0], self.flights[3], price='2000.00')
+        Flight.objects.filter(pk=self.flights[1].pk).update(status='canceled')
+
+        refreshed = RouteRecommender.refresh(model, save=False)
+        self.assertEqual(refreshed, 2)
+        self.assertModelsEqual(model, RouteRecommender.train(top_k=2, save=False))
+
+    def test_model_round_trip(self):
+        model = RouteRecommender.train(save=False)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.npz')
+            model.save(path)
+            loaded = RouteRatingModel.load(path)
+        self.assertEqual(loaded.routes, model.routes)
+        self.assertEqual(loaded.watermark, model.watermark)
+        self.assertModelsEqual(loaded, model)
+
+    def test_online_recommendation_does_not_query(self):
+        RouteRecommender.train()
+        engine = CollaborativeFilteringEngine()
+        with self.assertNumQueries(0):
+            recommendations = engine.generate_recommendations(self.users[0].id, limit=3)
+        self.assertEqual({item['route'] for item in recommendations}, {'北京->广州', '上海->深圳'})
+        self.assertEqual(engine.generate_recommendations(-1), [])
+
+
+class LogQueryEngineTest(SimpleTestCase):
+    """系统日志查询引擎测试"""
+    LEVELS = ('INFO', 'WARNING', 'ERROR', 'DEBUG')
+
+    def setUp(self):
+        LogQueryEngine._cache.clear()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'django.log')
+        self.lines = []  # 按写入顺序记录所有行（含轮转文件）
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, day, count, path=None, start=0):
+        with open(path or self.path, 'a', encoding='utf-8') as f:
+            for i in range(start, start + count):
+                level = self.LEVELS[i % len(self.LEVELS)] if i % 7 else 'ERROR'
+                line = f"{level} {day} 12:{i // 60 % 60:02d}:{i % 60:02d},000 views 1 2 消息 {day} {i}\n"
+                f.write(line)
+                self.lines.append(line)
+                if level == 'ERROR':
+                    f.write('Traceback (most recent call last):\n')
+
+    def expected(self, level=None, start=None, end=None, limit=100):
+        from .logreader import parse_log_line
+        logs = []
+        for line in reversed(self.lines):
+            entry = parse_log_line(line.strip())
+            if entry is None or (level and entry['level'] != level):
+                continue
+            day = entry['timestamp'][:10]
+            if (start and day < start.isoformat()) or (end and day > end.isoformat()):
+                continue
+            logs.append(entry)
+        return logs[:limit]
+
+    def test_queries_match_full_scan_across_rotated_files(self):
+        from datetime import date
+        self.write('2025-01-01', 300)
+        self.write('2025-01-02', 300)
+        os.rename(self.path, f'{self.path}.1')
+        self.write('2025-01-03', 300)
+        self.write('2025-01-04', 300)
+
+        engine = LogQueryEngine(self.path)
+        for level in (None, 'INFO', 'ERROR'):
+            for start, end in ((None, None), (date(2025, 1, 2), date(2025, 1, 3)), (date(2025, 1, 1), date(2025, 1, 1))):
+                for limit in (1, 50, 1000):
+                    self.assertEqual(engine.query(level, start, end, limit), self.expected(level, start, end, limit))
+        self.assertTrue(os.path.exists(engine.index_path))
+
+    def test_index_only_scans_appended_lines_and_survives_rotation(self):
+        from datetime import date
+        from unittest import mock
+        from .logreader import LogIndex
+
+        seen = []
+        original = LogIndex.update
+
+        def tracking(index, f, file_size):
+            # 记录每次扫描的起始位置
+            seen.append(index.size)
+            return original(index, f, file_size)
+
+        self.write('2025-02-01', 200)
+        engine = LogQueryEngine(self.path)
+        engine.query('ERROR', date(2025, 2, 1), None)
+
+        # 追加日志后只扫描新增部分，新的进程从索引文件加载
+        size = os.path.getsize(self.path)
+        self.write('2025-02-02', 10)
+        LogQueryEngine._cache.clear()
+        with mock.patch.object(LogIndex, 'update', tracking):
+            logs = engine.query('WARNING', date(2025, 2, 2), None)
+        self.assertEqual(seen, [size])
+        self.assertEqual(logs, self.expected('WARNING', date(2025, 2, 2)))
+
+        # 轮转后原文件的索引继续使用，不重新扫描
+        os.rename(self.path, f'{self.path}.1')
+        self.write('2025-02-03', 5)
+        seen.clear()
+        with mock.patch.object(LogIndex, 'update', tracking):
+            logs = engine.query(None, date(2025, 2, 1), date(2025, 2, 1), limit=1000)
+        self.assertEqual(seen, [0, os.path.getsize(f'{self.path}.1')])
+        self.assertEqual(logs, self.expected(None, date(2025, 2, 1), date(2025, 2, 1), 1000))
+
+    def test_unterminated_last_line_is_returned(self):
+        self.write('2025-03-01', 3)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('WARNING 2025-03-01 13:00:00,000 views 1 2 未写完')
+        logs = LogQueryEngine(self.path).query('WARNING', limit=1)
+        self.assertEqual(logs[0]['message'], '未写完')
@@ -0,0 +1,336 @@
+"""
+时间序列趋势引擎。
+
+每条序列保存为一个 float64 数组（按天序列另有一个 datetime64[D] 日期数组），
+所有计算都是整列的 NumPy 运算，结果为列式数组，由调用方决定是否转为逐行数据：
+
+- 移动平均：前缀和相减，耗时与窗口大小无关；序列开头窗口不足时使用已有数据
+- Z-score：相对全序列均值和样本标准差；滚动 Z-score 相对最近 window 个点，
+  窗口均值和方差同样由前缀和、平方前缀和相减得到
+- 指数加权移动平均（EWMA）：分块按闭式公式计算，避免逐点循环
+- 季节性：按月份、星期分组求均值
+- 同比：按"去年同月同日"（2 月 29 日对应 2 月 28 日）对齐上年序列
+"""
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDay
+from django.utils import timezone
+
+DateBound = Optional[Union[date, datetime]]
+
+# datetime64[D] 的第 0 天
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def to_number(value) -> float:
+    """转为浮点数，None 和无法解析的值按 0 处理。"""
+    if value is None:
+        return 0.0
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def to_array(values: Iterable) -> np.ndarray:
+    """转为 float64 数组，None、NaN 和无法解析的值按 0 处理。"""
+    values = list(values)
+    try:
+        array = np.asarray(values, dtype=np.float64)
+    except (ValueError, TypeError):
+        array = np.fromiter((to_number(value) for value in values), dtype=np.float64, count=len(values))
+    return np.where(np.isnan(array), 0.0, array)
+
+
+def to_dates(values: Iterable) -> np.ndarray:
+    """
+    转为 datetime64[D] 数组。
+
+    date 对象按序数换算（NumPy 逐个解析 date 对象较慢），其他输入（字符串、datetime64）交给 NumPy。
+    """
+    if isinstance(values, np.ndarray):
+        return values.astype('datetime64[D]')
+    values = list(values)
+    if values and all(type(value) is date for value in values):
+        ordinals = np.fromiter((value.toordinal() for value in values), dtype=np.int64, count=len(values))
+        return (ordinals - EPOCH_ORDINAL).astype('datetime64[D]')
+    return np.asarray(values, dtype='datetime64[D]')
+
+
+def moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    """尾随窗口的移动平均，前 window - 1 个点使用已有的数据。"""
+    count = len(values)
+    window = max(int(window), 1)
+    prefix = np.concatenate(([0.0], np.cumsum(values)))
+    end = np.arange(1, count + 1)
+    start = np.maximum(end - window, 0)
+    return (prefix[end] - prefix[start]) / (end - start)
+
+
+def zscores(values: np.ndarray) -> np.ndarray:
+    """
+    相对全序列均值和样本标准差的 Z-score，少于两个点或所有值相同时全为 0。
+
+    先按最大绝对值缩放后求均值和标准差，避免极小或极大的值在平方时下溢、溢出，
+    均值再用残差修正一次以减少舍入误差；换算回原量纲后按 (x - 均值) / 标准差 计算，
+    标准差在原量纲下为 0 时全为 0。
+    """
+    if len(values) < 2 or values.min() == values.max():
+        return np.zeros(len(values))
+    scale = np.abs(values).max()
+    scaled = values / scale
+    center = scaled.mean()
+    deviations = scaled - center
+    correction = deviations.mean()
+    deviations -= correction
+    std = np.sqrt((deviations * deviations).sum() / (len(values) - 1)) * scale
+    if std == 0:
+        return np.zeros(len(values))
+    return (values - (center + correction) * scale) / std
+
+
+def rolling_zscores(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    相对最近 window 个点（含当前点）的 Z-score。
+
+    窗口内少于两个点或标准差为 0 时为 0。先减去全序列均值再求前缀和，
+    减少平方前缀和相减时的精度损失。
+    """
+    count = len(values)
+    if count == 0:
+        return np.zeros(0)
+    window = max(int(window), 2)
+    centered = values - values.mean()
+    prefix = np.concatenate(([0.0], np.cumsum(centered)))
+    squares = np.concatenate(([0.0], np.cumsum(centered * centered)))
+    end = np.arange(1, count + 1)
+    start = np.maximum(end - window, 0)
+    size = end - start
+    total = prefix[end] - prefix[start]
+    mean = total / size
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = (squares[end] - squares[start] - total * mean) / (size - 1)
+        std = np.sqrt(np.clip(variance, 0, None))
+        scores = (centered - mean) / std
+    # 方差只剩舍入误差时视为 0
+    flat = (size < 2) | ~(std > 1e-9 * (np.abs(mean) + np.abs(values).max() + 1))
+    return np.where(flat, 0.0, scores)
+
+
+def ewma(values: np.ndarray, span: int) -> np.ndarray:
+    """
+    指数加权移动平均：y[0] = x[0]，y[t] = a * x[t] + (1 - a) * y[t - 1]，a = 2 / (span + 1)。
+
+    块内 y[t] = w^t * (w * y[-1] + a * Σ x[k] / w^k)（w = 1 - a），
+    块长度保证 w^-k 不超过 1e100。
+    """
+    count = len(values)
+    result = np.empty(count)
+    if count == 0:
+        return result
+    alpha = 2.0 / (max(int(span), 1) + 1)
+    decay = 1.0 - alpha
+    if decay <= 0:
+        return values.astype(np.float64, copy=True)
+    block = max(1, int(100 * np.log(10) / -np.log(decay)))
+    previous = values[0]
+    for begin in range(0, count, block):
+        chunk = values[begin:begin + block]
+        powers = decay ** np.arange(len(chunk))
+        result[begin:begin + block] = powers * (decay * previous + alpha * np.cumsum(chunk / powers))
+        previous = result[begin + len(chunk) - 1]
+    return result
+
+
+def confidence_levels(scores: np.ndarray) -> np.ndarray:
+    """|z| > 3 为 high，|z| > 2 为 medium，其余为 low。"""
+    magnitude = np.abs(scores)
+    return np.select([magnitude > 3, magnitude > 2], ['high', 'medium'], 'low')
+
+
+def group_average(keys: np.ndarray, values: np.ndarray) -> Dict[str, list]:
+    """
+    按整数键分组求均值。
+
+    Returns:
+        {'keys': [...], 'average': [...], 'sample_count': [...]}，按键排序，只包含有数据的键
+    """
+    if not len(keys):
+        return {'keys': [], 'average': [], 'sample_count': []}
+    keys = np.asarray(keys, dtype=np.int64)
+    counts = np.bincount(keys)
+    sums = np.bincount(keys, weights=values)
+    present = np.flatnonzero(counts)
+    return {
+        'keys': present.tolist(),
+        'average': np.round(sums[present] / counts[present], 2).tolist(),
+        'sample_count': counts[present].tolist(),
+    }
+
+
+def previous_year_dates(dates: np.ndarray) -> np.ndarray:
+    """去年同月同日，2 月 29 日对应去年 2 月 28 日。"""
+    months = dates.astype('datetime64[M]')
+    previous = months - 12
+    shifted = previous.astype('datetime64[D]') + (dates - months.astype('datetime64[D]'))
+    return np.minimum(shifted, (previous + 1).astype('datetime64[D]') - 1)
+
+
+class TrendSeries:
+    """
+    按天（或任意顺序）排列的一条时间序列。
+
+    Attributes:
+        values: float64 数值数组
+        dates: datetime64[D] 日期数组，没有日期时为 None（不能做季节性和同比分析）
+    """
+
+    def __init__(self, values: Iterable, dates: Optional[Sequence] = None):
+        self.values = values if isinstance(values, np.ndarray) and values.dtype == np.float64 else to_array(values)
+        self.dates = None if dates is None else to_dates(dates)
+
+    def __len__(self):
+        return len(self.values)
+
+    def moving_average(self, window: int) -> np.ndarray:
+        return moving_average(self.values, window)
+
+    def zscores(self) -> np.ndarray:
+        return zscores(self.values)
+
+    def rolling_zscores(self, window: int) -> np.ndarray:
+        return rolling_zscores(self.values, window)
+
+    def ewma(self, span: int) -> np.ndarray:
+        return ewma(self.values, span)
+
+    def anomalies(self, threshold: float = 2.0) -> Dict[str, np.ndarray]:
+        """按保留两位小数后的全局 Z-score 判断异常，返回 z_score、is_anomaly、confidence 三列。"""
+        scores = np.round(self.zscores(), 2)
+        return {
+            'z_score': scores,
+            'is_anomaly': np.abs(scores) > threshold,
+            'confidence': confidence_levels(scores),
+        }
+
+    def seasonality(self, by: str = 'month') -> dict:
+        """
+        按月份（1-12）或星期（1-7，星期一为 1）分组的均值。
+
+        Returns:
+            {'keys', 'average', 'sample_count', 'peak', 'low'}
+        """
+        if self.dates is None:
+            raise ValueError('没有日期的序列不能做季节性分析')
+        if by == 'month':
+            keys = self.dates.astype('datetime64[M]').astype(np.int64) % 12 + 1
+        elif by == 'weekday':
+            # datetime64 的第 0 天（1970-01-01）为星期四
+            keys = (self.dates.astype(np.int64) + 3) % 7 + 1
+        else:
+            raise ValueError(f'不支持的季节性分组: {by}')
+        pattern = group_average(keys, self.values)
+        averages = pattern['average']
+        pattern['peak'] = pattern['keys'][int(np.argmax(averages))] if averages else None
+        pattern['low'] = pattern['keys'][int(np.argmin(averages))] if averages else None
+        return pattern
+
+    def year_over_year(self, previous: 'TrendSeries') -> Dict[str, np.ndarray]:
+        """
+        与上年序列对齐后的同比。
+
+        上年没有对应日期时上期值为 0；上期值为 0 时，本期大于 0 记为 100%，否则为 0。
+        """
+        if self.dates is None or previous.dates is None:
+            raise ValueError('没有日期的序列不能做同比分析')
+        previous_values = np.zeros(len(self.values))
+        if len(previous.values) and len(self.values):
+            targets = previous_year_dates(self.dates)
+            index = np.clip((targets - previous.dates[0]).astype(np.int64), 0, len(previous.values) - 1)
+            # 上年序列按天连续时偏移即下标；不连续时下标处的日期与目标不一致，按 0 处理
+            matched = previous.dates[index] == targets
+            previous_values = np.where(matched, previous.values[index], 0.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = np.where(
+                previous_values > 0,
+                (self.values - previous_values) / previous_values * 100,
+                np.where(self.values > 0, 100.0, 0.0),
+            )
+        return {'previous_value': previous_values, 'yoy_rate': np.round(rates, 2)}
+
+    def iso_dates(self) -> List[str]:
+        return [] if self.dates is None else np.datetime_as_string(self.dates, unit='D').tolist()
+
+
+def daily_order_series(
+    windows: Sequence[Tuple[DateBound, DateBound]],
+    metrics: Sequence[str] = ('revenue', 'order_count'),
+) -> List[Dict[str, TrendSeries]]:
+    """
+    一条查询按天统计多个时间窗口内已支付订单的收入和订单数。
+
+    每个窗口的序列按天连续（没有订单的日期为 0），起止日期为窗口边界，
+    边界为空时取窗口内第一个或最后一个有订单的日期。
+
+    Args:
+        windows: [(start, end), ...]，按下单时间过滤，与 MultiDimensionAnalytics.analyze 一致
+        metrics: revenue、order_count 中的若干项
+
+    Returns:
+        每个窗口一个 {指标: TrendSeries}
+    """
+    from booking.models import Order
+
+    condition = Q()
+    for start, end in windows:
+        window = Q()
+        if start:
+            window &= Q(created_at__gte=start)
+        if end:
+            window &= Q(created_at__lte=end)
+        condition |= window
+    rows = list(
+        Order.objects.filter(status='paid').filter(condition)
+        .annotate(day=TruncDay('created_at')).order_by().values('day')
+        .annotate(revenue=Sum('total_price'), order_count=Count('id'))
+        .values_list('day', 'revenue', 'order_count')
+    )
+    days = to_dates(_as_date(day) for day, _, _ in rows)
+    columns = {
+        'revenue': to_array(revenue for _, revenue, _ in rows),
+        'order_count': to_array(count for _, _, count in rows),
+    }
+
+    result = []
+    for start, end in windows:
+        mask = np.ones(len(days), dtype=bool)
+        if start:
+            mask &= days >= np.datetime64(_as_date(start), 'D')
+        if end:
+            mask &= days <= np.datetime64(_as_date(end), 'D')
+        window_days = days[mask]
+        first = np.datetime64(_as_date(start), 'D') if start else (window_days.min() if len(window_days) else None)
+        last = np.datetime64(_as_date(end), 'D') if end else (window_days.max() if len(window_days) else None)
+        if first is None or last is None or last < first:
+            result.append({metric: TrendSeries(np.zeros(0), np.zeros(0, dtype='datetime64[D]')) for metric in metrics})
+            continue
+        dates = np.arange(first, last + 1, dtype='datetime64[D]')
+        index = (window_days - first).astype(np.int64)
+        series = {}
+        for metric in metrics:
+            values = np.zeros(len(dates))
+            values[index] = columns[metric][mask]
+            series[metric] = TrendSeries(values, dates)
+        result.append(series)
+    return result
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        return value.date()
+    return value
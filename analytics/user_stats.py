@@ -0,0 +1,153 @@
+"""
+用户消费统计维护。
+
+UserStats 记录每个用户已支付订单的数量、消费总额、首次和最近下单时间及分群，
+客户分群、忠诚度等按用户统计的分析直接读取，不再每次从全部订单重新聚合：
+
+- 订单支付、退款、取消、修改金额或删除（已支付订单的集合或金额发生变化）时
+  记录订单所属用户（见 analytics.signals），事务提交后（或本线程下一次读取前）
+  按用户批量重新统计：一条分组查询加一条批量写入
+- 用户分群（按已支付订单总数，见 analytics.olap.segment_for）是所有分析共用的
+  唯一定义：分群变化时该用户全部订单的销售事实重新生成，事实中的分群与本表一致
+- rebuild_rollups 命令全量重建（先于销售事实表）
+
+修改订单所属用户或绕过模型信号直接修改订单后，需要执行 rebuild_rollups 命令重建。
+"""
+import logging
+import threading
+from typing import Iterable, List, Optional
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+
+from booking.models import Order
+from .models import UserStats
+from .olap import SalesFactService, segment_for
+
+logger = logging.getLogger(__name__)
+
+# 计入统计的订单状态
+PAID_STATUS = 'paid'
+
+# 重新统计时更新的字段
+STAT_FIELDS = ('order_count', 'total_spend', 'first_order_at', 'last_order_at', 'segment', 'updated_at')
+
+_pending = threading.local()
+
+
+def _pending_users() -> set:
+    """本线程待重新统计的用户 ID。"""
+    if not hasattr(_pending, 'user_ids'):
+        _pending.user_ids = set()
+    return _pending.user_ids
+
+
+class UserStatsService:
+    """用户消费统计服务"""
+
+    @staticmethod
+    def contribution(values: Optional[dict]) -> Optional[tuple]:
+        """订单对用户统计的贡献：已支付订单为 (金额, 下单时间)，其他为 None。"""
+        if not values or values.get('status') != PAID_STATUS:
+            return None
+        return (values.get('total_price'), values.get('created_at'))
+
+    @staticmethod
+    def _stats(orders) -> List[UserStats]:
+        rows = orders.order_by().values('user_id').annotate(
+            order_count=Count('id'),
+            total_spend=Sum('total_price'),
+            first_order_at=Min('created_at'),
+            last_order_at=Max('created_at'),
+        )
+        return [
+            UserStats(
+                user_id=row['user_id'],
+                order_count=row['order_count'],
+                total_spend=row['total_spend'] or 0,
+                first_order_at=row['first_order_at'],
+                last_order_at=row['last_order_at'],
+                segment=segment_for(row['order_count']),
+            )
+            for row in rows
+        ]
+
+    # ------------------------------------------------------------------
+    # 增量维护
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def mark_dirty(cls, user_id: Optional[int]) -> None:
+        """记录需要重新统计的用户，事务提交后批量处理。"""
+        if user_id is None:
+            return
+        _pending_users().add(user_id)
+        transaction.on_commit(cls.flush)
+
+    @classmethod
+    def flush(cls, chunk_size: int = 500) -> int:
+        """处理本线程待重新统计的用户，返回写入的统计行数。"""
+        pending = _pending_users()
+        if not pending:
+            return 0
+        user_ids = sorted(pending)
+        pending.clear()
+        written = 0
+        try:
+            for offset in range(0, len(user_ids), chunk_size):
+                written += cls.refresh_users(user_ids[offset:offset + chunk_size])
+        except Exception:
+            pending.update(user_ids)
+            raise
+        return written
+
+    @classmethod
+    def refresh_users(cls, user_ids: Iterable[int]) -> int:
+        """
+        重新统计用户，没有已支付订单的用户删除统计行。
+
+        Returns:
+            写入的统计行数
+        """
+        user_ids = {pk for pk in user_ids if pk is not None}
+        if not user_ids:
+            return 0
+        stats = cls._stats(Order.objects.filter(user_id__in=user_ids, status=PAID_STATUS))
+        with transaction.atomic():
+            previous = dict(UserStats.objects.filter(user_id__in=user_ids).values_list('user_id', 'segment'))
+            UserStats.objects.filter(
+                user_id__in=user_ids - {item.user_id for item in stats}
+            ).delete()
+            UserStats.objects.bulk_create(
+                stats, update_conflicts=True, unique_fields=['user'], update_fields=STAT_FIELDS
+            )
+
+        # 分群变化的用户重新生成全部订单的销售事实
+        segments = {item.user_id: item.segment for item in stats}
+        changed = [
+            pk for pk in user_ids
+            if previous.get(pk, segment_for(0)) != segments.get(pk, segment_for(0))
+        ]
+        if changed:
+            SalesFactService.mark_dirty(*Order.objects.filter(user_id__in=changed).values_list('id', flat=True))
+        return len(stats)
+
+    # ------------------------------------------------------------------
+    # 全量重建
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def rebuild(cls) -> dict:
+        """
+        从已支付订单全量重建用户统计。
+
+        Returns:
+            统计信息（写入的用户数）
+        """
+        stats = cls._stats(Order.objects.filter(status=PAID_STATUS))
+        with transaction.atomic():
+            UserStats.objects.all().delete()
+            UserStats.objects.bulk_create(stats, batch_size=500)
+        result = {'user_stats_rows': len(stats)}
+        logger.info(f"用户消费统计重建完成: {result}")
+        return result
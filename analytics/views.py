@@ -1,8 +1,11 @@
 import datetime
 import random
 
-from django.db.models import Sum, Count, Avg, F
+import numpy as np
+from django.db.models import Sum, Count, Avg, F, Q
 from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.utils.timezone import now
 from rest_framework import permissions
 from rest_framework.response import Response
@@ -11,6 +14,13 @@ from rest_framework.views import APIView
 from accounts.models import User
 from booking.models import Order, Ticket
 from flight.models import Flight
+from .aggregates import TOTAL, bucket_counts, percentage
+from .cohorts import CohortEngine
+from .logreader import LogQueryEngine, parse_log_line
+from .models import DailySalesRollup, DailyUserRollup, HourlySalesRollup, UserStats
+from .route_metrics import RouteMetricsEngine
+from .services import DimensionPivotEngine
+from .user_stats import UserStatsService
 
 class AnalyticsOverview(APIView):
     """提供数据分析与报表概览接口，仅管理员可访问"""
@@ -23,7 +33,7 @@ class AnalyticsOverview(APIView):
         
         # 获取时间周期参数
         period = request.query_params.get('period', 'week')  # 默认显示本周数据
-        today = now().date()
+        today = timezone.localdate()
         
         if period == 'day':
             # 今日与昨日对比
@@ -48,33 +58,44 @@ class AnalyticsOverview(APIView):
             compare_start_date = start_of_week - datetime.timedelta(weeks=1)
             compare_end_date = start_date - datetime.timedelta(days=1)
         
-        # 计算当前统计数据
-        current_flights = Flight.objects.filter(departure_time__date__gte=start_date).count()
-        current_users = User.objects.filter(date_joined__date__gte=start_date).count()
-        current_orders = Order.objects.filter(created_at__date__gte=start_date).count()
-        current_revenue = Order.objects.filter(
-            status='paid', 
-            paid_at__date__gte=start_date
-        ).aggregate(total=Sum('total_price'))['total'] or 0
-        
-        # 计算对比周期数据
+        # 航班数：按起飞时间的半开区间统计，可使用 departure_time 索引
+        current_flights = Flight.objects.filter(departure_time__gte=_day_start(start_date)).count()
         compare_flights = Flight.objects.filter(
-            departure_time__date__gte=compare_start_date,
-            departure_time__date__lte=compare_end_date
-        ).count()
-        compare_users = User.objects.filter(
-            date_joined__date__gte=compare_start_date,
-            date_joined__date__lte=compare_end_date
+            departure_time__gte=_day_start(compare_start_date),
+            departure_time__lt=_day_start(compare_end_date + datetime.timedelta(days=1))
         ).count()
-        compare_orders = Order.objects.filter(
-            created_at__date__gte=compare_start_date,
-            created_at__date__lte=compare_end_date
-        ).count()
-        compare_revenue = Order.objects.filter(
-            status='paid',
-            paid_at__date__gte=compare_start_date,
-            paid_at__date__lte=compare_end_date
-        ).aggregate(total=Sum('total_price'))['total'] or 0
+
+        # 用户、订单和收入从每日汇总表读取：对比周期和最近7天趋势各一次查询
+        trend_start = today - datetime.timedelta(days=6)
+        since = min(compare_start_date, trend_start)
+        daily_sales = {
+            row['date']: row
+            for row in DailySalesRollup.objects.filter(date__gte=since).values('date').annotate(
+                orders=Sum('orders'), revenue=Sum('revenue')
+            )
+        }
+        daily_users = dict(
+            DailyUserRollup.objects.filter(date__gte=since).values_list('date', 'new_users')
+        )
+
+        def sales_between(field, first, last=None):
+            return sum(
+                (row[field] or 0) for day, row in daily_sales.items()
+                if day >= first and (last is None or day <= last)
+            )
+
+        def users_between(first, last=None):
+            return sum(
+                count for day, count in daily_users.items()
+                if day >= first and (last is None or day <= last)
+            )
+
+        current_users = users_between(start_date)
+        current_orders = sales_between('orders', start_date)
+        current_revenue = sales_between('revenue', start_date)
+        compare_users = users_between(compare_start_date, compare_end_date)
+        compare_orders = sales_between('orders', compare_start_date, compare_end_date)
+        compare_revenue = sales_between('revenue', compare_start_date, compare_end_date)
         
         # 计算增长率
         flights_growth = calculate_growth(current_flights, compare_flights)
@@ -85,16 +106,16 @@ class AnalyticsOverview(APIView):
         # 获取总数据
         total_flights = Flight.objects.count()
         total_users = User.objects.count()
-        total_orders = Order.objects.count()
-        total_revenue = Order.objects.filter(status='paid').aggregate(total=Sum('total_price'))['total'] or 0
+        totals = DailySalesRollup.objects.aggregate(orders=Sum('orders'), revenue=Sum('revenue'))
+        total_orders = totals['orders'] or 0
+        total_revenue = totals['revenue'] or 0
         
         # 最近7天销售趋势
         trend = []
         for i in range(6, -1, -1):  # 从6天前到今天
             day = today - datetime.timedelta(days=i)
-            revenue = Order.objects.filter(status='paid', paid_at__date=day).aggregate(sum=Sum('total_price'))['sum'] or 0
-            orders = Order.objects.filter(created_at__date=day).count()
-            trend.append([day.strftime('%Y-%m-%d'), float(revenue), orders])
+            row = daily_sales.get(day, {})
+            trend.append([day.strftime('%Y-%m-%d'), float(row.get('revenue') or 0), row.get('orders') or 0])
         
         # 获取热门目的地
         popular_destinations = []
@@ -137,8 +158,7 @@ class AnalyticsOverview(APIView):
         user_growth_data = []
         for i in range(6, -1, -1):  # 从6天前到今天
             day = today - datetime.timedelta(days=i)
-            new_users = User.objects.filter(date_joined__date=day).count()
-            user_growth_data.append([day.strftime('%Y-%m-%d'), new_users])
+            user_growth_data.append([day.strftime('%Y-%m-%d'), daily_users.get(day, 0)])
         
         # 订单完成情况
         order_status = Order.objects.values('status').annotate(count=Count('id'))
@@ -177,6 +197,37 @@ class AnalyticsOverview(APIView):
             'orderStatusData': order_status_data
         })
 
+def _day_start(day):
+    """本地时区某日零点（带时区），用于按日期范围过滤时间字段。"""
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def _parse_date_param(value):
+    """解析 YYYY-MM-DD 格式的日期查询参数，无法解析时返回 None。"""
+    if not value:
+        return None
+    try:
+        return parse_date(value[:10])
+    except ValueError:
+        return None
+
+
+def _parse_date_bound(value):
+    """
+    解析 OLAP 查询的日期边界：YYYY-MM-DD 返回 date（包含当天全天，可由预聚合表回答），
+    ISO 时间返回带时区的 datetime（精确时间），无法解析时返回 None。
+    """
+    if not value:
+        return None
+    try:
+        if 'T' in str(value):
+            parsed = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+            return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+        return datetime.datetime.strptime(str(value), '%Y-%m-%d').date()
+    except (ValueError, TypeError):
+        return None
+
+
 def calculate_growth(current, previous):
     """计算增长率百分比"""
     if previous == 0:
@@ -196,48 +247,38 @@ class FlightAnalytics(APIView):
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
         
-        queryset = Flight.objects.all()
-        if start_date:
-            queryset = queryset.filter(departure_time__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(departure_time__lte=end_date)
-            
-        # 热门航线统计
-        popular_routes = queryset.values('departure_city', 'arrival_city')\
-            .annotate(count=Count('id'))\
-            .order_by('-count')[:10]
-            
+        start = _parse_date_param(start_date)
+        end = _parse_date_param(end_date)
+        start = _day_start(start) if start else None
+        end = _day_start(end) if end else None
+        
+        # 热门航线统计（航线指标引擎，收入为已售机票的实际票价）
+        routes = RouteMetricsEngine.routes(start, end, order_by='flights', limit=10)
+        popular_routes = [
+            {
+                'departure_city': route['departure_city'],
+                'arrival_city': route['arrival_city'],
+                'count': route['flights']
+            }
+            for route in routes
+        ]
+        
         # 平均上座率
-        flights = queryset.annotate(
-            occupancy_rate=100 * (1 - F('available_seats') / F('capacity'))
-        ).aggregate(avg_occupancy=Avg('occupancy_rate'))
+        summary = RouteMetricsEngine.summary(start, end)
         
         # 按航线分类的收入
-        route_revenue = []
-        for route in popular_routes:
-            departure = route['departure_city']
-            arrival = route['arrival_city']
-            flights_ids = queryset.filter(
-                departure_city=departure, 
-                arrival_city=arrival
-            ).values_list('id', flat=True)
-            
-            revenue = Ticket.objects.filter(
-                flight_id__in=flights_ids, 
-                status='valid'
-            ).aggregate(
-                total=Sum('price')
-            )['total'] or 0
-            
-            route_revenue.append({
-                'route': f"{departure} - {arrival}",
-                'revenue': revenue,
-                'flight_count': route['count']
-            })
+        route_revenue = [
+            {
+                'route': f"{route['departure_city']} - {route['arrival_city']}",
+                'revenue': route['revenue'],
+                'flight_count': route['flights']
+            }
+            for route in routes
+        ]
         
         return Response({
             'popular_routes': popular_routes,
-            'avg_occupancy_rate': flights['avg_occupancy'],
+            'avg_occupancy_rate': summary['avg_load_factor'] if summary['total_flights'] else None,
             'route_revenue': route_revenue
         })
         
@@ -254,20 +295,23 @@ class RevenueAnalytics(APIView):
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
         
-        orders = Order.objects.filter(status='paid')
+        # 从每日汇总表按支付日期统计
+        rollups = DailySalesRollup.objects.filter(paid_orders__gt=0)
+        start_date = _parse_date_param(start_date)
+        end_date = _parse_date_param(end_date)
         if start_date:
-            orders = orders.filter(paid_at__date__gte=start_date)
+            rollups = rollups.filter(date__gte=start_date)
         if end_date:
-            orders = orders.filter(paid_at__date__lte=end_date)
+            rollups = rollups.filter(date__lte=end_date)
             
         # 总收入
-        total_revenue = orders.aggregate(total=Sum('total_price'))['total'] or 0
+        total_revenue = rollups.aggregate(total=Sum('revenue'))['total'] or 0
         
         # 按月收入趋势
-        monthly_trend = orders.annotate(
-            month=TruncMonth('paid_at')
+        monthly_trend = rollups.annotate(
+            month=TruncMonth('date')
         ).values('month').annotate(
-            revenue=Sum('total_price')
+            revenue=Sum('revenue')
         ).order_by('month')
         
         # 将日期转为字符串以便前端使用
@@ -279,16 +323,19 @@ class RevenueAnalytics(APIView):
                     'revenue': item['revenue'] or 0
                 })
         
-        # 按支付方式收入
-        payment_methods = orders.values('payment_method').annotate(
-            revenue=Sum('total_price'),
-            count=Count('id')
-        ).order_by('-revenue')
+        # 按支付方式收入（汇总表中未记录支付方式的订单以空字符串表示）
+        payment_methods = [
+            dict(item, payment_method=item['payment_method'] or None)
+            for item in rollups.values('payment_method').annotate(
+                revenue=Sum('revenue'),
+                count=Sum('paid_orders')
+            ).order_by('-revenue')
+        ]
         
         return Response({
             'total_revenue': total_revenue,
             'monthly_trend': monthly_result,
-            'payment_methods': list(payment_methods)
+            'payment_methods': payment_methods
         })
         
 class BusinessIntelligence(APIView):
@@ -311,35 +358,52 @@ class BusinessIntelligence(APIView):
         if end_date:
             orders = orders.filter(paid_at__date__lte=end_date)
             
-        user_stats = orders.values('user').annotate(
-            total_spent=Sum('total_price'),
-            order_count=Count('id')
-        ).aggregate(
-            avg_value=Avg('total_spent'),
-            avg_orders=Avg('order_count')
-        )
+        if start_date or end_date:
+            user_stats = orders.values('user').annotate(
+                total_spent=Sum('total_price'),
+                order_count=Count('id')
+            ).aggregate(
+                avg_value=Avg('total_spent'),
+                avg_orders=Avg('order_count')
+            )
+        else:
+            # 不限时间范围时直接读取用户消费统计表
+            UserStatsService.flush()
+            user_stats = UserStats.objects.aggregate(
+                avg_value=Avg('total_spend'),
+                avg_orders=Avg('order_count')
+            )
         
         # 销售转化率（假设以访问航班详情为起点，预订为转化）
         # 注意：这里是模拟数据，实际应该结合前端日志
+        booked = orders.count()
         conversion_rate = {
             'viewed': 1000,  # 模拟数据
-            'booked': orders.count(),
-            'rate': orders.count() / 1000 * 100 if orders.count() else 0
+            'booked': booked,
+            'rate': booked / 1000 * 100 if booked else 0
         }
         
-        # 预订提前期分析
-        advance_booking = []
-        for days in [7, 14, 30, 60, 90]:
-            count = Ticket.objects.filter(
-                order__status='paid',
-                flight__departure_time__gt=F('created_at'),
-                flight__departure_time__lte=F('created_at') + datetime.timedelta(days=days)
-            ).count()
-            advance_booking.append({
+        # 预订提前期分析（各提前期和已支付机票总数一条查询统计）
+        advance_days = [7, 14, 30, 60, 90]
+        advance_counts = bucket_counts(
+            Ticket.objects.filter(order__status='paid'),
+            {
+                days: Q(
+                    flight__departure_time__gt=F('created_at'),
+                    flight__departure_time__lte=F('created_at') + datetime.timedelta(days=days)
+                )
+                for days in advance_days
+            },
+            total=True
+        )
+        advance_booking = [
+            {
                 'days': days,
-                'count': count,
-                'percentage': count / Ticket.objects.filter(order__status='paid').count() * 100 if count else 0
-            })
+                'count': advance_counts[days],
+                'percentage': percentage(advance_counts[days], advance_counts[TOTAL])
+            }
+            for days in advance_days
+        ]
             
         return Response({
             'user_stats': user_stats,
@@ -412,14 +476,15 @@ class DataVisualization(APIView):
             {'min': 2000, 'max': 9999999, 'name': '2000元以上'}
         ]
         
-        # 计算每个区间的票数
-        ticket_price_ranges = []
-        for price_range in price_ranges:
-            count = tickets.filter(price__gte=price_range['min'], price__lt=price_range['max']).count()
-            ticket_price_ranges.append({
-                'name': price_range['name'],
-                'value': count
-            })
+        # 计算每个区间的票数（一条查询）
+        price_counts = bucket_counts(tickets, {
+            price_range['name']: Q(price__gte=price_range['min'], price__lt=price_range['max'])
+            for price_range in price_ranges
+        })
+        ticket_price_ranges = [
+            {'name': name, 'value': count}
+            for name, count in price_counts.items()
+        ]
         
         # 支付方式分布 - 从 Order.payment_method 聚合计算真实数据
         payment_data = Order.objects.filter(
@@ -522,7 +587,7 @@ class SystemLog(APIView):
         return Response(response_data)
     
     def _read_log_file(self, level=None, start_date=None, end_date=None, limit=100):
-        """从日志文件读取并解析日志记录
+        """从日志文件（含轮转文件）读取并解析最新的日志记录
         
         Args:
             level: 日志级别筛选
@@ -542,103 +607,15 @@ class SystemLog(APIView):
         if not os.path.exists(log_file_path):
             return [], '日志文件不存在'
         
-        logs = []
-        
+        engine = LogQueryEngine(log_file_path, persist=getattr(settings, 'LOG_INDEX_PERSIST', True))
         try:
-            with open(log_file_path, 'r', encoding='utf-8', errors='replace') as f:
-                # 读取所有行
-                lines = f.readlines()
-                
-                # 从后往前读取，获取最新的日志
-                for line in reversed(lines):
-                    log_entry = self._parse_log_line(line.strip())
-                    
-                    if log_entry is None:
-                        continue
-                    
-                    # 应用日志级别筛选
-                    if level and log_entry['level'] != level:
-                        continue
-                    
-                    # 应用时间范围筛选
-                    if start_date or end_date:
-                        try:
-                            log_date = datetime.datetime.strptime(
-                                log_entry['timestamp'][:10], '%Y-%m-%d'
-                            ).date()
-                            
-                            if start_date and log_date < start_date:
-                                continue
-                            if end_date and log_date > end_date:
-                                continue
-                        except (ValueError, IndexError):
-                            continue
-                    
-                    logs.append(log_entry)
-                    
-                    # 达到数量限制时停止
-                    if len(logs) >= limit:
-                        break
-            
-            return logs, None
-            
+            return engine.query(level, start_date, end_date, limit), None
         except IOError as e:
             return [], f'读取日志文件失败: {str(e)}'
     
     def _parse_log_line(self, line):
-        """解析单行日志
-        
-        日志格式: LEVEL YYYY-MM-DD HH:MM:SS,mmm source PID TID message
-        
-        Args:
-            line: 日志行字符串
-            
-        Returns:
-            dict: 解析后的日志条目，解析失败返回 None
-        """
-        if not line:
-            return None
-        
-        # 尝试解析日志行
-        # 格式: LEVEL YYYY-MM-DD HH:MM:SS,mmm source PID TID message
-        parts = line.split(' ', 6)
-        
-        if len(parts) < 5:
-            return None
-        
-        level = parts[0]
-        
-        # 验证日志级别
-        if level not in self.SUPPORTED_LEVELS:
-            return None
-        
-        try:
-            # 解析日期和时间
-            date_str = parts[1]
-            time_str = parts[2]
-            timestamp = f"{date_str}T{time_str.replace(',', '.')}"
-            
-            # 解析来源
-            source = parts[3] if len(parts) > 3 else 'unknown'
-            
-            # 解析消息（剩余部分）
-            # 跳过 PID 和 TID
-            if len(parts) >= 7:
-                message = parts[6]
-            elif len(parts) >= 6:
-                message = parts[5]
-            else:
-                message = ' '.join(parts[4:]) if len(parts) > 4 else ''
-            
-            return {
-                'timestamp': timestamp,
-                'level': level,
-                'message': message,
-                'source': source
-            }
-            
-        except (IndexError, ValueError):
-            return None
+        """解析单行日志，解析失败返回 None"""
+        return parse_log_line(line)
 
 class SalesTrend(APIView):
     """销售趋势分析接口"""
@@ -653,47 +630,47 @@ class SalesTrend(APIView):
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
         
-        # 获取时间单位参数(day, week, month)
+        # 获取时间单位参数(hour, day, week, month)
         time_unit = request.query_params.get('time_unit', 'day')
-        
-        # 准备销售数据
-        orders = Order.objects.filter(status='paid')
-        if start_date:
-            orders = orders.filter(created_at__gte=start_date)
-        if end_date:
-            orders = orders.filter(created_at__lte=end_date)
-        
-        # 根据时间单位聚合数据
-        if time_unit == 'week':
-            # 按周聚合
-            sales_data = orders.annotate(
-                date=TruncWeek('created_at')
-            ).values('date').annotate(
-                revenue=Sum('total_price'),
-                count=Count('id')
-            ).order_by('date')
-        elif time_unit == 'month':
-            # 按月聚合
-            sales_data = orders.annotate(
-                date=TruncMonth('created_at')
-            ).values('date').annotate(
-                revenue=Sum('total_price'),
-                count=Count('id')
-            ).order_by('date')
+        start_date = _parse_date_param(start_date)
+        end_date = _parse_date_param(end_date)
+        
+        # 从汇总表读取已支付订单的销售数据（按下单时间）
+        if time_unit == 'hour':
+            rollups = HourlySalesRollup.objects.filter(sales__gt=0)
+            if start_date:
+                rollups = rollups.filter(hour__gte=_day_start(start_date))
+            if end_date:
+                rollups = rollups.filter(hour__lt=_day_start(end_date + datetime.timedelta(days=1)))
+            period = F('hour')
+            date_format = '%Y-%m-%d %H:00'
         else:
-            # 默认按天聚合
-            sales_data = orders.annotate(
-                date=TruncDay('created_at')
-            ).values('date').annotate(
-                revenue=Sum('total_price'),
-                count=Count('id')
-            ).order_by('date')
+            rollups = DailySalesRollup.objects.filter(sales__gt=0)
+            if start_date:
+                rollups = rollups.filter(date__gte=start_date)
+            if end_date:
+                rollups = rollups.filter(date__lte=end_date)
+            if time_unit == 'week':
+                period = TruncWeek('date')
+            elif time_unit == 'month':
+                period = TruncMonth('date')
+            else:
+                period = F('date')
+            date_format = '%Y-%m-%d'
+        
+        sales_data = rollups.annotate(period=period).values('period').annotate(
+            revenue=Sum('sales_amount'),
+            count=Sum('sales')
+        ).order_by('period')
         
         # 格式化结果
         result = []
         for item in sales_data:
+            period_value = item['period']
+            if isinstance(period_value, datetime.datetime):
+                period_value = timezone.localtime(period_value)
             result.append({
-                'date': item['date'].strftime('%Y-%m-%d'),
+                'date': period_value.strftime(date_format),
                 'revenue': float(item['revenue']) if item['revenue'] else 0,
                 'count': item['count']
             })
@@ -726,58 +703,52 @@ class UserAnalytics(APIView):
             {'name': '50岁以上', 'min': 51, 'max': 200}
         ]
         
-        # 计算每个年龄区间的乘客数量
-        age_distribution = []
-        for age_range in age_ranges:
-            # 计算出生日期范围
-            # 年龄 >= min_age 意味着 birth_date <= today - min_age 年
-            # 年龄 < max_age 意味着 birth_date > today - max_age 年
-            max_birth_date = today.replace(year=today.year - age_range['min'])
-            min_birth_date = today.replace(year=today.year - age_range['max'])
-            
-            count = Passenger.objects.filter(
-                birth_date__gt=min_birth_date,
-                birth_date__lte=max_birth_date
-            ).count()
-            
-            age_distribution.append({
-                'age_range': age_range['name'],
-                'count': count
-            })
+        # 计算每个年龄区间的乘客数量（一次条件聚合查询）
+        # 年龄 >= min_age 意味着 birth_date <= today - min_age 年
+        # 年龄 < max_age 意味着 birth_date > today - max_age 年
+        age_counts = Passenger.objects.aggregate(**{
+            f'range_{index}': Count('id', filter=Q(
+                birth_date__gt=today.replace(year=today.year - age_range['max']),
+                birth_date__lte=today.replace(year=today.year - age_range['min'])
+            ))
+            for index, age_range in enumerate(age_ranges)
+        })
+        age_distribution = [
+            {'age_range': age_range['name'], 'count': age_counts[f'range_{index}']}
+            for index, age_range in enumerate(age_ranges)
+        ]
         
-        # 用户增长趋势 - 从 User.date_joined 聚合计算真实数据
-        end_date = now().date()
-        start_date = end_date - datetime.timedelta(days=365)  # 过去一年
+        # 用户增长趋势：过去一年按月统计
+        end_date = today
+        start_date = (end_date - datetime.timedelta(days=365)).replace(day=1)
         
-        # 按月聚合新用户数据
-        user_growth = []
-        current_date = start_date.replace(day=1)  # 从开始月份的第一天开始
+        # 当月新注册用户数，来自每日用户汇总表
+        new_users_by_month = {
+            item['month'].strftime('%Y-%m'): item['count']
+            for item in DailyUserRollup.objects.filter(date__gte=start_date).annotate(
+                month=TruncMonth('date')
+            ).values('month').annotate(count=Sum('new_users'))
+        }
+        
+        # 当月活跃用户数（基于 last_login 字段），一次分组查询
+        active_users_by_month = {
+            timezone.localtime(item['month']).strftime('%Y-%m'): item['count']
+            for item in User.objects.filter(last_login__gte=_day_start(start_date)).annotate(
+                month=TruncMonth('last_login')
+            ).values('month').annotate(count=Count('id'))
+        }
         
+        user_growth = []
+        current_date = start_date
         while current_date <= end_date:
-            next_month = current_date.month + 1 if current_date.month < 12 else 1
-            next_month_year = current_date.year if current_date.month < 12 else current_date.year + 1
-            next_month_date = current_date.replace(year=next_month_year, month=next_month, day=1)
-            
-            # 当月新注册用户数
-            new_users = User.objects.filter(
-                date_joined__gte=current_date,
-                date_joined__lt=next_month_date
-            ).count()
-            
-            # 当月活跃用户数（基于 last_login 字段）
-            active_users = User.objects.filter(
-                last_login__gte=current_date,
-                last_login__lt=next_month_date
-            ).count()
-            
+            month_key = current_date.strftime('%Y-%m')
             user_growth.append({
-                'month': current_date.strftime('%Y-%m'),
-                'new_users': new_users,
-                'active_users': active_users
+                'month': month_key,
+                'new_users': new_users_by_month.get(month_key, 0),
+                'active_users': active_users_by_month.get(month_key, 0)
             })
-            
             # 移至下个月
-            current_date = next_month_date
+            current_date = (current_date + datetime.timedelta(days=32)).replace(day=1)
         
         return Response({
             'age_distribution': age_distribution,
@@ -845,25 +816,15 @@ class FlightVisualization(APIView):
         if not hasattr(user, 'role') or user.role != 'admin':
             return Response({'detail': '权限不足'}, status=403)
         
-        # 获取航线载客率数据 - 使用真实数据
-        # 上座率 = (capacity - available_seats) / capacity * 100
-        routes = Flight.objects.values('departure_city', 'arrival_city').annotate(
-            avg_occupancy=Avg(100 * (F('capacity') - F('available_seats')) / F('capacity')),
-            flight_count=Count('id')
-        ).order_by('-flight_count')[:10]  # 取前10条热门航线
-        
-        flight_load = []
-        for route in routes:
-            flight_load.append({
+        # 各航线上座率和航班数（航线指标引擎，分组查询并缓存）
+        all_routes = RouteMetricsEngine.routes(order_by='flights')
+        flight_load = [
+            {
                 'name': f"{route['departure_city']}-{route['arrival_city']}",
-                'value': round(route['avg_occupancy']) if route['avg_occupancy'] else 0
-            })
-        
-        # 构建航线地图数据 - 使用真实航线数据
-        # 获取所有航线及其航班数量
-        all_routes = Flight.objects.values('departure_city', 'arrival_city').annotate(
-            count=Count('id')
-        ).order_by('-count')
+                'value': round(route['load_factor'])
+            }
+            for route in all_routes[:10]  # 取前10条热门航线
+        ]
         
         # 收集所有涉及的城市
         cities_in_routes = set()
@@ -889,7 +850,7 @@ class FlightVisualization(APIView):
                     'from': dep,
                     'to': arr,
                     'coords': [city_coordinates[dep], city_coordinates[arr]],
-                    'value': route['count']
+                    'value': route['flights']
                 })
         
         return Response({
@@ -912,11 +873,8 @@ class RouteAnalytics(APIView):
         # 获取分析指标参数(revenue, profit, roi)
         metric = request.query_params.get('metric', 'revenue')
         
-        # 获取热门航线数据
-        routes = Flight.objects.values('departure_city', 'arrival_city').annotate(
-            flight_count=Count('id'),
-            revenue=Sum(F('price') * (F('capacity') - F('available_seats')))
-        ).order_by('-flight_count')[:10]  # 取前10条热门航线
+        # 获取热门航线数据（收入为已售机票的实际票价）
+        routes = RouteMetricsEngine.routes(order_by='flights', limit=10)  # 取前10条热门航线
         
         # 处理不同指标
         route_data = []
@@ -935,19 +893,19 @@ class RouteAnalytics(APIView):
                 route_data.append({
                     'route': route_name,
                     'value': round(profit, 2),
-                    'flights': route['flight_count']
+                    'flights': route['flights']
                 })
             elif metric == 'roi':
                 route_data.append({
                     'route': route_name,
                     'value': round(roi, 2),
-                    'flights': route['flight_count']
+                    'flights': route['flights']
                 })
             else:  # 默认revenue
                 route_data.append({
                     'route': route_name,
-                    'value': float(route['revenue']) if route['revenue'] else 0,
-                    'flights': route['flight_count']
+                    'value': float(route['revenue']),
+                    'flights': route['flights']
                 })
         
         # 按指标值排序
@@ -1039,6 +997,8 @@ class CustomerSegments(APIView):
     - 高价值: 消费总额 >= 3000 元
     - 中价值: 1000 元 <= 消费总额 < 3000 元
     - 低价值: 消费总额 < 1000 元
+    
+    消费总额读取用户消费统计表（UserStats），不再从全部订单重新聚合。
     """
     permission_classes = [permissions.IsAuthenticated]
     
@@ -1051,90 +1011,33 @@ class CustomerSegments(APIView):
         if not hasattr(user, 'role') or user.role != 'admin':
             return Response({'detail': '权限不足'}, status=403)
         
-        # 基于 Order.total_price 聚合计算每个用户的消费总额
-        user_spending = Order.objects.filter(
-            status='paid'
-        ).values('user').annotate(
-            total_spend=Sum('total_price')
+        # 从用户消费统计表按消费总额分组汇总（一条查询）
+        UserStatsService.flush()
+        tiers = (
+            ('高价值客户', Q(total_spend__gte=self.HIGH_VALUE_THRESHOLD)),
+            ('中价值客户', Q(total_spend__gte=self.MEDIUM_VALUE_THRESHOLD, total_spend__lt=self.HIGH_VALUE_THRESHOLD)),
+            ('低价值客户', Q(total_spend__lt=self.MEDIUM_VALUE_THRESHOLD)),
         )
-        
-        # 初始化分群数据
-        high_value = {'count': 0, 'total_spend': 0.0, 'users': []}
-        medium_value = {'count': 0, 'total_spend': 0.0, 'users': []}
-        low_value = {'count': 0, 'total_spend': 0.0, 'users': []}
-        
-        # 按消费金额分群
-        for user_data in user_spending:
-            spend = float(user_data['total_spend']) if user_data['total_spend'] else 0
-            
-            if spend >= self.HIGH_VALUE_THRESHOLD:
-                high_value['count'] += 1
-                high_value['total_spend'] += spend
-            elif spend >= self.MEDIUM_VALUE_THRESHOLD:
-                medium_value['count'] += 1
-                medium_value['total_spend'] += spend
-            else:
-                low_value['count'] += 1
-                low_value['total_spend'] += spend
+        aggregates = {}
+        for index, (_, condition) in enumerate(tiers):
+            aggregates[f'count_{index}'] = Count('pk', filter=condition)
+            aggregates[f'spend_{index}'] = Sum('total_spend', filter=condition)
+        totals = UserStats.objects.aggregate(**aggregates)
         
         # 计算总用户数
-        total_users = high_value['count'] + medium_value['count'] + low_value['count']
+        total_users = sum(totals[f'count_{index}'] for index in range(len(tiers)))
         
         # 构建返回数据
         segments = []
-        
-        # 高价值客户
-        if high_value['count'] > 0:
-            segments.append({
-                'name': '高价值客户',
-                'count': high_value['count'],
-                'avg_spend': round(high_value['total_spend'] / high_value['count'], 2),
-                'total_spend': round(high_value['total_spend'], 2),
-                'percentage': round(high_value['count'] / total_users * 100, 1) if total_users > 0 else 0
-            })
-        else:
-            segments.append({
-                'name': '高价值客户',
-                'count': 0,
-                'avg_spend': 0,
-                'total_spend': 0,
-                'percentage': 0
-            })
-        
-        # 中价值客户
-        if medium_value['count'] > 0:
-            segments.append({
-                'name': '中价值客户',
-                'count': medium_value['count'],
-                'avg_spend': round(medium_value['total_spend'] / medium_value['count'], 2),
-                'total_spend': round(medium_value['total_spend'], 2),
-                'percentage': round(medium_value['count'] / total_users * 100, 1) if total_users > 0 else 0
-            })
-        else:
-            segments.append({
-                'name': '中价值客户',
-                'count': 0,
-                'avg_spend': 0,
-                'total_spend': 0,
-                'percentage': 0
-            })
-        
-        # 低价值客户
-        if low_value['count'] > 0:
-            segments.append({
-                'name': '低价值客户',
-                'count': low_value['count'],
-                'avg_spend': round(low_value['total_spend'] / low_value['count'], 2),
-                'total_spend': round(low_value['total_spend'], 2),
-                'percentage': round(low_value['count'] / total_users * 100, 1) if total_users > 0 else 0
-            })
-        else:
+        for index, (name, _) in enumerate(tiers):
+            count = totals[f'count_{index}']
+            spend = float(totals[f'spend_{index}'] or 0)
             segments.append({
-                'name': '低价值客户',
-                'count': 0,
-                'avg_spend': 0,
-                'total_spend': 0,
-                'percentage': 0
+                'name': name,
+                'count': count,
+                'avg_spend': round(spend / count, 2) if count else 0,
+                'total_spend': round(spend, 2) if count else 0,
+                'percentage': round(count / total_users * 100, 1) if total_users > 0 else 0
             })
         
         return Response({
@@ -1158,18 +1061,22 @@ class CustomerLoyalty(APIView):
         start_date = request.query_params.get('start_date')
         end_date = request.query_params.get('end_date')
         
-        # 基础查询
-        orders = Order.objects.filter(status='paid')
-        if start_date:
-            orders = orders.filter(created_at__date__gte=start_date)
-        if end_date:
-            orders = orders.filter(created_at__date__lte=end_date)
-        
-        # 计算每个用户的订单数和消费总额
-        user_stats = orders.values('user').annotate(
-            order_count=Count('id'),
-            total_spend=Sum('total_price')
-        )
+        # 计算每个用户的订单数和消费总额：不限时间范围时读取用户消费统计表
+        if start_date or end_date:
+            orders = Order.objects.filter(status='paid')
+            if start_date:
+                orders = orders.filter(created_at__date__gte=start_date)
+            if end_date:
+                orders = orders.filter(created_at__date__lte=end_date)
+            user_stats = list(orders.values('user').annotate(
+                order_count=Count('id'),
+                total_spend=Sum('total_price')
+            ))
+        else:
+            UserStatsService.flush()
+            user_stats = list(UserStats.objects.order_by().values(
+                'user', 'order_count', 'total_spend'
+            ))
         
         # 计算最大订单数用于归一化忠诚度指数
         max_orders = max([u['order_count'] for u in user_stats], default=1)
@@ -1189,58 +1096,19 @@ class CustomerLoyalty(APIView):
                 'value': [loyalty_index, order_count, round(avg_spend, 2)]
             })
         
-        # 计算留存趋势（按月统计回购用户比例）
-        retention_trend = self._calculate_retention_trend(orders)
+        # 留存趋势（按月统计回购用户比例）和首购月份队列的留存三角
+        cohorts = CohortEngine.report(start_date, end_date)
         
         # 按忠诚度分组的消费统计
         loyalty_spending = self._calculate_loyalty_spending(user_stats)
         
         return Response({
             'loyalty_levels': loyalty_levels,
-            'retention_trend': retention_trend,
+            'retention_trend': cohorts['retention_trend'],
+            'cohort_triangle': cohorts['cohort_triangle'],
             'loyalty_spending': loyalty_spending
         })
     
-    def _calculate_retention_trend(self, orders):
-        """计算留存趋势"""
-        from django.db.models.functions import TruncMonth
-        
-        # 按月统计有订单的用户数
-        monthly_users = orders.annotate(
-            month=TruncMonth('created_at')
-        ).values('month').annotate(
-            user_count=Count('user', distinct=True)
-        ).order_by('month')
-        
-        months = []
-        rates = []
-        prev_users = set()
-        
-        for month_data in monthly_users:
-            month_str = month_data['month'].strftime('%Y-%m') if month_data['month'] else ''
-            months.append(month_str)
-            
-            # 获取当月用户
-            current_month_users = set(orders.filter(
-                created_at__year=month_data['month'].year,
-                created_at__month=month_data['month'].month
-            ).values_list('user', flat=True))
-            
-            # 计算回购率（当月用户中有多少是之前的用户）
-            if prev_users:
-                returning = len(current_month_users & prev_users)
-                rate = round(returning / len(current_month_users) * 100, 1) if current_month_users else 0
-            else:
-                rate = 0
-            
-            rates.append(rate)
-            prev_users = prev_users | current_month_users
-        
-        return {
-            'months': months,
-            'rates': rates
-        }
-    
     def _calculate_loyalty_spending(self, user_stats):
         """按忠诚度分组计算消费统计"""
         # 分组：低频(1-2次)、中频(3-5次)、高频(6次以上)
@@ -1289,11 +1157,8 @@ class RouteMap(APIView):
         if not hasattr(user, 'role') or user.role != 'admin':
             return Response({'detail': '权限不足'}, status=403)
         
-        # 获取所有航线数据
-        routes = Flight.objects.values('departure_city', 'arrival_city').annotate(
-            count=Count('id'),
-            revenue=Sum(F('price') * (F('capacity') - F('available_seats')))
-        ).order_by('-count')
+        # 获取所有航线数据（收入为已售机票的实际票价）
+        routes = RouteMetricsEngine.routes(order_by='flights')
         
         # 城市坐标数据（实际应该从地理数据库获取）
         city_coordinates = {
@@ -1309,18 +1174,8 @@ class RouteMap(APIView):
             '武汉': [114.298572, 30.584355]
         }
         
-        # 获取城市列表
-        cities = set()
-        for route in routes:
-            cities.add(route['departure_city'])
-            cities.add(route['arrival_city'])
-        
-        # 计算每个城市的航班总数
-        city_traffic = {}
-        for city in cities:
-            departures = Flight.objects.filter(departure_city=city).count()
-            arrivals = Flight.objects.filter(arrival_city=city).count()
-            city_traffic[city] = departures + arrivals
+        # 每个城市的进出港航班总数
+        city_traffic = RouteMetricsEngine.city_traffic()
         
         # 生成航线数据
         route_data = []
@@ -1335,8 +1190,10 @@ class RouteMap(APIView):
                     'from': dep,
                     'to': arr,
                     'coords': [city_coordinates[dep], city_coordinates[arr]],
-                    'count': route['count'],
-                    'revenue': float(route['revenue']) if route['revenue'] else 0
+                    'count': route['flights'],
+                    'revenue': float(route['revenue']),
+                    'sold_seats': route['sold_seats'],
+                    'load_factor': route['load_factor']
                 })
         
         city_data = []
@@ -1360,19 +1217,19 @@ class PivotData(APIView):
     支持的维度:
     - city: 按城市聚合航班和收入数据
     - paymentMethod: 按支付方式聚合订单数据
-    - flight: 按航班聚合数据
-    - userType: 按用户类型聚合数据
     
     支持的指标:
     - revenue: 销售额
     - orders: 订单数
     - averageValue: 平均客单价
     - refundRate: 退票率
+    
+    聚合由 DimensionPivotEngine 完成，查询次数不随城市或支付方式的数量增长。
     """
     permission_classes = [permissions.IsAuthenticated]
     
     # 支持的维度列表
-    SUPPORTED_DIMENSIONS = ['city', 'paymentMethod', 'flight', 'userType']
+    SUPPORTED_DIMENSIONS = DimensionPivotEngine.DIMENSIONS
     
     def get(self, request):
         user = request.user
@@ -1390,16 +1247,7 @@ class PivotData(APIView):
                 'supported_dimensions': self.SUPPORTED_DIMENSIONS
             }, status=400)
         
-        pivot_data = []
-        
-        if dimension == 'city':
-            pivot_data = self._aggregate_by_city(metric)
-        elif dimension == 'paymentMethod':
-            pivot_data = self._aggregate_by_payment_method(metric)
-        elif dimension == 'flight':
-            pivot_data = self._aggregate_by_flight(metric)
-        elif dimension == 'userType':
-            pivot_data = self._aggregate_by_user_type(metric)
+        pivot_data = DimensionPivotEngine().aggregate(dimension, metric)
         
         # 排序
         pivot_data.sort(key=lambda x: x['value'], reverse=True)
@@ -1418,243 +1266,6 @@ class PivotData(APIView):
             'metric_label': metric_labels.get(metric, metric),
             'data': pivot_data
         })
-    
-    def _calculate_refund_rate(self, tickets_queryset):
-        """计算退票率"""
-        total_tickets = tickets_queryset.count()
-        if total_tickets == 0:
-            return 0
-        refunded_tickets = tickets_queryset.filter(status='refunded').count()
-        return round(refunded_tickets / total_tickets * 100, 2)
-    
-    def _aggregate_by_city(self, metric):
-        """按城市维度聚合数据"""
-        # 获取所有城市（出发城市和到达城市）
-        cities = set()
-        
-        departure_cities = Flight.objects.values_list('departure_city', flat=True).distinct()
-        arrival_cities = Flight.objects.values_list('arrival_city', flat=True).distinct()
-        
-        cities.update(departure_cities)
-        cities.update(arrival_cities)
-        
-        pivot_data = []
-        total_value = 0
-        
-        for city in cities:
-            # 获取该城市相关的航班（出发或到达）
-            city_flights = Flight.objects.filter(
-                departure_city=city
-            ) | Flight.objects.filter(
-                arrival_city=city
-            )
-            flight_ids = city_flights.values_list('id', flat=True)
-            
-            # 获取该城市相关的机票
-            city_tickets = Ticket.objects.filter(flight_id__in=flight_ids)
-            
-            if metric == 'revenue':
-                # 销售额：该城市相关机票的总收入
-                value = city_tickets.aggregate(total=Sum('price'))['total'] or 0
-                value = float(value)
-            elif metric == 'orders':
-                # 订单数：该城市相关机票的订单数
-                value = city_tickets.values('order_id').distinct().count()
-            elif metric == 'averageValue':
-                # 平均客单价：该城市相关订单的平均金额
-                order_ids = city_tickets.values_list('order_id', flat=True).distinct()
-                avg_result = Order.objects.filter(id__in=order_ids, status='paid').aggregate(
-                    avg=Avg('total_price')
-                )
-                value = float(avg_result['avg']) if avg_result['avg'] else 0
-            elif metric == 'refundRate':
-                # 退票率：该城市相关机票的退票率
-                value = self._calculate_refund_rate(city_tickets)
-            else:
-                value = 0
-            
-            total_value += value
-            
-            pivot_data.append({
-                'dimension': city,
-                'value': round(value, 2) if metric in ['revenue', 'averageValue'] else value,
-                'flight_count': city_flights.count()
-            })
-        
-        # 计算百分比
-        for item in pivot_data:
-            if total_value > 0:
-                item['percentage'] = round(item['value'] / total_value * 100, 2)
-            else:
-                item['percentage'] = 0
-        
-        return pivot_data
-    
-    def _aggregate_by_payment_method(self, metric):
-        """按支付方式维度聚合数据"""
-        # 获取所有支付方式
-        payment_methods = Order.objects.filter(
-            status='paid',
-            payment_method__isnull=False
-        ).exclude(
-            payment_method=''
-        ).values_list('payment_method', flat=True).distinct()
-        
-        pivot_data = []
-        total_value = 0
-        
-        for payment_method in payment_methods:
-            # 获取该支付方式的订单
-            method_orders = Order.objects.filter(
-                status='paid',
-                payment_method=payment_method
-            )
-            
-            if metric == 'revenue':
-                # 销售额：该支付方式的总收入
-                value = method_orders.aggregate(total=Sum('total_price'))['total'] or 0
-                value = float(value)
-            elif metric == 'orders':
-                # 订单数：该支付方式的订单数量
-                value = method_orders.count()
-            elif metric == 'averageValue':
-                # 平均客单价：该支付方式的平均订单金额
-                avg_result = method_orders.aggregate(avg=Avg('total_price'))
-                value = float(avg_result['avg']) if avg_result['avg'] else 0
-            elif metric == 'refundRate':
-                # 退票率：该支付方式订单的退票率
-                order_ids = method_orders.values_list('id', flat=True)
-                method_tickets = Ticket.objects.filter(order_id__in=order_ids)
-                value = self._calculate_refund_rate(method_tickets)
-            else:
-                value = 0
-            
-            total_value += value
-            
-            pivot_data.append({
-                'dimension': payment_method,
-                'value': round(value, 2) if metric in ['revenue', 'averageValue'] else value,
-                'order_count': method_orders.count()
-            })
-        
-        # 计算百分比
-        for item in pivot_data:
-            if total_value > 0:
-                item['percentage'] = round(item['value'] / total_value * 100, 2)
-            else:
-                item['percentage'] = 0
-        
-        return pivot_data
-    
-    def _aggregate_by_flight(self, metric):
-        """按航班维度聚合数据"""
-        # 获取有机票的航班
-        flights = Flight.objects.filter(tickets__isnull=False).distinct()[:20]  # 限制前20个
-        
-        pivot_data = []
-        total_value = 0
-        
-        for flight in flights:
-            flight_tickets = Ticket.objects.filter(flight=flight)
-            flight_label = f"{flight.flight_number} ({flight.departure_city}-{flight.arrival_city})"
-            
-            if metric == 'revenue':
-                value = flight_tickets.aggregate(total=Sum('price'))['total'] or 0
-                value = float(value)
-            elif metric == 'orders':
-                value = flight_tickets.values('order_id').distinct().count()
-            elif metric == 'averageValue':
-                order_ids = flight_tickets.values_list('order_id', flat=True).distinct()
-                avg_result = Order.objects.filter(id__in=order_ids, status='paid').aggregate(
-                    avg=Avg('total_price')
-                )
-                value = float(avg_result['avg']) if avg_result['avg'] else 0
-            elif metric == 'refundRate':
-                value = self._calculate_refund_rate(flight_tickets)
-            else:
-                value = 0
-            
-            total_value += value
-            
-            pivot_data.append({
-                'dimension': flight_label,
-                'value': round(value, 2) if metric in ['revenue', 'averageValue', 'refundRate'] else value,
-                'ticket_count': flight_tickets.count()
-            })
-        
-        # 计算百分比
-        for item in pivot_data:
-            if total_value > 0:
-                item['percentage'] = round(item['value'] / total_value * 100, 2)
-            else:
-                item['percentage'] = 0
-        
-        return pivot_data
-    
-    def _aggregate_by_user_type(self, metric):
-        """按用户类型维度聚合数据"""
-        # 用户类型定义：根据订单数量分类
-        # VIP: 订单数 >= 5
-        # 常客: 订单数 >= 2
-        # 新用户: 订单数 = 1
-        
-        user_types = [
-            {'name': 'VIP用户', 'min_orders': 5, 'max_orders': None},
-            {'name': '常客', 'min_orders': 2, 'max_orders': 4},
-            {'name': '新用户', 'min_orders': 1, 'max_orders': 1},
-        ]
-        
-        pivot_data = []
-        total_value = 0
-        
-        for user_type in user_types:
-            # 获取符合条件的用户
-            user_order_counts = Order.objects.filter(status='paid').values('user').annotate(
-                order_count=Count('id')
-            )
-            
-            if user_type['max_orders'] is None:
-                qualified_users = user_order_counts.filter(order_count__gte=user_type['min_orders'])
-            else:
-                qualified_users = user_order_counts.filter(
-                    order_count__gte=user_type['min_orders'],
-                    order_count__lte=user_type['max_orders']
-                )
-            
-            user_ids = [u['user'] for u in qualified_users]
-            type_orders = Order.objects.filter(user_id__in=user_ids, status='paid')
-            
-            if metric == 'revenue':
-                value = type_orders.aggregate(total=Sum('total_price'))['total'] or 0
-                value = float(value)
-            elif metric == 'orders':
-                value = type_orders.count()
-            elif metric == 'averageValue':
-                avg_result = type_orders.aggregate(avg=Avg('total_price'))
-                value = float(avg_result['avg']) if avg_result['avg'] else 0
-            elif metric == 'refundRate':
-                order_ids = type_orders.values_list('id', flat=True)
-                type_tickets = Ticket.objects.filter(order_id__in=order_ids)
-                value = self._calculate_refund_rate(type_tickets)
-            else:
-                value = 0
-            
-            total_value += value
-            
-            pivot_data.append({
-                'dimension': user_type['name'],
-                'value': round(value, 2) if metric in ['revenue', 'averageValue', 'refundRate'] else value,
-                'user_count': len(user_ids)
-            })
-        
-        # 计算百分比
-        for item in pivot_data:
-            if total_value > 0:
-                item['percentage'] = round(item['value'] / total_value * 100, 2)
-            else:
-                item['percentage'] = 0
-        
-        return pivot_data
 
 class RealtimeData(APIView):
     """实时数据监控接口"""
@@ -1733,8 +1344,8 @@ class MultiDimensionAnalysisView(APIView):
     请求参数:
     - dimensions: 分析维度列表 ['time', 'route', 'cabin_class', 'user_segment']
     - metrics: 指标列表 ['revenue', 'order_count', 'avg_price', 'ticket_count']
-    - start_date: 开始日期 (YYYY-MM-DD 或 ISO 格式)
-    - end_date: 结束日期 (YYYY-MM-DD 或 ISO 格式)
+    - start_date: 开始日期 (YYYY-MM-DD 包含当天，或 ISO 格式的精确时间)
+    - end_date: 结束日期 (YYYY-MM-DD 包含当天，或 ISO 格式的精确时间)
     - time_granularity: 时间粒度 (day, week, month, quarter, year)
     """
     permission_classes = [permissions.IsAuthenticated]
@@ -1785,18 +1396,7 @@ class MultiDimensionAnalysisView(APIView):
         return Response(result)
     
     def _parse_date(self, date_str):
-        """解析日期字符串为 datetime 对象"""
-        if not date_str:
-            return None
-        
-        try:
-            # 尝试解析 ISO 格式
-            if 'T' in str(date_str):
-                return datetime.datetime.fromisoformat(str(date_str).replace('Z', '+00:00'))
-            # 尝试解析 YYYY-MM-DD 格式
-            return datetime.datetime.strptime(str(date_str), '%Y-%m-%d')
-        except (ValueError, TypeError):
-            return None
+        return _parse_date_bound(date_str)
 
 
 
@@ -1812,8 +1412,8 @@ class PivotDataView(APIView):
     - col_dimensions: 列维度列表
     - value_metric: 值指标 (total_price, revenue, ticket_price, ticket_count)
     - aggregation: 聚合方式 (sum, count, avg)
-    - start_date: 开始日期
-    - end_date: 结束日期
+    - start_date: 开始日期 (YYYY-MM-DD 包含当天，或 ISO 格式的精确时间)
+    - end_date: 结束日期 (YYYY-MM-DD 包含当天，或 ISO 格式的精确时间)
     """
     permission_classes = [permissions.IsAuthenticated]
     
@@ -1843,28 +1443,22 @@ class PivotDataView(APIView):
         
         # 生成透视表数据
         engine = PivotTableEngine()
-        result = engine.generate(
-            row_dimensions=row_dimensions,
-            col_dimensions=col_dimensions,
-            value_metric=value_metric,
-            aggregation=aggregation,
-            start_date=start_date,
-            end_date=end_date,
-        )
+        try:
+            result = engine.generate(
+                row_dimensions=row_dimensions,
+                col_dimensions=col_dimensions,
+                value_metric=value_metric,
+                aggregation=aggregation,
+                start_date=start_date,
+                end_date=end_date,
+            )
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=400)
         
         return Response(result)
     
     def _parse_date(self, date_str):
-        """解析日期字符串为 datetime 对象"""
-        if not date_str:
-            return None
-        
-        try:
-            if 'T' in str(date_str):
-                return datetime.datetime.fromisoformat(str(date_str).replace('Z', '+00:00'))
-            return datetime.datetime.strptime(str(date_str), '%Y-%m-%d')
-        except (ValueError, TypeError):
-            return None
+        return _parse_date_bound(date_str)
 
 
 class PivotExportView(APIView):
@@ -1897,14 +1491,17 @@ class PivotExportView(APIView):
         
         # 生成透视表数据
         engine = PivotTableEngine()
-        pivot_result = engine.generate(
-            row_dimensions=row_dimensions,
-            col_dimensions=col_dimensions,
-            value_metric=value_metric,
-            aggregation=aggregation,
-            start_date=start_date,
-            end_date=end_date,
-        )
+        try:
+            pivot_result = engine.generate(
+                row_dimensions=row_dimensions,
+                col_dimensions=col_dimensions,
+                value_metric=value_metric,
+                aggregation=aggregation,
+                start_date=start_date,
+                end_date=end_date,
+            )
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=400)
         
         # 导出为 CSV
         csv_content = engine.export_csv(pivot_result['data'])
@@ -1915,16 +1512,7 @@ class PivotExportView(APIView):
         return response
     
     def _parse_date(self, date_str):
-        """解析日期字符串为 datetime 对象"""
-        if not date_str:
-            return None
-        
-        try:
-            if 'T' in str(date_str):
-                return datetime.datetime.fromisoformat(str(date_str).replace('Z', '+00:00'))
-            return datetime.datetime.strptime(str(date_str), '%Y-%m-%d')
-        except (ValueError, TypeError):
-            return None
+        return _parse_date_bound(date_str)
 
 
 
@@ -1951,7 +1539,7 @@ class TrendsView(APIView):
             return Response({'detail': '权限不足'}, status=403)
         
         try:
-            from .services import MultiDimensionAnalytics, TrendAnalyzer
+            from .trends import daily_order_series
             
             # 解析查询参数
             start_date = self._parse_date(request.query_params.get('start_date'))
@@ -1980,55 +1568,66 @@ class TrendsView(APIView):
                     'valid_metrics': valid_metrics
                 }, status=400)
             
-            # 获取基础时间序列数据
-            analytics = MultiDimensionAnalytics()
-            base_data = analytics.analyze(
-                dimensions=['time'],
-                metrics=['revenue', 'order_count'],
-                start_date=start_date,
-                end_date=end_date,
-                time_granularity='day',
-            )
-            
-            data = base_data.get('data', [])
-            
-            # 为数据添加 period 字段（用于季节性分析）
-            for item in data:
-                if 'time_period' in item:
-                    item['period'] = item['time_period']
-            
-            # 初始化趋势分析器
-            analyzer = TrendAnalyzer()
-            
-            with_ma = analyzer.calculate_moving_average(data, metric, window_size)
-            
-            with_anomalies = analyzer.detect_anomalies(with_ma, metric, anomaly_threshold)
-            
-            seasonal = analyzer.identify_seasonal_patterns(data, metric)
+            # 本期和去年同期的按天序列（没有订单的日期为 0）由一条查询得到
+            windows = [(start_date, end_date)]
+            compare = bool(start_date and end_date)
+            if compare:
+                windows.append((self._previous_year(start_date), self._previous_year(end_date)))
+            current, *previous = daily_order_series(windows, valid_metrics)
+            series = current[metric]
+            
+            flags = series.anomalies(anomaly_threshold)
+            columns = {
+                'periods': series.iso_dates(),
+                'revenue': np.round(current['revenue'].values, 2).tolist(),
+                'order_count': current['order_count'].values.astype(int).tolist(),
+                'moving_average': np.round(series.moving_average(window_size), 2).tolist(),
+                'ewma': np.round(series.ewma(window_size), 2).tolist(),
+                'rolling_z_score': np.round(series.rolling_zscores(window_size), 2).tolist(),
+                'z_score': flags['z_score'].tolist(),
+                'is_anomaly': flags['is_anomaly'].tolist(),
+                'confidence': flags['confidence'].tolist(),
+            }
             
-            # 获取去年同期数据
             yoy_data = []
-            if start_date and end_date:
-                prev_start = start_date.replace(year=start_date.year - 1)
-                prev_end = end_date.replace(year=end_date.year - 1)
-                
-                prev_data = analytics.analyze(
-                    dimensions=['time'],
-                    metrics=['revenue', 'order_count'],
-                    start_date=prev_start,
-                    end_date=prev_end,
-                    time_granularity='day',
+            if compare:
+                yoy = series.year_over_year(previous[0][metric])
+                columns['previous_value'] = np.round(yoy['previous_value'], 2).tolist()
+                columns['yoy_rate'] = yoy['yoy_rate'].tolist()
+                yoy_data = [
+                    {'period': period, metric: value, 'previous_value': previous_value, 'yoy_rate': rate}
+                    for period, value, previous_value, rate in zip(
+                        columns['periods'], columns[metric], columns['previous_value'], columns['yoy_rate']
+                    )
+                ]
+            
+            # 逐行数据供前端图表使用
+            trend_data = [
+                {
+                    'time_period': period, 'period': period,
+                    'revenue': revenue, 'order_count': order_count,
+                    'moving_average': average, 'z_score': z_score,
+                    'is_anomaly': is_anomaly, 'confidence': level,
+                }
+                for period, revenue, order_count, average, z_score, is_anomaly, level in zip(
+                    columns['periods'], columns['revenue'], columns['order_count'], columns['moving_average'],
+                    columns['z_score'], columns['is_anomaly'], columns['confidence'],
                 )
-                
-                prev_items = prev_data.get('data', [])
-                for item in prev_items:
-                    if 'time_period' in item:
-                        item['period'] = item['time_period']
-                
-                yoy_data = analyzer.year_over_year(data, prev_items, metric)
+            ]
+            
+            month = series.seasonality('month')
+            weekday = series.seasonality('weekday')
+            seasonal = {
+                'pattern': self._pattern(month),
+                'peak_month': month['peak'],
+                'low_month': month['low'],
+                'weekday_pattern': self._pattern(weekday),
+                'peak_weekday': weekday['peak'],
+                'low_weekday': weekday['low'],
+            }
             
-            anomaly_count = sum(1 for item in with_anomalies if item.get('is_anomaly', False))
-            total_count = len(with_anomalies)
+            anomaly_count = int(flags['is_anomaly'].sum())
+            total_count = len(series)
             
             if total_count == 0:
                 confidence = 'low'
@@ -2040,7 +1639,8 @@ class TrendsView(APIView):
                 confidence = 'high'
             
             return Response({
-                'trend_data': with_anomalies,
+                'trend_data': trend_data,
+                'series': columns,
                 'seasonal_patterns': seasonal,
                 'year_over_year': yoy_data,
                 'confidence': confidence,
@@ -2081,10 +1681,31 @@ class TrendsView(APIView):
         
         try:
             if 'T' in str(date_str):
-                return datetime.datetime.fromisoformat(str(date_str).replace('Z', '+00:00'))
-            return datetime.datetime.strptime(str(date_str), '%Y-%m-%d')
+                value = datetime.datetime.fromisoformat(str(date_str).replace('Z', '+00:00'))
+            else:
+                value = datetime.datetime.strptime(str(date_str), '%Y-%m-%d')
         except (ValueError, TypeError):
             return None
+        # 不带时区的时间按本地时区解释
+        return timezone.make_aware(value) if timezone.is_naive(value) else value
+    
+    @staticmethod
+    def _previous_year(value):
+        """去年同一天，2 月 29 日对应 2 月 28 日"""
+        try:
+            return value.replace(year=value.year - 1)
+        except ValueError:
+            return value.replace(year=value.year - 1, day=28)
+    
+    @staticmethod
+    def _pattern(seasonality):
+        """季节性分组结果转为 {分组: {average, sample_count}}"""
+        return {
+            key: {'average': average, 'sample_count': count}
+            for key, average, count in zip(
+                seasonality['keys'], seasonality['average'], seasonality['sample_count']
+            )
+        }
 
 
 class RouteRecommendationView(APIView):
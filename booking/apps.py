@@ -3,4 +3,30 @@ from django.apps import AppConfig
 class BookingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'booking'
-    verbose_name = '订票' 
\ No newline at end of file
+    verbose_name = '订票'
+
+    # 周期任务执行间隔（秒）
+    ORDER_EXPIRY_INTERVAL = 60
+    INVENTORY_FLUSH_INTERVAL = 1
+
+    def ready(self):
+        import atexit
+
+        import booking.signals
+
+        from core.scheduler import scheduler
+        from booking.inventory import flush_inventory
+        from booking.services import TimeoutService
+        scheduler.register(
+            'order_expiry',
+            TimeoutService.process_all_expired_orders,
+            self.ORDER_EXPIRY_INTERVAL,
+        )
+        # 待回写的库存变化量保存在各进程内，每个进程都需要回写
+        scheduler.register(
+            'inventory_flush',
+            flush_inventory,
+            self.INVENTORY_FLUSH_INTERVAL,
+            exclusive=False,
+        )
+        atexit.register(flush_inventory)
@@ -0,0 +1,393 @@
+"""
+座位库存后端模块。
+
+提供两种可插拔的库存后端：
+
+- DatabaseInventoryBackend：单条条件 UPDATE 完成扣减/释放和状态切换，无需行锁；
+- CounterInventoryBackend：座位计数保存在缓存（生产环境为 Redis）中原子增减，
+  变化量先在进程内累积，再按批次回写数据库（write-behind）。
+
+通过 settings.INVENTORY_BACKEND 选择后端，默认为 'database'。
+"""
+import logging
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from core import events
+from flight.models import Flight
+from flight.search import FlightSearchEngine
+from flight.status_engine import FlightStatusEngine
+
+logger = logging.getLogger(__name__)
+
+
+def _reserve_updates(count: int) -> dict:
+    """
+    扣减座位的 UPDATE 赋值表达式。
+
+    UPDATE 中右侧表达式引用的是更新前的值，因此“扣减后为 0”等价于
+    available_seats <= count。
+    """
+    return {
+        'available_seats': F('available_seats') - count,
+        'status': Case(
+            When(available_seats__lte=count, status='scheduled', then=Value('full')),
+            default=F('status'),
+        ),
+        'updated_at': timezone.now(),
+    }
+
+
+def _release_updates(count: int) -> dict:
+    """释放座位的 UPDATE 赋值表达式，座位数不超过总容量，已满航班恢复为正常。"""
+    return {
+        'available_seats': Least(F('available_seats') + count, F('capacity')),
+        'status': Case(
+            When(status='full', capacity__gt=0, then=Value('scheduled')),
+            default=F('status'),
+        ),
+        'updated_at': timezone.now(),
+    }
+
+
+def _invalidate_search(flight: Flight) -> None:
+    """条件 UPDATE 不触发 post_save 信号，需手动失效航班搜索缓存。"""
+    FlightSearchEngine.invalidate_flights(
+        [(flight.departure_city, flight.arrival_city, flight.departure_time)]
+    )
+
+
+def _publish_seats(flight: Flight, change: int, status: Optional[str] = None,
+                   available: Optional[int] = None) -> None:
+    """事务提交后向航班频道发布座位变化。"""
+    data = {'flight_id': flight.pk, 'change': change}
+    if status:
+        data['status'] = status
+    if available is not None:
+        data['available_seats'] = available
+    events.publish(events.flight_channel(flight.pk), 'seats', data)
+
+
+class InventoryBackend:
+    """库存后端基类。"""
+
+    def reserve(self, flight: Flight, count: int) -> bool:
+        """扣减座位，座位不足时返回 False。"""
+        raise NotImplementedError
+
+    def release(self, flight: Flight, count: int) -> bool:
+        """释放座位。"""
+        raise NotImplementedError
+
+    def flush(self) -> int:
+        """将未落库的变化回写数据库，返回回写的航班数。"""
+        return 0
+
+
+class DatabaseInventoryBackend(InventoryBackend):
+    """
+    数据库条件更新后端。
+
+    扣减使用 UPDATE ... SET available_seats = available_seats - n
+    WHERE available_seats >= n，不持有行锁等待。
+    常见情况（扣减后仍有余座、释放前未满）一条语句完成；
+    恰好售罄或从已满恢复时，再用一条带状态条件的 UPDATE 切换航班状态，
+    并向航班状态引擎上报状态变化。
+    """
+
+    def reserve(self, flight: Flight, count: int) -> bool:
+        flights = Flight.objects.filter(pk=flight.pk)
+        updated = flights.filter(available_seats__gt=count).update(
+            available_seats=F('available_seats') - count,
+            updated_at=timezone.now(),
+        )
+        if updated:
+            _publish_seats(flight, -count)
+        else:
+            # 剩余座位恰好等于 count，扣减后售罄
+            updated = flights.filter(available_seats=count, status='scheduled').update(
+                **_reserve_updates(count)
+            )
+            if updated:
+                FlightStatusEngine.emit('full', [flight.pk])
+                _publish_seats(flight, -count, status='full', available=0)
+            else:
+                updated = flights.filter(available_seats=count).update(**_reserve_updates(count))
+                if updated:
+                    _publish_seats(flight, -count, available=0)
+        if updated:
+            _invalidate_search(flight)
+        return bool(updated)
+
+    def release(self, flight: Flight, count: int) -> bool:
+        flights = Flight.objects.filter(pk=flight.pk)
+        updated = flights.exclude(status='full').update(
+            available_seats=Least(F('available_seats') + count, F('capacity')),
+            updated_at=timezone.now(),
+        )
+        if updated:
+            _publish_seats(flight, count)
+        else:
+            updated = flights.filter(status='full').update(**_release_updates(count))
+            if updated:
+                FlightStatusEngine.emit('scheduled', [flight.pk])
+                _publish_seats(flight, count, status='scheduled')
+        if updated:
+            _invalidate_search(flight)
+        return bool(updated)
+
+
+class LocalCounterStore:
+    """
+    进程内计数器存储。
+
+    实现计数器后端用到的 add/get/incr/decr/delete 接口，
+    可在测试或单进程部署中代替 Redis。
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            if key in self._data:
+                return False
+            self._data[key] = value
+            return True
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._data.get(key, default)
+
+    def incr(self, key, delta=1):
+        with self._lock:
+            if key not in self._data:
+                raise ValueError(f"Key '{key}' not found")
+            self._data[key] += delta
+            return self._data[key]
+
+    def decr(self, key, delta=1):
+        return self.incr(key, -delta)
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+
+class CounterInventoryBackend(InventoryBackend):
+    """
+    计数器库存后端（write-behind）。
+
+    每个航班的剩余座位保存为一个原子计数器，首次访问时从数据库加载。
+    扣减先 decr，结果为负则回补并返回失败，因此不会超售。
+    已提交事务的变化量在进程内按航班累积，累计 batch_size 次操作或
+    超过 flush_interval 秒后，每个航班用一条 UPDATE 回写。
+
+    已提交但尚未回写的变化量（所有进程）另外累积在共享的未回写计数中，
+    计数器应等于数据库座位数加未回写计数。
+
+    外层事务回滚时计数器不会回补（只会少卖不会超售），
+    由 reconcile() 定期按上式校准计数器。
+    """
+
+    KEY_PREFIX = 'inventory:seats'
+    UNFLUSHED_PREFIX = 'inventory:unflushed'
+    COUNTER_TIMEOUT = 24 * 60 * 60
+
+    def __init__(self, store=None, batch_size: int = 100, flush_interval: float = 1.0):
+        self.store = store if store is not None else cache
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: Dict[int, int] = {}
+        self._flights: Dict[int, Tuple[str, str, object]] = {}
+        self._capacity: Dict[int, int] = {}
+        self._ops = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self.stats = {'reserved': 0, 'rejected': 0, 'released': 0, 'flushes': 0}
+
+    def _key(self, flight_id: int) -> str:
+        return f'{self.KEY_PREFIX}:{flight_id}'
+
+    def _unflushed_key(self, flight_id: int) -> str:
+        return f'{self.UNFLUSHED_PREFIX}:{flight_id}'
+
+    def _add_unflushed(self, flight_id: int, delta: int) -> None:
+        key = self._unflushed_key(flight_id)
+        self.store.add(key, 0, self.COUNTER_TIMEOUT)
+        self.store.incr(key, delta)
+
+    def _expected(self, flight_id: int) -> Tuple[int, int]:
+        """
+        计数器应有的值（数据库座位数加所有进程已提交未回写的变化量）和总容量。
+
+        先读未回写计数再读数据库：两次读取之间其他进程回写时，
+        同一变化量会被计入两次，结果只会偏少而不会超售。
+        """
+        unflushed = self.store.get(self._unflushed_key(flight_id)) or 0
+        available, capacity = Flight.objects.filter(pk=flight_id).values_list(
+            'available_seats', 'capacity'
+        ).get()
+        return available + unflushed, capacity
+
+    def _ensure_counter(self, flight: Flight) -> str:
+        """确保计数器已从数据库初始化，返回计数器键。"""
+        key = self._key(flight.pk)
+        if self.store.get(key) is None:
+            available, capacity = self._expected(flight.pk)
+            with self._lock:
+                self._capacity[flight.pk] = capacity
+            self.store.add(key, available, self.COUNTER_TIMEOUT)
+        elif flight.pk not in self._capacity:
+            self._capacity[flight.pk] = flight.capacity
+        return key
+
+    def reserve(self, flight: Flight, count: int) -> bool:
+        key = self._ensure_counter(flight)
+        remaining = self.store.decr(key, count)
+        if remaining < 0:
+            self.store.incr(key, count)
+            self.stats['rejected'] += 1
+            return False
+        self.stats['reserved'] += 1
+        self._record(flight, -count)
+        if remaining == 0:
+            FlightStatusEngine.emit('full', [flight.pk])
+        _publish_seats(flight, -count, status='full' if remaining == 0 else None, available=remaining)
+        return True
+
+    def release(self, flight: Flight, count: int) -> bool:
+        key = self._ensure_counter(flight)
+        capacity = self._capacity[flight.pk]
+        remaining = self.store.incr(key, count)
+        was_full = remaining - count <= 0
+        overflow = remaining - capacity
+        if overflow > 0:
+            self.store.decr(key, overflow)
+            count -= overflow
+        self.stats['released'] += 1
+        if count > 0:
+            self._record(flight, count)
+            if was_full:
+                FlightStatusEngine.emit('scheduled', [flight.pk])
+            _publish_seats(
+                flight, count, status='scheduled' if was_full else None,
+                available=remaining - max(overflow, 0)
+            )
+        return True
+
+    def _record(self, flight: Flight, delta: int) -> None:
+        """在事务提交后记录待回写的变化量。"""
+        route = (flight.departure_city, flight.arrival_city, flight.departure_time)
+
+        def apply():
+            self._add_unflushed(flight.pk, delta)
+            with self._lock:
+                self._pending[flight.pk] = self._pending.get(flight.pk, 0) + delta
+                self._flights[flight.pk] = route
+                self._ops += 1
+                due = (
+                    self._ops >= self.batch_size or
+                    time.monotonic() - self._last_flush >= self.flush_interval
+                )
+            if due:
+                self.flush()
+
+        transaction.on_commit(apply)
+
+    def flush(self) -> int:
+        """
+        将累积的变化量回写数据库。
+
+        每个航班一条 UPDATE，扣减和释放复用数据库后端的状态切换表达式。
+
+        Returns:
+            回写的航班数
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            flights, self._flights = self._flights, {}
+            self._ops = 0
+            self._last_flush = time.monotonic()
+
+        pending = {flight_id: delta for flight_id, delta in pending.items() if delta}
+        if not pending:
+            return 0
+
+        with transaction.atomic(savepoint=False):
+            for flight_id, delta in pending.items():
+                updates = _reserve_updates(-delta) if delta < 0 else _release_updates(delta)
+                Flight.objects.filter(pk=flight_id).update(**updates)
+        for flight_id, delta in pending.items():
+            self._add_unflushed(flight_id, -delta)
+
+        FlightSearchEngine.invalidate_flights(flights[flight_id] for flight_id in pending)
+        self.stats['flushes'] += 1
+        logger.debug(f"库存回写完成: {len(pending)} 个航班")
+        return len(pending)
+
+    def reconcile(self, flight_ids: Optional[Iterable[int]] = None) -> int:
+        """
+        回写本进程的变化量后，将计数器增减到数据库座位数加未回写计数。
+
+        不删除计数器：其他进程已提交未回写的变化量不在数据库中，
+        以数据库为准重新加载会丢失这些扣减而超售。
+
+        Args:
+            flight_ids: 需要校准的航班 ID，默认为本进程已知的全部航班
+
+        Returns:
+            校准的航班数
+        """
+        self.flush()
+        with self._lock:
+            ids = list(flight_ids) if flight_ids is not None else list(self._capacity)
+        for flight_id in ids:
+            key = self._key(flight_id)
+            if self.store.get(key) is None:
+                continue
+            expected, capacity = self._expected(flight_id)
+            with self._lock:
+                self._capacity[flight_id] = capacity
+            drift = expected - self.store.get(key, expected)
+            if drift:
+                self.store.incr(key, drift)
+        return len(ids)
+
+
+BACKENDS = {
+    'database': DatabaseInventoryBackend,
+    'counter': CounterInventoryBackend,
+}
+
+_backend = None
+
+
+def get_backend() -> InventoryBackend:
+    """获取当前配置的库存后端实例。"""
+    global _backend
+    if _backend is None:
+        name = getattr(settings, 'INVENTORY_BACKEND', 'database')
+        _backend = BACKENDS[name]()
+    return _backend
+
+
+def set_backend(backend: Optional[InventoryBackend]) -> None:
+    """替换库存后端（传入 None 时恢复为配置的后端），主要用于测试和基准测试。"""
+    global _backend
+    _backend = backend
+
+
+def flush_inventory() -> int:
+    """回写当前后端累积的库存变化（周期任务）。"""
+    return get_backend().flush()
+
@@ -0,0 +1,139 @@
+"""
+座位库存并发基准测试命令。
+
+在一个临时的热门航班上用多线程并发预订，对比改造前的行锁实现
+（select_for_update + save + refresh_from_db + 状态 save）与当前库存后端的每秒预订数。
+
+Usage:
+    python manage.py benchmark_inventory
+    python manage.py benchmark_inventory --threads 16 --bookings 2000
+    python manage.py benchmark_inventory --modes locking database
+"""
+import threading
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from booking.inventory import (
+    CounterInventoryBackend,
+    DatabaseInventoryBackend,
+    LocalCounterStore,
+)
+from flight.models import Flight
+
+
+def _locking_reserve(flight, count):
+    """改造前的预订实现，仅用于基准对比。"""
+    with transaction.atomic():
+        locked_flight = Flight.objects.select_for_update().get(pk=flight.pk)
+        if locked_flight.available_seats < count:
+            return False
+        locked_flight.available_seats = F('available_seats') - count
+        locked_flight.save(update_fields=['available_seats', 'updated_at'])
+        locked_flight.refresh_from_db()
+        if locked_flight.available_seats <= 0 and locked_flight.status != 'full':
+            locked_flight.status = 'full'
+            locked_flight.save(update_fields=['status', 'updated_at'])
+        return True
+
+
+class Command(BaseCommand):
+    """座位库存并发基准测试。"""
+
+    help = '对比不同库存实现在单个热门航班上的并发预订吞吐量'
+
+    MODES = ('locking', 'database', 'counter')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='并发线程数，默认 8')
+        parser.add_argument('--bookings', type=int, default=500, help='预订总次数，默认 500')
+        parser.add_argument(
+            '--modes', nargs='+', choices=self.MODES, default=list(self.MODES),
+            help='参与对比的实现，默认全部'
+        )
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        bookings = options['bookings']
+
+        self.stdout.write(f'线程数: {threads}, 预订次数: {bookings}, 数据库: {connection.vendor}')
+        for mode in options['modes']:
+            flight = self._create_flight(capacity=bookings)
+            try:
+                reserve, finish = self._get_reserve(mode)
+                elapsed, succeeded, errors = self._run(flight, reserve, threads, bookings)
+                finish()
+                flight.refresh_from_db()
+                rate = succeeded / elapsed if elapsed else 0
+                self.stdout.write(self.style.SUCCESS(
+                    f'[{mode:>8}] {rate:10.1f} 次/秒  成功 {succeeded}  错误 {errors}  '
+                    f'耗时 {elapsed:.2f}s  剩余座位 {flight.available_seats}  状态 {flight.status}'
+                ))
+            finally:
+                flight.delete()
+
+    def _get_reserve(self, mode):
+        """返回 (预订函数, 结束时的回写函数)。"""
+        if mode == 'locking':
+            return _locking_reserve, lambda: None
+        if mode == 'database':
+            return DatabaseInventoryBackend().reserve, lambda: None
+        backend = CounterInventoryBackend(store=LocalCounterStore())
+        return backend.reserve, backend.flush
+
+    def _create_flight(self, capacity):
+        departure_time = timezone.now() + timedelta(days=7)
+        return Flight.objects.create(
+            flight_number=f'BM{uuid.uuid4().hex[:6].upper()}',
+            airline_name='基准测试',
+            departure_city='基准A',
+            arrival_city='基准B',
+            departure_time=departure_time,
+            arrival_time=departure_time + timedelta(hours=2),
+            price=Decimal('100.00'),
+            capacity=capacity,
+            available_seats=capacity,
+            aircraft_type='Benchmark',
+        )
+
+    def _run(self, flight, reserve, thread_count, bookings):
+        """多线程并发预订，返回 (耗时, 成功次数, 错误次数)。"""
+        remaining = [bookings]
+        succeeded = [0]
+        errors = [0]
+        lock = threading.Lock()
+        start_barrier = threading.Barrier(thread_count)
+
+        def worker():
+            start_barrier.wait()
+            try:
+                while True:
+                    with lock:
+                        if remaining[0] <= 0:
+                            return
+                        remaining[0] -= 1
+                    try:
+                        ok = reserve(flight, 1)
+                    except Exception:
+                        ok = False
+                        with lock:
+                            errors[0] += 1
+                    if ok:
+                        with lock:
+                            succeeded[0] += 1
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(thread_count)]
+        started = time.perf_counter()
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        return time.perf_counter() - started, succeeded[0], errors[0]
@@ -0,0 +1,107 @@
+"""
+机票序列化基准测试命令。
+
+在临时数据上对比机票输出的两种方式：
+- single: 逐张序列化（每张机票单独计算航班派生字段，航班和订单由 select_related 加载）
+- batch: 批量序列化（航班派生字段每个航班只计算一次）
+
+输出每秒序列化的机票数和执行的查询数。临时数据在事务中创建，结束后回滚。
+
+Usage:
+    python manage.py benchmark_serializers
+    python manage.py benchmark_serializers --tickets 20000 --flights 50
+"""
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import User
+from booking.models import Order, Ticket
+from booking.serializers import TicketSerializer
+from flight.models import Flight
+
+
+class Command(BaseCommand):
+    """机票序列化基准测试。"""
+
+    help = '对比机票逐张序列化与批量序列化的吞吐量和查询数'
+
+    MODES = ('single', 'batch')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tickets', type=int, default=5000, help='机票数，默认 5000')
+        parser.add_argument('--flights', type=int, default=20, help='航班数，默认 20')
+        parser.add_argument('--rounds', type=int, default=3, help='每种实现的重复次数，默认 3')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self._create_data(options['tickets'], options['flights'])
+            self.stdout.write(
+                f"机票数: {options['tickets']}, 航班数: {options['flights']}, 数据库: {connection.vendor}"
+            )
+            for mode in self.MODES:
+                best, queries = None, 0
+                for _ in range(options['rounds']):
+                    elapsed, queries = self._run(mode)
+                    best = elapsed if best is None else min(best, elapsed)
+                rate = options['tickets'] / best if best else 0
+                self.stdout.write(self.style.SUCCESS(
+                    f'[{mode:>6}] {rate:12.1f} 张/秒  耗时 {best:.3f}s  查询 {queries} 条'
+                ))
+            transaction.set_rollback(True)
+
+    def _create_data(self, ticket_count, flight_count):
+        now = timezone.now()
+        user = User.objects.create_user(username=f'benchmark_{int(time.time())}', password='benchmark')
+        flights = Flight.objects.bulk_create([
+            Flight(
+                flight_number=f'BS{i:05d}',
+                airline_name='基准测试',
+                departure_city='基准A',
+                arrival_city='基准B',
+                departure_time=now + timedelta(days=1, hours=i),
+                arrival_time=now + timedelta(days=1, hours=i + 2),
+                price=Decimal('800.00'),
+                capacity=ticket_count,
+                available_seats=ticket_count,
+                aircraft_type='Benchmark',
+            )
+            for i in range(flight_count)
+        ])
+        orders = Order.objects.bulk_create([
+            Order(user=user, order_number=f'ORDBENCH{i:08d}', total_price=Decimal('1600.00'), status='paid')
+            for i in range((ticket_count + 1) // 2)
+        ])
+        Ticket.objects.bulk_create([
+            Ticket(
+                ticket_number=f'BENCH{i:010d}',
+                order=orders[i // 2],
+                flight=flights[i % flight_count],
+                passenger_name='基准乘客',
+                passenger_id_number='110101199001011234',
+                cabin_class='economy',
+                price=Decimal('800.00'),
+            )
+            for i in range(ticket_count)
+        ], batch_size=1000)
+
+    def _run(self, mode):
+        """返回 (序列化耗时, 查询数)，机票列表查询不计入。"""
+        if mode == 'single':
+            tickets = list(Ticket.objects.select_related('order', 'flight').filter(ticket_number__startswith='BENCH'))
+        else:
+            tickets = list(TicketSerializer.optimize_queryset(Ticket.objects.filter(ticket_number__startswith='BENCH')))
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            if mode == 'single':
+                [TicketSerializer(ticket).data for ticket in tickets]
+            else:
+                TicketSerializer(tickets, many=True).data
+            elapsed = time.perf_counter() - started
+        return elapsed, len(queries)
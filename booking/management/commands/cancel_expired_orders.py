@@ -7,6 +7,7 @@
 Usage:
     python manage.py cancel_expired_orders
     python manage.py cancel_expired_orders --dry-run
+    python manage.py cancel_expired_orders --chunk-size 1000 --max-chunks 10
 """
 from django.core.management.base import BaseCommand
 
@@ -26,6 +27,18 @@ class Command(BaseCommand):
             dest='dry_run',
             help='仅显示将要取消的订单，不执行实际取消操作',
         )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=TimeoutService.EXPIRY_CHUNK_SIZE,
+            help=f'每批处理的订单数，默认 {TimeoutService.EXPIRY_CHUNK_SIZE}',
+        )
+        parser.add_argument(
+            '--max-chunks',
+            type=int,
+            default=None,
+            help='最多处理的批次数，默认处理全部超时订单',
+        )
     
     def handle(self, *args, **options):
         """执行命令。"""
@@ -53,7 +66,10 @@ class Command(BaseCommand):
         
         self.stdout.write('开始处理超时订单...')
         
-        result = TimeoutService.process_all_expired_orders()
+        result = TimeoutService.process_all_expired_orders(
+            chunk_size=options['chunk_size'],
+            max_chunks=options['max_chunks'],
+        )
         
         processed = result['processed']
         failed = result['failed']
@@ -63,6 +79,10 @@ class Command(BaseCommand):
             self.stdout.write(
                 self.style.SUCCESS(f'成功取消 {processed} 个超时订单')
             )
+            self.stdout.write(
+                f"共 {result['chunks']} 批，释放 {result['seats_released']} 个座位，"
+                f"耗时 {result['elapsed']:.2f} 秒，{result['orders_per_second']:.0f} 单/秒"
+            )
         
         if failed > 0:
             self.stdout.write(
@@ -94,6 +94,9 @@ class Order(models.Model):
             models.Index(fields=['user', 'status']),
             models.Index(fields=['status', 'created_at']),
             models.Index(fields=['created_at']),
+            # 订单列表的键集分页（全部订单、单个用户的订单）
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['user', 'created_at', 'id']),
         ]
 
     def __str__(self):
@@ -104,6 +107,13 @@ class Order(models.Model):
             self.order_number = f"ORD{uuid.uuid4().hex[:8].upper()}"
         super().save(*args, **kwargs)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录加载时的字段值，保存时用于计算状态和金额变化（分析汇总表增量维护）
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
 
 class Ticket(models.Model):
     """
@@ -233,6 +243,13 @@ class Ticket(models.Model):
             self.ticket_number = self.generate_ticket_number()
         super().save(*args, **kwargs)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录加载时的字段值，保存时用于计算状态变化（分析汇总表增量维护）
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     @staticmethod
     def generate_ticket_number():
         """
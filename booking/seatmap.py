@@ -0,0 +1,215 @@
+"""
+航班座位占用位图模块。
+
+每个航班的座位占用情况用一个按 (排, 列) 编号的位图表示，
+位图尺寸由航班的 seat_rows 和 seats_per_row 决定。
+位图由一次查询构建并缓存，查询单个座位是否占用只需一次位运算；
+机票的占座状态变化时（订票、退票、改签、值机）使缓存失效。
+"""
+import re
+from typing import Iterable, List, Optional, Tuple
+
+from django.core.cache import cache
+from django.db import transaction
+
+from flight.models import Flight
+from .models import Ticket
+
+# 座位号格式：排号 + 列字母，如 12A
+SEAT_PATTERN = re.compile(r'^(\d+)([A-Z])$')
+
+# 占用座位的机票状态
+OCCUPYING_STATUSES = ('valid', 'used')
+
+# 航班未配置座位布局时使用的默认值，与座位图接口保持一致
+DEFAULT_SEAT_ROWS = 30
+DEFAULT_SEATS_PER_ROW = 6
+
+
+def parse_seat(seat_number: str) -> Optional[Tuple[int, int]]:
+    """
+    解析座位号。
+
+    Args:
+        seat_number: 座位号，如 '12A'
+
+    Returns:
+        (排号, 列序号)，排号从 1 开始，列序号从 0 开始；格式无效时返回 None
+    """
+    if not seat_number:
+        return None
+    match = SEAT_PATTERN.match(seat_number.strip().upper())
+    if not match:
+        return None
+    return int(match.group(1)), ord(match.group(2)) - ord('A')
+
+
+def format_seat(row: int, col: int) -> str:
+    """将 (排号, 列序号) 格式化为座位号。"""
+    return f"{row}{chr(ord('A') + col)}"
+
+
+class SeatMap:
+    """
+    航班座位占用位图。
+
+    第 r 排第 c 列（r 从 1 开始，c 从 0 开始）对应第 (r - 1) * seats_per_row + c 位。
+    超出座位布局的座位号（历史数据或手工录入）单独记录在 extra 中，
+    保证查询结果与机票数据一致。
+    """
+
+    __slots__ = ('rows', 'seats_per_row', 'bits', 'extra')
+
+    def __init__(self, rows: int, seats_per_row: int):
+        self.rows = rows
+        self.seats_per_row = seats_per_row
+        self.bits = bytearray((rows * seats_per_row + 7) // 8)
+        self.extra = set()
+
+    @classmethod
+    def for_flight(cls, flight: Flight) -> 'SeatMap':
+        """按航班座位布局创建空位图。"""
+        return cls(
+            flight.seat_rows or DEFAULT_SEAT_ROWS,
+            flight.seats_per_row or DEFAULT_SEATS_PER_ROW,
+        )
+
+    def _index(self, seat_number: str) -> Optional[int]:
+        parsed = parse_seat(seat_number)
+        if parsed is None:
+            return None
+        row, col = parsed
+        if not (1 <= row <= self.rows and 0 <= col < self.seats_per_row):
+            return None
+        return (row - 1) * self.seats_per_row + col
+
+    def is_taken(self, seat_number: str) -> bool:
+        """座位是否已被占用。"""
+        index = self._index(seat_number)
+        if index is None:
+            return seat_number.strip().upper() in self.extra
+        return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def is_taken_at(self, row: int, col: int) -> bool:
+        """按 (排号, 列序号) 查询座位是否已被占用，供座位图逐格渲染使用。"""
+        if not (1 <= row <= self.rows and 0 <= col < self.seats_per_row):
+            return format_seat(row, col) in self.extra
+        index = (row - 1) * self.seats_per_row + col
+        return bool(self.bits[index >> 3] & (1 << (index & 7)))
+
+    def occupy(self, seat_number: str) -> None:
+        """标记座位为已占用。"""
+        index = self._index(seat_number)
+        if index is None:
+            self.extra.add(seat_number.strip().upper())
+        else:
+            self.bits[index >> 3] |= 1 << (index & 7)
+
+    def release(self, seat_number: str) -> None:
+        """标记座位为空闲。"""
+        index = self._index(seat_number)
+        if index is None:
+            self.extra.discard(seat_number.strip().upper())
+        else:
+            self.bits[index >> 3] &= ~(1 << (index & 7)) & 0xFF
+
+    def taken_seats(self, start_row: int = 1, end_row: Optional[int] = None) -> List[str]:
+        """
+        按排列顺序列出指定排范围内的已占用座位。
+
+        Args:
+            start_row: 起始排号（含）
+            end_row: 结束排号（含），默认为最后一排
+
+        Returns:
+            座位号列表
+        """
+        end_row = self.rows if end_row is None else min(end_row, self.rows)
+        seats = []
+        for row in range(max(start_row, 1), end_row + 1):
+            base = (row - 1) * self.seats_per_row
+            for col in range(self.seats_per_row):
+                index = base + col
+                if self.bits[index >> 3] & (1 << (index & 7)):
+                    seats.append(format_seat(row, col))
+        for seat in sorted(self.extra):
+            parsed = parse_seat(seat)
+            if parsed and start_row <= parsed[0] <= end_row:
+                seats.append(seat)
+        return seats
+
+    def __len__(self):
+        return sum(bin(byte).count('1') for byte in self.bits) + len(self.extra)
+
+
+class SeatMapService:
+    """
+    座位位图服务。
+
+    位图按航班缓存，缓存缺失时用一条只取座位号的查询重建。
+    机票占座状态变化时调用 invalidate()，事务内立即删除一次、
+    提交后再删除一次，避免并发读取在提交前回填旧数据。
+    """
+
+    KEY_PREFIX = 'seatmap'
+    TIMEOUT = 10 * 60
+
+    @classmethod
+    def _key(cls, flight_id: int) -> str:
+        return f'{cls.KEY_PREFIX}:{flight_id}'
+
+    @classmethod
+    def build(cls, flight: Flight) -> SeatMap:
+        """从数据库构建航班座位位图。"""
+        seat_map = SeatMap.for_flight(flight)
+        seat_numbers = Ticket.objects.filter(
+            flight_id=flight.pk,
+            status__in=OCCUPYING_STATUSES,
+            seat_number__isnull=False,
+        ).values_list('seat_number', flat=True)
+        for seat_number in seat_numbers:
+            if seat_number:
+                seat_map.occupy(seat_number)
+        return seat_map
+
+    @classmethod
+    def get(cls, flight: Flight) -> SeatMap:
+        """获取航班座位位图（带缓存）。"""
+        key = cls._key(flight.pk)
+        seat_map = cache.get(key)
+        if seat_map is None:
+            seat_map = cls.build(flight)
+            cache.set(key, seat_map, cls.TIMEOUT)
+        return seat_map
+
+    @classmethod
+    def find_taken(cls, flight: Flight, seat_numbers: Iterable[str]) -> List[str]:
+        """
+        一次性检查多个座位，返回其中已被占用或在本次请求中重复的座位号。
+
+        Args:
+            flight: 航班对象
+            seat_numbers: 待检查的座位号
+
+        Returns:
+            不可用的座位号列表（保持输入顺序）
+        """
+        seat_map = cls.get(flight)
+        requested = set()
+        taken = []
+        for seat_number in seat_numbers:
+            normalized = seat_number.strip().upper()
+            if normalized in requested or seat_map.is_taken(normalized):
+                taken.append(seat_number)
+            requested.add(normalized)
+        return taken
+
+    @classmethod
+    def invalidate(cls, flight_ids: Iterable[int]) -> None:
+        """使航班座位位图缓存失效。"""
+        keys = [cls._key(flight_id) for flight_id in set(flight_ids)]
+        if not keys:
+            return
+        cache.delete_many(keys)
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
@@ -1,7 +1,7 @@
 from datetime import timedelta
 from decimal import Decimal
 
-from django.db import transaction
+from django.db import models, transaction
 from django.utils import timezone
 from rest_framework import serializers
 
@@ -10,162 +10,226 @@ from flight.models import Flight  # 导入航班模型
 from .models import Order, Ticket
 from .services import TimeoutService, InventoryService
 
-class TicketSerializer(serializers.ModelSerializer):
-    flight_number = serializers.SerializerMethodField()
-    departure_city = serializers.SerializerMethodField()
-    arrival_city = serializers.SerializerMethodField()
-    departure_time = serializers.SerializerMethodField()
-    arrival_time = serializers.SerializerMethodField()
-    # 添加更多航班相关字段
-    airline_name = serializers.SerializerMethodField()
-    airline_logo = serializers.SerializerMethodField()
-    departure_airport = serializers.SerializerMethodField()
-    arrival_airport = serializers.SerializerMethodField()
-    duration = serializers.SerializerMethodField()
-    flight_status = serializers.SerializerMethodField()
-    # 添加前端需要的嵌套字段
-    order_number = serializers.SerializerMethodField()
-    order_id = serializers.SerializerMethodField()
-    flight_info = serializers.SerializerMethodField()
-    seat_info = serializers.SerializerMethodField()
-    passenger_info = serializers.SerializerMethodField()
-    # 前端状态映射
-    frontend_status = serializers.SerializerMethodField()
+CABIN_CLASS_LABELS = {
+    'economy': '经济舱',
+    'business': '商务舱',
+    'first': '头等舱',
+}
 
-    class Meta:
-        model = Ticket
-        fields = '__all__'
+DEFAULT_AIRLINE_LOGO = "https://picsum.photos/id/24/40/40"
 
-    def get_flight_number(self, obj):
-        return obj.flight.flight_number if obj.flight else None
 
-    def get_departure_city(self, obj):
-        return obj.flight.departure_city if obj.flight else None
+def mask_document_number(number):
+    """证件号码脱敏，保留前 4 位和后 4 位。"""
+    if number and len(number) > 8:
+        return number[:4] + '*' * (len(number) - 8) + number[-4:]
+    return number
 
-    def get_arrival_city(self, obj):
-        return obj.flight.arrival_city if obj.flight else None
 
-    def get_departure_time(self, obj):
-        return obj.flight.departure_time if obj.flight else None
+class TicketListSerializer(serializers.ListSerializer):
+    """批量输出机票，航班和订单数据按批加载、每个航班只计算一次。"""
 
-    def get_arrival_time(self, obj):
-        return obj.flight.arrival_time if obj.flight else None
+    def to_representation(self, data):
+        tickets = data.all() if isinstance(data, models.manager.BaseManager) else data
+        return self.child.represent_many(tickets)
 
-    # 添加获取新字段的方法
-    def get_airline_name(self, obj):
-        return obj.flight.airline_name if obj.flight else "未知航空"
 
-    def get_airline_logo(self, obj):
-        # 返回默认LOGO或航空公司LOGO
-        return getattr(obj.flight, 'airline_logo', None) or "https://picsum.photos/id/24/40/40"
+class TicketSerializer(serializers.ModelSerializer):
+    """
+    机票序列化器。
 
-    def get_departure_airport(self, obj):
-        if not obj.flight:
-            return None
-        # 尝试获取更详细的机场信息
-        try:
-            return f"{obj.flight.departure_city}机场"
-        except:
-            return None
-
-    def get_arrival_airport(self, obj):
-        if not obj.flight:
-            return None
-        # 尝试获取更详细的机场信息
-        try:
-            return f"{obj.flight.arrival_city}机场"
-        except:
-            return None
+    输出为机票模型字段加上 FLIGHT_FIELDS 和 TICKET_FIELDS 中的派生字段，
+    由 represent_many 按字段表批量计算：航班派生字段（时长、机场、航班信息等）
+    每个航班只计算一次，未预先加载的航班和订单各用一条查询批量读取。
+    """
 
-    def get_duration(self, obj):
-        """计算飞行持续时间（分钟）"""
-        if not obj.flight or not obj.flight.departure_time or not obj.flight.arrival_time:
-            return 0
+    # 输出中由航班派生的字段（见 flight_summary）
+    FLIGHT_FIELDS = (
+        'flight_number', 'departure_city', 'arrival_city', 'departure_time', 'arrival_time',
+        'airline_name', 'airline_logo', 'departure_airport', 'arrival_airport', 'duration',
+        'flight_status', 'flight_info',
+    )
+    # 输出中逐张机票计算的字段（见 ticket_fields）
+    TICKET_FIELDS = ('order_number', 'order_id', 'seat_info', 'passenger_info', 'frontend_status')
+    # 计算航班派生字段需要读取的航班列
+    FLIGHT_COLUMNS = (
+        'id', 'flight_number', 'airline_name', 'departure_city', 'arrival_city',
+        'departure_time', 'arrival_time', 'status',
+    )
 
-        try:
-            from datetime import datetime
-            departure = obj.flight.departure_time
-            arrival = obj.flight.arrival_time
-            # 确保处理的是datetime对象
-            if isinstance(departure, str):
-                departure = datetime.fromisoformat(departure.replace('Z', '+00:00'))
-            if isinstance(arrival, str):
-                arrival = datetime.fromisoformat(arrival.replace('Z', '+00:00'))
-
-            duration = (arrival - departure).total_seconds() / 60
-            return int(duration)
-        except Exception as e:
-            return 120  # 默认2小时
-
-    def get_flight_status(self, obj):
-        """获取航班状态"""
-        if not obj.flight:
-            return "scheduled"
-        return getattr(obj.flight, 'status', 'scheduled')
-
-    def get_order_number(self, obj):
-        """获取订单编号"""
-        return obj.order.order_number if obj.order else None
-
-    def get_order_id(self, obj):
-        """获取订单ID"""
-        return obj.order.id if obj.order else None
-
-    def get_flight_info(self, obj):
-        """获取航班信息（前端嵌套格式）"""
-        if not obj.flight:
-            return None
-        return {
-            'airline': obj.flight.airline_name or '未知航空',
-            'flight_number': obj.flight.flight_number,
-            'departure_city': obj.flight.departure_city,
-            'departure_airport': f"{obj.flight.departure_city}机场",
-            'departure_time': obj.flight.departure_time.isoformat() if obj.flight.departure_time else None,
-            'arrival_city': obj.flight.arrival_city,
-            'arrival_airport': f"{obj.flight.arrival_city}机场",
-            'arrival_time': obj.flight.arrival_time.isoformat() if obj.flight.arrival_time else None,
-        }
+    class Meta:
+        model = Ticket
+        fields = '__all__'
+        list_serializer_class = TicketListSerializer
 
-    def get_seat_info(self, obj):
-        """获取座位信息（前端嵌套格式）"""
-        cabin_class_map = {
-            'economy': '经济舱',
-            'business': '商务舱',
-            'first': '头等舱',
-        }
+    def to_representation(self, instance):
+        return self.represent_many([instance])[0]
+
+    @classmethod
+    def optimize_queryset(cls, queryset, include_order=True):
+        """
+        只读取输出所需的列：机票的全部列、航班派生字段所需的航班列和订单号。
+
+        用于只读的列表接口，返回的航班和订单对象只加载了部分字段。
+        """
+        related = ['flight'] + (['order'] if include_order else [])
+        columns = [field.name for field in Ticket._meta.concrete_fields]
+        columns += [f'flight__{name}' for name in cls.FLIGHT_COLUMNS]
+        if include_order:
+            columns.append('order__order_number')
+        return queryset.select_related(*related).only(*columns)
+
+    # ------------------------------------------------------------------
+    # 批量输出
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def flight_summary(flight):
+        """航班派生字段，每个航班计算一次。"""
+        if flight is None:
+            return {
+                'flight_number': None, 'departure_city': None, 'arrival_city': None,
+                'departure_time': None, 'arrival_time': None, 'airline_name': "未知航空",
+                'airline_logo': DEFAULT_AIRLINE_LOGO, 'departure_airport': None,
+                'arrival_airport': None, 'duration': 0, 'flight_status': "scheduled",
+                'flight_info': None,
+            }
+        departure, arrival = flight.departure_time, flight.arrival_time
+        departure_airport = f"{flight.departure_city}机场"
+        arrival_airport = f"{flight.arrival_city}机场"
         return {
-            'cabin_class': cabin_class_map.get(obj.cabin_class, obj.cabin_class),
-            'seat_number': obj.seat_number,
+            'flight_number': flight.flight_number,
+            'departure_city': flight.departure_city,
+            'arrival_city': flight.arrival_city,
+            'departure_time': departure,
+            'arrival_time': arrival,
+            'airline_name': flight.airline_name,
+            'airline_logo': getattr(flight, 'airline_logo', None) or DEFAULT_AIRLINE_LOGO,
+            'departure_airport': departure_airport,
+            'arrival_airport': arrival_airport,
+            'duration': int((arrival - departure).total_seconds() / 60) if departure and arrival else 0,
+            'flight_status': getattr(flight, 'status', 'scheduled'),
+            'flight_info': {
+                'airline': flight.airline_name or '未知航空',
+                'flight_number': flight.flight_number,
+                'departure_city': flight.departure_city,
+                'departure_airport': departure_airport,
+                'departure_time': departure.isoformat() if departure else None,
+                'arrival_city': flight.arrival_city,
+                'arrival_airport': arrival_airport,
+                'arrival_time': arrival.isoformat() if arrival else None,
+            },
         }
 
-    def get_passenger_info(self, obj):
-        """获取乘客信息（前端嵌套格式）"""
-        # 对证件号码进行脱敏处理
-        id_card = obj.passenger_id_number
-        if id_card and len(id_card) > 8:
-            id_card = id_card[:4] + '*' * (len(id_card) - 8) + id_card[-4:]
+    def _field_plan(self):
+        """
+        字段表：[(输出字段名, 取值方式, 参数)]，主键、派生字段、其余模型字段依次排列。
+
+        取值方式：'flight' 航班派生字段，'ticket' 逐张机票计算的字段，
+        'model' 模型字段（参数为属性名和格式化函数）。
+        """
+        plan = getattr(self, '_plan', None)
+        if plan is not None:
+            return plan
+        model_fields = []
+        for name, field in self.fields.items():
+            if field.write_only:
+                continue
+            model_field = Ticket._meta.get_field(field.source)
+            # 主键关联字段直接输出外键值，其余字段使用序列化器字段格式化
+            if isinstance(field, (serializers.DateTimeField, serializers.DecimalField,
+                                  serializers.DateField, serializers.TimeField)):
+                formatter = field.to_representation
+            else:
+                formatter = None
+            model_fields.append((name, 'model', (model_field.attname, formatter)))
+        plan = (
+            model_fields[:1]
+            + [(name, 'flight', None) for name in self.FLIGHT_FIELDS]
+            + [(name, 'ticket', None) for name in self.TICKET_FIELDS]
+            + model_fields[1:]
+        )
+        self._plan = plan
+        return plan
+
+    @classmethod
+    def _load_related(cls, tickets):
+        """批量加载未预先加载的航班（只读取所需的列）和订单号。"""
+        missing_flights = {t.flight_id for t in tickets if not Ticket.flight.is_cached(t)}
+        flights = {}
+        if missing_flights:
+            flights = Flight.objects.only(*cls.FLIGHT_COLUMNS).in_bulk(missing_flights)
+        missing_orders = {t.order_id for t in tickets if not Ticket.order.is_cached(t)}
+        order_numbers = {}
+        if missing_orders:
+            order_numbers = dict(
+                Order.objects.filter(id__in=missing_orders).values_list('id', 'order_number')
+            )
+        return flights, order_numbers
+
+    def represent_many(self, tickets):
+        """批量输出机票。"""
+        tickets = list(tickets)
+        if not tickets:
+            return []
+        plan = self._field_plan()
+        flights, order_numbers = self._load_related(tickets)
+        summaries = getattr(self, '_flight_summaries', None)
+        if summaries is None:
+            summaries = self._flight_summaries = {}
+        now = timezone.now()
+
+        result = []
+        for ticket in tickets:
+            flight = ticket.flight if Ticket.flight.is_cached(ticket) else flights.get(ticket.flight_id)
+            summary = summaries.get(ticket.flight_id)
+            if summary is None:
+                summary = summaries[ticket.flight_id] = self.flight_summary(flight)
+            if Ticket.order.is_cached(ticket):
+                order_number = ticket.order.order_number
+            else:
+                order_number = order_numbers.get(ticket.order_id)
+
+            derived = self.ticket_fields(ticket, order_number, summary['departure_time'], now)
+            row = {}
+            for name, kind, args in plan:
+                if kind == 'flight':
+                    row[name] = summary[name]
+                elif kind == 'ticket':
+                    row[name] = derived[name]
+                else:
+                    attname, formatter = args
+                    value = getattr(ticket, attname)
+                    row[name] = formatter(value) if formatter and value is not None else value
+            result.append(row)
+        return result
+
+    @staticmethod
+    def ticket_fields(ticket, order_number, departure_time, now):
+        """逐张机票计算的字段（TICKET_FIELDS）。"""
+        # 后端状态到前端状态的映射，有效机票的航班已起飞时为已过期
+        if ticket.status == 'refunded':
+            frontend_status = 'REFUNDED'
+        elif ticket.status == 'used':
+            frontend_status = 'USED'
+        elif ticket.status == 'valid' and departure_time and departure_time < now:
+            frontend_status = 'EXPIRED'
+        else:
+            frontend_status = 'UNUSED'
         return {
-            'name': obj.passenger_name,
-            'id_card': id_card,
+            'order_number': order_number,
+            'order_id': ticket.order_id,
+            'seat_info': {
+                'cabin_class': CABIN_CLASS_LABELS.get(ticket.cabin_class, ticket.cabin_class),
+                'seat_number': ticket.seat_number,
+            },
+            'passenger_info': {
+                'name': ticket.passenger_name,
+                'id_card': mask_document_number(ticket.passenger_id_number),
+            },
+            'frontend_status': frontend_status,
         }
 
-    def get_frontend_status(self, obj):
-        """获取前端状态"""
-        from django.utils import timezone
-
-        # 后端状态到前端状态的映射
-        if obj.status == 'refunded':
-            return 'REFUNDED'
-        elif obj.status == 'used':
-            return 'USED'
-        elif obj.status == 'valid':
-            # 检查是否已过期（航班已起飞）
-            if obj.flight and obj.flight.departure_time:
-                if obj.flight.departure_time < timezone.now():
-                    return 'EXPIRED'
-            return 'UNUSED'
-        return 'UNUSED'
-
 class OrderSerializer(serializers.ModelSerializer):
     tickets = TicketSerializer(many=True, read_only=True)
     # 添加前端期望的字段
@@ -206,16 +270,12 @@ class OrderSerializer(serializers.ModelSerializer):
             # 使用证件号码作为唯一标识去重
             if ticket.passenger_id_number not in seen_ids:
                 seen_ids.add(ticket.passenger_id_number)
-                # 证件号码脱敏处理
-                id_number = ticket.passenger_id_number
-                if id_number and len(id_number) > 8:
-                    id_number = id_number[:4] + '*' * (len(id_number) - 8) + id_number[-4:]
-                
                 passengers.append({
                     'id': ticket.id,
                     'name': ticket.passenger_name,
                     'id_type': ticket.passenger_id_type,
-                    'id_number': id_number,
+                    # 证件号码脱敏处理
+                    'id_number': mask_document_number(ticket.passenger_id_number),
                     'phone': None  # 机票模型中没有存储乘客电话
                 })
         
@@ -304,9 +364,9 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         with transaction.atomic():
             # 如果提供了座位号，检查每个座位是否可用
             if seat_numbers:
-                for seat_number in seat_numbers:
-                    if not InventoryService.check_seat_availability(flight, seat_number):
-                        raise serializers.ValidationError(f'座位{seat_number}已被占用')
+                taken_seats = InventoryService.get_unavailable_seats(flight, seat_numbers)
+                if taken_seats:
+                    raise serializers.ValidationError(f'座位{taken_seats[0]}已被占用')
             
             # 使用 InventoryService 预留座位（原子性操作，防止并发超售）
             seat_count = len(passengers_data)
@@ -3,17 +3,22 @@
 
 本模块包含订单增强功能的核心业务逻辑服务，包括座位库存管理、订单超时处理和改签服务。
 """
+import time
 from datetime import timedelta
 from decimal import Decimal
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, List
 
 from django.db import transaction
-from django.db.models import F, QuerySet
+from django.db.models import Count, QuerySet
 from django.utils import timezone
 from rest_framework.exceptions import ValidationError
 
 from flight.models import Flight
 from booking.models import Order, Ticket, RescheduleLog
+from booking.inventory import get_backend
+from booking.seatmap import SeatMapService
+from booking.signals import publish_order_status
+from notifications.services import create_timeout_notification
 
 
 class InventoryService:
@@ -21,14 +26,16 @@ class InventoryService:
     座位库存服务类。
     
     确保座位库存的一致性，防止并发超售问题。
-    使用数据库事务和行级锁定来保证原子性操作。
+    具体的扣减/释放由可插拔的库存后端完成（见 booking.inventory），
+    默认后端使用单条条件 UPDATE，不持有行锁。
     """
     
     @staticmethod
-    @transaction.atomic
     def reserve_seats(flight: Flight, count: int = 1) -> bool:
         """
-        预留座位（使用 select_for_update 锁定防止并发超售）。
+        预留座位。
+        
+        座位扣减与航班状态切换在后端中原子完成，座位不足时不做任何修改。
         
         Args:
             flight: 航班对象
@@ -43,27 +50,9 @@ class InventoryService:
         if count <= 0:
             raise ValueError("预留座位数必须大于 0")
         
-        # 使用 select_for_update 锁定航班记录，防止并发修改
-        locked_flight = Flight.objects.select_for_update().get(pk=flight.pk)
-        
-        # 检查是否有足够的可用座位
-        if locked_flight.available_seats < count:
-            return False
-        
-        # 扣减可用座位数
-        locked_flight.available_seats = F('available_seats') - count
-        locked_flight.save(update_fields=['available_seats', 'updated_at'])
-        
-        # 刷新对象以获取更新后的值
-        locked_flight.refresh_from_db()
-        
-        # 更新航班状态
-        InventoryService._update_flight_status(locked_flight)
-        
-        return True
+        return get_backend().reserve(flight, count)
     
     @staticmethod
-    @transaction.atomic
     def release_seats(flight: Flight, count: int = 1) -> bool:
         """
         释放座位。
@@ -81,20 +70,7 @@ class InventoryService:
         if count <= 0:
             raise ValueError("释放座位数必须大于 0")
         
-        # 使用 select_for_update 锁定航班记录
-        locked_flight = Flight.objects.select_for_update().get(pk=flight.pk)
-        
-        # 计算释放后的座位数，确保不超过总容量
-        new_available = min(locked_flight.available_seats + count, locked_flight.capacity)
-        
-        # 更新可用座位数
-        locked_flight.available_seats = new_available
-        locked_flight.save(update_fields=['available_seats', 'updated_at'])
-        
-        # 更新航班状态
-        InventoryService._update_flight_status(locked_flight)
-        
-        return True
+        return get_backend().release(flight, count)
     
     @staticmethod
     def check_seat_availability(flight: Flight, seat_number: str) -> bool:
@@ -112,32 +88,28 @@ class InventoryService:
         if flight.available_seats <= 0:
             return False
         
-        # 检查该座位是否已被有效机票占用
-        is_occupied = Ticket.objects.filter(
-            flight=flight,
-            seat_number=seat_number,
-            status__in=['valid', 'used']
-        ).exists()
-        
-        return not is_occupied
+        # 在航班座位位图中检查该座位是否已被有效机票占用
+        return not SeatMapService.get(flight).is_taken(seat_number)
     
     @staticmethod
-    def _update_flight_status(flight: Flight) -> None:
+    def get_unavailable_seats(flight: Flight, seat_numbers: Iterable[str]) -> List[str]:
         """
-        根据可用座位数更新航班状态。
+        批量检查座位，返回不可用的座位号。
         
-        当可用座位数为 0 时，状态更新为 'full'；
-        当可用座位数大于 0 且当前状态为 'full' 时，状态恢复为 'scheduled'。
+        所有座位共用一次位图查询，同一批次中重复的座位也视为不可用。
         
         Args:
             flight: 航班对象
+            seat_numbers: 座位号列表
+            
+        Returns:
+            不可用的座位号列表，全部可用时为空列表
         """
-        if flight.available_seats <= 0 and flight.status != 'full':
-            flight.status = 'full'
-            flight.save(update_fields=['status', 'updated_at'])
-        elif flight.available_seats > 0 and flight.status == 'full':
-            flight.status = 'scheduled'
-            flight.save(update_fields=['status', 'updated_at'])
+        seat_numbers = list(seat_numbers)
+        if flight.available_seats <= 0:
+            return seat_numbers
+        
+        return SeatMapService.find_taken(flight, seat_numbers)
 
 
 class TimeoutService:
@@ -149,6 +121,8 @@ class TimeoutService:
     """
     
     ORDER_TIMEOUT_MINUTES = 30
+    # 批量取消超时订单时每批处理的订单数
+    EXPIRY_CHUNK_SIZE = 500
     
     @staticmethod
     def get_expired_orders():
@@ -211,8 +185,9 @@ class TimeoutService:
             flight = Flight.objects.get(pk=flight_id)
             InventoryService.release_seats(flight, count)
         
-        # 更新机票状态为已取消
+        # 更新机票状态为已取消（批量更新不触发信号，需手动失效座位位图）
         tickets.update(status='canceled')
+        SeatMapService.invalidate(flight_seat_counts)
         
         # 更新订单状态为已取消
         locked_order.status = 'canceled'
@@ -221,40 +196,143 @@ class TimeoutService:
         return True
     
     @staticmethod
-    def process_all_expired_orders() -> dict:
+    def expire_order_chunk(now=None, chunk_size: int = None) -> Dict[str, int]:
+        """
+        批量取消一批超时订单（在单个事务中完成）。
+        
+        1. 以 SKIP LOCKED 方式认领一批超时订单，多个进程同时执行时互不阻塞；
+        2. 一条 UPDATE 将仍为待支付的订单置为已取消；
+        3. 按航班聚合这些订单的有效机票数，一条 UPDATE 取消机票；
+        4. 每个航班一次释放座位；
+        5. 提交后为已取消订单的用户批量发送超时通知。
+        
+        Args:
+            now: 超时判断的基准时间，默认为当前时间
+            chunk_size: 本批最多认领的订单数，默认为 EXPIRY_CHUNK_SIZE
+            
+        Returns:
+            {
+                'claimed': int,         # 认领的订单数（为 0 表示没有可处理的订单）
+                'canceled': int,        # 实际取消的订单数
+                'seats_released': int   # 释放的座位数
+            }
+        """
+        now = now or timezone.now()
+        chunk_size = chunk_size or TimeoutService.EXPIRY_CHUNK_SIZE
+        
+        with transaction.atomic():
+            # 不支持 SELECT ... FOR UPDATE 的数据库（如 SQLite）会忽略该子句
+            order_ids = list(
+                Order.objects.filter(
+                    status='pending',
+                    expires_at__isnull=False,
+                    expires_at__lt=now
+                ).order_by('expires_at', 'id')
+                .select_for_update(skip_locked=True)
+                .values_list('id', flat=True)[:chunk_size]
+            )
+            if not order_ids:
+                return {'claimed': 0, 'canceled': 0, 'seats_released': 0}
+            
+            # 条件更新，已被其他进程取消或已支付的订单不会被重复处理
+            canceled = Order.objects.filter(
+                id__in=order_ids, status='pending'
+            ).update(status='canceled')
+            
+            # 只处理本批中已取消订单下仍有效的机票
+            tickets = Ticket.objects.filter(
+                order_id__in=order_ids,
+                order__status='canceled',
+                status='valid'
+            )
+            flight_seat_counts = dict(
+                tickets.order_by().values('flight_id')
+                .annotate(count=Count('id'))
+                .values_list('flight_id', 'count')
+            )
+            tickets.update(status='canceled')
+            
+            # 每个航班一次释放
+            flights = Flight.objects.filter(pk__in=flight_seat_counts).only(
+                'id', 'departure_city', 'arrival_city', 'departure_time', 'capacity'
+            )
+            for flight in flights:
+                InventoryService.release_seats(flight, flight_seat_counts[flight.pk])
+            
+            # 批量更新不触发信号，需手动失效座位位图
+            SeatMapService.invalidate(flight_seat_counts)
+            
+            # 通知和订单状态事件在本批提交后发送
+            for order in Order.objects.filter(id__in=order_ids, status='canceled').only(
+                'id', 'user_id', 'order_number', 'total_price', 'status', 'expires_at'
+            ):
+                create_timeout_notification(order.user_id, order)
+                publish_order_status(order, 'pending')
+        
+        return {
+            'claimed': len(order_ids),
+            'canceled': canceled,
+            'seats_released': sum(flight_seat_counts.values())
+        }
+    
+    @staticmethod
+    def process_all_expired_orders(chunk_size: int = None, max_chunks: int = None) -> dict:
         """
         处理所有超时订单。
         
+        按固定大小分批处理，每批独立提交。中途中断后重新执行会从
+        剩余的待支付订单继续，不会重复处理；可在多个进程中同时执行。
+        只处理开始时已超时的订单，处理过程中新超时的订单留给下一次执行。
+        
+        Args:
+            chunk_size: 每批处理的订单数，默认为 EXPIRY_CHUNK_SIZE
+            max_chunks: 最多处理的批次数，默认处理到没有超时订单为止
+        
         Returns:
             {
-                'processed': int,  # 成功处理的订单数
-                'failed': int,     # 处理失败的订单数
-                'errors': list     # 错误信息列表
+                'processed': int,           # 成功处理的订单数
+                'failed': int,              # 处理失败的订单数
+                'errors': list,             # 错误信息列表
+                'chunks': int,              # 处理的批次数
+                'seats_released': int,      # 释放的座位数
+                'elapsed': float,           # 耗时（秒）
+                'orders_per_second': float  # 吞吐量
             }
         """
         result = {
             'processed': 0,
             'failed': 0,
-            'errors': []
+            'errors': [],
+            'chunks': 0,
+            'seats_released': 0,
+            'elapsed': 0.0,
+            'orders_per_second': 0.0
         }
         
-        expired_orders = TimeoutService.get_expired_orders()
+        now = timezone.now()
+        started = time.monotonic()
         
-        for order in expired_orders:
+        while max_chunks is None or result['chunks'] < max_chunks:
             try:
-                success = TimeoutService.cancel_expired_order(order)
-                if success:
-                    result['processed'] += 1
-                else:
-                    result['failed'] += 1
-                    result['errors'].append(
-                        f"订单 {order.order_number} 取消失败：状态不允许"
-                    )
+                chunk = TimeoutService.expire_order_chunk(now, chunk_size)
             except Exception as e:
-                result['failed'] += 1
-                result['errors'].append(
-                    f"订单 {order.order_number} 取消失败：{str(e)}"
-                )
+                # 整批回滚，订单仍为待支付，下次执行时会重试
+                result['errors'].append(f"第 {result['chunks'] + 1} 批取消失败：{str(e)}")
+                result['failed'] = TimeoutService.get_expired_orders().filter(
+                    expires_at__lt=now
+                ).count()
+                break
+            
+            if not chunk['claimed']:
+                break
+            
+            result['chunks'] += 1
+            result['processed'] += chunk['canceled']
+            result['seats_released'] += chunk['seats_released']
+        
+        result['elapsed'] = time.monotonic() - started
+        if result['elapsed'] > 0:
+            result['orders_per_second'] = result['processed'] / result['elapsed']
         
         return result
     
@@ -517,18 +595,16 @@ class ReschedulingService:
                 'message': '机票状态已变更，请刷新后重试'
             })
         
-        # 9. 释放原航班座位
-        InventoryService.release_seats(original_flight, 1)
-        
-        # 10. 预留目标航班座位
+        # 9. 预留目标航班座位（先预留再释放，预留失败时无需补偿）
         if not InventoryService.reserve_seats(target_flight, 1):
-            # 回滚原航班座位释放
-            InventoryService.reserve_seats(original_flight, 1)
             raise ValidationError({
                 'code': 'RESCHEDULE_NO_SEATS',
                 'message': '目标航班座位不足'
             })
         
+        # 10. 释放原航班座位
+        InventoryService.release_seats(original_flight, 1)
+        
         # 11. 更新原机票状态为已改签
         locked_ticket.status = 'rescheduled'
         locked_ticket.save(update_fields=['status', 'updated_at'])
@@ -0,0 +1,79 @@
+"""
+订单与机票模块信号处理。
+
+机票占座状态或航班座位布局变化时失效航班座位位图缓存；
+订单创建或状态变化时向用户事件频道发布订单状态。
+"""
+from typing import Optional
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core import events
+from flight.models import Flight
+from .models import Order, Ticket
+from .seatmap import SeatMapService
+
+# 变更后影响座位占用的机票字段
+SEAT_FIELDS = frozenset({'flight', 'flight_id', 'seat_number', 'status'})
+
+# 变更后影响位图尺寸的航班字段
+LAYOUT_FIELDS = frozenset({'seat_rows', 'seats_per_row'})
+
+
+@receiver(post_save, sender=Ticket)
+def invalidate_seat_map_on_ticket_save(sender, instance, update_fields=None, **kwargs):
+    """订票、退票、改签、值机换座等保存机票时失效所在航班的座位位图。"""
+    if update_fields is not None and not (set(update_fields) & SEAT_FIELDS):
+        return
+    SeatMapService.invalidate([instance.flight_id])
+
+
+@receiver(post_delete, sender=Ticket)
+def invalidate_seat_map_on_ticket_delete(sender, instance, **kwargs):
+    """删除机票时失效所在航班的座位位图。"""
+    SeatMapService.invalidate([instance.flight_id])
+
+
+@receiver(post_save, sender=Flight)
+def invalidate_seat_map_on_flight_save(sender, instance, created=False, update_fields=None, **kwargs):
+    """新建航班或座位布局变化时丢弃该航班 ID 下可能残留的位图。"""
+    if not created and update_fields is not None and not (set(update_fields) & LAYOUT_FIELDS):
+        return
+    SeatMapService.invalidate([instance.pk])
+
+
+def publish_order_status(order: Order, previous: Optional[str]) -> None:
+    """事务提交后向下单用户发布订单状态（客户端据此更新剩余支付时间）。"""
+    events.publish(events.user_channel(order.user_id), 'order_status', {
+        'order_id': order.pk,
+        'order_number': order.order_number,
+        'status': order.status,
+        'previous': previous,
+        'expires_at': order.expires_at,
+    })
+
+
+@receiver(pre_save, sender=Order)
+def snapshot_order_status(sender, instance, raw=False, **kwargs):
+    """保存前取得订单原有状态。"""
+    if raw or instance._state.adding or instance.pk is None:
+        instance._previous_status = None
+        return
+    loaded = getattr(instance, '_loaded_values', None) or {}
+    if 'status' in loaded:
+        instance._previous_status = loaded['status']
+    else:
+        instance._previous_status = Order.objects.filter(pk=instance.pk).values_list(
+            'status', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Order)
+def publish_order_status_on_save(sender, instance, created=False, raw=False, **kwargs):
+    """下单、支付、取消等状态变化后通知下单用户。"""
+    if raw:
+        return
+    previous = getattr(instance, '_previous_status', None)
+    if created or previous != instance.status:
+        publish_order_status(instance, previous)
@@ -1,7 +1,9 @@
 """订单和机票模块测试"""
+import json
 from datetime import timedelta
 from decimal import Decimal
 
+from django.core.cache import cache
 from django.test import TestCase
 from django.urls import reverse
 from django.utils import timezone
@@ -10,7 +12,11 @@ from rest_framework import status
 
 from accounts.models import User
 from flight.models import Flight
+from flight.status_engine import FlightStatusEngine
+from .inventory import CounterInventoryBackend, DatabaseInventoryBackend, LocalCounterStore
 from .models import Order, Ticket
+from .seatmap import SeatMap, SeatMapService
+from .services import InventoryService, TimeoutService
 
 
 class OrderModelTest(TestCase):
@@ -225,6 +231,24 @@ class TicketAPITest(APITestCase):
         response = self.client.get(url, {'status': 'REFUNDED'})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_export_tickets(self):
+        """测试管理员流式导出机票"""
+        url = reverse('ticket-export-csv')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        admin = User.objects.create_user(username='exportadmin', password='adminpassword123', role='admin')
+        self.client.force_authenticate(user=admin)
+        response = self.client.get(url, {'export_format': 'jsonl'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode('utf-8').splitlines()]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['order_number'], self.order.order_number)
+        self.assertEqual(records[0]['flight_number'], 'CA1234')
+
+        response = self.client.get(url, {'export_format': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_get_ticket_detail(self):
         """测试获取机票详情"""
         url = reverse('ticket-detail', args=[self.ticket.id])
@@ -232,3 +256,420 @@ class TicketAPITest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['passenger_name'], '张三')
         self.assertEqual(response.data['seat_number'], '1A')
+
+
+class InventoryBackendTest(TestCase):
+    """座位库存后端测试"""
+    def setUp(self):
+        self.flight = Flight.objects.create(
+            flight_number='CA5678',
+            departure_city='北京',
+            arrival_city='上海',
+            departure_time=timezone.now() + timedelta(days=7),
+            arrival_time=timezone.now() + timedelta(days=7, hours=2),
+            price=Decimal('800.00'),
+            capacity=3,
+            available_seats=3,
+            status='scheduled',
+            aircraft_type='Boeing 737',
+        )
+
+    def tearDown(self):
+        FlightStatusEngine.dispatch_notifications()
+
+    def test_database_reserve_is_single_update(self):
+        """未售罄时扣减座位只需一条 UPDATE"""
+        backend = DatabaseInventoryBackend()
+        with self.assertNumQueries(1):
+            self.assertTrue(backend.reserve(self.flight, 2))
+        self.flight.refresh_from_db()
+        self.assertEqual(self.flight.available_seats, 1)
+        self.assertEqual(self.flight.status, 'scheduled')
+
+    def test_database_reserve_sellout_emits_full(self):
+        """售罄时在同一条 UPDATE 中切换为已满，并上报状态变化"""
+        backend = DatabaseInventoryBackend()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(2):
+                self.assertTrue(backend.reserve(self.flight, 3))
+        self.flight.refresh_from_db()
+        self.assertEqual(self.flight.available_seats, 0)
+        self.assertEqual(self.flight.status, 'full')
+        self.assertEqual(FlightStatusEngine.pending_notifications(), {'full': [self.flight.pk]})
+
+    def test_database_reserve_rejects_oversell(self):
+        backend = DatabaseInventoryBackend()
+        self.assertFalse(backend.reserve(self.flight, 4))
+        self.flight.refresh_from_db()
+        self.assertEqual(self.flight.available_seats, 3)
+        self.assertEqual(self.flight.status, 'scheduled')
+
+    def test_database_release_restores_status(self):
+        backend = DatabaseInventoryBackend()
+        backend.reserve(self.flight, 3)
+        self.assertTrue(backend.release(self.flight, 5))
+        self.flight.refresh_from_db()
+        self.assertEqual(self.flight.available_seats, 3)
+        self.assertEqual(self.flight.status, 'scheduled')
+
+    def test_counter_backend_batches_write_behind(self):
+        """计数器后端不超售，并按批次回写数据库"""
+        backend = CounterInventoryBackend(store=LocalCounterStore(), batch_size=100)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(backend.reserve(self.flight, 2))
+            self.assertTrue(backend.reserve(self.flight, 1))
+            self.assertFalse(backend.reserve(self.flight, 1))
+
+        # 尚未达到批次，数据库未变化
+        self.flight.refresh_from_db()
+        self.assertEqual(self.flight.available_seats, 3)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(backend.flush(), 1)
+        self.flight.refresh_from_db()
+        self.assertEqual(self.flight.available_seats, 0)
+        self.assertEqual(self.flight.status, 'full')
+
+    def test_counter_backend_reconcile_reloads_from_db(self):
+        store = LocalCounterStore()
+        backend = CounterInventoryBackend(store=store)
+        backend.reserve(self.flight, 1)
+        Flight.objects.filter(pk=self.flight.pk).update(available_seats=3)
+        backend.reconcile()
+        self.assertTrue(backend.reserve(self.flight, 3))
+
+
+    def test_counter_backend_reconcile_keeps_other_process_deltas(self):
+        """校准时计入其他进程已提交但尚未回写的扣减，不会超售"""
+        store = LocalCounterStore()
+        first = CounterInventoryBackend(store=store)
+        second = CounterInventoryBackend(store=store)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(first.reserve(self.flight, 2))
+        second.reconcile([self.flight.pk])
+        self.assertFalse(second.reserve(self.flight, 2))
+
+        first.flush()
+        second.reconcile()
+        self.assertEqual(store.get(second._key(self.flight.pk)), 1)
+        self.assertTrue(second.reserve(self.flight, 1))
+
+class SeatMapTest(TestCase):
+    """航班座位位图测试"""
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='seatuser',
+            email='seat@example.com',
+            password='testpassword123'
+        )
+        self.flight = Flight.objects.create(
+            flight_number='CA9012',
+            departure_city='北京',
+            arrival_city='上海',
+            departure_time=timezone.now() + timedelta(days=7),
+            arrival_time=timezone.now() + timedelta(days=7, hours=2),
+            price=Decimal('800.00'),
+            capacity=60,
+            available_seats=58,
+            status='scheduled',
+            aircraft_type='Boeing 737',
+            seat_rows=10,
+            seats_per_row=6,
+        )
+        self.order = Order.objects.create(
+            user=self.user,
+            total_price=Decimal('1600.00'),
+            status='paid'
+        )
+        self.ticket = self._create_ticket('1A')
+        self._create_ticket('3F')
+
+    def _create_ticket(self, seat_number, status='valid'):
+        return Ticket.objects.create(
+            order=self.order,
+            flight=self.flight,
+            passenger_name='张三',
+            passenger_id_number='110101199001011234',
+            seat_number=seat_number,
+            price=Decimal('800.00'),
+            status=status
+        )
+
+    def test_bitset_occupy_and_release(self):
+        seat_map = SeatMap(rows=2, seats_per_row=6)
+        seat_map.occupy('2f')
+        seat_map.occupy('40K')
+        self.assertTrue(seat_map.is_taken('2F'))
+        self.assertTrue(seat_map.is_taken_at(2, 5))
+        self.assertTrue(seat_map.is_taken('40K'))
+        self.assertFalse(seat_map.is_taken('2E'))
+        self.assertEqual(len(seat_map), 2)
+        seat_map.release('2F')
+        self.assertFalse(seat_map.is_taken('2F'))
+        self.assertEqual(seat_map.taken_seats(), [])
+
+    def test_multi_seat_check_is_single_query(self):
+        """多个座位只需一次位图查询，并识别请求内重复的座位"""
+        with self.assertNumQueries(1):
+            taken = InventoryService.get_unavailable_seats(
+                self.flight, ['1A', '2B', '2C', '2B', '3F']
+            )
+        self.assertEqual(taken, ['1A', '2B', '3F'])
+
+        # 位图已缓存，再次检查不访问数据库
+        with self.assertNumQueries(0):
+            self.assertTrue(InventoryService.check_seat_availability(self.flight, '5C'))
+
+    def test_ticket_changes_invalidate_seat_map(self):
+        self.assertFalse(InventoryService.check_seat_availability(self.flight, '1A'))
+
+        # 退票后座位释放
+        self.ticket.status = 'refunded'
+        self.ticket.save()
+        self.assertTrue(InventoryService.check_seat_availability(self.flight, '1A'))
+
+        # 新订座位后立即可见
+        self._create_ticket('4D')
+        self.assertFalse(InventoryService.check_seat_availability(self.flight, '4D'))
+
+        # 批量取消（不触发信号）后手动失效
+        Ticket.objects.filter(seat_number='4D').update(status='canceled')
+        SeatMapService.invalidate([self.flight.pk])
+        self.assertTrue(InventoryService.check_seat_availability(self.flight, '4D'))
+
+    def test_seats_endpoint_uses_seat_map(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = reverse('flight-seats', args=[self.flight.id])
+        response = client.get(url, {'cabin_class': 'first'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['occupied_seats'], ['1A', '3F'])
+        self.assertTrue(response.data['seat_map'][0][0]['taken'])
+        self.assertFalse(response.data['seat_map'][0][1]['taken'])
+
+    def test_checkin_rejects_taken_seat(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = reverse('ticket-checkin', args=[self.ticket.id])
+        response = client.post(url, {'seat_number': '3F'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = client.post(url, {'seat_number': '2C'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(SeatMapService.get(self.flight).is_taken('2C'))
+        self.assertFalse(SeatMapService.get(self.flight).is_taken('1A'))
+
+
+class BulkOrderExpiryTest(TestCase):
+    """超时订单批量取消测试"""
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='expireuser',
+            email='expire@example.com',
+            password='testpassword123'
+        )
+        self.flights = [
+            Flight.objects.create(
+                flight_number=f'CA70{i}',
+                departure_city='北京',
+                arrival_city='上海',
+                departure_time=timezone.now() + timedelta(days=7),
+                arrival_time=timezone.now() + timedelta(days=7, hours=2),
+                price=Decimal('800.00'),
+                capacity=10,
+                available_seats=0,
+                status='full',
+                aircraft_type='Boeing 737',
+            )
+            for i in range(2)
+        ]
+        expired = timezone.now() - timedelta(minutes=1)
+        self.expired_orders = [self._create_order('pending', expired) for _ in range(5)]
+        self.paid_order = self._create_order('paid', expired)
+        self.active_order = self._create_order('pending', timezone.now() + timedelta(minutes=10))
+
+    def _create_order(self, status, expires_at):
+        order = Order.objects.create(
+            user=self.user,
+            total_price=Decimal('1600.00'),
+            status=status,
+            expires_at=expires_at
+        )
+        for flight in self.flights:
+            Ticket.objects.create(
+                order=order,
+                flight=flight,
+                passenger_name='张三',
+                passenger_id_number='110101199001011234',
+                price=Decimal('800.00'),
+                status='valid'
+            )
+        return order
+
+    def test_process_all_expired_orders_in_chunks(self):
+        result = TimeoutService.process_all_expired_orders(chunk_size=2)
+
+        self.assertEqual(result['processed'], 5)
+        self.assertEqual(result['failed'], 0)
+        self.assertEqual(result['chunks'], 3)
+        self.assertEqual(result['seats_released'], 10)
+        self.assertIn('orders_per_second', result)
+
+        self.assertEqual(
+            Order.objects.filter(pk__in=[o.pk for o in self.expired_orders], status='canceled').count(), 5
+        )
+        self.assertEqual(Ticket.objects.filter(status='canceled').count(), 10)
+        self.paid_order.refresh_from_db()
+        self.active_order.refresh_from_db()
+        self.assertEqual(self.paid_order.status, 'paid')
+        self.assertEqual(self.active_order.status, 'pending')
+
+        for flight in self.flights:
+            flight.refresh_from_db()
+            self.assertEqual(flight.available_seats, 5)
+            self.assertEqual(flight.status, 'scheduled')
+
+    def test_chunk_query_count_does_not_grow_with_orders(self):
+        """每批的查询数只与航班数有关，与订单数无关"""
+        # 航班均为已满，每个航班释放座位时需两条 UPDATE（释放并恢复状态），
+        # 另有一条查询读取需要通知的订单
+        with self.assertNumQueries(12):
+            chunk = TimeoutService.expire_order_chunk(chunk_size=5)
+        self.assertEqual(chunk['canceled'], 5)
+
+    def test_chunk_notifies_users_after_commit(self):
+        from notifications.models import Notification
+        from notifications.services import create_timeout_notification
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TimeoutService.expire_order_chunk(chunk_size=5)
+            self.assertFalse(Notification.objects.exists())
+        notifications = Notification.objects.filter(notif_type='order', title='订单已超时取消')
+        self.assertEqual(notifications.count(), 5)
+
+        # 重复发送同一事件不会产生重复通知
+        with self.captureOnCommitCallbacks(execute=True):
+            for order in self.expired_orders:
+                create_timeout_notification(order.user_id, order)
+        self.assertEqual(notifications.count(), 5)
+
+    def test_resume_after_partial_run(self):
+        first = TimeoutService.process_all_expired_orders(chunk_size=2, max_chunks=1)
+        self.assertEqual(first['processed'], 2)
+        self.assertEqual(TimeoutService.get_expired_orders().count(), 3)
+
+        second = TimeoutService.process_all_expired_orders(chunk_size=2)
+        self.assertEqual(second['processed'], 3)
+        self.assertFalse(TimeoutService.get_expired_orders().exists())
+
+
+class TicketSerializerTest(APITestCase):
+    """机票批量序列化测试"""
+    def setUp(self):
+        self.user = User.objects.create_user(username='serializeruser', password='testpassword123')
+        now = timezone.now()
+        self.flights = [
+            Flight.objects.create(
+                flight_number=f'SR{i:04d}',
+                airline_name='测试航空' if i else '',
+                departure_city='北京',
+                arrival_city='上海',
+                departure_time=now + timedelta(days=i - 1),
+                arrival_time=now + timedelta(days=i - 1, minutes=135),
+                price=Decimal('800.00'),
+                capacity=100,
+                available_seats=100,
+                aircraft_type='A320',
+            )
+            for i in range(2)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def create_orders(self, count, tickets_per_order=2):
+        statuses = ['valid', 'refunded', 'used']
+        for i in range(count):
+            order = Order.objects.create(user=self.user, total_price=Decimal('1600.00'), status='paid')
+            for j in range(tickets_per_order):
+                Ticket.objects.create(
+                    order=order, flight=self.flights[(i + j) % 2], passenger_name=f'乘客{j}',
+                    passenger_id_number=f'11010119900101{j:04d}', seat_number=f'{j + 1}A',
+                    cabin_class='business', price=Decimal('800.00'), status=statuses[(i + j) % 3],
+                )
+
+    def test_ticket_output(self):
+        from .serializers import TicketSerializer
+
+        flight = self.flights[1]
+        order = Order.objects.create(user=self.user, total_price=Decimal('800.00'), status='paid')
+        ticket = Ticket.objects.create(
+            order=order, flight=flight, passenger_name='张三', passenger_id_number='110101199001011234',
+            seat_number='3C', cabin_class='business', price=Decimal('800.00'), status='valid',
+        )
+        departure = flight.departure_time.isoformat()
+        arrival = flight.arrival_time.isoformat()
+
+        data = TicketSerializer(Ticket.objects.get(pk=ticket.pk)).data
+        self.assertEqual(list(data)[:19], [
+            'id', 'flight_number', 'departure_city', 'arrival_city', 'departure_time', 'arrival_time',
+            'airline_name', 'airline_logo', 'departure_airport', 'arrival_airport', 'duration',
+            'flight_status', 'flight_info', 'order_number', 'order_id', 'seat_info', 'passenger_info',
+            'frontend_status', 'ticket_number',
+        ])
+        self.assertEqual({name: data[name] for name in list(data)[1:18]}, {
+            'flight_number': 'SR0001',
+            'departure_city': '北京',
+            'arrival_city': '上海',
+            'departure_time': flight.departure_time,
+            'arrival_time': flight.arrival_time,
+            'airline_name': '测试航空',
+            'airline_logo': 'https://picsum.photos/id/24/40/40',
+            'departure_airport': '北京机场',
+            'arrival_airport': '上海机场',
+            'duration': 135,
+            'flight_status': 'scheduled',
+            'flight_info': {
+                'airline': '测试航空', 'flight_number': 'SR0001',
+                'departure_city': '北京', 'departure_airport': '北京机场', 'departure_time': departure,
+                'arrival_city': '上海', 'arrival_airport': '上海机场', 'arrival_time': arrival,
+            },
+            'order_number': order.order_number,
+            'order_id': order.pk,
+            'seat_info': {'cabin_class': '商务舱', 'seat_number': '3C'},
+            'passenger_info': {'name': '张三', 'id_card': '1101**********1234'},
+            # 航班已起飞
+            'frontend_status': 'EXPIRED',
+        })
+        self.assertEqual((data['order'], data['flight'], data['price']), (order.pk, flight.pk, '800.00'))
+
+        # 批量输出与单张输出一致
+        self.create_orders(3)
+        tickets = list(Ticket.objects.all())
+        fast = TicketSerializer(tickets, many=True).data
+        self.assertEqual(fast[0], data)
+        self.assertEqual(
+            [(row['frontend_status'], row['airline_name']) for row in fast[1:4]],
+            [('EXPIRED', ''), ('REFUNDED', '测试航空'), ('REFUNDED', '测试航空')]
+        )
+
+        # 航班和订单未预先加载时各用一条查询批量读取
+        tickets = list(Ticket.objects.all())
+        with self.assertNumQueries(2):
+            TicketSerializer(tickets, many=True).data
+
+    def test_list_query_counts_do_not_grow(self):
+        """订单和机票列表的查询数与记录数无关"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        counts = {'order-list': [], 'ticket-list': []}
+        for batch in (1, 5):
+            self.create_orders(batch)
+            for name in counts:
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                counts[name].append(len(queries))
+        self.assertEqual(counts['order-list'][0], counts['order-list'][1])
+        self.assertEqual(counts['ticket-list'][0], counts['ticket-list'][1])
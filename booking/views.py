@@ -1,6 +1,7 @@
 import logging
 
 from django.db import transaction
+from django.db.models import Prefetch
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, permissions, status, viewsets
@@ -8,16 +9,20 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
 
+from accounts.permissions import IsAdminUser
+from core.export import ExportColumn
+from core.mixins import StreamingExportMixin
 from core.utils import mask_id_number
 from flight.serializers import FlightSerializer
 from notifications.services import create_order_notification, create_refund_notification
 from .filters import OrderFilter, TicketFilter
 from .models import Order, Ticket
+from .seatmap import SeatMapService
 from .serializers import OrderCreateSerializer, OrderSerializer, TicketSerializer
 from .services import ReschedulingService, TimeoutService, InventoryService
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(StreamingExportMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -25,6 +30,18 @@ class OrderViewSet(viewsets.ModelViewSet):
     search_fields = ['order_number', 'contact_name']
     ordering_fields = ['created_at', 'total_price']
     ordering = ['-created_at']
+    export_filename = 'orders'
+    export_columns = [
+        ExportColumn('id', 'id'),
+        ExportColumn('order_number', 'order_number'),
+        ExportColumn('user', 'user_id'),
+        ExportColumn('username', 'user__username'),
+    ] + [
+        ExportColumn(name, name) for name in (
+            'total_price', 'status', 'payment_method', 'contact_name', 'contact_phone',
+            'contact_email', 'created_at', 'paid_at', 'expires_at'
+        )
+    ]
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -38,9 +55,15 @@ class OrderViewSet(viewsets.ModelViewSet):
             return Order.objects.none()
             
         # 使用select_related和prefetch_related优化查询
-        queryset = Order.objects.select_related('user').prefetch_related(
-            'tickets__flight'
-        )
+        if self.action in ('list', 'retrieve'):
+            # 只读接口只加载机票输出所需的航班列
+            queryset = Order.objects.select_related('user').prefetch_related(Prefetch(
+                'tickets', queryset=TicketSerializer.optimize_queryset(Ticket.objects.all(), include_order=False)
+            ))
+        else:
+            queryset = Order.objects.select_related('user').prefetch_related(
+                'tickets__flight'
+            )
         
         if hasattr(user, 'role') and user.role == 'admin':
             return queryset
@@ -83,6 +106,11 @@ class OrderViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def export_csv(self, request):
+        """导出订单（流式输出，支持 export_format=jsonl 和 compression=gzip）。"""
+        return self.stream_export(request)
+
     @action(detail=True, methods=['patch', 'put'], permission_classes=[permissions.IsAuthenticated])
     def status(self, request, pk=None):
         """
@@ -194,7 +222,7 @@ class OrderViewSet(viewsets.ModelViewSet):
             'is_expired': remaining_seconds == 0 and order.status == 'pending',
         })
 
-class TicketViewSet(viewsets.ReadOnlyModelViewSet):
+class TicketViewSet(StreamingExportMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Ticket.objects.all()
     serializer_class = TicketSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -202,16 +230,38 @@ class TicketViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = TicketFilter
     search_fields = ['passenger_name', 'ticket_number']
     ordering = ['-created_at']
+    export_filename = 'tickets'
+    export_columns = [
+        ExportColumn('id', 'id'),
+        ExportColumn('ticket_number', 'ticket_number'),
+        ExportColumn('order_number', 'order__order_number'),
+        ExportColumn('flight_number', 'flight__flight_number'),
+        ExportColumn('departure_time', 'flight__departure_time'),
+    ] + [
+        ExportColumn(name, name) for name in (
+            'passenger_name', 'passenger_id_type', 'passenger_id_number', 'seat_number',
+            'cabin_class', 'price', 'status', 'checked_in', 'checked_in_at', 'created_at'
+        )
+    ]
 
     def get_queryset(self):
         user = self.request.user
         # 使用select_related优化查询
-        queryset = Ticket.objects.select_related('order__user', 'flight')
+        if self.action == 'list':
+            # 列表只加载输出所需的航班列和订单号
+            queryset = TicketSerializer.optimize_queryset(Ticket.objects.all())
+        else:
+            queryset = Ticket.objects.select_related('order__user', 'flight')
         
         if hasattr(user, 'role') and user.role == 'admin':
             return queryset
         return queryset.filter(order__user=user)
 
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def export_csv(self, request):
+        """导出机票（流式输出，支持 export_format=jsonl 和 compression=gzip）。"""
+        return self.stream_export(request)
+
     @action(detail=False, methods=['post'], url_path='search-for-checkin',
             permission_classes=[permissions.AllowAny])
     def search_for_checkin(self, request):
@@ -423,12 +473,11 @@ class TicketViewSet(viewsets.ReadOnlyModelViewSet):
         # 获取新座位号（可选）
         new_seat = request.data.get('seat_number')
         if new_seat:
-            # 检查座位是否可用
-            existing = Ticket.objects.filter(
-                flight=flight,
-                seat_number=new_seat,
-                status='valid'
-            ).exclude(id=ticket.id).exists()
+            # 在座位位图中检查座位是否可用（本机票原座位除外）
+            existing = (
+                new_seat != ticket.seat_number and
+                SeatMapService.get(flight).is_taken(new_seat)
+            )
             
             if existing:
                 return Response(
@@ -4,4 +4,8 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
-    verbose_name = '核心功能' 
\ No newline at end of file
+    verbose_name = '核心功能'
+
+    def ready(self):
+        from core.settings_cache import settings_cache
+        settings_cache.connect()
@@ -0,0 +1,60 @@
+"""
+异步操作审计日志。
+
+SystemLogMiddleware 在请求结束时只生成一条精简的日志记录并放入进程内的有界队列，
+由后台写入线程每 AUDIT_LOG_BATCH_SIZE 条或每 AUDIT_LOG_FLUSH_INTERVAL 毫秒
+用一条 bulk_create 批量写入 SystemLog，请求路径上不再执行 INSERT。
+
+- 队列满时最多等待 AUDIT_LOG_ENQUEUE_TIMEOUT 毫秒（背压），仍无空位则丢弃并计数
+- 写入失败的批次丢弃并计数，不会阻塞后续日志
+- 进程退出时写入队列中剩余的日志
+- 关闭 AUDIT_LOG_ASYNC 时（如测试环境）直接同步写入
+"""
+import atexit
+from typing import List, Optional
+
+from django.conf import settings
+
+from .batching import BackgroundBatchWriter
+from .models import SystemLog
+
+
+def build_detail(request, body: Optional[bytes], max_bytes: int) -> str:
+    """
+    生成日志详情：请求体最多保留 max_bytes 字节，超出部分只记录总大小。
+
+    body 为 None 表示未读取请求体（如上传文件），只记录类型和大小。
+    """
+    content_type = request.META.get('CONTENT_TYPE', '').split(';')[0]
+    length = request.META.get('CONTENT_LENGTH') or 0
+    if body is None:
+        return f'[{content_type or "未知类型"} {length} 字节]' if length not in (0, '0', '') else ''
+    text = body[:max_bytes].decode('utf-8', errors='replace')
+    if len(body) > max_bytes:
+        text += f'...[已截断，共 {len(body)} 字节]'
+    return text
+
+
+class AuditLogWriter(BackgroundBatchWriter):
+    """SystemLog 异步批量写入器"""
+
+    name = 'audit-log'
+
+    @classmethod
+    def from_settings(cls) -> 'AuditLogWriter':
+        return cls(
+            queue_size=getattr(settings, 'AUDIT_LOG_QUEUE_SIZE', 10000),
+            batch_size=getattr(settings, 'AUDIT_LOG_BATCH_SIZE', 200),
+            flush_interval=getattr(settings, 'AUDIT_LOG_FLUSH_INTERVAL', 500) / 1000,
+            enqueue_timeout=getattr(settings, 'AUDIT_LOG_ENQUEUE_TIMEOUT', 5) / 1000,
+            asynchronous=getattr(settings, 'AUDIT_LOG_ASYNC', True),
+        )
+
+    def write_batch(self, records: List[SystemLog]) -> int:
+        SystemLog.objects.bulk_create(records)
+        return len(records)
+
+
+audit_writer = AuditLogWriter.from_settings()
+
+atexit.register(audit_writer.stop, 5)
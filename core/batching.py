@@ -0,0 +1,218 @@
+"""
+后台批量写入。
+
+请求线程把记录放入进程内的有界队列，后台写入线程每 batch_size 条
+或每 flush_interval 秒批量写入一次，请求路径上不执行写入。
+
+- 队列满时最多等待 enqueue_timeout 秒（背压），仍无空位时丢弃并计数，
+  或（drop_when_full 为 False 时）在当前线程中直接写入
+- 写入失败的批次丢弃并计数，不会阻塞后续记录
+- stop() 时写入队列中剩余的记录
+- 关闭 asynchronous 时（如测试环境）提交即同步写入
+
+子类实现 write_batch() 写入一批记录。
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundBatchWriter:
+    """
+    后台批量写入器基类。
+
+    Attributes:
+        name: 写入器名称，用于线程名和日志
+        drop_when_full: 队列满且等待超时后是否丢弃记录，否则在当前线程中写入
+        batch_size: 每批写入的最大条数
+        flush_interval: 队列中有记录时两次写入的最大间隔（秒）
+        enqueue_timeout: 队列满时的最长等待时间（秒）
+        asynchronous: 是否使用后台线程写入
+    """
+
+    name = 'batch-writer'
+    drop_when_full = True
+
+    def __init__(self, queue_size: int = 10000, batch_size: int = 200,
+                 flush_interval: float = 0.5, enqueue_timeout: float = 0.005,
+                 asynchronous: bool = True):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.asynchronous = asynchronous
+        self.stats = {
+            'enqueued': 0,
+            'written': 0,
+            'dropped': 0,
+            'failed': 0,
+            'batches': 0,
+            'blocked': 0,
+        }
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._reset_queue()
+
+    def _reset_queue(self) -> None:
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._pid = os.getpid()
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    # ------------------------------------------------------------------
+    # 子类扩展点
+    # ------------------------------------------------------------------
+
+    def write_batch(self, records: List) -> int:
+        """写入一批记录，返回写入条数。"""
+        raise NotImplementedError
+
+    # ------------------------------------------------------------------
+    # 入队
+    # ------------------------------------------------------------------
+
+    def submit(self, record) -> bool:
+        """
+        提交一条记录，必要时启动后台写入线程。
+
+        Returns:
+            记录是否被接收（队列已满时被丢弃则为 False）
+        """
+        if not self.asynchronous:
+            self.write([record])
+            return True
+        self.start()
+        return self.enqueue(record)
+
+    def enqueue(self, record) -> bool:
+        """放入队列，队列满时最多等待 enqueue_timeout 秒，仍无空位则丢弃或直接写入。"""
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.stats['blocked'] += 1
+            try:
+                self._queue.put(record, timeout=self.enqueue_timeout)
+            except queue.Full:
+                if not self.drop_when_full:
+                    self.write([record])
+                    return True
+                self.stats['dropped'] += 1
+                if self.stats['dropped'] % 1000 == 1:
+                    logger.warning(f"{self.name} 队列已满，已丢弃 {self.stats['dropped']} 条记录")
+                return False
+        self.stats['enqueued'] += 1
+        return True
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def write(self, records: List) -> int:
+        """写入一批记录，失败时丢弃该批次并计数，返回写入条数。"""
+        if not records:
+            return 0
+        try:
+            written = self.write_batch(records)
+        except Exception:
+            self.stats['failed'] += len(records)
+            logger.exception(f"{self.name} 写入失败，丢弃 {len(records)} 条记录")
+            return 0
+        self.stats['written'] += written
+        self.stats['batches'] += 1
+        return written
+
+    def _drain(self, limit: int) -> List:
+        records = []
+        while len(records) < limit:
+            try:
+                records.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return records
+
+    def flush(self) -> int:
+        """在当前线程中写入队列中的全部记录，返回写入条数。"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                records = self._drain(self.batch_size)
+                if not records:
+                    return written
+                written += self.write(records)
+
+    # ------------------------------------------------------------------
+    # 后台线程
+    # ------------------------------------------------------------------
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> bool:
+        """
+        启动后台写入线程（重复调用不会启动多个线程）。
+
+        fork 出的子进程中线程不存在，会以新的空队列重新启动。
+
+        Returns:
+            本次调用是否启动了线程
+        """
+        if self.running:
+            return False
+        with self._lock:
+            if self.running:
+                return False
+            if self._pid != os.getpid():
+                self._reset_queue()
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._loop, name=f'ifly-{self.name}', daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """停止后台写入线程并写入剩余记录。"""
+        self._stop_event.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout)
+        if self._pid == os.getpid():
+            self.flush()
+
+    def _loop(self) -> None:
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    first = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+                # 凑满一批或等待满 flush_interval 后写入
+                records = [first]
+                deadline = time.monotonic() + self.flush_interval
+                while len(records) < self.batch_size and not self._stop_event.is_set():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        records.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                with self._flush_lock:
+                    self.write(records)
+                close_old_connections()
+        finally:
+            self.flush()
+            close_old_connections()
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self.stats, pending=self.pending, running=self.running)
@@ -0,0 +1,131 @@
+"""
+用户未读数计数器。
+
+未读数保存在 UnreadCounter 表中（每个用户每个类别一行），轮询时只读取一行：
+- 首次读取时统计源表并建立计数行
+- 新增（post_save）、标记已读/未读、批量已读、删除时以 F() 表达式原子增减，
+  与源表的修改在同一事务中提交
+- 绕过以上路径直接修改源表时计数可能偏差，由周期任务按源表校准
+"""
+import logging
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_save
+
+from .models import UnreadCounter
+
+logger = logging.getLogger(__name__)
+
+
+class UnreadCounterService:
+    """
+    一类未读数的计数器。
+
+    Args:
+        kind: 计数器类别
+        model: 源模型，需有 user 外键和 is_read 字段
+    """
+
+    # 校准时每批处理的计数行数
+    RECONCILE_BATCH_SIZE = 1000
+
+    def __init__(self, kind: str, model):
+        self.kind = kind
+        self.model = model
+
+    def count_unread(self, user_id: int) -> int:
+        """统计源表中的未读数。"""
+        return self.model.objects.filter(user_id=user_id, is_read=False).count()
+
+    def get(self, user_id: int) -> int:
+        """获取未读数，计数行不存在时统计源表并建立。"""
+        unread = UnreadCounter.objects.filter(user_id=user_id, kind=self.kind).values_list(
+            'unread', flat=True
+        ).first()
+        if unread is not None:
+            return unread
+        unread = self.count_unread(user_id)
+        try:
+            with transaction.atomic():
+                UnreadCounter.objects.create(user_id=user_id, kind=self.kind, unread=unread)
+        except IntegrityError:
+            # 并发请求已建立计数行
+            pass
+        return unread
+
+    def adjust(self, user_id: int, delta: int) -> None:
+        """增减一个用户的未读数。"""
+        if delta:
+            self.adjust_many({user_id: delta})
+
+    def adjust_many(self, deltas: Dict[int, int]) -> None:
+        """
+        批量增减未读数，增减量相同的用户合并为一条 UPDATE。
+
+        计数行不存在的用户不处理，首次读取时再统计。
+        """
+        by_delta = defaultdict(list)
+        for user_id, delta in deltas.items():
+            if delta:
+                by_delta[delta].append(user_id)
+        for delta, user_ids in by_delta.items():
+            UnreadCounter.objects.filter(user_id__in=user_ids, kind=self.kind).update(
+                unread=F('unread') + delta
+            )
+
+    def created(self, user_ids: Iterable[int]) -> None:
+        """为批量新增的未读记录增加计数（bulk_create 不触发 post_save）。"""
+        self.adjust_many(Counter(user_ids))
+
+    def changed(self, user_id: int, was_unread: bool, is_unread: bool) -> None:
+        """单条记录已读状态变化后调整计数。"""
+        self.adjust(user_id, int(is_unread) - int(was_unread))
+
+    def connect(self) -> None:
+        """通过 post_save 信号统计逐条新增的未读记录。"""
+        post_save.connect(
+            self._on_save, sender=self.model, weak=False,
+            dispatch_uid=f'unread_counter_{self.kind}'
+        )
+
+    def _on_save(self, sender, instance, created, **kwargs):
+        if created and not instance.is_read:
+            self.adjust(instance.user_id, 1)
+
+    def reconcile(self, user_ids: Optional[Iterable[int]] = None) -> int:
+        """
+        按源表校准计数行（周期任务）。
+
+        只在计数行未被并发修改时写入校准值，避免覆盖校准期间的增减。
+
+        Returns:
+            被校准的计数行数量
+        """
+        rows = UnreadCounter.objects.filter(kind=self.kind).order_by('id')
+        if user_ids is not None:
+            rows = rows.filter(user_id__in=list(user_ids))
+
+        fixed = 0
+        last_id = 0
+        while True:
+            batch = list(rows.filter(id__gt=last_id).values_list(
+                'id', 'user_id', 'unread'
+            )[:self.RECONCILE_BATCH_SIZE])
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            actual = dict(
+                self.model.objects.filter(
+                    user_id__in=[user_id for _, user_id, _ in batch], is_read=False
+                ).order_by().values('user_id').annotate(count=Count('id')).values_list('user_id', 'count')
+            )
+            for row_id, user_id, unread in batch:
+                count = actual.get(user_id, 0)
+                if count != unread:
+                    fixed += UnreadCounter.objects.filter(id=row_id, unread=unread).update(unread=count)
+        if fixed:
+            logger.info(f"已校准 {fixed} 个{self.kind}未读计数")
+        return fixed
@@ -0,0 +1,275 @@
+"""
+实时事件总线。
+
+新通知、订单状态变化和航班座位变化在事务提交后发布到频道，
+客户端通过 SSE 或长轮询接口（core.views.EventStreamView / EventPollView）订阅，
+不再轮询通知列表、未读数和订单剩余时间。
+
+- 频道：user:<用户ID>（通知、订单状态）、flight:<航班ID>（座位变化）
+- 每个频道的事件有递增序号，只保留最近 EVENT_BUS_BUFFER 条
+- 游标记录各频道已收到的序号（如 "user:5=12,flight:3=40"），作为 SSE 的事件 ID，
+  断线重连时通过 Last-Event-ID 续传；游标早于保留范围时返回 reset，客户端需重新拉取
+
+通过 settings.EVENT_BUS_BACKEND 选择后端：
+- local：进程内总线，单进程部署或开发环境使用
+- cache：基于缓存（生产环境为 Redis）的总线，多个进程共享
+"""
+import json
+import logging
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+Cursor = Dict[str, int]
+
+
+def user_channel(user_id: int) -> str:
+    return f'user:{user_id}'
+
+
+def flight_channel(flight_id: int) -> str:
+    return f'flight:{flight_id}'
+
+
+def encode_cursor(cursor: Cursor) -> str:
+    return ','.join(f'{channel}={seq}' for channel, seq in sorted(cursor.items()))
+
+
+def parse_cursor(value: Optional[str]) -> Cursor:
+    """解析游标，忽略格式错误的部分。"""
+    cursor = {}
+    for part in (value or '').split(','):
+        channel, _, seq = part.strip().rpartition('=')
+        if channel and seq.isdigit():
+            cursor[channel] = int(seq)
+    return cursor
+
+
+def sse_message(event_type: str, data, event_id: Optional[str] = None) -> str:
+    """编码一条 SSE 消息。"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event_type}')
+    lines.append('data: ' + json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False))
+    return '\n'.join(lines) + '\n\n'
+
+
+class EventBus:
+    """
+    事件总线基类。
+
+    事件格式: {'channel': 频道, 'id': 序号, 'type': 事件类型, 'data': 数据}
+    """
+
+    def __init__(self, buffer_size: int = 1000):
+        self.buffer_size = buffer_size
+
+    def publish(self, channel: str, event_type: str, data: dict) -> int:
+        """发布事件，返回事件序号。"""
+        raise NotImplementedError
+
+    def latest(self, channels: Iterable[str]) -> Cursor:
+        """各频道当前最新的序号。"""
+        raise NotImplementedError
+
+    def fetch(self, cursor: Cursor) -> Tuple[List[dict], List[str]]:
+        """
+        取得游标之后的事件（不等待）。
+
+        Returns:
+            (事件列表, 游标已早于保留范围的频道)
+        """
+        raise NotImplementedError
+
+    def wait(self, cursor: Cursor, timeout: float) -> None:
+        """等待任一频道出现新事件或超时。"""
+        raise NotImplementedError
+
+    def read(self, cursor: Cursor, timeout: float = 0) -> Tuple[List[dict], List[str]]:
+        """取得游标之后的事件，没有新事件时最多等待 timeout 秒。"""
+        events, reset = self.fetch(cursor)
+        if events or reset or timeout <= 0:
+            return events, reset
+        self.wait(cursor, timeout)
+        return self.fetch(cursor)
+
+    @staticmethod
+    def advance(cursor: Cursor, events: List[dict], reset: Iterable[str] = (),
+                latest: Optional[Cursor] = None) -> Cursor:
+        """收到事件后的新游标，reset 的频道跳到最新序号。"""
+        cursor = dict(cursor)
+        for event in events:
+            cursor[event['channel']] = max(cursor.get(event['channel'], 0), event['id'])
+        for channel in reset:
+            cursor[channel] = (latest or {}).get(channel, cursor.get(channel, 0))
+        return cursor
+
+
+class LocalEventBus(EventBus):
+    """进程内事件总线，每个频道一个有界环形缓冲区。"""
+
+    def __init__(self, buffer_size: int = 1000):
+        super().__init__(buffer_size)
+        self._channels: Dict[str, deque] = {}
+        self._sequences: Dict[str, int] = {}
+        self._condition = threading.Condition()
+
+    def publish(self, channel: str, event_type: str, data: dict) -> int:
+        with self._condition:
+            seq = self._sequences.get(channel, 0) + 1
+            self._sequences[channel] = seq
+            buffer = self._channels.get(channel)
+            if buffer is None:
+                buffer = self._channels[channel] = deque(maxlen=self.buffer_size)
+            buffer.append({'channel': channel, 'id': seq, 'type': event_type, 'data': data})
+            self._condition.notify_all()
+        return seq
+
+    def latest(self, channels: Iterable[str]) -> Cursor:
+        with self._condition:
+            return {channel: self._sequences.get(channel, 0) for channel in channels}
+
+    def _has_new(self, cursor: Cursor) -> bool:
+        return any(self._sequences.get(channel, 0) > seq for channel, seq in cursor.items())
+
+    def fetch(self, cursor: Cursor) -> Tuple[List[dict], List[str]]:
+        events, reset = [], []
+        with self._condition:
+            for channel, seq in cursor.items():
+                latest = self._sequences.get(channel, 0)
+                if latest <= seq:
+                    continue
+                buffer = self._channels[channel]
+                if buffer[0]['id'] > seq + 1:
+                    reset.append(channel)
+                    continue
+                events.extend(event for event in buffer if event['id'] > seq)
+        return events, reset
+
+    def wait(self, cursor: Cursor, timeout: float) -> None:
+        with self._condition:
+            self._condition.wait_for(lambda: self._has_new(cursor), timeout)
+
+
+class CacheEventBus(EventBus):
+    """
+    基于缓存的事件总线（生产环境为 Redis），多个进程共享。
+
+    频道序号用 cache.incr 原子递增，事件按 (频道, 序号) 保存并在 retention 秒后过期；
+    等待新事件时每 poll_interval 秒用一次 get_many 检查各频道序号。
+    游标之后的第一条事件已不存在时（过期或被淘汰）返回 reset。
+    """
+
+    KEY_PREFIX = 'events'
+
+    def __init__(self, buffer_size: int = 1000, retention: int = 600, poll_interval: float = 0.25):
+        super().__init__(buffer_size)
+        self.retention = retention
+        self.poll_interval = poll_interval
+
+    def _seq_key(self, channel: str) -> str:
+        return f'{self.KEY_PREFIX}:seq:{channel}'
+
+    def _event_key(self, channel: str, seq: int) -> str:
+        return f'{self.KEY_PREFIX}:{channel}:{seq}'
+
+    def publish(self, channel: str, event_type: str, data: dict) -> int:
+        key = self._seq_key(channel)
+        cache.add(key, 0, None)
+        try:
+            seq = cache.incr(key)
+        except ValueError:
+            # 序号键在 add 与 incr 之间被淘汰
+            cache.add(key, 0, None)
+            seq = cache.incr(key)
+        cache.set(
+            self._event_key(channel, seq),
+            json.dumps({'channel': channel, 'id': seq, 'type': event_type, 'data': data}, cls=DjangoJSONEncoder),
+            self.retention,
+        )
+        return seq
+
+    def latest(self, channels: Iterable[str]) -> Cursor:
+        channels = list(channels)
+        values = cache.get_many([self._seq_key(channel) for channel in channels])
+        return {channel: values.get(self._seq_key(channel), 0) for channel in channels}
+
+    def fetch(self, cursor: Cursor) -> Tuple[List[dict], List[str]]:
+        latest = self.latest(cursor)
+        wanted, reset = {}, []
+        for channel, seq in cursor.items():
+            if latest[channel] <= seq:
+                continue
+            if latest[channel] - seq > self.buffer_size:
+                reset.append(channel)
+                continue
+            for number in range(seq + 1, latest[channel] + 1):
+                wanted[self._event_key(channel, number)] = channel
+        if not wanted:
+            return [], reset
+
+        values = cache.get_many(list(wanted))
+        events = []
+        for channel, seq in cursor.items():
+            for number in range(seq + 1, latest[channel] + 1):
+                key = self._event_key(channel, number)
+                if key not in wanted:
+                    break
+                if key not in values:
+                    # 第一条即缺失说明事件已过期，需重新拉取；中间缺失时先投递缺失之前的事件
+                    if number == seq + 1:
+                        reset.append(channel)
+                    break
+                events.append(json.loads(values[key]))
+        return events, reset
+
+    def wait(self, cursor: Cursor, timeout: float) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            latest = self.latest(cursor)
+            if any(latest[channel] > seq for channel, seq in cursor.items()):
+                return
+            time.sleep(min(self.poll_interval, max(0.0, deadline - time.monotonic())))
+
+
+BACKENDS = {
+    'local': LocalEventBus,
+    'cache': CacheEventBus,
+}
+
+_bus: Optional[EventBus] = None
+
+
+def get_bus() -> EventBus:
+    """获取当前配置的事件总线实例。"""
+    global _bus
+    if _bus is None:
+        name = getattr(settings, 'EVENT_BUS_BACKEND', 'local')
+        _bus = BACKENDS[name](buffer_size=getattr(settings, 'EVENT_BUS_BUFFER', 1000))
+    return _bus
+
+
+def set_bus(bus: Optional[EventBus]) -> None:
+    """替换事件总线（传入 None 时恢复为配置的总线），主要用于测试和基准测试。"""
+    global _bus
+    _bus = bus
+
+
+def publish(channel: str, event_type: str, data: dict) -> None:
+    """在当前事务提交后发布事件，发布失败只记录日志。"""
+    def send():
+        try:
+            get_bus().publish(channel, event_type, data)
+        except Exception:
+            logger.exception(f"发布事件 {event_type} 到 {channel} 失败")
+
+    transaction.on_commit(send)
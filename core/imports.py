@@ -0,0 +1,298 @@
+"""
+分块 CSV 导入。
+
+上传文件按行流式解析，每 chunk_size 行为一批：
+1. 逐行校验字段（只做字段级校验，不访问数据库）
+2. 用一条 IN 查询取得本批已存在的记录（及子类需要的关联数据）
+3. 用一条 bulk_create(update_conflicts=True) 写入本批新增和更新的记录
+
+导入结果包含新增、更新、失败行数、逐行错误报告和处理速度。
+文件很大时可以作为后台任务执行（ImportJob），通过任务 ID 查询进度和结果。
+"""
+import codecs
+import csv
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connections, models, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class RowError(Exception):
+    """行校验失败，errors 为 {字段: [错误信息]}。"""
+
+    def __init__(self, errors: Dict[str, List[str]]):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def _messages(error: ValidationError) -> List[str]:
+    return [str(message) for message in error.messages]
+
+
+class BulkCsvImporter:
+    """
+    分块 CSV 导入器基类。
+
+    子类定义：
+    - model: 导入的模型
+    - key_field: 用于匹配已有记录的唯一字段
+    - fields: 从 CSV 读取的模型字段（不含关联字段）
+    - defaults: 列缺失或为空时使用的默认值，未指定时使用模型字段默认值
+    并可重写 prepare_chunk / clean_row / after_chunk 处理关联字段和副作用。
+    """
+
+    model = None
+    key_field = 'id'
+    fields: Tuple[str, ...] = ()
+    defaults: Dict[str, object] = {}
+
+    # 每批处理的行数
+    chunk_size = 1000
+
+    # 错误报告最多记录的行数
+    max_errors = 1000
+
+    def __init__(self, chunk_size: Optional[int] = None):
+        if chunk_size:
+            self.chunk_size = chunk_size
+
+    # ------------------------------------------------------------------
+    # 子类扩展点
+    # ------------------------------------------------------------------
+
+    def update_fields(self) -> List[str]:
+        """记录已存在时更新的字段。"""
+        names = [name for name in self.fields if name != self.key_field]
+        if any(field.name == 'updated_at' for field in self.model._meta.concrete_fields):
+            names.append('updated_at')
+        return names
+
+    def prepare_chunk(self, rows: List[Tuple[int, Dict[str, str]]]) -> None:
+        """处理一批行之前调用，用于批量加载关联数据。"""
+
+    def clean_row(self, row: Dict[str, str], values: Dict[str, object]) -> Dict[str, object]:
+        """
+        字段级校验之后调用，返回要保存的字段值。
+
+        Raises:
+            RowError: 行数据无效
+        """
+        return values
+
+    def after_chunk(self, objs: List[models.Model], existing: Dict[object, tuple]) -> None:
+        """一批记录写入后调用（在同一事务中），existing 为写入前已存在记录的 {键: 原有字段值}。"""
+
+    def existing_values(self) -> Tuple[str, ...]:
+        """查询已存在记录时读取的字段，供 after_chunk 使用。"""
+        return ()
+
+    # ------------------------------------------------------------------
+    # 解析与校验
+    # ------------------------------------------------------------------
+
+    def clean_field(self, name: str, raw: Optional[str]):
+        """使用模型字段校验单个值（不访问数据库）。"""
+        field = self.model._meta.get_field(name)
+        raw = raw.strip() if isinstance(raw, str) else raw
+        if raw in (None, ''):
+            if name in self.defaults:
+                return self.defaults[name]
+            if field.has_default():
+                return field.get_default()
+            if field.null:
+                return None
+        value = field.clean(raw, None)
+        if isinstance(value, datetime) and timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        return value
+
+    def parse_row(self, row: Dict[str, str]) -> Dict[str, object]:
+        values, errors = {}, {}
+        for name in self.fields:
+            try:
+                values[name] = self.clean_field(name, row.get(name))
+            except ValidationError as e:
+                errors[name] = _messages(e)
+        if errors:
+            raise RowError(errors)
+        return self.clean_row(row, values)
+
+    @staticmethod
+    def read_rows(file) -> Iterator[Tuple[int, Dict[str, str]]]:
+        """按行流式读取上传文件（兼容带 BOM 的 UTF-8），返回 (行号, 行数据)，行号从表头之后的 2 开始。"""
+        reader = csv.DictReader(codecs.iterdecode(file, 'utf-8-sig'))
+        for row in reader:
+            yield reader.line_num, row
+
+    @staticmethod
+    def chunks(rows: Iterable, size: int) -> Iterator[list]:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    # ------------------------------------------------------------------
+    # 执行
+    # ------------------------------------------------------------------
+
+    def run(self, file, progress: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        导入 CSV 文件。
+
+        Args:
+            file: 二进制文件对象（上传文件或已打开的文件）
+            progress: 每批处理后以当前统计调用
+
+        Returns:
+            导入报告：total, created, updated, failed, errors, elapsed, rows_per_second
+        """
+        started = time.perf_counter()
+        report = {'total': 0, 'created': 0, 'updated': 0, 'failed': 0, 'errors': [],
+                  'errors_truncated': False}
+
+        try:
+            for chunk in self.chunks(self.read_rows(file), self.chunk_size):
+                self.import_chunk(chunk, report)
+                report['elapsed'] = round(time.perf_counter() - started, 3)
+                if progress:
+                    progress(report)
+        except (UnicodeDecodeError, csv.Error) as e:
+            self.add_error(report, None, {'file': [f'文件格式错误: {e}']})
+
+        elapsed = time.perf_counter() - started
+        report['elapsed'] = round(elapsed, 3)
+        report['rows_per_second'] = round(report['total'] / elapsed, 1) if elapsed > 0 else None
+        logger.info(
+            f"{self.model._meta.verbose_name}导入完成: 共 {report['total']} 行, "
+            f"新增 {report['created']}, 更新 {report['updated']}, 失败 {report['failed']}, "
+            f"{report['rows_per_second']} 行/秒"
+        )
+        return report
+
+    def add_error(self, report: dict, line: Optional[int], errors: Dict[str, List[str]]) -> None:
+        if len(report['errors']) < self.max_errors:
+            report['errors'].append({'row': line, 'errors': errors})
+        else:
+            report['errors_truncated'] = True
+
+    def import_chunk(self, chunk: List[Tuple[int, Dict[str, str]]], report: dict) -> None:
+        report['total'] += len(chunk)
+        self.prepare_chunk(chunk)
+
+        # 同一批内重复的键以最后一行为准
+        valid: Dict[object, Dict[str, object]] = {}
+        failed = 0
+        for line, row in chunk:
+            try:
+                values = self.parse_row(row)
+            except RowError as e:
+                failed += 1
+                self.add_error(report, line, e.errors)
+                continue
+            valid.pop(values[self.key_field], None)
+            valid[values[self.key_field]] = values
+        report['failed'] += failed
+        duplicates = len(chunk) - failed - len(valid)
+        if not valid:
+            return
+
+        with transaction.atomic():
+            lookup = self.model.objects.filter(**{f'{self.key_field}__in': list(valid)})
+            existing = {row[0]: row[1:] for row in lookup.values_list(self.key_field, *self.existing_values())}
+            objs = [self.model(**values) for values in valid.values()]
+            self.model.objects.bulk_create(
+                objs,
+                update_conflicts=True,
+                unique_fields=[self.key_field],
+                update_fields=self.update_fields(),
+            )
+            self.after_chunk(objs, existing)
+
+        created = len(valid) - len(existing)
+        report['created'] += created
+        report['updated'] += len(valid) - created + duplicates
+
+
+class ImportJob:
+    """
+    后台导入任务。
+
+    上传文件先保存为临时文件，在后台线程中导入；任务状态保存在缓存中，
+    任意进程都可以按任务 ID 查询进度和结果。
+    """
+
+    KEY_PREFIX = 'import_job'
+    TIMEOUT = 24 * 60 * 60
+
+    @classmethod
+    def _key(cls, job_id: str) -> str:
+        return f'{cls.KEY_PREFIX}:{job_id}'
+
+    @classmethod
+    def get(cls, job_id: str) -> Optional[dict]:
+        return cache.get(cls._key(job_id))
+
+    @classmethod
+    def _save(cls, job_id: str, **state) -> None:
+        previous = cache.get(cls._key(job_id)) or {}
+        cache.set(cls._key(job_id), {**previous, 'job_id': job_id, **state}, cls.TIMEOUT)
+
+    @classmethod
+    def create(cls, uploaded_file, user_id: Optional[int] = None) -> Tuple[str, str]:
+        """保存上传文件并登记任务，返回 (任务 ID, 临时文件路径)。"""
+        job_id = uuid.uuid4().hex
+        fd, path = tempfile.mkstemp(prefix='import_', suffix='.csv')
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in uploaded_file.chunks():
+                f.write(chunk)
+        cls._save(job_id, user_id=user_id, status='pending', report=None)
+        return job_id, path
+
+    @classmethod
+    def run(cls, job_id: str, importer: BulkCsvImporter, path: str) -> dict:
+        """执行任务（后台线程中调用），完成后删除临时文件。"""
+        cls._save(job_id, status='running', report=None)
+        try:
+            with open(path, 'rb') as f:
+                report = importer.run(
+                    f, progress=lambda report: cls._save(job_id, status='running', report=dict(report))
+                )
+            cls._save(job_id, status='finished', report=report)
+            return report
+        except Exception as e:
+            logger.exception(f"导入任务 {job_id} 失败")
+            cls._save(job_id, status='failed', report=None, error=str(e))
+            raise
+        finally:
+            os.remove(path)
+
+    @classmethod
+    def submit(cls, importer: BulkCsvImporter, uploaded_file, user_id: Optional[int] = None) -> str:
+        """提交后台导入任务，返回任务 ID。"""
+        job_id, path = cls.create(uploaded_file, user_id)
+
+        def target():
+            try:
+                cls.run(job_id, importer, path)
+            except Exception:
+                pass  # 已记录到任务状态
+            finally:
+                connections.close_all()
+
+        threading.Thread(target=target, name=f'import-{job_id}', daemon=True).start()
+        return job_id
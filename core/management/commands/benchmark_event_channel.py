@@ -0,0 +1,128 @@
+"""
+实时事件通道负载测试命令。
+
+模拟一批在线客户端在一段时间内接收新通知和订单状态变化，对比两种方式的请求量和送达延迟：
+
+- polling：改造前的前端轮询，每个客户端每隔 --interval 秒请求通知列表、未读数和订单详情三个接口
+- events：通过事件总线长轮询（与 /api/core/events/poll/ 相同的读取流程），有事件时立即返回
+
+两种方式使用同一条事件总线和同样的事件发布节奏，只统计请求次数和从发布到客户端收到的延迟，
+不经过 HTTP 和数据库。
+
+Usage:
+    python manage.py benchmark_event_channel
+    python manage.py benchmark_event_channel --clients 500 --duration 20 --rate 50
+    python manage.py benchmark_event_channel --backend cache
+"""
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import events
+
+# 改造前每个客户端每次轮询请求的接口数（通知列表、未读数、订单详情）
+POLL_REQUESTS_PER_TICK = 3
+
+
+class Command(BaseCommand):
+    """实时事件通道负载测试。"""
+
+    help = '对比前端轮询与事件长轮询在同样事件量下的请求数和送达延迟'
+
+    MODES = ('polling', 'events')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=200, help='在线客户端数，默认 200')
+        parser.add_argument('--duration', type=float, default=10, help='每种方式的测试时长（秒），默认 10')
+        parser.add_argument('--rate', type=float, default=20, help='每秒发布的事件数，默认 20')
+        parser.add_argument('--interval', type=float, default=5, help='轮询间隔（秒），默认 5')
+        parser.add_argument('--timeout', type=float, default=25, help='长轮询最长等待（秒），默认 25')
+        parser.add_argument(
+            '--backend', choices=sorted(events.BACKENDS), default='local', help='事件总线后端，默认 local'
+        )
+        parser.add_argument(
+            '--modes', nargs='+', choices=self.MODES, default=list(self.MODES),
+            help='参与对比的方式，默认全部'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"客户端: {options['clients']}, 时长: {options['duration']}s, "
+            f"事件: {options['rate']}/s, 后端: {options['backend']}"
+        )
+        for mode in options['modes']:
+            bus = events.BACKENDS[options['backend']]()
+            # 每次运行使用独立的频道，避免缓存后端中残留上次的事件
+            prefix = f'bench{random.randrange(10 ** 9)}'
+            channels = [f'{prefix}:{index}' for index in range(options['clients'])]
+            requests, latencies, published = self._run(mode, bus, channels, options)
+
+            latencies.sort()
+            average = sum(latencies) / len(latencies) * 1000 if latencies else 0
+            p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0
+            per_second = requests / options['duration']
+            self.stdout.write(self.style.SUCCESS(
+                f'[{mode:>7}] 请求 {requests:8d}  ({per_second:8.1f} 次/秒)  '
+                f'事件 {published}  送达 {len(latencies)}  '
+                f'平均延迟 {average:8.1f}ms  P95 {p95:8.1f}ms'
+            ))
+
+    def _run(self, mode, bus, channels, options):
+        """运行一种方式，返回 (请求数, 各事件的送达延迟, 发布的事件数)。"""
+        stop = threading.Event()
+        lock = threading.Lock()
+        requests = [0]
+        latencies = []
+
+        def receive(found):
+            now = time.monotonic()
+            with lock:
+                latencies.extend(
+                    now - event['data']['sent'] for event in found if event['type'] == 'notification'
+                )
+
+        def polling_client(channel):
+            cursor = bus.latest([channel])
+            # 错开各客户端的轮询时刻
+            if stop.wait(random.uniform(0, options['interval'])):
+                return
+            while True:
+                found, reset = bus.fetch(cursor)
+                cursor = bus.advance(cursor, found, reset, bus.latest(reset) if reset else None)
+                receive(found)
+                with lock:
+                    requests[0] += POLL_REQUESTS_PER_TICK
+                if stop.wait(options['interval']):
+                    return
+
+        def event_client(channel):
+            cursor = bus.latest([channel])
+            while not stop.is_set():
+                with lock:
+                    requests[0] += 1
+                found, reset = bus.read(cursor, options['timeout'])
+                cursor = bus.advance(cursor, found, reset, bus.latest(reset) if reset else None)
+                receive(found)
+
+        target = polling_client if mode == 'polling' else event_client
+        clients = [threading.Thread(target=target, args=(channel,), daemon=True) for channel in channels]
+        for client in clients:
+            client.start()
+
+        published = 0
+        deadline = time.monotonic() + options['duration']
+        while time.monotonic() < deadline:
+            bus.publish(random.choice(channels), 'notification', {'sent': time.monotonic()})
+            published += 1
+            time.sleep(1 / options['rate'])
+        stop.set()
+
+        # 唤醒仍在等待的长轮询客户端
+        for channel in channels:
+            bus.publish(channel, 'stop', {'sent': time.monotonic()})
+        for client in clients:
+            client.join(options['timeout'])
+        with lock:
+            return requests[0], list(latencies), published
@@ -0,0 +1,81 @@
+"""
+周期任务调度器命令。
+
+用法:
+    python manage.py run_scheduler           # 前台持续运行调度器
+    python manage.py run_scheduler --once    # 执行一次所有任务
+    python manage.py run_scheduler --metrics # 查看各任务执行指标
+
+Web 进程默认在后台线程中运行调度器（SCHEDULER_ENABLED），
+也可以将其关闭，改为单独运行本命令。多个实例同时运行时，
+每个任务在一个周期内仍只会由一个进程执行。
+"""
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.scheduler import scheduler
+
+
+class Command(BaseCommand):
+    help = '运行周期任务调度器（航班状态更新、超时订单取消等）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='执行一次所有已到期的任务后退出'
+        )
+        parser.add_argument(
+            '--metrics',
+            action='store_true',
+            help='显示各任务的执行指标'
+        )
+
+    def handle(self, *args, **options):
+        if options['metrics']:
+            self.show_metrics()
+            return
+
+        if options['once']:
+            executed = scheduler.run_pending()
+            self.stdout.write(self.style.SUCCESS(
+                f"已执行: {', '.join(executed) if executed else '无（其他进程已执行）'}"
+            ))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"周期任务调度器已启动，任务: {', '.join(scheduler.jobs)}"
+        ))
+        self.stdout.write("按 Ctrl+C 停止服务")
+
+        signal.signal(signal.SIGINT, self.signal_handler)
+        signal.signal(signal.SIGTERM, self.signal_handler)
+
+        scheduler.start()
+        while scheduler.running:
+            time.sleep(1)
+
+        self.stdout.write(self.style.SUCCESS("服务已停止"))
+
+    def signal_handler(self, signum, frame):
+        """处理停止信号"""
+        self.stdout.write("\n正在停止服务...")
+        scheduler.stop()
+
+    def show_metrics(self):
+        """显示任务指标"""
+        self.stdout.write("\n周期任务指标:")
+        self.stdout.write("-" * 60)
+        for name, metrics in scheduler.get_metrics().items():
+            runs = metrics['runs']
+            average = metrics['total_duration'] / runs if runs else 0
+            last_duration = metrics['last_duration'] or 0
+            self.stdout.write(
+                f"  {name}: 执行 {runs} 次, 失败 {metrics['failures']} 次, "
+                f"上次 {last_duration:.3f}s, 平均 {average:.3f}s, "
+                f"最长 {metrics['max_duration']:.3f}s, 上次执行 {metrics['last_run_at'] or '-'}"
+            )
+            if metrics['last_error']:
+                self.stdout.write(self.style.ERROR(f"    最近错误: {metrics['last_error']}"))
@@ -1,4 +1,7 @@
+from .audit import audit_writer, build_detail
 from .models import SystemLog
+from .scheduler import scheduler, start_scheduler
+from django.conf import settings
 from django.utils import timezone
 import logging
 from django.http import JsonResponse
@@ -8,47 +11,52 @@ logger = logging.getLogger(__name__)
 User = get_user_model()
 
 class SystemLogMiddleware:
-    """中间件：记录用户的关键操作日志"""
+    """
+    中间件：记录用户的关键操作日志
+
+    日志记录在请求结束时交给 core.audit 的异步写入器批量写入，
+    请求体只保留前 AUDIT_LOG_DETAIL_MAX_BYTES 字节，上传文件只记录类型和大小。
+    """
+    WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.max_bytes = getattr(settings, 'AUDIT_LOG_DETAIL_MAX_BYTES', 2048)
 
     def __call__(self, request):
-        # 在请求到达视图前，先保存一份请求体数据的副本
-        if request.method in ['POST', 'PUT', 'PATCH', 'DELETE']:
-            # 跳过admin路径的日志记录，避免与admin视图冲突
-            if request.path.startswith('/admin/'):
-                return self.get_response(request)
+        if request.method not in self.WRITE_METHODS:
+            return self.get_response(request)
+        # 跳过admin路径的日志记录，避免与admin视图冲突
+        if request.path.startswith('/admin/'):
+            return self.get_response(request)
 
+        # 在请求到达视图前保存请求体（视图读取后无法再访问），上传文件不读取
+        body = None
+        if not request.META.get('CONTENT_TYPE', '').startswith('multipart/'):
             try:
-                # 安全地获取请求体，可能会抛出异常
-                request._body_copy = request.body
+                body = request.body
             except Exception:
-                request._body_copy = b''
+                body = b''
 
         # 继续处理请求
         response = self.get_response(request)
 
         # 仅记录已登录用户的写操作
-        if (hasattr(request, 'user') and request.user.is_authenticated and 
-                request.method in ['POST', 'PUT', 'PATCH', 'DELETE'] and
-                not request.path.startswith('/admin/')):
+        if hasattr(request, 'user') and request.user.is_authenticated:
             try:
-                action = f"{request.method} {request.path}"
-                detail = ''
-                if hasattr(request, '_body_copy'):
-                    detail = request._body_copy.decode('utf-8', errors='replace')
-                ip = request.META.get('REMOTE_ADDR') or ''
-                SystemLog.objects.create(
-                    user=request.user,
-                    action=action,
-                    detail=detail,
-                    ip_address=ip
-                )
+                audit_writer.submit(SystemLog(
+                    user_id=request.user.pk,
+                    action=f"{request.method} {request.path}"[:50],
+                    detail=build_detail(request, body, self.max_bytes),
+                    ip_address=request.META.get('REMOTE_ADDR') or '',
+                    created_at=timezone.now(),
+                ))
             except Exception as e:
                 # 记录日志时发生错误不应阻止正常响应
-                print(f"日志记录失败: {str(e)}")
-                
-        return response 
+                logger.error(f"日志记录失败: {str(e)}")
+
+        return response
+
 
 class CORSMiddleware:
     """
@@ -87,40 +95,20 @@ class CORSMiddleware:
         return response 
 
 
-class FlightStatusUpdateMiddleware:
+class SchedulerMiddleware:
     """
-    航班状态自动更新中间件。
+    周期任务调度器启动中间件。
     
-    在请求处理过程中定期检查并更新航班状态。
-    使用缓存控制更新频率，避免每次请求都执行数据库操作。
+    航班状态更新、超时订单取消等周期任务由 core.scheduler 在后台线程中执行，
+    本中间件只负责在当前进程收到请求时确保调度线程已启动，不访问数据库。
+    在请求中而不是加载时启动，是为了兼容预加载应用后再 fork 的部署方式。
     """
     
-    # 更新间隔（秒）
-    UPDATE_INTERVAL = 60
-    
-    # 上次更新时间（类变量，所有实例共享）
-    _last_update = None
-    
     def __init__(self, get_response):
         self.get_response = get_response
     
     def __call__(self, request):
-        # 检查是否需要更新航班状态
-        self._check_and_update()
+        if not scheduler.running:
+            start_scheduler()
         
         return self.get_response(request)
-    
-    def _check_and_update(self):
-        """检查并执行航班状态更新"""
-        now = timezone.now()
-        
-        # 检查是否超过更新间隔
-        if (FlightStatusUpdateMiddleware._last_update is None or 
-            (now - FlightStatusUpdateMiddleware._last_update).total_seconds() >= self.UPDATE_INTERVAL):
-            
-            try:
-                from flight.services import FlightStatusService
-                FlightStatusService.run_all_updates()
-                FlightStatusUpdateMiddleware._last_update = now
-            except Exception as e:
-                logger.error(f"航班状态更新失败: {e}")
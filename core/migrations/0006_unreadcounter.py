@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-18 07:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_systemsettings_settingshistory'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=30, verbose_name='类别')),
+                ('unread', models.IntegerField(default=0, verbose_name='未读数')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unread_counters', to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '未读计数',
+                'verbose_name_plural': '未读计数',
+                'constraints': [models.UniqueConstraint(fields=('user', 'kind'), name='unique_unread_counter')],
+            },
+        ),
+    ]
@@ -1,7 +1,13 @@
 """
 通用混入类，用于消除重复代码
 """
-from rest_framework import permissions
+from django.db import transaction
+from rest_framework import permissions, serializers, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from core.export import stream_queryset
+from core.imports import ImportJob
 
 
 class AdminOrOwnerQuerySetMixin:
@@ -121,3 +127,125 @@ class BulkActionMixin:
     def perform_bulk_update(self, queryset, validated_data):
         """执行批量更新"""
         return queryset.update(**validated_data)
+
+
+class StreamingExportMixin:
+    """
+    混入类：流式导出当前视图的查询集
+
+    子类定义 export_columns（ExportColumn 列表）和 export_filename，
+    在导出 action 中调用 stream_export()。请求参数：
+    - export_format: csv（默认）或 jsonl
+    - compression: gzip 时压缩下载
+    """
+
+    export_columns = ()
+    export_filename = 'export'
+
+    def get_export_queryset(self):
+        """导出的查询集，默认为应用了过滤和排序的视图查询集"""
+        return self.filter_queryset(self.get_queryset())
+
+    def stream_export(self, request):
+        params = request.query_params
+        compression = params.get('compression', '')
+        if compression not in ('', 'gzip'):
+            raise ValidationError({'compression': '只支持 gzip 压缩'})
+        try:
+            return stream_queryset(
+                self.get_export_queryset(),
+                self.export_columns,
+                self.export_filename,
+                file_format=params.get('export_format', 'csv'),
+                compress=compression == 'gzip',
+            )
+        except ValueError as e:
+            raise ValidationError({'export_format': str(e)})
+
+
+class CsvImportMixin:
+    """
+    混入类：分块导入上传的 CSV 文件
+
+    子类定义 importer_class（BulkCsvImporter 子类），在导入 action 中调用 run_import()。
+    请求参数 async=true 时提交后台任务，返回任务 ID，
+    通过 /api/core/import-jobs/<job_id>/ 查询进度和结果。
+    """
+
+    importer_class = None
+
+    def run_import(self, request):
+        file = request.FILES.get('file')
+        if not file:
+            return Response({'detail': '请上传 CSV 文件'}, status=status.HTTP_400_BAD_REQUEST)
+
+        importer = self.importer_class()
+        if request.query_params.get('async', '').lower() in ('1', 'true'):
+            job_id = ImportJob.submit(importer, file, user_id=request.user.id)
+            return Response({'job_id': job_id, 'status': 'pending'}, status=status.HTTP_202_ACCEPTED)
+        return Response(importer.run(file))
+
+
+class UnreadCounterMixin:
+    """
+    混入类：维护当前用户的未读计数
+
+    子类定义 unread_counter（UnreadCounterService），修改已读状态或删除记录时
+    通过以下方法同步调整计数，unread_count action 直接读取计数。
+    新增记录由 post_save 信号计数。
+    """
+
+    unread_counter = None
+    # 带这些查询参数时未读数需按筛选条件统计
+    unread_filter_params = ('type',)
+
+    @transaction.atomic
+    def set_read(self, obj, is_read):
+        """
+        修改单条记录的已读状态。
+
+        is_read 可以是请求中的 "false"、"0" 等字符串；只有状态实际改变的行
+        （并发请求中只有一个能更新成功）才调整计数。
+        """
+        is_read = serializers.BooleanField().to_internal_value(is_read)
+        updated = type(obj)._default_manager.filter(
+            pk=obj.pk, is_read=not is_read
+        ).update(is_read=is_read)
+        obj.is_read = is_read
+        self.unread_counter.adjust(obj.user_id, -updated if is_read else updated)
+        return obj
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        was_unread = not serializer.instance.is_read
+        instance = serializer.save()
+        self.unread_counter.changed(instance.user_id, was_unread, not instance.is_read)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        user_id, unread = instance.user_id, not instance.is_read
+        instance.delete()
+        if unread:
+            self.unread_counter.adjust(user_id, -1)
+
+    @transaction.atomic
+    def mark_all_read(self, queryset):
+        """将查询集中的未读记录标记为已读，返回标记的数量。"""
+        updated = queryset.filter(is_read=False).update(is_read=True)
+        self.unread_counter.adjust(self.request.user.pk, -updated)
+        return updated
+
+    @transaction.atomic
+    def delete_many(self, queryset):
+        """删除查询集中的记录，返回删除的数量。"""
+        label = self.unread_counter.model._meta.label
+        unread = queryset.filter(is_read=False).delete()[1].get(label, 0)
+        deleted = queryset.delete()[1].get(label, 0)
+        self.unread_counter.adjust(self.request.user.pk, -unread)
+        return unread + deleted
+
+    def get_unread_count(self, queryset):
+        """未读数：带筛选参数时统计查询集，否则读取计数。"""
+        if any(self.request.query_params.get(param) for param in self.unread_filter_params):
+            return queryset.filter(is_read=False).count()
+        return self.unread_counter.get(self.request.user.pk)
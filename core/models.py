@@ -3,9 +3,11 @@ Core 模块数据模型。
 
 包含系统日志、城市、机场、航空公司和热门航线等核心数据模型。
 """
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 
+from .settings_cache import settings_cache
+
 
 class SystemLog(models.Model):
     """系统操作日志"""
@@ -124,49 +126,47 @@ class SystemSettings(models.Model):
     
     @classmethod
     def get_value(cls, category: str, key: str, default=None):
-        """获取配置值"""
-        try:
-            setting = cls.objects.get(category=category, key=key)
-            return setting.value
-        except cls.DoesNotExist:
-            return default
+        """获取配置值（读取进程内缓存的分类快照）"""
+        return settings_cache.get(category, key, default)
     
     @classmethod
     def set_value(cls, category: str, key: str, value: str, user=None):
         """
         设置配置值，同时记录变更历史
         
+        保存后由 post_save 信号失效设置缓存。
         """
-        # 获取旧值（如果存在）
-        try:
-            old_setting = cls.objects.get(category=category, key=key)
-            old_value = old_setting.value
-        except cls.DoesNotExist:
-            old_value = None
-        
-        # 创建或更新设置
-        setting, created = cls.objects.update_or_create(
-            category=category, 
-            key=key,
-            defaults={'value': str(value), 'updated_by': user}
-        )
-        
-        # 记录变更历史（仅当值发生变化时）
-        if old_value is not None and old_value != str(value):
-            SettingsHistory.objects.create(
-                setting=setting,
-                old_value=old_value,
-                new_value=str(value),
-                changed_by=user
-            )
+        value = str(value)
+        with transaction.atomic():
+            setting = cls.objects.select_for_update().filter(category=category, key=key).first()
+            if setting is None:
+                setting, created = cls.objects.get_or_create(
+                    category=category, key=key,
+                    defaults={'value': value, 'updated_by': user}
+                )
+                if created:
+                    return setting
+            
+            old_value = setting.value
+            setting.value = value
+            setting.updated_by = user
+            setting.save(update_fields=['value', 'updated_by', 'updated_at'])
+            
+            # 记录变更历史（仅当值发生变化时）
+            if old_value != value:
+                SettingsHistory.objects.create(
+                    setting=setting,
+                    old_value=old_value,
+                    new_value=value,
+                    changed_by=user
+                )
         
         return setting
     
     @classmethod
     def get_category_settings(cls, category: str) -> dict:
         """获取某分类的所有设置"""
-        settings_qs = cls.objects.filter(category=category)
-        return {s.key: s.value for s in settings_qs}
+        return dict(settings_cache.get_category(category))
 
 
 
@@ -199,3 +199,31 @@ class SettingsHistory(models.Model):
     
     def __str__(self):
         return f"{self.setting.key}: {self.old_value} → {self.new_value}"
+
+
+class UnreadCounter(models.Model):
+    """
+    用户未读数计数器
+    
+    按用户和类别（如通知、消息）保存未读数，避免每次轮询都统计源表。
+    由 core.counters.UnreadCounterService 维护并定期与源表校准。
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='unread_counters',
+        verbose_name='用户'
+    )
+    kind = models.CharField(max_length=30, verbose_name='类别')
+    unread = models.IntegerField(default=0, verbose_name='未读数')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+    
+    class Meta:
+        verbose_name = '未读计数'
+        verbose_name_plural = '未读计数'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind'], name='unique_unread_counter'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} {self.kind}: {self.unread}"
@@ -0,0 +1,183 @@
+"""
+键集（游标）分页。
+
+按视图的 keyset_ordering（如 ('-departure_time', '-id')）排序，游标记录上一页最后一行的
+排序字段值，下一页用 (departure_time, id) < (游标值) 条件直接定位，
+不使用 OFFSET，任意深度的翻页耗时相同，翻页期间插入或删除数据也不会重复或遗漏。
+
+- 每页条数由 page_size 参数指定（不超过 max_page_size）
+- 总数默认不计算；count=exact 返回精确总数，count=estimate 在 PostgreSQL 上
+  返回查询计划的估算行数（其他数据库返回精确总数）
+- 排序字段必须非空，最后一个字段必须唯一（通常为 id）
+"""
+import base64
+import json
+from typing import List, Optional, Sequence
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    键集分页，返回 {count, next, previous, results}。
+
+    视图通过 keyset_ordering 属性指定排序字段，未指定时使用 default_ordering。
+    """
+
+    default_ordering = ('-id',)
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = '无效的分页游标'
+
+    def get_ordering(self, view) -> Sequence[str]:
+        return tuple(getattr(view, 'keyset_ordering', None) or self.default_ordering)
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    # ------------------------------------------------------------------
+    # 游标编码
+    # ------------------------------------------------------------------
+
+    def encode_cursor(self, values: list, reverse: bool) -> str:
+        # 时间保留到微秒（DjangoJSONEncoder 会截断到毫秒，导致同一毫秒内的行被跳过）
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+        payload = json.dumps({'v': values, 'r': int(reverse)}, default=str, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request, queryset, ordering):
+        """解析游标，返回 (排序字段值列表, 是否向前翻页)；没有游标时返回 (None, False)。"""
+        raw = request.query_params.get(self.cursor_query_param)
+        if not raw:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(raw + '=' * (-len(raw) % 4)))
+            values, reverse = payload['v'], bool(payload['r'])
+            if len(values) != len(ordering):
+                raise ValueError
+            model = queryset.model
+            values = [
+                model._meta.get_field(name.lstrip('-')).to_python(value)
+                for name, value in zip(ordering, values)
+            ]
+        except (TypeError, ValueError, KeyError, FieldDoesNotExist, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    # ------------------------------------------------------------------
+    # 分页
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def keyset_filter(ordering: Sequence[str], values: list) -> Q:
+        """排在游标之后的行：(a, b, c) 之后 = a 之后 或 (a 相等且 b 之后) 或 ..."""
+        condition = Q()
+        equal = Q()
+        for name, value in zip(ordering, values):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+    @staticmethod
+    def reverse_ordering(ordering: Sequence[str]) -> List[str]:
+        return [name[1:] if name.startswith('-') else f'-{name}' for name in ordering]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = self.get_ordering(view)
+        self.page_size_value = self.get_page_size(request)
+        self.count = self.get_count(queryset, request)
+
+        values, reverse = self.decode_cursor(request, queryset, self.ordering)
+        ordering = self.reverse_ordering(self.ordering) if reverse else list(self.ordering)
+        page_queryset = queryset.order_by(*ordering)
+        if values is not None:
+            page_queryset = page_queryset.filter(self.keyset_filter(ordering, values))
+
+        # 多取一行判断是否还有下一页
+        rows = list(page_queryset[:self.page_size_value + 1])
+        has_more = len(rows) > self.page_size_value
+        rows = rows[:self.page_size_value]
+        if reverse:
+            rows.reverse()
+
+        self.page = rows
+        if reverse:
+            self.has_next, self.has_previous = values is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+        return rows
+
+    def get_count(self, queryset, request) -> Optional[int]:
+        mode = request.query_params.get(self.count_query_param)
+        if mode == 'exact':
+            return queryset.count()
+        if mode == 'estimate':
+            return self.estimate_count(queryset)
+        return None
+
+    @staticmethod
+    def estimate_count(queryset) -> int:
+        """PostgreSQL 上读取查询计划的估算行数，避免扫描全表计数。"""
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return queryset.count()
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def _row_values(self, row) -> list:
+        return [getattr(row, name.lstrip('-')) for name in self.ordering]
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.has_next or not self.page:
+            return None
+        cursor = self.encode_cursor(self._row_values(self.page[-1]), reverse=False)
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_previous_link(self) -> Optional[str]:
+        if not self.has_previous:
+            return None
+        url = self.request.build_absolute_uri()
+        if not self.page:
+            return remove_query_param(url, self.cursor_query_param)
+        cursor = self.encode_cursor(self._row_values(self.page[0]), reverse=True)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer', 'nullable': True},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
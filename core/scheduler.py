@@ -0,0 +1,275 @@
+"""
+进程内周期任务调度器。
+
+各应用在 AppConfig.ready 中向全局调度器注册周期任务，
+调度器在 Web 进程内以后台线程运行，不占用用户请求。
+
+多进程部署时通过缓存（生产环境为 Redis）实现跨进程互斥：
+每个任务在一个周期内只有一个进程能取得租约并执行，
+同时用运行锁防止耗时超过周期的任务被并发执行。
+每次执行的耗时、结果和异常记录为任务指标，写入缓存供任意进程查询。
+
+后台线程中，跨进程互斥的任务（如全表校准、模型训练，可能耗时较长）提交到
+工作线程池执行，同一任务上一次执行未结束时跳过本次；处理进程内状态的
+短任务（如库存回写、状态通知）在调度线程中直接执行，不会被耗时任务阻塞。
+"""
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicJob:
+    """
+    周期任务。
+
+    Attributes:
+        name: 任务名称，同时用于缓存中的租约、运行锁和指标键
+        func: 任务函数，无参数
+        interval: 执行间隔（秒）
+        exclusive: 是否跨进程互斥；处理进程内状态的任务（如回写本进程累积的数据）应设为 False
+        timeout: 运行锁的超时时间（秒），默认为 10 个周期
+    """
+
+    def __init__(self, name: str, func: Callable, interval: float,
+                 exclusive: bool = True, timeout: Optional[float] = None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.exclusive = exclusive
+        self.timeout = timeout or interval * 10
+        self.next_run = 0.0
+        self.metrics = {
+            'runs': 0,
+            'failures': 0,
+            'skipped': 0,
+            'last_run_at': None,
+            'last_duration': None,
+            'max_duration': 0.0,
+            'total_duration': 0.0,
+            'last_result': None,
+            'last_error': None,
+        }
+
+
+class JobScheduler:
+    """
+    周期任务调度器。
+
+    run_pending() 检查并执行到期的任务，可由后台线程循环调用，
+    也可由管理命令或测试直接调用。
+    """
+
+    KEY_PREFIX = 'scheduler'
+    METRICS_TIMEOUT = 24 * 60 * 60
+
+    def __init__(self, tick: float = 1.0, workers: int = 4):
+        self.tick = tick
+        self.workers = workers
+        self.jobs: Dict[str, PeriodicJob] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._futures: Dict[str, Future] = {}
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def owner(self) -> str:
+        """当前进程标识（fork 后的工作进程各不相同）。"""
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def register(self, name: str, func: Callable, interval: float,
+                 exclusive: bool = True, timeout: Optional[float] = None) -> PeriodicJob:
+        """
+        注册周期任务，同名任务会被替换。
+
+        Args:
+            name: 任务名称
+            func: 任务函数
+            interval: 执行间隔（秒）
+            exclusive: 是否跨进程互斥
+            timeout: 运行锁超时时间（秒）
+
+        Returns:
+            注册的任务
+        """
+        job = PeriodicJob(name, func, interval, exclusive, timeout)
+        with self._lock:
+            self.jobs[name] = job
+        return job
+
+    def _key(self, kind: str, name: str) -> str:
+        return f'{self.KEY_PREFIX}:{kind}:{name}'
+
+    def _acquire(self, job: PeriodicJob) -> bool:
+        """取得本周期的租约和运行锁，任一失败说明其他进程已执行或正在执行。"""
+        if not cache.add(self._key('lease', job.name), self.owner, job.interval):
+            return False
+        if not cache.add(self._key('running', job.name), self.owner, job.timeout):
+            return False
+        return True
+
+    def _release(self, job: PeriodicJob) -> None:
+        cache.delete(self._key('running', job.name))
+
+    def run_job(self, job: PeriodicJob) -> bool:
+        """
+        执行单个任务并记录指标。
+
+        Returns:
+            本进程是否执行了该任务
+        """
+        if job.exclusive and not self._acquire(job):
+            job.metrics['skipped'] += 1
+            return False
+
+        started = time.perf_counter()
+        try:
+            job.metrics['last_result'] = job.func()
+            job.metrics['last_error'] = None
+        except Exception as e:
+            job.metrics['failures'] += 1
+            job.metrics['last_error'] = str(e)
+            logger.exception(f"周期任务 {job.name} 执行失败")
+        finally:
+            duration = time.perf_counter() - started
+            if job.exclusive:
+                self._release(job)
+            # 后台线程中执行，需及时释放失效的数据库连接
+            close_old_connections()
+
+        metrics = job.metrics
+        metrics['runs'] += 1
+        metrics['last_run_at'] = timezone.now().isoformat()
+        metrics['last_duration'] = duration
+        metrics['max_duration'] = max(metrics['max_duration'], duration)
+        metrics['total_duration'] += duration
+        cache.set(
+            self._key('metrics', job.name),
+            dict(metrics, owner=self.owner, interval=job.interval),
+            self.METRICS_TIMEOUT
+        )
+        logger.debug(f"周期任务 {job.name} 执行完成，耗时 {duration:.3f} 秒")
+        return True
+
+    def run_pending(self, background: bool = False) -> List[str]:
+        """
+        执行所有到期的任务。
+
+        Args:
+            background: 是否将跨进程互斥的任务提交到工作线程池（后台线程使用），
+                否则全部在当前线程中依次执行
+
+        Returns:
+            本进程实际执行（或已提交到线程池）的任务名称列表
+        """
+        now = time.monotonic()
+        executed = []
+        with self._lock:
+            jobs = list(self.jobs.values())
+        for job in jobs:
+            if now < job.next_run:
+                continue
+            job.next_run = now + job.interval
+            if background and job.exclusive:
+                if self._submit(job):
+                    executed.append(job.name)
+            elif self.run_job(job):
+                executed.append(job.name)
+        return executed
+
+    def _submit(self, job: PeriodicJob) -> bool:
+        """提交到工作线程池，上一次执行尚未结束时跳过。"""
+        with self._lock:
+            future = self._futures.get(job.name)
+            if future is not None and not future.done():
+                job.metrics['skipped'] += 1
+                return False
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='ifly-job')
+            self._futures[job.name] = self._executor.submit(self.run_job, job)
+        return True
+
+    def wait_workers(self, timeout: Optional[float] = None) -> None:
+        """等待已提交到线程池的任务执行完成。"""
+        with self._lock:
+            futures = list(self._futures.values())
+        for future in futures:
+            future.result(timeout)
+
+    def get_metrics(self) -> Dict[str, dict]:
+        """获取各任务最近一次执行的指标（来自缓存，可能由其他进程写入）。"""
+        keys = {self._key('metrics', name): name for name in self.jobs}
+        cached = cache.get_many(list(keys))
+        return {
+            name: cached.get(key, dict(self.jobs[name].metrics))
+            for key, name in keys.items()
+        }
+
+    # ------------------------------------------------------------------
+    # 后台线程
+    # ------------------------------------------------------------------
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> bool:
+        """
+        启动后台调度线程（重复调用不会启动多个线程）。
+
+        Returns:
+            本次调用是否启动了线程
+        """
+        with self._lock:
+            if self.running:
+                return False
+            self._stop_event.clear()
+            self._thread = threading.Thread(
+                target=self._loop, name='ifly-scheduler', daemon=True
+            )
+            self._thread.start()
+        logger.info(f"周期任务调度器已启动: {self.owner}")
+        return True
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """停止后台调度线程，不再向线程池提交任务（正在执行的任务不等待）。"""
+        self._stop_event.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout)
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _loop(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.run_pending(background=True)
+            except Exception:
+                logger.exception("周期任务调度出错")
+            self._stop_event.wait(self.tick)
+
+
+scheduler = JobScheduler()
+
+atexit.register(scheduler.stop, 5)
+
+
+def start_scheduler() -> bool:
+    """按 SCHEDULER_ENABLED 配置启动全局调度器。"""
+    if not getattr(settings, 'SCHEDULER_ENABLED', False):
+        return False
+    return scheduler.start()
@@ -5,6 +5,9 @@ Core 模块服务层。
 """
 import re
 from typing import Optional
+
+from django.db import transaction
+
 from .models import SystemSettings, SettingsHistory
 
 
@@ -27,15 +30,16 @@ class SettingsService:
         Returns:
             dict: 包含所有站点设置的字典
         """
+        site = SystemSettings.get_category_settings('site')
         return {
-            'site_name': SystemSettings.get_value('site', 'site_name', 'iFly'),
-            'logo_url': SystemSettings.get_value('site', 'logo_url', ''),
-            'favicon_url': SystemSettings.get_value('site', 'favicon_url', ''),
-            'contact_email': SystemSettings.get_value('site', 'contact_email', ''),
-            'contact_phone': SystemSettings.get_value('site', 'contact_phone', ''),
-            'contact_address': SystemSettings.get_value('site', 'contact_address', ''),
-            'copyright_text': SystemSettings.get_value('site', 'copyright_text', ''),
-            'icp_number': SystemSettings.get_value('site', 'icp_number', ''),
+            'site_name': site.get('site_name', 'iFly'),
+            'logo_url': site.get('logo_url', ''),
+            'favicon_url': site.get('favicon_url', ''),
+            'contact_email': site.get('contact_email', ''),
+            'contact_phone': site.get('contact_phone', ''),
+            'contact_address': site.get('contact_address', ''),
+            'copyright_text': site.get('copyright_text', ''),
+            'icp_number': site.get('icp_number', ''),
         }
     
     @staticmethod
@@ -51,19 +55,12 @@ class SettingsService:
         Returns:
             dict: 包含所有业务规则的字典
         """
+        business = SystemSettings.get_category_settings('business')
         return {
-            'payment_timeout_minutes': int(
-                SystemSettings.get_value('business', 'payment_timeout', '30')
-            ),
-            'refund_fee_rate': float(
-                SystemSettings.get_value('business', 'refund_fee_rate', '0.05')
-            ),
-            'reschedule_fee_rate': float(
-                SystemSettings.get_value('business', 'reschedule_fee_rate', '0.1')
-            ),
-            'checkin_hours_before': int(
-                SystemSettings.get_value('business', 'checkin_hours', '24')
-            ),
+            'payment_timeout_minutes': int(business.get('payment_timeout', '30')),
+            'refund_fee_rate': float(business.get('refund_fee_rate', '0.05')),
+            'reschedule_fee_rate': float(business.get('reschedule_fee_rate', '0.1')),
+            'checkin_hours_before': int(business.get('checkin_hours', '24')),
         }
 
     
@@ -93,8 +90,9 @@ class SettingsService:
         if errors:
             return {'success': False, 'errors': errors}
         
-        for key, value in data.items():
-            SystemSettings.set_value('site', key, str(value), user)
+        with transaction.atomic():
+            for key, value in data.items():
+                SystemSettings.set_value('site', key, str(value), user)
         
         return {'success': True}
     
@@ -120,9 +118,10 @@ class SettingsService:
             'checkin_hours_before': 'checkin_hours',
         }
         
-        for field, db_key in field_mapping.items():
-            if field in data:
-                SystemSettings.set_value('business', db_key, str(data[field]), user)
+        with transaction.atomic():
+            for field, db_key in field_mapping.items():
+                if field in data:
+                    SystemSettings.set_value('business', db_key, str(data[field]), user)
         
         return {'success': True}
     
@@ -0,0 +1,112 @@
+"""
+系统设置缓存。
+
+每个分类的设置用一条查询载入进程内快照，之后的读取直接返回快照中的值：
+- 设置保存或删除时立即丢弃本进程的快照，并在事务提交后更换共享缓存中的版本号；
+  提交前同一事务中的读取直接查询数据库，不保存快照
+- 其他进程每 SETTINGS_CACHE_CHECK_INTERVAL 秒最多检查一次版本号，
+  版本变化时丢弃快照，因此设置修改最迟在一个检查间隔后在所有进程生效，无需重启
+- 关闭 SETTINGS_CACHE_ENABLED 时（如测试环境）每次读取都查询数据库
+"""
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+
+class SettingsCache:
+    """SystemSettings 的进程内快照缓存"""
+
+    VERSION_KEY = 'system_settings:version'
+
+    def __init__(self):
+        self._snapshots: Dict[str, Dict[str, str]] = {}
+        self._version: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return getattr(settings, 'SETTINGS_CACHE_ENABLED', True)
+
+    def _load(self, category: str) -> Dict[str, str]:
+        from .models import SystemSettings
+        return dict(SystemSettings.objects.filter(category=category).values_list('key', 'value'))
+
+    def _check_version(self) -> None:
+        """距上次检查超过检查间隔时读取版本号，版本变化则丢弃全部快照。"""
+        now = time.monotonic()
+        if now - self._checked_at < getattr(settings, 'SETTINGS_CACHE_CHECK_INTERVAL', 5):
+            return
+        version = cache.get(self.VERSION_KEY)
+        with self._lock:
+            self._checked_at = now
+            if version != self._version:
+                self._version = version
+                self._snapshots = {}
+
+    def get_category(self, category: str) -> Dict[str, str]:
+        """
+        获取一个分类的全部设置。
+
+        返回的字典为缓存快照，调用方不得修改。
+        """
+        if not self.enabled:
+            return self._load(category)
+        self._check_version()
+        snapshot = self._snapshots.get(category)
+        if snapshot is None:
+            snapshots = self._snapshots
+            snapshot = self._load(category)
+            # 本线程的事务修改了设置且尚未提交时不保存，事务回滚后不会留下未提交的值
+            if self._pending_commit():
+                return snapshot
+            with self._lock:
+                # 载入期间快照被丢弃时不保存，避免缓存修改前的值
+                if snapshots is self._snapshots:
+                    self._snapshots[category] = snapshot
+        return snapshot
+
+    def get(self, category: str, key: str, default=None):
+        return self.get_category(category).get(key, default)
+
+    def clear(self) -> None:
+        """丢弃本进程的全部快照。"""
+        with self._lock:
+            self._snapshots = {}
+
+    def invalidate(self) -> None:
+        """设置变化后丢弃本进程的快照，事务提交后通知其他进程。"""
+        self.clear()
+        transaction.on_commit(self._bump)
+
+    def _bump(self) -> None:
+        # 提交前其他线程可能已载入旧值，提交后再丢弃一次
+        self.clear()
+        cache.set(self.VERSION_KEY, uuid.uuid4().hex, None)
+
+    def _pending_commit(self) -> bool:
+        """本线程当前事务中是否有尚未提交的设置修改（回滚的保存点中的修改不计）。"""
+        connection = transaction.get_connection()
+        return connection.in_atomic_block and any(
+            func == self._bump for _, func, _ in connection.run_on_commit
+        )
+
+    def connect(self) -> None:
+        """设置保存或删除时失效缓存。"""
+        from .models import SystemSettings
+        post_save.connect(self._on_change, sender=SystemSettings, weak=False,
+                          dispatch_uid='settings_cache_save')
+        post_delete.connect(self._on_change, sender=SystemSettings, weak=False,
+                            dispatch_uid='settings_cache_delete')
+
+    def _on_change(self, sender, **kwargs):
+        self.invalidate()
+
+
+settings_cache = SettingsCache()
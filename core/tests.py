@@ -0,0 +1,471 @@
+"""核心模块测试"""
+import csv
+import gzip
+import io
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import User
+from core import events
+from core.audit import AuditLogWriter
+from core.export import ExportColumn, stream_queryset
+from core.middleware import SchedulerMiddleware, SystemLogMiddleware
+from core.models import SystemLog
+from core.scheduler import JobScheduler, scheduler
+from core.settings_cache import SettingsCache, settings_cache
+from flight.models import Flight
+
+
+class JobSchedulerTest(TestCase):
+    """周期任务调度器测试"""
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+
+    def _job(self):
+        self.calls.append(1)
+        return len(self.calls)
+
+    def test_exclusive_job_runs_once_per_interval_across_workers(self):
+        """多个进程共享缓存时，一个周期内只有一个进程执行互斥任务"""
+        workers = [JobScheduler(), JobScheduler()]
+        for worker in workers:
+            worker.register('demo', self._job, interval=60)
+
+        executed = [worker.run_pending() for worker in workers]
+        self.assertEqual(executed, [['demo'], []])
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(workers[1].jobs['demo'].metrics['skipped'], 1)
+
+        # 未到下一个周期，本进程也不会重复执行
+        self.assertEqual(workers[0].run_pending(), [])
+        self.assertEqual(len(self.calls), 1)
+
+    def test_non_exclusive_job_runs_in_every_worker(self):
+        workers = [JobScheduler(), JobScheduler()]
+        for worker in workers:
+            worker.register('local', self._job, interval=60, exclusive=False)
+            worker.run_pending()
+        self.assertEqual(len(self.calls), 2)
+
+    def test_metrics_record_timing_and_failures(self):
+        worker = JobScheduler()
+
+        def failing():
+            raise RuntimeError('boom')
+
+        worker.register('ok', self._job, interval=60)
+        worker.register('failing', failing, interval=60)
+        worker.run_pending()
+
+        metrics = worker.get_metrics()
+        self.assertEqual(metrics['ok']['runs'], 1)
+        self.assertEqual(metrics['ok']['last_result'], 1)
+        self.assertGreaterEqual(metrics['ok']['last_duration'], 0)
+        self.assertEqual(metrics['failing']['failures'], 1)
+        self.assertEqual(metrics['failing']['last_error'], 'boom')
+
+        # 失败后运行锁已释放，下一周期可再次执行
+        self.assertIsNone(cache.get('scheduler:running:failing'))
+
+    def test_background_exclusive_jobs_do_not_block_short_jobs(self):
+        """后台调度时耗时的互斥任务在线程池中执行，不阻塞进程内短任务"""
+        worker = JobScheduler()
+        self.addCleanup(worker.stop)
+        started, finish = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            finish.wait(5)
+            return 'trained'
+
+        worker.register('slow', slow, interval=60)
+        worker.register('flush', self._job, interval=0, exclusive=False)
+        self.assertEqual(worker.run_pending(background=True), ['slow', 'flush'])
+        self.assertTrue(started.wait(5))
+
+        # 互斥任务仍在执行时，短任务照常执行，同一任务不会重复提交
+        worker.jobs['slow'].next_run = 0
+        self.assertEqual(worker.run_pending(background=True), ['flush'])
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(worker.jobs['slow'].metrics['skipped'], 1)
+
+        finish.set()
+        worker.wait_workers(5)
+        self.assertEqual(worker.get_metrics()['slow']['last_result'], 'trained')
+
+    def test_default_jobs_registered(self):
+        self.assertIn('flight_status_update', scheduler.jobs)
+        self.assertIn('order_expiry', scheduler.jobs)
+        self.assertFalse(scheduler.jobs['inventory_flush'].exclusive)
+
+    @override_settings(SCHEDULER_ENABLED=False)
+    def test_middleware_does_not_touch_database(self):
+        middleware = SchedulerMiddleware(lambda request: HttpResponse('ok'))
+        request = RequestFactory().get('/')
+        with self.assertNumQueries(0):
+            response = middleware(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(scheduler.running)
+
+
+class StreamingExportTest(TestCase):
+    """流式导出测试"""
+    COLUMNS = [
+        ExportColumn('flight_number', 'flight_number'),
+        ExportColumn('price', 'price'),
+        ExportColumn('departure_time', 'departure_time'),
+    ]
+
+    def setUp(self):
+        for i in range(3):
+            Flight.objects.create(
+                flight_number=f'EX{i:04d}',
+                departure_city='北京',
+                arrival_city='上海',
+                departure_time=timezone.now() + timedelta(days=i + 1),
+                arrival_time=timezone.now() + timedelta(days=i + 1, hours=2),
+                price=Decimal('500.00'),
+                capacity=100,
+                available_seats=100,
+                aircraft_type='A320',
+            )
+        self.queryset = Flight.objects.prefetch_related('ticket_set').order_by('flight_number')
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_csv_reads_projection_in_single_query(self):
+        response = stream_queryset(self.queryset, self.COLUMNS, 'flights')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="flights.csv"')
+        # 预取被忽略，只执行一条投影查询
+        with self.assertNumQueries(1):
+            rows = list(csv.reader(io.StringIO(self.content(response).decode('utf-8'))))
+        self.assertEqual(rows[0], ['flight_number', 'price', 'departure_time'])
+        self.assertEqual([row[0] for row in rows[1:]], ['EX0000', 'EX0001', 'EX0002'])
+        self.assertEqual(rows[1][1], '500.00')
+
+    def test_gzip_jsonl(self):
+        response = stream_queryset(self.queryset, self.COLUMNS, 'flights', file_format='jsonl', compress=True)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="flights.jsonl.gz"')
+        lines = gzip.decompress(self.content(response)).decode('utf-8').splitlines()
+        records = [json.loads(line) for line in lines]
+        self.assertEqual([record['flight_number'] for record in records], ['EX0000', 'EX0001', 'EX0002'])
+        self.assertEqual(records[0]['price'], '500.00')
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            stream_queryset(self.queryset, self.COLUMNS, 'flights', file_format='xlsx')
+
+
+class ImportJobTest(TestCase):
+    """后台导入任务测试"""
+    def setUp(self):
+        cache.clear()
+
+    def test_job_reports_progress_and_cleans_up(self):
+        import os
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from flight.imports import FlightImporter
+        from core.imports import ImportJob
+
+        departure = timezone.now() + timedelta(days=1)
+        content = 'flight_number,departure_city,arrival_city,departure_time,arrival_time,price,capacity,aircraft_type\n' + ''.join(
+            f'JOB{i:03d},北京,上海,{departure.isoformat()},{(departure + timedelta(hours=2)).isoformat()},500,100,A320\n'
+            for i in range(5)
+        )
+        job_id, path = ImportJob.create(SimpleUploadedFile('flights.csv', content.encode('utf-8')), user_id=7)
+        self.assertEqual(ImportJob.get(job_id)['status'], 'pending')
+
+        report = ImportJob.run(job_id, FlightImporter(chunk_size=2), path)
+        self.assertEqual(report['created'], 5)
+        job = ImportJob.get(job_id)
+        self.assertEqual((job['status'], job['user_id'], job['report']['created']), ('finished', 7, 5))
+        self.assertFalse(os.path.exists(path))
+
+
+class AuditLogWriterTest(TestCase):
+    """异步审计日志测试"""
+    def setUp(self):
+        self.user = User.objects.create_user(username='audit', password='password')
+
+    def record(self, action='POST /api/test/'):
+        return SystemLog(user_id=self.user.pk, action=action, detail='', ip_address='127.0.0.1',
+                         created_at=timezone.now())
+
+    def test_flush_writes_in_batches(self):
+        writer = AuditLogWriter(batch_size=3)
+        for i in range(7):
+            self.assertTrue(writer.enqueue(self.record(f'POST /api/{i}/')))
+        with self.assertNumQueries(3):
+            self.assertEqual(writer.flush(), 7)
+        self.assertEqual(SystemLog.objects.count(), 7)
+        self.assertEqual((writer.stats['written'], writer.stats['batches'], writer.pending), (7, 3, 0))
+
+    def test_full_queue_drops_and_counts(self):
+        writer = AuditLogWriter(queue_size=2, enqueue_timeout=0.001)
+        results = [writer.enqueue(self.record()) for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual((writer.stats['enqueued'], writer.stats['dropped']), (2, 1))
+
+    def test_background_thread_flushes_on_stop(self):
+        writer = AuditLogWriter(batch_size=2, flush_interval=0.01)
+        batches = []
+        writer.write = lambda records: batches.append(len(records)) or len(records)
+        writer.start()
+        for _ in range(5):
+            writer.enqueue(self.record())
+        writer.stop(timeout=5)
+        self.assertFalse(writer.running)
+        self.assertEqual(sum(batches), 5)
+        self.assertTrue(all(size <= 2 for size in batches))
+
+    def test_middleware_records_compact_detail(self):
+        middleware = SystemLogMiddleware(lambda request: HttpResponse('ok'))
+        factory = RequestFactory()
+
+        request = factory.post('/api/orders/', data=json.dumps({'note': 'x' * 5000}),
+                               content_type='application/json')
+        request.user = self.user
+        middleware(request)
+        log = SystemLog.objects.get()
+        self.assertEqual(log.action, 'POST /api/orders/')
+        self.assertLess(len(log.detail), 2200)
+        self.assertIn('已截断', log.detail)
+
+        # 上传文件不读取请求体，只记录类型和大小
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        request = factory.post('/api/flights/import_csv/', {'file': SimpleUploadedFile('f.csv', b'a,b\n' * 1000)})
+        request.user = self.user
+        middleware(request)
+        self.assertFalse(hasattr(request, '_body'))
+        detail = SystemLog.objects.latest('id').detail
+        self.assertTrue(detail.startswith('[multipart/form-data '))
+
+
+class EventBusTest(TestCase):
+    """实时事件总线测试"""
+    def setUp(self):
+        cache.clear()
+
+    def test_local_bus_resumes_and_resets(self):
+        bus = events.LocalEventBus(buffer_size=2)
+        for i in range(3):
+            bus.publish('user:1', 'notification', {'n': i})
+
+        found, reset = bus.fetch({'user:1': 1})
+        self.assertEqual([event['id'] for event in found], [2, 3])
+        self.assertEqual(reset, [])
+        # 第一条事件已被淘汰
+        self.assertEqual(bus.fetch({'user:1': 0}), ([], ['user:1']))
+
+        cursor = bus.advance({'user:1': 0}, [], ['user:1'], bus.latest(['user:1']))
+        self.assertEqual(events.parse_cursor(events.encode_cursor(cursor)), {'user:1': 3})
+
+    def test_local_bus_wakes_waiting_reader(self):
+        import threading
+        bus = events.LocalEventBus()
+        timer = threading.Timer(0.05, bus.publish, args=('flight:7', 'seats', {'change': -1}))
+        timer.start()
+        started = timezone.now()
+        found, _ = bus.read({'flight:7': 0}, timeout=5)
+        timer.join()
+        self.assertEqual(found[0]['data'], {'change': -1})
+        self.assertLess((timezone.now() - started).total_seconds(), 2)
+
+    def test_cache_bus_reports_expired_events(self):
+        bus = events.CacheEventBus()
+        for i in range(3):
+            bus.publish('user:2', 'notification', {'n': i})
+        found, reset = bus.fetch({'user:2': 0})
+        self.assertEqual([event['data']['n'] for event in found], [0, 1, 2])
+
+        cache.delete(bus._event_key('user:2', 2))
+        self.assertEqual(bus.fetch({'user:2': 1}), ([], ['user:2']))
+        found, reset = bus.fetch({'user:2': 0})
+        self.assertEqual(([event['id'] for event in found], reset), ([1], []))
+
+
+class EventChannelViewTest(TestCase):
+    """SSE 和长轮询接口测试"""
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.user = User.objects.create_user(username='listener', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        events.set_bus(events.LocalEventBus())
+        self.addCleanup(events.set_bus, None)
+
+    def poll(self, cursor=None, **params):
+        params.setdefault('timeout', 0)
+        if cursor is not None:
+            params['last_event_id'] = cursor
+        return self.client.get('/api/core/events/poll/', params).json()
+
+    def test_poll_delivers_notifications_and_order_status_after_commit(self):
+        from booking.models import Order
+        from notifications.dispatcher import notify_many
+
+        cursor = self.poll()['cursor']
+        with self.captureOnCommitCallbacks(execute=True):
+            notify_many([self.user], '提醒', '航班即将起飞')
+            order = Order.objects.create(user=self.user, total_price=Decimal('100.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            order.status = 'paid'
+            order.save()
+            order.save()
+
+        data = self.poll(cursor)
+        self.assertCountEqual(
+            [(event['type'], event['data'].get('status')) for event in data['events']],
+            [('notification', None), ('order_status', 'pending'), ('order_status', 'paid')]
+        )
+        notification = next(event for event in data['events'] if event['type'] == 'notification')
+        self.assertEqual(notification['data']['title'], '提醒')
+        self.assertEqual(self.poll(data['cursor'])['events'], [])
+
+    def test_poll_resets_unknown_cursor(self):
+        data = self.poll(f'user:{self.user.pk}=50')
+        self.assertEqual(data['reset'], [f'user:{self.user.pk}'])
+        self.assertEqual(data['cursor'], f'user:{self.user.pk}=0')
+
+    @override_settings(EVENT_STREAM_MAX_SECONDS=0.2, EVENT_STREAM_KEEPALIVE=0.05)
+    def test_stream_sends_events_with_resumable_ids(self):
+        from rest_framework.authtoken.models import Token
+        bus = events.get_bus()
+        bus.publish(events.user_channel(self.user.pk), 'notification', {'id': 1})
+        bus.publish(events.flight_channel(9), 'seats', {'flight_id': 9, 'change': -2})
+
+        self.client.force_authenticate(None)
+        token, _ = Token.objects.get_or_create(user=self.user)
+        response = self.client.get(
+            '/api/core/events/stream/', {'token': token.key, 'flights': '9'},
+            HTTP_ACCEPT='text/event-stream', HTTP_LAST_EVENT_ID=f'user:{self.user.pk}=0,flight:9=0',
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream; charset=utf-8')
+        body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.startswith('retry: '))
+        self.assertIn(f'id: flight:9=0,user:{self.user.pk}=1\nevent: notification\n', body)
+        self.assertIn(f'id: flight:9=1,user:{self.user.pk}=1\nevent: seats\ndata: {{"flight_id": 9, "change": -2}}', body)
+        self.assertIn(': keepalive', body)
+
+        response = self.client.get('/api/core/events/stream/', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(SETTINGS_CACHE_ENABLED=True, SETTINGS_CACHE_CHECK_INTERVAL=0)
+class SettingsCacheTest(TestCase):
+    """系统设置缓存测试"""
+    def setUp(self):
+        from core.models import SystemSettings
+        cache.clear()
+        settings_cache.clear()
+        self.addCleanup(settings_cache.clear)
+        # 测试事务不会提交，初始数据不经保存信号写入，避免被视为未提交的设置修改
+        SystemSettings.objects.bulk_create([
+            SystemSettings(category='business', key='payment_timeout', value='45'),
+        ])
+
+    def test_reads_category_once(self):
+        from core.services import SettingsService
+        with self.assertNumQueries(1):
+            self.assertEqual(SettingsService.get_business_rules()['payment_timeout_minutes'], 45)
+        with self.assertNumQueries(0):
+            SettingsService.get_business_rules()
+            self.assertEqual(SettingsService.get_business_rules()['refund_fee_rate'], 0.05)
+
+    def test_set_value_invalidates_all_processes(self):
+        from core.models import SystemSettings
+        other = SettingsCache()
+        self.assertEqual(other.get('business', 'payment_timeout'), '45')
+        self.assertEqual(SystemSettings.get_value('business', 'payment_timeout'), '45')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SystemSettings.set_value('business', 'payment_timeout', '15')
+            # 写入的进程立即读到新值
+            self.assertEqual(SystemSettings.get_value('business', 'payment_timeout'), '15')
+            # 其他进程在事务提交前仍使用旧值
+            self.assertEqual(other.get('business', 'payment_timeout'), '45')
+        self.assertEqual(other.get('business', 'payment_timeout'), '15')
+
+    def test_uncommitted_values_are_not_cached(self):
+        from core.models import SystemSettings
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                SystemSettings.set_value('business', 'payment_timeout', '15')
+                self.assertEqual(SystemSettings.get_value('business', 'payment_timeout'), '15')
+                raise RuntimeError
+        # 事务回滚后不会读到快照中未提交的值
+        self.assertEqual(SystemSettings.get_value('business', 'payment_timeout'), '45')
+
+    def test_check_interval_bounds_version_checks(self):
+        from core.models import SystemSettings
+        other = SettingsCache()
+        other.get('business', 'payment_timeout')
+        with override_settings(SETTINGS_CACHE_CHECK_INTERVAL=60):
+            with self.captureOnCommitCallbacks(execute=True):
+                SystemSettings.set_value('business', 'payment_timeout', '15')
+            self.assertEqual(other.get('business', 'payment_timeout'), '45')
+            other._checked_at -= 60
+            self.assertEqual(other.get('business', 'payment_timeout'), '15')
+
+
+class KeysetPaginationTest(TestCase):
+    """键集分页测试"""
+    def setUp(self):
+        from rest_framework.test import APIClient
+        self.admin = User.objects.create_user(username='pager', password='password', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        departure = timezone.now() + timedelta(days=3)
+        # 同一起飞时间的航班按 id 区分先后
+        for index in range(7):
+            Flight.objects.create(
+                flight_number=f'KP{index:03d}', departure_city='北京', arrival_city='上海',
+                departure_time=departure + timedelta(hours=index // 2),
+                arrival_time=departure + timedelta(hours=index // 2 + 2),
+                price=Decimal('500.00'), capacity=100, available_seats=100, aircraft_type='A320',
+            )
+        self.expected = list(Flight.objects.order_by('-departure_time', '-id').values_list('flight_number', flat=True))
+
+    def test_walks_pages_forward_and_back(self):
+        pages, url = [], '/api/admin/flights/?page_size=3'
+        while url:
+            with self.assertNumQueries(1):
+                data = self.client.get(url).json()
+            pages.append([flight['flight_number'] for flight in data['results']])
+            self.assertIsNone(data['count'])
+            url, previous = data['next'], data['previous']
+        self.assertEqual([number for page in pages for number in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+
+        data = self.client.get(previous).json()
+        self.assertEqual([flight['flight_number'] for flight in data['results']], pages[1])
+        data = self.client.get(data['previous']).json()
+        self.assertEqual([flight['flight_number'] for flight in data['results']], pages[0])
+        self.assertIsNone(data['previous'])
+
+    def test_count_and_invalid_cursor(self):
+        data = self.client.get('/api/admin/flights/?page_size=2&count=exact').json()
+        self.assertEqual((data['count'], len(data['results'])), (7, 2))
+        self.assertEqual(self.client.get('/api/admin/flights/?count=estimate').json()['count'], 7)
+        self.assertEqual(self.client.get('/api/admin/flights/?cursor=bm90LWEtY3Vyc29y').status_code, 404)
+
+    def test_user_orders_are_paginated(self):
+        from booking.models import Order
+        for _ in range(3):
+            Order.objects.create(user=self.admin, total_price=Decimal('100.00'))
+        data = self.client.get(f'/api/admin/users/{self.admin.pk}/orders/?page_size=2').json()
+        self.assertEqual(len(data['results']), 2)
+        self.assertEqual(len(self.client.get(data['next']).json()['results']), 1)
+
@@ -6,4 +6,7 @@ app_name = 'core'
 urlpatterns = [
     path('cities/', views.CityListView.as_view(), name='city_list'),
     path('popular-routes/', views.PopularRouteListView.as_view(), name='popular_routes'),
+    path('import-jobs/<str:job_id>/', views.ImportJobView.as_view(), name='import_job'),
+    path('events/stream/', views.EventStreamView.as_view(), name='event_stream'),
+    path('events/poll/', views.EventPollView.as_view(), name='event_poll'),
 ]
\ No newline at end of file
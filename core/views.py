@@ -1,5 +1,17 @@
-from rest_framework import generics
+import time
 
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework import generics, permissions, status
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+from core import events
+from core.imports import ImportJob
+from core.pagination import KeysetPagination
 from core.models import City, PopularRoute
 from core.serializers import (
     CitySerializer,
@@ -7,11 +19,18 @@ from core.serializers import (
     SimplePopularRouteSerializer,
 )
 
+class CityPagination(KeysetPagination):
+    """城市列表分页，常用城市一页即可返回"""
+    page_size = 500
+    max_page_size = 1000
+
+
 class CityListView(generics.ListAPIView):
-    """获取所有城市列表"""
-    queryset = City.objects.all().order_by('name')
+    """获取城市列表（按名称键集分页）"""
+    queryset = City.objects.all().order_by('name', 'id')
     serializer_class = CitySerializer
-    pagination_class = None  # 禁用分页，返回完整城市列表
+    pagination_class = CityPagination
+    keyset_ordering = ('name', 'id')
 
 
 class PopularRouteListView(generics.ListAPIView):
@@ -30,4 +49,148 @@ class PopularRouteListView(generics.ListAPIView):
         limit = self.request.query_params.get('limit')
         if limit and limit.isdigit():
             queryset = queryset[:int(limit)]
-        return queryset
\ No newline at end of file
+        return queryset
+
+
+class ImportJobView(APIView):
+    """查询后台导入任务的进度和结果（仅任务提交者可见）"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = ImportJob.get(job_id)
+        if not job or job.get('user_id') != request.user.id:
+            return Response({'detail': '导入任务不存在'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({key: value for key, value in job.items() if key != 'user_id'})
+
+
+class QueryTokenAuthentication(TokenAuthentication):
+    """从查询参数 token 读取令牌（浏览器的 EventSource 无法设置请求头）"""
+
+    def authenticate(self, request):
+        key = request.query_params.get('token')
+        if not key:
+            return None
+        return self.authenticate_credentials(key)
+
+
+class EventStreamRenderer(BaseRenderer):
+    """text/event-stream 渲染器，只用于渲染错误响应，事件流本身由 StreamingHttpResponse 输出"""
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return events.sse_message('error', data)
+
+
+class EventChannelMixin:
+    """
+    订阅当前用户的事件频道，以及 flights 参数（逗号分隔的航班ID）指定航班的座位变化。
+
+    起始游标取自 Last-Event-ID 请求头或 last_event_id 参数；未给出的频道从最新事件开始。
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [*api_settings.DEFAULT_AUTHENTICATION_CLASSES, QueryTokenAuthentication]
+
+    # 每个连接最多订阅的航班数
+    MAX_FLIGHTS = 20
+
+    def get_channels(self, request):
+        channels = [events.user_channel(request.user.pk)]
+        flight_ids = request.query_params.get('flights', '').split(',')
+        for value in flight_ids[:self.MAX_FLIGHTS]:
+            if value.strip().isdigit():
+                channels.append(events.flight_channel(int(value)))
+        return channels
+
+    def get_cursor(self, request, channels):
+        """
+        Returns:
+            (起始游标, 需要客户端重新拉取的频道)
+        """
+        given = events.parse_cursor(
+            request.headers.get('Last-Event-ID') or request.query_params.get('last_event_id')
+        )
+        latest = events.get_bus().latest(channels)
+        cursor, reset = {}, []
+        for channel in channels:
+            seq = given.get(channel, latest[channel])
+            if seq > latest[channel]:
+                # 游标超前于总线（如进程内总线已重启），期间的事件无法确认
+                reset.append(channel)
+                seq = latest[channel]
+            cursor[channel] = seq
+        return cursor, reset
+
+
+class EventPollView(EventChannelMixin, APIView):
+    """
+    长轮询获取实时事件。
+
+    没有新事件时最多等待 timeout 秒（默认且最大为 EVENT_POLL_TIMEOUT），
+    返回 {cursor, events, reset}，客户端下次请求时以 last_event_id=cursor 续传；
+    reset 中的频道有事件丢失，需重新拉取通知列表或订单状态。
+    """
+
+    def get(self, request):
+        max_timeout = getattr(settings, 'EVENT_POLL_TIMEOUT', 25)
+        try:
+            timeout = min(max(float(request.query_params.get('timeout', max_timeout)), 0), max_timeout)
+        except ValueError:
+            timeout = max_timeout
+
+        bus = events.get_bus()
+        channels = self.get_channels(request)
+        cursor, reset = self.get_cursor(request, channels)
+        found = []
+        if not reset:
+            found, reset = bus.read(cursor, timeout)
+        cursor = bus.advance(cursor, found, reset, bus.latest(reset) if reset else None)
+        return Response({'cursor': events.encode_cursor(cursor), 'events': found, 'reset': reset})
+
+
+class EventStreamView(EventChannelMixin, APIView):
+    """
+    通过 SSE 推送实时事件。
+
+    事件类型：notification（新通知）、order_status（订单状态变化）、seats（航班座位变化）、
+    reset（频道有事件丢失，需重新拉取）。每条事件的 id 为完整游标，断线后浏览器自动携带
+    Last-Event-ID 重连续传。连接持续 EVENT_STREAM_MAX_SECONDS 秒后结束，避免长期占用工作线程。
+    """
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
+    # 断线后客户端的重连间隔（毫秒）
+    RETRY_MS = 3000
+
+    def get(self, request):
+        channels = self.get_channels(request)
+        cursor, reset = self.get_cursor(request, channels)
+        response = StreamingHttpResponse(
+            self.stream(events.get_bus(), cursor, reset),
+            content_type='text/event-stream; charset=utf-8',
+        )
+        response['Cache-Control'] = 'no-cache'
+        # 禁止 Nginx 缓冲事件流
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def stream(self, bus, cursor, reset):
+        max_seconds = getattr(settings, 'EVENT_STREAM_MAX_SECONDS', 55)
+        keepalive = getattr(settings, 'EVENT_STREAM_KEEPALIVE', 15)
+        deadline = time.monotonic() + max_seconds
+
+        yield f'retry: {self.RETRY_MS}\n\n'
+        while True:
+            if reset:
+                cursor = bus.advance(cursor, [], reset, bus.latest(reset))
+                yield events.sse_message('reset', {'channels': reset}, events.encode_cursor(cursor))
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            found, reset = bus.read(cursor, min(keepalive, remaining))
+            for event in found:
+                cursor = bus.advance(cursor, [event])
+                yield events.sse_message(event['type'], event['data'], events.encode_cursor(cursor))
+            if not found and not reset:
+                yield ': keepalive\n\n'
+
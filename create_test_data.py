@@ -12,6 +12,7 @@ import uuid
 from decimal import Decimal
 
 import django
+from django.core.management import call_command
 from django.utils import timezone
 from django.db import transaction
 
@@ -24,6 +25,7 @@ from accounts.models import User, Passenger
 from flight.models import Flight
 from booking.models import Order, Ticket, RescheduleLog
 from notifications.models import Notification
+from analytics.recommender import RouteRecommender
 
 # ============ 常量定义 ============
 
@@ -1427,6 +1429,13 @@ def main():
     # 根据实际订单数据更新热门航线
     update_popular_routes()
 
+    # 订单时间通过 UPDATE 回填，不触发信号，需重建分析汇总表、用户消费统计和销售事实表
+    # （rebuild_rollups 先重建用户消费统计，销售事实中的用户分群读取该统计）
+    call_command('rebuild_rollups')
+
+    # 训练航线推荐模型
+    RouteRecommender.train()
+
     # 打印统计
     print_summary()
 
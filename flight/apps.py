@@ -5,3 +5,36 @@ class FlightConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "flight"
     verbose_name = "航班管理"
+
+    # 周期任务执行间隔（秒）
+    DEPARTURE_INTERVAL = 30
+    STATUS_NOTIFY_INTERVAL = 5
+    STATUS_RECONCILE_INTERVAL = 60 * 60
+
+    def ready(self):
+        import atexit
+
+        import flight.signals
+
+        from core.scheduler import scheduler
+        from flight.services import FlightStatusService
+        from flight.status_engine import FlightStatusEngine
+        scheduler.register(
+            'flight_departures',
+            FlightStatusEngine.advance_departures,
+            self.DEPARTURE_INTERVAL,
+        )
+        # 状态变化事件保存在各进程内，每个进程都需要发送
+        scheduler.register(
+            'flight_status_notify',
+            FlightStatusEngine.dispatch_notifications,
+            self.STATUS_NOTIFY_INTERVAL,
+            exclusive=False,
+        )
+        # 全表校准兜底，处理绕过库存代码直接修改座位数的情况
+        scheduler.register(
+            'flight_status_update',
+            FlightStatusService.run_all_updates,
+            self.STATUS_RECONCILE_INTERVAL,
+        )
+        atexit.register(FlightStatusEngine.dispatch_at_exit)
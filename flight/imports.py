@@ -0,0 +1,44 @@
+"""
+航班 CSV 导入。
+
+按航班号新增或更新航班。批量写入不触发模型信号，
+写入后由导入器失效受影响航线的搜索缓存并登记起飞队列。
+"""
+from typing import Dict, List
+
+from core.imports import BulkCsvImporter
+from .models import Flight
+from .search import FlightSearchEngine
+from .status_engine import FlightStatusEngine
+
+
+class FlightImporter(BulkCsvImporter):
+    """航班导入器"""
+
+    model = Flight
+    key_field = 'flight_number'
+    fields = (
+        'flight_number', 'airline_name', 'departure_city', 'arrival_city',
+        'departure_time', 'arrival_time', 'price', 'discount',
+        'capacity', 'available_seats', 'status', 'aircraft_type',
+    )
+    defaults = {'airline_name': '', 'available_seats': None}
+
+    def clean_row(self, row: Dict[str, str], values: Dict[str, object]) -> Dict[str, object]:
+        # 未提供剩余座位数时等于总座位数
+        if values['available_seats'] is None:
+            values['available_seats'] = values['capacity']
+        return values
+
+    def existing_values(self):
+        return ('departure_city', 'arrival_city', 'departure_time')
+
+    def after_chunk(self, objs: List[Flight], existing: Dict[str, tuple]) -> None:
+        # 航班原航线和新航线的搜索缓存都需要失效
+        FlightSearchEngine.invalidate_flights(
+            [(f.departure_city, f.arrival_city, f.departure_time) for f in objs] + list(existing.values())
+        )
+        # 只需按最早起飞的未起飞航班回调一次起飞队列水位线
+        active = [f for f in objs if f.status in FlightStatusEngine.ACTIVE_STATUSES]
+        if active:
+            FlightStatusEngine.schedule_departure(min(active, key=lambda f: f.departure_time))
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('flight', '0008_add_cabin_services'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['departure_time', 'id'], name='flight_flig_departu_2dc65b_idx'),
+        ),
+    ]
@@ -53,6 +53,17 @@ class Flight(models.Model):
     def __str__(self):
         return f"{self.flight_number}: {self.departure_city} -> {self.arrival_city}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录加载时的航线和起飞时间，航线变更时用于失效原航线的搜索缓存
+        loaded = instance.__dict__
+        if all(name in loaded for name in ('departure_city', 'arrival_city', 'departure_time')):
+            instance._loaded_route = (
+                loaded['departure_city'], loaded['arrival_city'], loaded['departure_time']
+            )
+        return instance
+
     class Meta:
         verbose_name = '航班'
         verbose_name_plural = '航班'
@@ -61,4 +72,6 @@ class Flight(models.Model):
             models.Index(fields=['status', 'departure_time']),
             models.Index(fields=['departure_time']),
             models.Index(fields=['price']),
+            # 管理后台航班列表的键集分页
+            models.Index(fields=['departure_time', 'id']),
         ]
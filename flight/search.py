@@ -0,0 +1,338 @@
+"""
+航班搜索引擎模块。
+
+将用户输入的城市归一化为精确键，按起飞时间的半开区间走
+(departure_city, arrival_city, departure_time) 复合索引查询，
+并以 (航线, 日期) 为粒度缓存紧凑的字段投影。
+航班票价、座位数或状态变化时，通过递增版本号使对应缓存失效。
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from core.config.airport_data import AIRPORT_DATA
+from core.models import City
+from .models import Flight
+
+
+class FlightSearchEngine:
+    """
+    航班搜索引擎。
+
+    出发城市、到达城市和日期齐全时，结果按 (航线, 日期) 缓存，
+    缓存键中带有该航线日期的版本号，航班变更时只需递增版本号即可失效。
+    """
+
+    # 搜索结果的紧凑投影字段（不含座位布局和时间戳等列表页不需要的字段）
+    SEARCH_FIELDS = (
+        'id', 'flight_number', 'airline_name',
+        'departure_city', 'arrival_city', 'departure_time', 'arrival_time',
+        'price', 'discount', 'capacity', 'available_seats', 'status',
+        'aircraft_type', 'is_international', 'meal_service', 'baggage_allowance',
+        'wifi', 'power_outlet', 'entertainment',
+    )
+
+    # 变更后需要使搜索缓存失效的字段
+    INVALIDATING_FIELDS = frozenset({
+        'price', 'discount', 'available_seats', 'status',
+        'departure_city', 'arrival_city', 'departure_time', 'arrival_time',
+    })
+
+    # 搜索结果中排除的航班状态
+    EXCLUDED_STATUSES = ('canceled', 'departed')
+
+    CITY_ALIAS_CACHE_KEY = 'flight_search:city_aliases'
+    CITY_ALIAS_TIMEOUT = 60 * 60
+    RESULT_TIMEOUT = 5 * 60
+    VERSION_TIMEOUT = 24 * 60 * 60
+
+    # 单次返回的最大结果数
+    MAX_RESULTS = 200
+
+    _field_serializers = None
+
+    # ------------------------------------------------------------------
+    # 城市归一化
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def get_city_aliases(cls) -> Dict[str, str]:
+        """
+        获取城市别名到标准城市名的映射。
+
+        别名来源于 City 表（名称、城市代码）和 AIRPORT_DATA（城市名、机场代码、机场名）。
+
+        Returns:
+            {别名: 标准城市名}
+        """
+        aliases = cache.get(cls.CITY_ALIAS_CACHE_KEY)
+        if aliases is not None:
+            return aliases
+
+        aliases = {}
+        for city_name, airport in AIRPORT_DATA.items():
+            aliases[city_name] = city_name
+            aliases[airport['code'].upper()] = city_name
+            aliases[airport['name']] = city_name
+
+        for name, code in City.objects.values_list('name', 'code'):
+            aliases.setdefault(name, name)
+            if code:
+                aliases.setdefault(code.upper(), name)
+
+        cache.set(cls.CITY_ALIAS_CACHE_KEY, aliases, cls.CITY_ALIAS_TIMEOUT)
+        return aliases
+
+    @classmethod
+    def invalidate_city_aliases(cls) -> None:
+        """城市数据变化时清除别名缓存。"""
+        cache.delete(cls.CITY_ALIAS_CACHE_KEY)
+
+    @classmethod
+    def normalize_city(cls, value: Optional[str]) -> Optional[str]:
+        """
+        将用户输入的城市归一化为精确匹配键。
+
+        依次尝试原值、大写（机场/城市代码）和去掉“市”后缀的形式，
+        均未命中时返回去除首尾空白的原值。
+
+        Args:
+            value: 用户输入的城市名、城市代码或机场代码
+
+        Returns:
+            标准城市名，输入为空时返回 None
+        """
+        if value is None:
+            return None
+        value = value.strip()
+        if not value:
+            return None
+
+        aliases = cls.get_city_aliases()
+        for candidate in (value, value.upper(), value.rstrip('市')):
+            if candidate in aliases:
+                return aliases[candidate]
+        return value
+
+    # ------------------------------------------------------------------
+    # 时间区间与缓存版本
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def day_range(day) -> Tuple[datetime, datetime]:
+        """
+        计算某一天（当前时区）的半开时间区间 [start, end)。
+
+        Args:
+            day: date 对象
+
+        Returns:
+            (当天零点, 次日零点)，均为带时区的 datetime
+        """
+        tz = timezone.get_current_timezone()
+        start = timezone.make_aware(datetime.combine(day, time.min), tz)
+        end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min), tz)
+        return start, end
+
+    @staticmethod
+    def _version_key(departure_city: str, arrival_city: str, day) -> str:
+        return f'flight_search:ver:{departure_city}:{arrival_city}:{day.isoformat()}'
+
+    @classmethod
+    def get_route_version(cls, departure_city: str, arrival_city: str, day) -> int:
+        """获取 (航线, 日期) 当前的缓存版本号。"""
+        key = cls._version_key(departure_city, arrival_city, day)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, 1, cls.VERSION_TIMEOUT)
+            version = cache.get(key, 1)
+        return version
+
+    @classmethod
+    def invalidate_route(cls, departure_city: str, arrival_city: str, day) -> None:
+        """递增 (航线, 日期) 的缓存版本号，使已缓存的结果失效。"""
+        key = cls._version_key(departure_city, arrival_city, day)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # 版本号不存在说明该航线日期尚未被缓存，写入初始版本即可
+            cache.add(key, 2, cls.VERSION_TIMEOUT)
+
+    @staticmethod
+    def _local_date(departure_time):
+        """将起飞时间（可能是字符串或 naive datetime）转换为当前时区下的日期。"""
+        if isinstance(departure_time, str):
+            departure_time = parse_datetime(departure_time)
+        if departure_time is None:
+            return None
+        if timezone.is_naive(departure_time):
+            departure_time = timezone.make_aware(departure_time)
+        return timezone.localtime(departure_time).date()
+
+    @classmethod
+    def invalidate_flights(cls, route_rows: Iterable[Tuple[str, str, object]]) -> None:
+        """
+        批量失效航班所在 (航线, 日期) 的缓存。
+
+        Args:
+            route_rows: (出发城市, 到达城市, 起飞时间) 元组序列
+        """
+        seen = set()
+        for departure_city, arrival_city, departure_time in route_rows:
+            day = cls._local_date(departure_time)
+            if day is None:
+                continue
+            key = (departure_city, arrival_city, day)
+            if key not in seen:
+                seen.add(key)
+                cls.invalidate_route(*key)
+
+    @classmethod
+    def invalidate_flight(cls, flight: Flight) -> None:
+        """使航班当前及加载时所在 (航线, 日期) 的缓存失效。"""
+        rows = [(flight.departure_city, flight.arrival_city, flight.departure_time)]
+        loaded_route = getattr(flight, '_loaded_route', None)
+        if loaded_route:
+            rows.append(loaded_route)
+        cls.invalidate_flights(rows)
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def _fetch_rows(cls, departure_city=None, arrival_city=None, start=None, end=None,
+                    min_price=None, max_price=None, min_seats=None, limit=None) -> List[tuple]:
+        """按精确城市和半开时间区间查询投影行。"""
+        queryset = Flight.objects.exclude(status__in=cls.EXCLUDED_STATUSES)
+        if departure_city:
+            queryset = queryset.filter(departure_city=departure_city)
+        if arrival_city:
+            queryset = queryset.filter(arrival_city=arrival_city)
+        if start is not None:
+            queryset = queryset.filter(departure_time__gte=start)
+        if end is not None:
+            queryset = queryset.filter(departure_time__lt=end)
+        if min_price is not None:
+            queryset = queryset.filter(price__gte=min_price)
+        if max_price is not None:
+            queryset = queryset.filter(price__lte=max_price)
+        if min_seats is not None:
+            queryset = queryset.filter(available_seats__gte=min_seats)
+        queryset = queryset.order_by('departure_time', 'id').values_list(*cls.SEARCH_FIELDS)
+        if limit is not None:
+            queryset = queryset[:limit]
+        return list(queryset)
+
+    @classmethod
+    def get_route_day_rows(cls, departure_city: str, arrival_city: str, day) -> List[tuple]:
+        """
+        获取某航线某日的全部可售航班投影行（带缓存）。
+
+        Returns:
+            按起飞时间排序的 SEARCH_FIELDS 元组列表
+        """
+        version = cls.get_route_version(departure_city, arrival_city, day)
+        cache_key = f'flight_search:rows:{departure_city}:{arrival_city}:{day.isoformat()}:{version}'
+        rows = cache.get(cache_key)
+        if rows is None:
+            start, end = cls.day_range(day)
+            rows = cls._fetch_rows(departure_city, arrival_city, start, end)
+            cache.set(cache_key, rows, cls.RESULT_TIMEOUT)
+        return rows
+
+    @staticmethod
+    def _parse_decimal(value, name):
+        try:
+            return Decimal(str(value))
+        except (InvalidOperation, ValueError):
+            raise ValueError(f'{name} 格式无效')
+
+    @classmethod
+    def search(cls, departure_city=None, arrival_city=None, departure_date=None,
+               min_price=None, max_price=None, min_seats=None,
+               limit=None, offset=0) -> Dict:
+        """
+        搜索可预订航班。
+
+        Args:
+            departure_city: 出发城市（名称、城市代码或机场代码）
+            arrival_city: 到达城市
+            departure_date: 出发日期，YYYY-MM-DD
+            min_price / max_price: 票价区间
+            min_seats: 最少剩余座位数
+            limit / offset: 分页参数，limit 不超过 MAX_RESULTS
+
+        Returns:
+            {'results': 序列化后的航班列表, 'total': 匹配总数}
+
+        Raises:
+            ValueError: 参数格式无效时
+        """
+        departure_city = cls.normalize_city(departure_city)
+        arrival_city = cls.normalize_city(arrival_city)
+
+        day = None
+        if departure_date:
+            day = parse_date(departure_date)
+            if day is None:
+                raise ValueError('departure_date 格式应为 YYYY-MM-DD')
+
+        min_price = cls._parse_decimal(min_price, 'min_price') if min_price else None
+        max_price = cls._parse_decimal(max_price, 'max_price') if max_price else None
+        min_seats = int(min_seats) if min_seats else None
+        limit = min(int(limit), cls.MAX_RESULTS) if limit else cls.MAX_RESULTS
+        offset = max(int(offset or 0), 0)
+
+        now = timezone.now()
+        if departure_city and arrival_city and day is not None:
+            rows = cls.get_route_day_rows(departure_city, arrival_city, day)
+            time_idx = cls.SEARCH_FIELDS.index('departure_time')
+            price_idx = cls.SEARCH_FIELDS.index('price')
+            seats_idx = cls.SEARCH_FIELDS.index('available_seats')
+            matched = [
+                row for row in rows
+                if row[time_idx] > now
+                and (min_price is None or row[price_idx] >= min_price)
+                and (max_price is None or row[price_idx] <= max_price)
+                and (min_seats is None or row[seats_idx] >= min_seats)
+            ]
+            return {
+                'results': cls.to_representation(matched[offset:offset + limit]),
+                'total': len(matched),
+            }
+
+        # 条件不完整时不缓存，过滤条件全部下推到数据库，并只扫描当前页所需的行
+        start, end = cls.day_range(day) if day is not None else (now, None)
+        start = max(start, now)
+        rows = cls._fetch_rows(
+            departure_city, arrival_city, start, end,
+            min_price, max_price, min_seats, limit=offset + limit + 1,
+        )
+        page = rows[offset:offset + limit]
+        return {
+            'results': cls.to_representation(page),
+            # 未缓存的查询不统计总数，仅在已到最后一页时给出
+            'total': None if len(rows) > offset + limit else len(rows),
+        }
+
+    @classmethod
+    def to_representation(cls, rows: List[tuple]) -> List[Dict]:
+        """使用 FlightSerializer 的字段格式化投影行，保持与航班接口一致的输出格式。"""
+        if cls._field_serializers is None:
+            from .serializers import FlightSerializer
+            fields = FlightSerializer().fields
+            cls._field_serializers = [fields[name] for name in cls.SEARCH_FIELDS]
+
+        field_pairs = list(zip(cls.SEARCH_FIELDS, cls._field_serializers))
+        return [
+            {
+                name: (field.to_representation(value) if value is not None else None)
+                for (name, field), value in zip(field_pairs, row)
+            }
+            for row in rows
+        ]
@@ -2,11 +2,16 @@
 航班服务模块。
 
 提供航班状态自动更新、通知发送等业务逻辑。
+
+日常的状态切换由 flight.status_engine 事件驱动完成，
+本模块的全表更新作为兜底校准，低频执行。
 """
 import logging
 from django.utils import timezone
 
 from .models import Flight
+from .search import FlightSearchEngine
+from .status_engine import FlightStatusEngine
 
 logger = logging.getLogger(__name__)
 
@@ -25,9 +30,13 @@ class FlightStatusService:
         now = timezone.now()
         flights = Flight.objects.filter(
             departure_time__lte=now,
-            status='scheduled'
+            status__in=FlightStatusEngine.ACTIVE_STATUSES
         )
+        flight_ids = list(flights.values_list('id', flat=True))
+        if not flight_ids:
+            return 0
         count = flights.update(status='departed')
+        FlightStatusEngine.emit('departed', flight_ids)
         
         if count > 0:
             logger.info(f"已将 {count} 个航班状态更新为已起飞")
@@ -46,7 +55,12 @@ class FlightStatusService:
             available_seats=0,
             status='scheduled'
         )
+        rows = list(flights.values_list('id', 'departure_city', 'arrival_city', 'departure_time'))
+        if not rows:
+            return 0
         count = flights.update(status='full')
+        FlightSearchEngine.invalidate_flights(row[1:] for row in rows)
+        FlightStatusEngine.emit('full', [row[0] for row in rows])
         
         if count > 0:
             logger.info(f"已将 {count} 个航班状态更新为已满")
@@ -65,7 +79,12 @@ class FlightStatusService:
             available_seats__gt=0,
             status='full'
         )
+        rows = list(flights.values_list('id', 'departure_city', 'arrival_city', 'departure_time'))
+        if not rows:
+            return 0
         count = flights.update(status='scheduled')
+        FlightSearchEngine.invalidate_flights(row[1:] for row in rows)
+        FlightStatusEngine.emit('scheduled', [row[0] for row in rows])
         
         if count > 0:
             logger.info(f"已将 {count} 个航班状态恢复为正常")
@@ -0,0 +1,44 @@
+"""
+航班模块信号处理。
+
+航班或城市数据变化时失效航班搜索缓存。
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.models import City
+from .models import Flight
+from .search import FlightSearchEngine
+from .status_engine import FlightStatusEngine
+
+
+@receiver(post_save, sender=Flight)
+def invalidate_flight_search_on_save(sender, instance, update_fields=None, **kwargs):
+    """航班票价、座位数、状态或航线时间变化时失效对应的搜索缓存。"""
+    if update_fields is not None and not (
+        set(update_fields) & FlightSearchEngine.INVALIDATING_FIELDS
+    ):
+        return
+    FlightSearchEngine.invalidate_flight(instance)
+
+
+@receiver(post_save, sender=Flight)
+def schedule_flight_departure(sender, instance, created=False, update_fields=None, **kwargs):
+    """新建航班或起飞时间、状态变化时，确保起飞队列能覆盖该航班。"""
+    if not created and update_fields is not None and not (
+        set(update_fields) & {'departure_time', 'status'}
+    ):
+        return
+    FlightStatusEngine.schedule_departure(instance)
+
+
+@receiver(post_delete, sender=Flight)
+def invalidate_flight_search_on_delete(sender, instance, **kwargs):
+    """删除航班时失效对应的搜索缓存。"""
+    FlightSearchEngine.invalidate_flight(instance)
+
+
+@receiver([post_save, post_delete], sender=City)
+def invalidate_city_aliases(sender, **kwargs):
+    """城市数据变化时清除城市别名缓存。"""
+    FlightSearchEngine.invalidate_city_aliases()
@@ -0,0 +1,162 @@
+"""
+事件驱动的航班状态引擎。
+
+- 已起飞：以起飞时间为队列，每次推进只处理自上次推进以来越过起飞时间的航班。
+  推进位置（水位线）保存在缓存中，任意进程都可以接着推进；
+  航班新建或起飞时间改到水位线之前时回调水位线，保证不会漏掉。
+- 已满/恢复：由修改 available_seats 的库存代码在状态切换时上报。
+
+所有状态变化先在进程内累积，提交后由周期任务按批次通知持有机票的用户。
+"""
+import logging
+import threading
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict, Iterable, List
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Flight
+from .search import FlightSearchEngine
+
+logger = logging.getLogger(__name__)
+
+
+class FlightStatusEngine:
+    """航班状态引擎。"""
+
+    # 尚未起飞、需要在起飞时间到达时切换为已起飞的状态
+    ACTIVE_STATUSES = ('scheduled', 'full')
+
+    WATERMARK_KEY = 'flight_status:departure_watermark'
+
+    # 每批通知涉及的航班数
+    NOTIFY_BATCH_SIZE = 200
+
+    _pending: Dict[str, set] = defaultdict(set)
+    _lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # 起飞队列
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def get_watermark(cls):
+        """获取起飞队列的水位线，此前起飞的航班均已处理；为 None 表示需要全量补齐。"""
+        return cache.get(cls.WATERMARK_KEY)
+
+    @classmethod
+    def advance_departures(cls, now=None) -> int:
+        """
+        推进起飞队列，将 (水位线, now] 区间内起飞的航班标记为已起飞。
+
+        查询走 (status, departure_time) 索引，只涉及本区间内越过起飞时间的航班。
+
+        Args:
+            now: 推进到的时间，默认为当前时间
+
+        Returns:
+            标记为已起飞的航班数量
+        """
+        now = now or timezone.now()
+        watermark = cls.get_watermark()
+
+        due = Flight.objects.filter(status__in=cls.ACTIVE_STATUSES, departure_time__lte=now)
+        if watermark is not None:
+            due = due.filter(departure_time__gt=watermark)
+        rows = list(due.values_list('id', 'departure_city', 'arrival_city', 'departure_time'))
+
+        count = 0
+        if rows:
+            flight_ids = [row[0] for row in rows]
+            with transaction.atomic():
+                count = Flight.objects.filter(
+                    id__in=flight_ids,
+                    status__in=cls.ACTIVE_STATUSES,
+                    departure_time__lte=now
+                ).update(status='departed', updated_at=now)
+                FlightSearchEngine.invalidate_flights(row[1:] for row in rows)
+                cls.emit('departed', flight_ids)
+            logger.info(f"已将 {count} 个航班状态更新为已起飞")
+
+        cache.set(cls.WATERMARK_KEY, now, None)
+        return count
+
+    @classmethod
+    def schedule_departure(cls, flight: Flight) -> None:
+        """
+        航班新建或起飞时间变化时调用。
+
+        起飞时间早于水位线的未起飞航班不会再被区间查询覆盖，
+        此时将水位线回调到该航班起飞时间之前，下次推进时处理。
+        """
+        if flight.status not in cls.ACTIVE_STATUSES or flight.departure_time is None:
+            return
+        watermark = cls.get_watermark()
+        if watermark is not None and flight.departure_time <= watermark:
+            cache.set(cls.WATERMARK_KEY, flight.departure_time - timedelta(microseconds=1), None)
+
+    # ------------------------------------------------------------------
+    # 状态变化事件
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def emit(cls, status: str, flight_ids: Iterable[int]) -> None:
+        """
+        上报航班状态变化，事务提交后进入待通知队列。
+
+        Args:
+            status: 新状态
+            flight_ids: 发生变化的航班 ID
+        """
+        flight_ids = list(flight_ids)
+        if not flight_ids:
+            return
+
+        def record():
+            with cls._lock:
+                cls._pending[status].update(flight_ids)
+
+        transaction.on_commit(record)
+
+    @classmethod
+    def dispatch_notifications(cls) -> int:
+        """
+        按批次为待通知的状态变化创建通知（周期任务）。
+
+        Returns:
+            创建的通知数量
+        """
+        with cls._lock:
+            pending, cls._pending = cls._pending, defaultdict(set)
+        if not pending:
+            return 0
+
+        from notifications.services import create_flight_notifications
+
+        created = 0
+        for status, flight_ids in pending.items():
+            flight_ids = sorted(flight_ids)
+            for start in range(0, len(flight_ids), cls.NOTIFY_BATCH_SIZE):
+                created += create_flight_notifications(
+                    flight_ids[start:start + cls.NOTIFY_BATCH_SIZE], status
+                )
+        if created:
+            logger.info(f"已发送 {created} 条航班状态通知")
+        return created
+
+    @classmethod
+    def dispatch_at_exit(cls) -> None:
+        """进程退出前发送剩余通知，失败时只记录日志。"""
+        try:
+            cls.dispatch_notifications()
+        except Exception:
+            logger.exception("退出前发送航班状态通知失败")
+
+    @classmethod
+    def pending_notifications(cls) -> Dict[str, List[int]]:
+        """获取待通知的状态变化（用于监控和测试）。"""
+        with cls._lock:
+            return {status: sorted(ids) for status, ids in cls._pending.items() if ids}
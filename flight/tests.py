@@ -1,5 +1,6 @@
 from datetime import timedelta
 
+from django.core.cache import cache
 from django.test import TestCase
 from django.urls import reverse
 from django.utils import timezone
@@ -9,6 +10,8 @@ from rest_framework import status
 
 from accounts.models import User
 from .models import Flight
+from .search import FlightSearchEngine
+from .status_engine import FlightStatusEngine
 
 
 class FlightModelTest(TestCase):
@@ -145,3 +148,243 @@ class FlightAPITest(APITestCase):
         self.assertEqual(resp_import.status_code, status.HTTP_200_OK)
         data = resp_import.data
         self.assertIn('updated', data)
+
+
+class FlightSearchEngineTest(APITestCase):
+    """航班搜索引擎测试"""
+    def setUp(self):
+        cache.clear()
+        self.departure_time = timezone.localtime() + timedelta(days=3)
+        self.day = self.departure_time.date()
+        self.flight = Flight.objects.create(
+            flight_number='CA8801',
+            departure_city='北京',
+            arrival_city='上海',
+            departure_time=self.departure_time,
+            arrival_time=self.departure_time + timedelta(hours=2),
+            price=800.00,
+            capacity=100,
+            available_seats=100,
+            status='scheduled',
+            aircraft_type='A320',
+        )
+        self.url = reverse('flight-search')
+
+    def _search(self, **params):
+        params.setdefault('departure_date', self.day.isoformat())
+        return self.client.get(self.url, params)
+
+    def test_normalize_city_by_airport_code(self):
+        """机场代码和“市”后缀归一化为标准城市名"""
+        self.assertEqual(FlightSearchEngine.normalize_city('pek'), '北京')
+        self.assertEqual(FlightSearchEngine.normalize_city(' 上海市 '), '上海')
+        self.assertEqual(FlightSearchEngine.normalize_city('未知城市'), '未知城市')
+
+    def test_search_by_airport_code(self):
+        resp = self._search(departure_city='PEK', arrival_city='PVG')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([f['flight_number'] for f in resp.data], ['CA8801'])
+        self.assertEqual(resp['X-Total-Count'], '1')
+
+    def test_search_excludes_other_days(self):
+        resp = self._search(
+            departure_city='北京', arrival_city='上海',
+            departure_date=(self.day + timedelta(days=1)).isoformat()
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.data, [])
+
+    def test_route_day_results_are_cached(self):
+        """同一航线日期的第二次搜索不访问数据库"""
+        FlightSearchEngine.search('北京', '上海', self.day.isoformat())
+        with self.assertNumQueries(0):
+            result = FlightSearchEngine.search('北京', '上海', self.day.isoformat())
+        self.assertEqual(result['total'], 1)
+
+    def test_cache_invalidated_on_seat_change(self):
+        FlightSearchEngine.search('北京', '上海', self.day.isoformat())
+        self.flight.available_seats = 0
+        self.flight.save(update_fields=['available_seats', 'updated_at'])
+        result = FlightSearchEngine.search('北京', '上海', self.day.isoformat(), min_seats=1)
+        self.assertEqual(result['total'], 0)
+
+    def test_cache_invalidated_on_status_change(self):
+        FlightSearchEngine.search('北京', '上海', self.day.isoformat())
+        flight = Flight.objects.get(pk=self.flight.pk)
+        flight.status = 'canceled'
+        flight.save()
+        result = FlightSearchEngine.search('北京', '上海', self.day.isoformat())
+        self.assertEqual(result['total'], 0)
+
+    def test_pagination(self):
+        Flight.objects.create(
+            flight_number='CA8802',
+            departure_city='北京',
+            arrival_city='上海',
+            departure_time=self.departure_time + timedelta(minutes=30),
+            arrival_time=self.departure_time + timedelta(hours=3),
+            price=600.00,
+            capacity=100,
+            available_seats=100,
+            aircraft_type='A320',
+        )
+        resp = self._search(departure_city='北京', arrival_city='上海', limit=1, offset=1)
+        self.assertEqual([f['flight_number'] for f in resp.data], ['CA8802'])
+        self.assertEqual(resp['X-Total-Count'], '2')
+
+    def test_invalid_date_returns_400(self):
+        resp = self._search(departure_city='北京', arrival_city='上海', departure_date='bad')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class FlightStatusEngineTest(TestCase):
+    """事件驱动航班状态引擎测试"""
+    def setUp(self):
+        cache.clear()
+        self.now = timezone.now()
+
+    def tearDown(self):
+        FlightStatusEngine.dispatch_notifications()
+
+    def _create_flight(self, number, departure_time, status='scheduled'):
+        return Flight.objects.create(
+            flight_number=number,
+            departure_city='CityA',
+            arrival_city='CityB',
+            departure_time=departure_time,
+            arrival_time=departure_time + timedelta(hours=2),
+            price=100.00,
+            capacity=100,
+            available_seats=100,
+            status=status,
+            aircraft_type='A320',
+        )
+
+    def test_advance_only_touches_flights_past_watermark(self):
+        departed = self._create_flight('S100', self.now - timedelta(minutes=5))
+        full = self._create_flight('S101', self.now - timedelta(minutes=1), status='full')
+        upcoming = self._create_flight('S102', self.now + timedelta(minutes=30))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(FlightStatusEngine.advance_departures(self.now), 2)
+        self.assertEqual(
+            FlightStatusEngine.pending_notifications(), {'departed': [departed.pk, full.pk]}
+        )
+
+        # 水位线之后没有新航班越过起飞时间时不做任何更新
+        with self.assertNumQueries(1):
+            self.assertEqual(FlightStatusEngine.advance_departures(self.now + timedelta(minutes=1)), 0)
+
+        self.assertEqual(
+            FlightStatusEngine.advance_departures(self.now + timedelta(minutes=31)), 1
+        )
+        upcoming.refresh_from_db()
+        self.assertEqual(upcoming.status, 'departed')
+
+    def test_late_added_flight_rewinds_watermark(self):
+        FlightStatusEngine.advance_departures(self.now)
+        late = self._create_flight('S200', self.now - timedelta(hours=1))
+        self.assertLess(FlightStatusEngine.get_watermark(), late.departure_time)
+
+        self.assertEqual(FlightStatusEngine.advance_departures(self.now), 1)
+        late.refresh_from_db()
+        self.assertEqual(late.status, 'departed')
+
+    def test_status_changes_fan_out_to_ticket_holders(self):
+        from booking.models import Order, Ticket
+        from notifications.models import Notification
+
+        flight = self._create_flight('S300', self.now - timedelta(minutes=1))
+        users = [
+            User.objects.create_user(username=f'holder{i}', password='testpassword123')
+            for i in range(3)
+        ]
+        for user in users:
+            order = Order.objects.create(user=user, total_price=200, status='paid')
+            # 同一用户两张机票只通知一次
+            for _ in range(2):
+                Ticket.objects.create(
+                    order=order, flight=flight, passenger_name='张三',
+                    passenger_id_number='110101199001011234', price=100
+                )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FlightStatusEngine.advance_departures(self.now)
+        # 读取航班、读取持票用户、批量写入通知、增加未读计数
+        with self.assertNumQueries(4):
+            self.assertEqual(FlightStatusEngine.dispatch_notifications(), 3)
+
+        notifications = Notification.objects.filter(notif_type='flight')
+        self.assertEqual(notifications.count(), 3)
+        self.assertIn('已起飞', notifications.first().message)
+
+
+class FlightImporterTest(TestCase):
+    """航班分块导入测试"""
+    HEADER = 'flight_number,departure_city,arrival_city,departure_time,arrival_time,price,capacity,aircraft_type,status\n'
+
+    def setUp(self):
+        cache.clear()
+        self.departure = (timezone.localtime() + timedelta(days=2)).replace(microsecond=0)
+        self.existing = Flight.objects.create(
+            flight_number='IM0001',
+            departure_city='北京',
+            arrival_city='上海',
+            departure_time=self.departure,
+            arrival_time=self.departure + timedelta(hours=2),
+            price=100.00,
+            capacity=100,
+            available_seats=80,
+            aircraft_type='A320',
+        )
+
+    def csv_file(self, rows):
+        lines = [
+            f"{number},{dep},{arr},{self.departure.isoformat()},"
+            f"{(self.departure + timedelta(hours=2)).isoformat()},{price},120,A321,scheduled\n"
+            for number, dep, arr, price in rows
+        ]
+        return SimpleUploadedFile('flights.csv', (self.HEADER + ''.join(lines)).encode('utf-8'))
+
+    def test_upsert_with_row_errors(self):
+        from .imports import FlightImporter
+
+        report = FlightImporter(chunk_size=2).run(self.csv_file([
+            ('IM0001', '北京', '广州', '900'),
+            ('IM0002', '上海', '深圳', 'abc'),
+            ('IM0003', '上海', '深圳', '500'),
+            ('IM0003', '上海', '深圳', '550'),
+        ]))
+
+        self.assertEqual((report['total'], report['created'], report['updated'], report['failed']), (4, 1, 2, 1))
+        self.assertEqual([(error['row'], list(error['errors'])) for error in report['errors']], [(3, ['price'])])
+        self.assertIsNotNone(report['rows_per_second'])
+
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.arrival_city, '广州')
+        self.assertEqual(self.existing.available_seats, 120)
+        self.assertEqual(Flight.objects.get(flight_number='IM0003').price, 550)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .imports import FlightImporter
+
+        # SQLite 单条语句的参数个数有限，bulk_create 按批拆分，这里的行数都在一批之内
+        counts = []
+        for size in (2, 30):
+            rows = [(f'Q{size}{i:04d}', '北京', '上海', '500') for i in range(size)]
+            with CaptureQueriesContext(connection) as queries:
+                FlightImporter().run(self.csv_file(rows))
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_import_invalidates_search_cache(self):
+        from .imports import FlightImporter
+
+        day = self.departure.date().isoformat()
+        first = FlightSearchEngine.search(departure_city='北京', arrival_city='上海', departure_date=day)
+        self.assertEqual(first['total'], 1)
+        FlightImporter().run(self.csv_file([('IM0004', '北京', '上海', '300')]))
+        second = FlightSearchEngine.search(departure_city='北京', arrival_city='上海', departure_date=day)
+        self.assertEqual(second['total'], 2)
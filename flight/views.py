@@ -6,13 +6,21 @@ from rest_framework import viewsets, permissions, filters as drf_filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from booking.models import Ticket
+from booking.seatmap import SeatMapService
+from booking.services import InventoryService
 from core.config.airport_data import get_airport_info, get_airline_info
+from core.export import ExportColumn
+from core.mixins import CsvImportMixin, StreamingExportMixin
 from .filters import FlightFilter
+from .imports import FlightImporter
 from .models import Flight
+from .search import FlightSearchEngine
 from .serializers import FlightSerializer
 
-class FlightViewSet(viewsets.ModelViewSet):
+logger = logging.getLogger(__name__)
+
+
+class FlightViewSet(StreamingExportMixin, CsvImportMixin, viewsets.ModelViewSet):
     queryset = Flight.objects.select_related().prefetch_related('ticket_set')
     serializer_class = FlightSerializer
     filter_backends = [drf_filters.OrderingFilter, drf_filters.SearchFilter]
@@ -20,6 +28,15 @@ class FlightViewSet(viewsets.ModelViewSet):
     search_fields = ['flight_number', 'departure_city', 'arrival_city', 'aircraft_type']
     ordering_fields = ['departure_time', 'arrival_time', 'price']
     ordering = ['departure_time']
+    importer_class = FlightImporter
+    export_filename = 'flights'
+    export_columns = [
+        ExportColumn(name, name) for name in (
+            'flight_number', 'airline_name', 'departure_city', 'arrival_city',
+            'departure_time', 'arrival_time', 'price', 'discount',
+            'capacity', 'available_seats', 'status', 'aircraft_type'
+        )
+    ]
 
     def get_permissions(self):
         admin_actions = [
@@ -36,74 +53,53 @@ class FlightViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def search(self, request):
-        """搜索航班接口，支持多种过滤条件"""
-        from django.utils import timezone
-        
-        queryset = self.get_queryset()
-        
-        # 获取查询参数
-        departure_city = request.query_params.get('departure_city')
-        arrival_city = request.query_params.get('arrival_city')
-        departure_date = request.query_params.get('departure_date')
-        min_price = request.query_params.get('min_price')
-        max_price = request.query_params.get('max_price')
-        available_seats = request.query_params.get('available_seats')
-        
-        # 使用logging替代print
-        logger = logging.getLogger(__name__)
-        logger.info(f"搜索航班: 出发城市={departure_city}, 到达城市={arrival_city}, 日期={departure_date}")
-        
-        # 默认只显示未起飞的航班（起飞时间大于当前时间）
-        queryset = queryset.filter(departure_time__gt=timezone.now())
-        
-        # 排除已取消和已起飞的航班
-        queryset = queryset.exclude(status__in=['canceled', 'departed'])
-        
-        # 应用过滤
-        if departure_city:
-            queryset = queryset.filter(departure_city__icontains=departure_city)
-        if arrival_city:
-            queryset = queryset.filter(arrival_city__icontains=arrival_city)
-        if departure_date:
-            # 假设格式为YYYY-MM-DD，查询当天所有航班
-            queryset = queryset.filter(departure_time__date=departure_date)
-        if min_price:
-            queryset = queryset.filter(price__gte=min_price)
-        if max_price:
-            queryset = queryset.filter(price__lte=max_price)
-        if available_seats:
-            queryset = queryset.filter(available_seats__gte=available_seats)
-            
-        # 默认按起飞时间排序
-        queryset = queryset.order_by('departure_time')
-        
-        # 记录查询结果数量
-        logger.info(f"查询结果: {queryset.count()}条航班记录")
-        
-        # 序列化结果
-        serializer = self.get_serializer(queryset, many=True)
-        
-        # 简化返回，不添加任何缓存控制头
-        return Response(serializer.data)
+        """
+        搜索航班接口，支持多种过滤条件。
+
+        城市支持名称、城市代码和机场代码，归一化后精确匹配；
+        出发/到达城市和日期齐全时结果按 (航线, 日期) 缓存。
+        可通过 limit/offset 分页，匹配总数在 X-Total-Count 响应头中返回。
+        """
+        params = request.query_params
+        logger.info(
+            f"搜索航班: 出发城市={params.get('departure_city')}, "
+            f"到达城市={params.get('arrival_city')}, 日期={params.get('departure_date')}"
+        )
+
+        try:
+            result = FlightSearchEngine.search(
+                departure_city=params.get('departure_city'),
+                arrival_city=params.get('arrival_city'),
+                departure_date=params.get('departure_date'),
+                min_price=params.get('min_price'),
+                max_price=params.get('max_price'),
+                min_seats=params.get('available_seats'),
+                limit=params.get('limit'),
+                offset=params.get('offset'),
+            )
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        logger.info(f"查询结果: {len(result['results'])}条航班记录")
+
+        response = Response(result['results'])
+        if result['total'] is not None:
+            response['X-Total-Count'] = result['total']
+        return response
 
     @action(detail=True, methods=['post'])
     def book(self, request, pk=None):
         flight = self.get_object()
-        if flight.available_seats <= 0:
+        if not InventoryService.reserve_seats(flight, 1):
             return Response({'detail': '无剩余座位'}, status=status.HTTP_400_BAD_REQUEST)
-        flight.available_seats -= 1
-        if flight.available_seats == 0:
-            flight.status = 'full'
-        flight.save()
+        flight.refresh_from_db()
         return Response(self.get_serializer(flight).data)
 
     @action(detail=True, methods=['post'])
     def cancel_seat(self, request, pk=None):
         flight = self.get_object()
-        flight.available_seats = min(flight.available_seats + 1, flight.capacity)
-        if flight.status == 'full' and flight.available_seats > 0:
-            flight.status = 'scheduled'
-        flight.save()
+        InventoryService.release_seats(flight, 1)
+        flight.refresh_from_db()
         return Response(self.get_serializer(flight).data)
 
     @action(detail=True, methods=['post'])
@@ -122,59 +118,13 @@ class FlightViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def export_csv(self, request):
-        import csv
-        from django.http import HttpResponse
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="flights.csv"'
-        writer = csv.writer(response)
-        headers = [
-            'flight_number', 'airline_name', 'departure_city', 'arrival_city',
-            'departure_time', 'arrival_time', 'price', 'discount',
-            'capacity', 'available_seats', 'status', 'aircraft_type'
-        ]
-        writer.writerow(headers)
-        for flight in self.get_queryset():
-            writer.writerow([
-                flight.flight_number, flight.airline_name,
-                flight.departure_city, flight.arrival_city,
-                flight.departure_time, flight.arrival_time,
-                flight.price, flight.discount,
-                flight.capacity, flight.available_seats,
-                flight.status, flight.aircraft_type
-            ])
-        return response
+        """导出航班信息（流式输出，支持 export_format=jsonl 和 compression=gzip）。"""
+        return self.stream_export(request)
 
     @action(detail=False, methods=['post'])
     def import_csv(self, request):
-        file = request.FILES.get('file')
-        if not file:
-            return Response({'detail': '请上传 CSV 文件'}, status=status.HTTP_400_BAD_REQUEST)
-        import csv, io
-        decoded = file.read().decode('utf-8')
-        reader = csv.DictReader(io.StringIO(decoded))
-        created = updated = 0
-        for row in reader:
-            obj, created_flag = Flight.objects.update_or_create(
-                flight_number=row['flight_number'],
-                defaults={
-                    'airline_name': row.get('airline_name', ''),
-                    'departure_city': row['departure_city'],
-                    'arrival_city': row['arrival_city'],
-                    'departure_time': row['departure_time'],
-                    'arrival_time': row['arrival_time'],
-                    'price': row['price'],
-                    'discount': row.get('discount',1),
-                    'capacity': row['capacity'],
-                    'available_seats': row.get('available_seats', row['capacity']),
-                    'status': row.get('status','scheduled'),
-                    'aircraft_type': row['aircraft_type']
-                }
-            )
-            if created_flag:
-                created += 1
-            else:
-                updated += 1
-        return Response({'created': created, 'updated': updated})
+        """按航班号分块导入航班，返回逐行错误报告；async=true 时作为后台任务执行。"""
+        return self.run_import(request)
 
     @action(detail=True, methods=['get'])
     def seats(self, request, pk=None):
@@ -210,12 +160,8 @@ class FlightViewSet(viewsets.ModelViewSet):
         # 确保行范围不超过航班实际座位排数
         end_row = min(end_row, rows)
         
-        # 获取已占用座位
-        occupied_seats = []
-        tickets = Ticket.objects.filter(flight=flight, status='valid')
-        for ticket in tickets:
-            if ticket.seat_number:
-                occupied_seats.append(ticket.seat_number)
+        # 从座位位图获取占用情况，逐格查询为一次位运算
+        seat_map_bits = SeatMapService.get(flight)
                 
         # 构建座位图（仅包含指定舱位的行）
         seat_map = []
@@ -223,15 +169,12 @@ class FlightViewSet(viewsets.ModelViewSet):
             row_list = []
             for c in range(per_row):
                 seat = f"{r}{chr(ord('A')+c)}"
-                taken = seat in occupied_seats
+                taken = seat_map_bits.is_taken_at(r, c)
                 row_list.append({'seat': seat, 'taken': taken})
             seat_map.append(row_list)
         
-        # 过滤出当前舱位范围内的已占用座位
-        cabin_occupied_seats = [
-            seat for seat in occupied_seats 
-            if self._get_seat_row(seat) >= start_row and self._get_seat_row(seat) <= end_row
-        ]
+        # 当前舱位范围内的已占用座位
+        cabin_occupied_seats = seat_map_bits.taken_seats(start_row, end_row)
             
         # 返回前端需要的格式
         return Response({
@@ -245,11 +188,6 @@ class FlightViewSet(viewsets.ModelViewSet):
             'end_row': end_row
         })
     
-    def _get_seat_row(self, seat_number: str) -> int:
-        """从座位号中提取行号，如 '12A' -> 12"""
-        row_str = ''.join(filter(str.isdigit, seat_number))
-        return int(row_str) if row_str else 0
-
     @action(detail=True, methods=['get'])
     def fare(self, request, pk=None):
         """返回航班票价信息，包括各种舱位和折扣"""
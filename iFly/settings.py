@@ -71,7 +71,7 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django.middleware.http.ConditionalGetMiddleware",
     'core.middleware.SystemLogMiddleware',  # 系统操作日志中间件
-    'core.middleware.FlightStatusUpdateMiddleware',  # 航班状态自动更新
+    'core.middleware.SchedulerMiddleware',  # 启动周期任务调度器（航班状态更新、超时订单取消等）
 ]
 
 # debug-toolbar 中间件
@@ -221,6 +221,59 @@ USE_TZ = True
 STATIC_URL = "/static/"
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
+# 座位库存后端：'database'（条件 UPDATE）或 'counter'（缓存计数器 + 批量回写）
+INVENTORY_BACKEND = os.environ.get('INVENTORY_BACKEND', 'database')
+
+# 是否在 Web 进程内启动周期任务调度器（测试时不启动）
+SCHEDULER_ENABLED = (
+    os.environ.get('SCHEDULER_ENABLED', 'true').lower() == 'true' and 'test' not in sys.argv
+)
+
+# 航线推荐模型文件路径（由 train_recommender 命令和周期任务生成）
+RECOMMENDER_MODEL_PATH = None if 'test' in sys.argv else os.environ.get(
+    'RECOMMENDER_MODEL_PATH', os.path.join(BASE_DIR, 'data', 'route_recommender.npz')
+)
+# 每个用户保留的相似用户数、参与相似度计算的最少购买航线数
+RECOMMENDER_TOP_K = 20
+RECOMMENDER_MIN_ORDERS = 1
+# 测试时每次推荐前重新训练，推荐结果与当前数据一致
+RECOMMENDER_SYNC_TRAINING = 'test' in sys.argv
+
+# 操作审计日志：后台线程批量写入（测试时同步写入）
+AUDIT_LOG_ASYNC = 'test' not in sys.argv
+AUDIT_LOG_QUEUE_SIZE = 10000       # 队列容量（条）
+AUDIT_LOG_BATCH_SIZE = 200         # 每批写入条数
+AUDIT_LOG_FLUSH_INTERVAL = 500     # 最长写入间隔（毫秒）
+AUDIT_LOG_ENQUEUE_TIMEOUT = 5      # 队列满时请求线程的最长等待（毫秒），超时丢弃
+AUDIT_LOG_DETAIL_MAX_BYTES = 2048  # 每条日志保留的请求体字节数
+
+# 通知分发：事务提交后由后台线程批量写入（测试时同步写入）
+NOTIFICATION_ASYNC = 'test' not in sys.argv
+NOTIFICATION_DEDUP_WINDOW = 24 * 60 * 60  # 同一用户同一事件的去重时间窗口（秒）
+
+# 实时事件总线：'local'（进程内，单进程部署）或 'cache'（缓存/Redis，多进程共享）
+EVENT_BUS_BACKEND = os.environ.get('EVENT_BUS_BACKEND', 'local')
+EVENT_BUS_BUFFER = 100          # 每个频道保留的事件数
+EVENT_STREAM_MAX_SECONDS = 55   # 单个 SSE 连接的最长时间（秒），到期后客户端自动重连续传
+EVENT_STREAM_KEEPALIVE = 15     # SSE 心跳间隔（秒）
+EVENT_POLL_TIMEOUT = 25         # 长轮询的最长等待（秒）
+
+# 系统设置缓存：各分类的设置保存在进程内快照中（测试时每次读取数据库）
+SETTINGS_CACHE_ENABLED = 'test' not in sys.argv
+SETTINGS_CACHE_CHECK_INTERVAL = 5  # 检查其他进程修改设置的间隔（秒），即修改生效的最长延迟
+
+# 航线指标（上座率、已售座位、机票收入）的缓存时间（秒），测试时不缓存
+ROUTE_METRICS_CACHE_TIMEOUT = 0 if 'test' in sys.argv else 300
+
+# 客户留存队列（回购率、队列留存三角）的缓存时间（秒），测试时不缓存
+COHORT_CACHE_TIMEOUT = 0 if 'test' in sys.argv else 300
+
+# 销售 OLAP 查询结果的缓存时间（秒），测试时不缓存
+OLAP_CACHE_TIMEOUT = 0 if 'test' in sys.argv else 300
+
+# 是否将系统日志查询的索引保存到日志文件旁（测试时只保存在内存中）
+LOG_INDEX_PERSIST = 'test' not in sys.argv
+
 # 默认主键类型
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -70,6 +70,10 @@ CACHES = {
     }
 }
 
+# 实时事件总线：多进程部署时通过 Redis 缓存共享事件，
+# 否则一个进程发布的事件到达不了连接在其他进程上的 SSE/长轮询客户端
+EVENT_BUS_BACKEND = os.environ.get('EVENT_BUS_BACKEND', 'cache')
+
 # 日志配置
 LOGGING = {
     'version': 1,
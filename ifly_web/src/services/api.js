@@ -130,6 +130,27 @@ setupResponseInterceptor(apiClient)
 setupRequestInterceptor(uploadClient)
 setupResponseInterceptor(uploadClient)
 
+// 键集分页：从分页响应的 next 链接中取出下一页游标，没有下一页时返回 null
+export const nextCursor = page => {
+  if (!page?.next) return null
+  return new URL(page.next).searchParams.get('cursor')
+}
+
+// 依次跟随 next 游标取回键集分页接口的全部数据（仅用于城市等小型列表）
+const fetchAllPages = async (url, params = {}) => {
+  const results = []
+  let cursor = null
+  do {
+    const page = await apiClient.get(url, {
+      params: cursor ? { ...params, cursor } : params
+    })
+    if (Array.isArray(page)) return page
+    results.push(...(page.results || []))
+    cursor = nextCursor(page)
+  } while (cursor)
+  return results
+}
+
 // API模块
 const api = {
   // 用户认证相关
@@ -257,7 +278,7 @@ const api = {
 
   // 核心数据相关
   core: {
-    getCities: () => apiClient.get('/core/cities/')
+    getCities: () => fetchAllPages('/core/cities/')
   },
 
   // 推荐相关
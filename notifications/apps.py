@@ -3,4 +3,17 @@ from django.apps import AppConfig
 class NotificationsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'notifications'
-    verbose_name = '应用内消息中心' 
\ No newline at end of file
+    verbose_name = '应用内消息中心'
+
+    # 未读计数校准间隔（秒）
+    UNREAD_RECONCILE_INTERVAL = 10 * 60
+
+    def ready(self):
+        from core.scheduler import scheduler
+        from notifications.counters import notification_counter
+        notification_counter.connect()
+        scheduler.register(
+            'notification_unread_reconcile',
+            notification_counter.reconcile,
+            self.UNREAD_RECONCILE_INTERVAL,
+        )
@@ -0,0 +1,5 @@
+"""通知未读计数"""
+from core.counters import UnreadCounterService
+from .models import Notification
+
+notification_counter = UnreadCounterService('notification', Notification)
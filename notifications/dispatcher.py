@@ -0,0 +1,148 @@
+"""
+通知批量分发。
+
+notify_many 为一组用户发送同一条通知：
+1. 标题和内容按事件渲染一次
+2. 事件在当前事务提交后才交给分发器（事务回滚则不发送）
+3. 分发器在后台线程中把一批事件合并为一条 bulk_create 写入
+4. 指定 event_key 时，同一用户同一事件在 NOTIFICATION_DEDUP_WINDOW 秒内只通知一次
+5. 写入的通知发布到用户的事件频道（core.events），在线客户端无需轮询
+
+关闭 NOTIFICATION_ASYNC 时（如测试环境）事务提交后直接同步写入。
+"""
+import atexit
+from datetime import timedelta
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from core.events import publish, user_channel
+from core.batching import BackgroundBatchWriter
+from .counters import notification_counter
+from .models import Notification
+
+User = get_user_model()
+
+
+class NotificationEvent(NamedTuple):
+    """一次通知事件：同一内容发送给多个用户。"""
+
+    user_ids: Tuple[int, ...]
+    title: str
+    message: str
+    notif_type: str = 'system'
+    event_key: Optional[str] = None
+    # 用户 ID 来自调用方传入时需确认用户存在
+    check_users: bool = False
+
+
+class NotificationDispatcher(BackgroundBatchWriter):
+    """
+    通知分发器。
+
+    每批事件最多执行四条查询：确认用户存在、查询已发送的同一事件、批量写入、
+    增加未读计数（各用户新增数相同时）。
+    队列已满时在当前线程中直接写入，不丢弃通知。
+    """
+
+    name = 'notifications'
+    drop_when_full = False
+
+    # 每条 INSERT 写入的通知数
+    insert_batch_size = 500
+
+    def __init__(self, dedup_window: float = 24 * 60 * 60, **kwargs):
+        super().__init__(**kwargs)
+        self.dedup_window = dedup_window
+
+    @classmethod
+    def from_settings(cls) -> 'NotificationDispatcher':
+        return cls(
+            dedup_window=getattr(settings, 'NOTIFICATION_DEDUP_WINDOW', 24 * 60 * 60),
+            asynchronous=getattr(settings, 'NOTIFICATION_ASYNC', True),
+        )
+
+    def write_batch(self, events: List[NotificationEvent], batch_size: Optional[int] = None) -> int:
+        checked = {user_id for event in events if event.check_users for user_id in event.user_ids}
+        if checked:
+            checked = set(User.objects.filter(id__in=checked).values_list('id', flat=True))
+
+        keyed = [event for event in events if event.event_key]
+        sent = set()
+        if keyed:
+            sent = set(Notification.objects.filter(
+                event_key__in={event.event_key for event in keyed},
+                user_id__in={user_id for event in keyed for user_id in event.user_ids},
+                created_at__gte=timezone.now() - timedelta(seconds=self.dedup_window),
+            ).values_list('user_id', 'event_key'))
+
+        notifications = []
+        for event in events:
+            for user_id in event.user_ids:
+                if event.check_users and user_id not in checked:
+                    continue
+                if event.event_key:
+                    if (user_id, event.event_key) in sent:
+                        continue
+                    sent.add((user_id, event.event_key))
+                notifications.append(Notification(
+                    user_id=user_id,
+                    title=event.title,
+                    message=event.message,
+                    notif_type=event.notif_type,
+                    event_key=event.event_key,
+                    is_read=False,
+                ))
+        Notification.objects.bulk_create(notifications, batch_size=batch_size or self.insert_batch_size)
+        notification_counter.created(notification.user_id for notification in notifications)
+        for notification in notifications:
+            publish(user_channel(notification.user_id), 'notification', {
+                'id': notification.pk,
+                'title': notification.title,
+                'message': notification.message,
+                'notif_type': notification.notif_type,
+                'created_at': notification.created_at,
+            })
+        return len(notifications)
+
+
+dispatcher = NotificationDispatcher.from_settings()
+
+atexit.register(dispatcher.stop, 5)
+
+
+def notify_many(users: Iterable, title: str, message: str, notif_type: str = 'system',
+                event_key: Optional[str] = None, context: Optional[dict] = None) -> int:
+    """
+    在当前事务提交后为一组用户发送同一条通知。
+
+    Args:
+        users: 用户对象或用户ID，重复的用户只通知一次
+        title: 通知标题，可包含 {name} 形式的占位符
+        message: 通知内容，可包含 {name} 形式的占位符
+        notif_type: 通知类型
+        event_key: 事件标识，同一用户同一事件只通知一次
+        context: 渲染标题和内容的参数
+
+    Returns:
+        int: 提交的用户数
+    """
+    user_ids, check_users = [], False
+    for user in users:
+        if isinstance(user, int):
+            user_ids.append(user)
+            check_users = True
+        else:
+            user_ids.append(user.pk)
+    user_ids = tuple(dict.fromkeys(user_ids))
+    if not user_ids:
+        return 0
+
+    if context:
+        title, message = title.format(**context), message.format(**context)
+    event = NotificationEvent(user_ids, title, message, notif_type, event_key, check_users)
+    transaction.on_commit(lambda: dispatcher.submit(event))
+    return len(user_ids)
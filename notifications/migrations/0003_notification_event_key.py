@@ -0,0 +1,24 @@
+# Generated by Django 5.1.4 on 2026-10-18 07:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0002_alter_notification_notif_type'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='event_key',
+            field=models.CharField(blank=True, max_length=100, null=True, verbose_name='事件标识'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['event_key', 'user'], name='notification_event_user_idx'),
+        ),
+    ]
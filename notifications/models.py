@@ -41,11 +41,20 @@ class Notification(models.Model):
         verbose_name='消息类型'
     )
     is_read = models.BooleanField(default=False, verbose_name='已读')
+    # 同一用户同一事件的通知只发送一次（见 notifications.dispatcher）
+    event_key = models.CharField(max_length=100, null=True, blank=True, verbose_name='事件标识')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
 
     class Meta:
         verbose_name = '消息通知'
         verbose_name_plural = '消息通知'
+        indexes = [
+            models.Index(fields=['event_key', 'user'], name='notification_event_user_idx'),
+            # 通知列表按时间倒序（可按类型筛选），未读数统计和批量已读按已读状态筛选
+            models.Index(fields=['user', '-created_at'], name='notification_user_time_idx'),
+            models.Index(fields=['user', 'notif_type', '-created_at'], name='notification_user_type_idx'),
+            models.Index(fields=['user', 'is_read'], name='notification_user_read_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user} - {self.title}"
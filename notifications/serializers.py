@@ -4,5 +4,5 @@ from .models import Notification
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
-        fields = '__all__'
+        exclude = ['event_key']
         read_only_fields = ['user', 'title', 'message', 'notif_type', 'created_at'] 
\ No newline at end of file
@@ -1,38 +1,22 @@
-from .models import Notification
-from django.contrib.auth import get_user_model
+from collections import defaultdict
 
-User = get_user_model()
+from .dispatcher import NotificationEvent, dispatcher, notify_many
 
-def create_notification(user, title, message, notif_type='system'):
+def create_notification(user, title, message, notif_type='system', event_key=None):
     """
-    创建一条通知消息
+    创建一条通知消息（在当前事务提交后由分发器批量写入）
     
     Args:
         user: 用户对象或用户ID
         title: 通知标题
         message: 通知内容
         notif_type: 通知类型，可选值：system, order, flight, payment, refund, info, warning, alert
+        event_key: 事件标识，同一用户同一事件只通知一次
         
     Returns:
-        Notification: 创建的通知对象
+        int: 提交的通知数量
     """
-    # 如果传入的是用户ID，获取用户对象
-    if isinstance(user, int):
-        try:
-            user = User.objects.get(id=user)
-        except User.DoesNotExist:
-            return None
-    
-    # 创建并保存通知
-    notification = Notification.objects.create(
-        user=user,
-        title=title,
-        message=message,
-        notif_type=notif_type,
-        is_read=False
-    )
-    
-    return notification
+    return notify_many([user], title, message, notif_type, event_key)
 
 def create_order_notification(user, order, status, additional_info=None):
     """
@@ -76,7 +60,7 @@ def create_order_notification(user, order, status, additional_info=None):
     if additional_info:
         message += f" {additional_info}"
     
-    return create_notification(user, title, message, 'order')
+    return create_notification(user, title, message, 'order', f'order:{order.pk}:{status}')
 
 def create_payment_notification(user, order, payment_status):
     """
@@ -85,7 +69,7 @@ def create_payment_notification(user, order, payment_status):
     if payment_status == 'success':
         title = '支付成功通知'
         message = f'您的订单 {order.order_number} 支付成功，金额: ¥{order.total_price}。'
-        return create_notification(user, title, message, 'payment')
+        return create_notification(user, title, message, 'payment', f'payment:{order.pk}:{payment_status}')
     
     return None
 
@@ -96,29 +80,81 @@ def create_refund_notification(user, order, refund_status, refund_amount=None):
     if refund_status == 'processing':
         title = '退款申请已受理'
         message = f'您的订单 {order.order_number} 退款申请已受理，我们将尽快处理。'
-        return create_notification(user, title, message, 'refund')
+        return create_notification(user, title, message, 'refund', f'refund:{order.pk}:{refund_status}')
     
     elif refund_status == 'completed':
         title = '退款完成通知'
         amount_text = f'¥{refund_amount}' if refund_amount else ''
         message = f'您的订单 {order.order_number} 退款{amount_text}已完成，将在1-7个工作日内返回原支付账户。'
-        return create_notification(user, title, message, 'refund')
+        return create_notification(user, title, message, 'refund', f'refund:{order.pk}:{refund_status}')
     
     return None
 
+def _flight_notification_message(flight, status_change, additional_info=None):
+    """生成航班状态变更通知的内容"""
+    message = f'您的航班 {flight.flight_number} ({flight.departure_city}-{flight.arrival_city}) 状态已更新为: {status_change}。'
+    
+    if additional_info:
+        message += f" {additional_info}"
+    
+    return message
+
+
 def create_flight_notification(user, flight, status_change, additional_info=None):
     """
     创建航班状态变更的通知
     """
     title = '航班状态更新'
-    message = f'您的航班 {flight.flight_number} ({flight.departure_city}-{flight.arrival_city}) 状态已更新为: {status_change}。'
-    
-    if additional_info:
-        message += f" {additional_info}"
+    message = _flight_notification_message(flight, status_change, additional_info)
     
     return create_notification(user, title, message, 'flight')
 
 
+def create_flight_notifications(flight_ids, status, additional_info=None, batch_size=500):
+    """
+    为持有有效机票的用户批量创建航班状态变更通知
+    
+    同一用户在同一航班上有多张机票时只通知一次，通知内容与
+    create_flight_notification 相同，每个航班为一个通知事件，合并为一次批量写入。
+    
+    Args:
+        flight_ids: 航班ID列表
+        status: 航班新状态（Flight.status 的取值）
+        additional_info: 附加信息
+        batch_size: 每次批量写入的通知数
+        
+    Returns:
+        int: 创建的通知数量
+    """
+    from booking.models import Ticket
+    from flight.models import Flight
+    
+    flights = Flight.objects.only(
+        'flight_number', 'departure_city', 'arrival_city'
+    ).in_bulk(flight_ids)
+    if not flights:
+        return 0
+    
+    status_change = dict(Flight.FLIGHT_STATUS_CHOICES).get(status, status)
+    messages = {
+        flight_id: _flight_notification_message(flight, status_change, additional_info)
+        for flight_id, flight in flights.items()
+    }
+    
+    recipients = defaultdict(list)
+    for user_id, flight_id in Ticket.objects.filter(
+        flight_id__in=flights, status='valid'
+    ).values_list('order__user_id', 'flight_id').distinct():
+        recipients[flight_id].append(user_id)
+    
+    # 已在事务外的后台任务中执行，直接由分发器写入
+    events = [
+        NotificationEvent(tuple(user_ids), '航班状态更新', messages[flight_id], 'flight')
+        for flight_id, user_ids in recipients.items()
+    ]
+    return dispatcher.write_batch(events, batch_size)
+
+
 def create_reschedule_notification(user, original_ticket, new_ticket, reschedule_log):
     """
     创建改签成功的通知
@@ -154,7 +190,7 @@ def create_reschedule_notification(user, original_ticket, new_ticket, reschedule
     if reschedule_log.reschedule_fee > 0:
         message += f' 改签手续费: ¥{reschedule_log.reschedule_fee}。'
     
-    return create_notification(user, title, message, 'order')
+    return create_notification(user, title, message, 'order', f'reschedule:{reschedule_log.pk}')
 
 
 def create_timeout_notification(user, order):
@@ -175,4 +211,4 @@ def create_timeout_notification(user, order):
         f'如需继续购票，请重新预订。'
     )
     
-    return create_notification(user, title, message, 'order')
\ No newline at end of file
+    return create_notification(user, title, message, 'order', f'order:{order.pk}:timeout')
\ No newline at end of file
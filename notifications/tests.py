@@ -0,0 +1,82 @@
+"""通知模块测试"""
+from django.test import TestCase
+
+from accounts.models import User
+from .dispatcher import NotificationDispatcher, NotificationEvent, notify_many
+from .models import Notification
+
+
+class NotifyManyTest(TestCase):
+    """批量通知分发测试"""
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(username=f'notify{i}', password='testpassword123')
+            for i in range(3)
+        ]
+
+    def test_sent_once_per_user_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            submitted = notify_many(
+                self.users + [self.users[0].pk], '航班{flight}取消', '您的航班 {flight} 已取消。',
+                'flight', event_key='flight:1:canceled', context={'flight': 'CA1234'}
+            )
+            self.assertEqual(submitted, 3)
+            self.assertFalse(Notification.objects.exists())
+
+        notifications = Notification.objects.order_by('user_id')
+        self.assertEqual([n.user_id for n in notifications], [user.pk for user in self.users])
+        self.assertEqual(notifications[0].title, '航班CA1234取消')
+        self.assertEqual(notifications[0].message, '您的航班 CA1234 已取消。')
+
+        # 同一事件再次发送时已通知的用户被跳过
+        new_user = User.objects.create_user(username='notify_new', password='testpassword123')
+        with self.captureOnCommitCallbacks(execute=True):
+            notify_many(self.users + [new_user], '航班取消', '已取消', event_key='flight:1:canceled')
+        self.assertEqual(Notification.objects.count(), 4)
+
+    def test_batch_uses_fixed_number_of_queries(self):
+        dispatcher = NotificationDispatcher(asynchronous=False)
+        events = [
+            NotificationEvent(tuple(user.pk for user in self.users) + (999999,), f'标题{i}', '内容',
+                              event_key=f'event:{i}', check_users=True)
+            for i in range(5)
+        ]
+        # 确认用户存在、查询已发送事件、批量写入、增加未读计数
+        with self.assertNumQueries(4):
+            self.assertEqual(dispatcher.write(events), 15)
+
+    def test_rolled_back_transaction_sends_nothing(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            notify_many(self.users, '标题', '内容')
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_full_queue_writes_in_caller_thread(self):
+        dispatcher = NotificationDispatcher(queue_size=1, enqueue_timeout=0.001)
+        event = NotificationEvent((self.users[0].pk,), '标题', '内容')
+        self.assertTrue(dispatcher.enqueue(event))
+        self.assertTrue(dispatcher.enqueue(event))
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertEqual(dispatcher.stats['dropped'], 0)
+        dispatcher.flush()
+        self.assertEqual(Notification.objects.count(), 2)
+
+    def test_unread_count_includes_dispatched_notifications(self):
+        from django.urls import reverse
+        from rest_framework.test import APIClient
+        from .counters import notification_counter
+
+        user = self.users[0]
+        self.assertEqual(notification_counter.get(user.pk), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            notify_many(self.users, '标题', '内容')
+            notify_many([user], '标题2', '内容2')
+        self.assertEqual(notification_counter.get(user.pk), 2)
+
+        client = APIClient()
+        client.force_authenticate(user=user)
+        notification = Notification.objects.filter(user=user).first()
+        client.post(reverse('notification-mark-read', args=[notification.pk]))
+        self.assertEqual(client.get(reverse('notification-unread-count')).data['count'], 1)
+        client.post(reverse('notification-read-all'))
+        self.assertEqual(client.get(reverse('notification-unread-count')).data['count'], 0)
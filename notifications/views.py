@@ -7,15 +7,18 @@ from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
+from core.mixins import UnreadCounterMixin
+from .counters import notification_counter
 from .models import Notification
 from .serializers import NotificationSerializer
 
 
-class NotificationViewSet(viewsets.ModelViewSet):
+class NotificationViewSet(UnreadCounterMixin, viewsets.ModelViewSet):
     """通知视图集，提供通知的 CRUD 操作和自定义动作。"""
 
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
+    unread_counter = notification_counter
 
     def get_queryset(self):
         """获取当前用户的通知列表，支持类型过滤。"""
@@ -32,33 +35,26 @@ class NotificationViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def mark_read(self, request, pk=None):
         """标记单个通知为已读。"""
-        notif = self.get_object()
-        notif.is_read = True
-        notif.save()
+        notif = self.set_read(self.get_object(), True)
         return Response(self.get_serializer(notif).data)
 
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def mark_unread(self, request, pk=None):
         """标记单个通知为未读。"""
-        notif = self.get_object()
-        notif.is_read = False
-        notif.save()
+        notif = self.set_read(self.get_object(), False)
         return Response(self.get_serializer(notif).data)
 
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def read(self, request, pk=None):
         """标记通知已读/未读（兼容旧接口）。"""
-        notif = self.get_object()
         is_read = request.data.get('is_read', True)
-        notif.is_read = is_read
-        notif.save()
+        notif = self.set_read(self.get_object(), is_read)
         return Response(self.get_serializer(notif).data)
 
     @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def read_all(self, request):
         """标记所有通知为已读。"""
-        notifications = self.get_queryset()
-        notifications.update(is_read=True)
+        self.mark_all_read(self.get_queryset())
         return Response({'status': 'success'})
 
     @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
@@ -71,11 +67,10 @@ class NotificationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        self.get_queryset().filter(id__in=message_ids).delete()
+        self.delete_many(self.get_queryset().filter(id__in=message_ids))
         return Response({'status': 'success'})
 
     @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
     def unread_count(self, request):
         """获取未读通知数量。"""
-        count = self.get_queryset().filter(is_read=False).count()
-        return Response({'count': count})
+        return Response({'count': self.get_unread_count(self.get_queryset())})
@@ -4,4 +4,17 @@ from django.apps import AppConfig
 class UserMessagesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user_messages'
-    verbose_name = '用户消息' 
\ No newline at end of file
+    verbose_name = '用户消息'
+
+    # 未读计数校准间隔（秒）
+    UNREAD_RECONCILE_INTERVAL = 10 * 60
+
+    def ready(self):
+        from core.scheduler import scheduler
+        from user_messages.counters import message_counter
+        message_counter.connect()
+        scheduler.register(
+            'message_unread_reconcile',
+            message_counter.reconcile,
+            self.UNREAD_RECONCILE_INTERVAL,
+        )
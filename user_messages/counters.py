@@ -0,0 +1,5 @@
+"""用户消息未读计数"""
+from core.counters import UnreadCounterService
+from .models import Message
+
+message_counter = UnreadCounterService('message', Message)
@@ -32,6 +32,12 @@ class Message(models.Model):
         verbose_name = '用户消息'
         verbose_name_plural = '用户消息列表'
         ordering = ['-created_at']
+        indexes = [
+            # 消息列表按时间倒序（可按类型筛选），未读数统计和批量已读按已读状态筛选
+            models.Index(fields=['user', '-created_at'], name='message_user_time_idx'),
+            models.Index(fields=['user', 'type', '-created_at'], name='message_user_type_time_idx'),
+            models.Index(fields=['user', 'is_read'], name='message_user_read_idx'),
+        ]
         
     def __str__(self):
         return f"{self.get_type_display()}: {self.title} - {self.user.username}"
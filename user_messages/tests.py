@@ -122,3 +122,53 @@ class MessageAPITest(APITestCase):
         # 验证消息已删除
         remaining = Message.objects.filter(user=self.user).count()
         self.assertEqual(remaining, 1)
+
+    def test_unread_counter_tracks_changes(self):
+        """未读数由计数行提供，并随新增、已读、删除同步变化"""
+        url = reverse('messages-unread-count')
+        self.assertEqual(self.client.get(url).data['count'], 2)
+        # 计数行建立后只需一条查询
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).data['count'], 2)
+
+        self.client.post(reverse('messages-list'), {'type': 'system', 'title': '新消息', 'content': '内容'})
+        self.client.post(reverse('messages-read', args=[self.message1.id]), {'is_read': True})
+        self.client.post(reverse('messages-read', args=[self.message3.id]), {'is_read': False}, format='json')
+        self.assertEqual(self.client.get(url).data['count'], 3)
+
+        self.client.post(reverse('messages-delete-multiple'), {
+            'message_ids': [self.message2.id, self.message3.id]
+        }, format='json')
+        self.assertEqual(self.client.get(url).data['count'], 1)
+
+        self.client.post(reverse('messages-read-all'))
+        self.assertEqual(self.client.get(url).data['count'], 0)
+        self.assertEqual(self.client.get(url, {'type': 'system'}).data['count'], 0)
+
+    def test_set_read_parses_form_values_and_counts_once(self):
+        """表单中的 "false" 按未读处理，重复标记已读只减少一次计数"""
+        url = reverse('messages-unread-count')
+        read_url = reverse('messages-read', args=[self.message1.id])
+        self.assertEqual(self.client.get(url).data['count'], 2)
+
+        self.client.post(read_url, {'is_read': 'false'})
+        self.message1.refresh_from_db()
+        self.assertFalse(self.message1.is_read)
+        self.assertEqual(self.client.get(url).data['count'], 2)
+
+        self.client.post(read_url, {'is_read': 'true'})
+        self.client.post(read_url, {'is_read': 'true'})
+        self.assertEqual(self.client.get(url).data['count'], 1)
+        response = self.client.post(read_url, {'is_read': 'maybe'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_reconcile_fixes_drift(self):
+        from user_messages.counters import message_counter
+
+        self.assertEqual(message_counter.get(self.user.pk), 2)
+        # 绕过视图直接修改源表
+        Message.objects.filter(user=self.user).update(is_read=False)
+        self.assertEqual(message_counter.get(self.user.pk), 2)
+        self.assertEqual(message_counter.reconcile(), 1)
+        self.assertEqual(message_counter.get(self.user.pk), 3)
+        self.assertEqual(message_counter.reconcile(), 0)
@@ -9,6 +9,8 @@ from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
+from core.mixins import UnreadCounterMixin
+from .counters import message_counter
 from .models import Message
 from .serializers import MessageSerializer
 
@@ -21,11 +23,12 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 100
 
 
-class MessageViewSet(viewsets.ModelViewSet):
+class MessageViewSet(UnreadCounterMixin, viewsets.ModelViewSet):
     """消息API视图集，提供消息的增删改查及批量操作功能。"""
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = StandardResultsSetPagination
+    unread_counter = message_counter
     
     def get_queryset(self):
         """只返回当前登录用户的消息"""
@@ -45,24 +48,21 @@ class MessageViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'])
     def read(self, request, pk=None):
         """标记消息为已读或未读"""
-        message = self.get_object()
         is_read = request.data.get('is_read', True)
-        message.is_read = is_read
-        message.save()
+        message = self.set_read(self.get_object(), is_read)
         serializer = self.get_serializer(message)
         return Response(serializer.data)
     
     @action(detail=False, methods=['post'])
     def read_all(self, request):
         """标记所有消息为已读"""
-        self.get_queryset().update(is_read=True)
+        self.mark_all_read(self.get_queryset())
         return Response({'status': 'success', 'message': '所有消息已标记为已读'})
     
     @action(detail=False, methods=['get'])
     def unread_count(self, request):
         """获取未读消息数量"""
-        count = self.get_queryset().filter(is_read=False).count()
-        return Response({'count': count})
+        return Response({'count': self.get_unread_count(self.get_queryset())})
     
     @action(detail=False, methods=['post'])
     def delete_multiple(self, request):
@@ -71,9 +71,7 @@ class MessageViewSet(viewsets.ModelViewSet):
         if not message_ids:
             return Response({'error': '未提供消息ID'}, status=status.HTTP_400_BAD_REQUEST)
             
-        messages_to_delete = self.get_queryset().filter(id__in=message_ids)
-        count = messages_to_delete.count()
-        messages_to_delete.delete()
+        count = self.delete_many(self.get_queryset().filter(id__in=message_ids))
         
         return Response({
             'status': 'success',